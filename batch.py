@@ -0,0 +1,266 @@
+# batch.py - Process many C files in parallel with a process pool
+
+import contextlib
+import glob
+import io
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from parser.parser import process_file, read_c_files
+from tac_utils.cache import CacheStats, TACCache
+from tac_utils.io import JSON_SUFFIX, save_tac_to_file
+
+GLOB_CHARS = set('*?[')
+
+# Files a worker preprocesses together in one cpp run
+FILES_PER_TASK = 8
+
+@dataclass
+class FileResult:
+    input_file: str
+    output_file: str
+    ok: bool
+    instructions: int = 0
+    seconds: float = 0.0
+    error: str = ''
+    cache_stats: Optional[CacheStats] = None
+
+# One cache object per worker process, created on first use
+_worker_cache: Optional[TACCache] = None
+
+def _get_cache(cache_config: Optional[Tuple[str, int]]) -> Optional[TACCache]:
+    global _worker_cache
+    if cache_config is None:
+        return None
+    cache_dir, max_bytes = cache_config
+    if _worker_cache is None or _worker_cache.cache_dir != cache_dir:
+        _worker_cache = TACCache(cache_dir, max_bytes=max_bytes)
+    return _worker_cache
+
+def _expand_spec(spec: str, base_dir: str = '') -> List[str]:
+    """Expand a single input spec (file, directory or glob) into C files."""
+    path = os.path.join(base_dir, spec) if base_dir and not os.path.isabs(spec) else spec
+    if GLOB_CHARS & set(path):
+        return sorted(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+    if os.path.isdir(path):
+        return sorted(str(p) for p in Path(path).rglob('*.c') if p.is_file())
+    return [path]
+
+def read_manifest(manifest_file: str) -> List[str]:
+    """
+    Read a manifest of input specs, one per line.
+
+    Blank lines and lines starting with '#' are ignored. Relative entries
+    are resolved against the manifest's directory.
+
+    Args:
+        manifest_file (str): Path to the manifest
+
+    Returns:
+        list: Input C files
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    files = []
+    with open(manifest_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                files.extend(_expand_spec(line, base_dir))
+    return files
+
+def collect_inputs(specs: Iterable[str]) -> List[str]:
+    """
+    Expand input specs into a de-duplicated list of C files.
+
+    Each spec can be a C file, a directory (searched recursively for *.c),
+    a glob pattern (``**`` is supported) or ``@manifest`` naming a file
+    that lists further specs.
+
+    Args:
+        specs: Input specs from the command line
+
+    Returns:
+        list: Absolute paths of the input files, in first-seen order
+    """
+    files = []
+    for spec in specs:
+        if spec.startswith('@'):
+            files.extend(read_manifest(spec[1:]))
+        else:
+            files.extend(_expand_spec(spec))
+
+    seen = set()
+    unique = []
+    for f in files:
+        f = os.path.abspath(f)
+        if f not in seen:
+            seen.add(f)
+            unique.append(f)
+    return unique
+
+def output_paths(input_files: Sequence[str], output_dir: str) -> List[str]:
+    """
+    Map input files to per-file output paths under output_dir.
+
+    The directory layout below the inputs' common parent is preserved so
+    files with the same name in different directories do not collide.
+    """
+    if not input_files:
+        return []
+    base = os.path.commonpath([os.path.dirname(f) for f in input_files])
+    return [
+        os.path.join(output_dir, str(Path(os.path.relpath(f, base)).with_suffix('.txt')))
+        for f in input_files
+    ]
+
+def process_one(input_file: str, output_file: str, pipeline: Optional[List[str]] = None,
+                max_iterations: int = 10, cache_config: Optional[Tuple[str, int]] = None,
+                raw_format: str = JSON_SUFFIX, source: Optional[str] = None,
+                target: Optional[str] = None) -> FileResult:
+    """
+    Generate (and optionally optimize) TAC for one file and save it.
+
+    Runs inside worker processes, so anything the parser prints is captured
+    and reported as the failure reason instead of interleaving on stdout.
+    ``source`` is the file's text from read_c_files(), if already read.
+    """
+    start = time.perf_counter()
+    captured = io.StringIO()
+    cache = _get_cache(cache_config)
+    stats_before = cache.stats.copy() if cache is not None else None
+    tac = None
+    try:
+        with contextlib.redirect_stdout(captured):
+            pass_manager = None
+            if pipeline:
+                from optimizer.pass_manager import PassManager
+                pass_manager = PassManager(pipeline, max_iterations=max_iterations, target=target)
+            functions = []
+            tac = process_file(input_file, cache=cache, pass_manager=pass_manager, source=source,
+                               functions=functions)
+            # Optimization may legitimately remove every instruction
+            if tac is None or (not tac and pass_manager is None):
+                ok, error = False, 'No TAC instructions generated'
+            elif not save_tac_to_file(tac, output_file, raw_format=raw_format, functions=functions):
+                ok, error = False, 'Failed to save TAC'
+            else:
+                ok, error = True, ''
+    except Exception as e:
+        ok, error = False, f"{type(e).__name__}: {e}"
+
+    if not ok and captured.getvalue().strip():
+        error = f"{error} ({captured.getvalue().strip().splitlines()[0]})"
+    cache_stats = cache.stats.since(stats_before) if cache is not None else None
+    return FileResult(input_file, output_file, ok, len(tac or []), time.perf_counter() - start, error, cache_stats)
+
+def process_chunk(work: Sequence[Tuple[str, str]], pipeline: Optional[List[str]] = None,
+                  max_iterations: int = 10, cache_config: Optional[Tuple[str, int]] = None,
+                  raw_format: str = JSON_SUFFIX, target: Optional[str] = None) -> List[FileResult]:
+    """
+    Process (input file, output file) pairs, preprocessing the inputs in one cpp run.
+
+    Starting cpp once per file costs more than preprocessing most files,
+    so a worker reads and preprocesses all of its files up front.
+    """
+    start = time.perf_counter()
+    sources = read_c_files([input_file for input_file, _ in work])
+    # Charge the shared preprocessing to the files evenly
+    shared_seconds = (time.perf_counter() - start) / len(work)
+    results = []
+    for (input_file, output_file), source in zip(work, sources):
+        result = process_one(input_file, output_file, pipeline, max_iterations, cache_config, raw_format, source,
+                             target)
+        result.seconds += shared_seconds
+        results.append(result)
+    return results
+
+def run_batch(input_files: Sequence[str], output_dir: str, jobs: Optional[int] = None,
+              max_in_flight: Optional[int] = None, pipeline: Optional[List[str]] = None,
+              max_iterations: int = 10, cache_config: Optional[Tuple[str, int]] = None,
+              raw_format: str = JSON_SUFFIX, files_per_task: int = FILES_PER_TASK,
+              target: Optional[str] = None) -> Iterator[FileResult]:
+    """
+    Process files in a process pool, yielding results as they complete.
+
+    Files are handed to workers in chunks of up to ``files_per_task``, each
+    chunk preprocessed in one cpp run, but never in fewer chunks than twice
+    the number of jobs. At most ``max_in_flight`` files are submitted at a
+    time, so memory stays bounded no matter how many inputs there are.
+
+    Args:
+        input_files: C files to process
+        output_dir: Directory for per-file outputs
+        jobs: Number of worker processes (default: CPU count); 1 runs in-process
+        max_in_flight: Maximum submitted but unfinished files (default: 2 * jobs)
+        pipeline: Optimization pass names, or None to skip optimization
+        max_iterations: Pipeline iteration limit
+        cache_config: Optional (cache directory, max bytes) shared by all workers
+        raw_format: Format of the raw TAC written next to each text output
+        files_per_task: Largest number of files handed to a worker at once
+        target: Target profile name for the passes (see optimizer.target)
+
+    Yields:
+        FileResult for each input file
+    """
+    jobs = jobs or os.cpu_count() or 1
+    max_in_flight = max(max_in_flight or 2 * jobs, 1)
+    work = list(zip(input_files, output_paths(input_files, output_dir)))
+    chunk_size = max(1, min(files_per_task, len(work) // (2 * jobs), max_in_flight))
+    chunks = [work[i:i + chunk_size] for i in range(0, len(work), chunk_size)]
+
+    if jobs == 1:
+        for chunk in chunks:
+            yield from process_chunk(chunk, pipeline, max_iterations, cache_config, raw_format, target)
+        return
+
+    pending = iter(chunks)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        in_flight = set()
+        while True:
+            for chunk in pending:
+                in_flight.add(executor.submit(
+                    process_chunk, chunk, pipeline, max_iterations, cache_config, raw_format, target))
+                if len(in_flight) * chunk_size >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+def format_summary(results: Sequence[FileResult], wall_time: float, jobs: int, cache_enabled: bool = False) -> str:
+    """Format per-file timings, failures and totals for a batch run."""
+    lines = [f"{'Status':6} {'Time (s)':>9} {'Instrs':>8}  File"]
+    for r in sorted(results, key=lambda r: r.input_file):
+        status = 'ok' if r.ok else 'FAILED'
+        lines.append(f"{status:6} {r.seconds:9.3f} {r.instructions:8}  {r.input_file}")
+
+    failures = [r for r in results if not r.ok]
+    if failures:
+        lines.append("")
+        lines.append(f"Failures ({len(failures)}):")
+        for r in failures:
+            lines.append(f"  {r.input_file}: {r.error}")
+
+    busy = sum(r.seconds for r in results)
+    lines.append("")
+    lines.append(
+        f"Processed {len(results)} file(s), {len(failures)} failed, in {wall_time:.2f}s "
+        f"with {jobs} worker(s)"
+    )
+    if wall_time > 0:
+        lines.append(
+            f"Throughput: {len(results) / wall_time:.1f} files/s; "
+            f"worker time {busy:.2f}s ({busy / wall_time:.1f} workers busy on average)"
+        )
+    if cache_enabled:
+        total = CacheStats()
+        for r in results:
+            if r.cache_stats is not None:
+                total.add(r.cache_stats)
+        lines.append(total.format())
+    return "\n".join(lines)
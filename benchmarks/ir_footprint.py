@@ -0,0 +1,111 @@
+# ir_footprint.py - Compare memory and pass throughput of dict TAC vs. interned IR
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Allow running as a script from anywhere in the checkout
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tac_utils.ir import TACProgram
+from optimizer.constant_folding import ConstantFolder
+from optimizer.constant_propagation import ConstantPropagator
+from optimizer.copy_propagation import CopyPropagator
+from optimizer.common_subexpression_elimination import CommonSubexpressionEliminator
+from optimizer.dead_code_elimination import DeadCodeEliminator
+from optimizer.peephole_optimization import PeepholeOptimizer
+from optimizer.strength_reduction import StrengthReducer
+
+PASSES = [
+    ConstantFolder,
+    ConstantPropagator,
+    CopyPropagator,
+    CommonSubexpressionEliminator,
+    DeadCodeEliminator,
+    PeepholeOptimizer,
+    StrengthReducer,
+]
+
+def generate_tac_dicts(count, num_vars=200, seed=0):
+    """
+    Generate a random straight-line TAC program in the parser's dict form.
+    
+    Args:
+        count (int): Number of instructions to generate
+        num_vars (int): Number of distinct user variables
+        seed (int): Random seed
+        
+    Returns:
+        list: TAC instructions as dicts
+    """
+    rng = random.Random(seed)
+    names = [f"v{i}" for i in range(num_vars)]
+    instructions = []
+    temp = 0
+
+    def operand(var_ratio):
+        if rng.random() < var_ratio:
+            return rng.choice(names)
+        # Mix the literal spellings the generator passes through from C
+        value = rng.randint(0, 16)
+        return rng.choice((str(value), str(value), hex(value), f"{value}u", f"{value}.0"))
+
+    for _ in range(count):
+        if rng.random() < 0.3:
+            instructions.append({'type': 'assign', 'lhs': rng.choice(names), 'rhs': operand(0.5)})
+        else:
+            instructions.append({
+                'type': 'binop',
+                'lhs': f"t{temp}",
+                'op': rng.choice('+-*/'),
+                'arg1': operand(0.7),
+                'arg2': operand(0.5)
+            })
+            temp += 1
+    return instructions
+
+def measure_memory(build):
+    """Return (result, bytes allocated) for a zero-argument builder."""
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare dict TAC against the interned IR.')
+    parser.add_argument('-n', '--instructions', type=int, default=200000, help='Number of instructions to generate')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    dicts, dict_bytes = measure_memory(lambda: generate_tac_dicts(args.instructions, seed=args.seed))
+    program, ir_bytes = measure_memory(lambda: TACProgram.from_dicts(dicts))
+    _, convert_in = time_call(TACProgram.from_dicts, dicts)
+    _, convert_out = time_call(program.to_dicts)
+
+    print(f"Instructions: {len(dicts)}")
+    print(f"Dict TAC:     {dict_bytes / 1e6:8.2f} MB")
+    print(f"Interned IR:  {ir_bytes / 1e6:8.2f} MB ({dict_bytes / ir_bytes:.1f}x smaller)")
+    print(f"Conversion:   from_dicts {convert_in:.3f}s, to_dicts {convert_out:.3f}s")
+    print()
+    # "Dicts" runs each pass on string operands, classifying every operand
+    # (constant, temp or variable) on the way in as the passes used to do,
+    # and converting back on the way out;
+    # "IR" runs it on operands classified once, at generation time.
+    print(f"{'Pass':32} {'Dicts (s)':>9} {'IR (s)':>8} {'Speedup':>8} {'Minstr/s':>9}")
+    for pass_class in PASSES:
+        _, dict_elapsed = time_call(pass_class().optimize, dicts)
+        _, elapsed = time_call(pass_class().optimize, program)
+        print(f"{pass_class.__name__:32} {dict_elapsed:9.3f} {elapsed:8.3f} "
+              f"{dict_elapsed / elapsed:7.1f}x {len(program) / elapsed / 1e6:9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# loops.py - Count the instructions loop kernels execute with and without the loop passes
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+# Allow running as a script from anywhere in the checkout
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimizer.pass_manager import DEFAULT_PIPELINE, PassManager
+from optimizer.target import PROFILES, get_target
+from parser.parser import generate_ir, parse_c_file
+from tac_utils.interpreter import run
+
+# The default pipeline with loop-invariant code motion and induction variable optimization after CSE
+LOOP_PIPELINE = ['sccp', 'copy-propagation', 'cse', 'licm', 'induction-variables',
+                 'copy-propagation', 'peephole', 'strength-reduction', 'dce']
+
+# Each kernel is a function of n (the trip count) and m
+KERNELS = {
+    'scaled_sum': """
+int scaled_sum(int n, int m) {
+    int i; int s;
+    s = 0;
+    for (i = 0; i < n; i++) {
+        s = s + i * 4 + m * m;
+    }
+    return s;
+}""",
+    'nested': """
+int nested(int n, int m) {
+    int i; int j; int s;
+    s = 0;
+    for (i = 0; i < n; i++) {
+        for (j = 0; j < n; j++) {
+            s = s + (i * n + j) * 8 + m * 3;
+        }
+    }
+    return s;
+}""",
+    'while_step': """
+int while_step(int n, int m) {
+    int j; int s;
+    s = 0;
+    j = 0;
+    while (j < n) {
+        j = j + 3;
+        s = s + j * 5 - (m + 1);
+    }
+    return s;
+}""",
+    'do_while': """
+int do_while(int n, int m) {
+    int i; int s;
+    s = 0;
+    i = 0;
+    do {
+        s = s + (i << 2) + m * m;
+        i++;
+    } while (i < n);
+    return s;
+}""",
+    'countdown': """
+int countdown(int n, int m) {
+    int i; int s; int k;
+    s = 0;
+    for (i = n; i > 0; i--) {
+        k = m * 2 + 1;
+        s = s + i * 12 - k;
+    }
+    return s;
+}""",
+}
+
+def measure(name, source, pipelines, arguments, costs):
+    """
+    Generate TAC for one kernel, optimize it with every pipeline and run each version.
+
+    Args:
+        name (str): Kernel (and function) name
+        source (str): C source of the kernel
+        pipelines (dict): Pipeline name -> list of pass names (None for the default pipeline)
+        arguments (dict): Values of the kernel's parameters
+        costs (dict): Cost per executed operator, for the weighted count
+
+    Returns:
+        dict: Per version ('unoptimized' and every pipeline), the static size,
+        the return value and the executed and cost-weighted instruction counts
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{name}.c")
+        with open(path, 'w') as f:
+            f.write(source)
+        program = generate_ir(parse_c_file(path))
+    versions = {'unoptimized': program}
+    for pipeline_name, pipeline in pipelines.items():
+        versions[pipeline_name] = PassManager(pipeline).run(program)
+
+    results = {}
+    for version, optimized in versions.items():
+        execution = run(optimized, name, arguments)
+        results[version] = {
+            'instructions': len(optimized),
+            'value': execution.value,
+            'executed': execution.steps,
+            'cost': execution.cost(costs),
+        }
+    return results
+
+def print_summary(report):
+    versions = list(next(iter(report['kernels'].values())))
+    print(f"Executed instructions (cost-weighted for {report['target']}), n={report['arguments']['n']}:")
+    print(f"{'Kernel':12}" + ''.join(f" {version:>22}" for version in versions))
+    for name, results in report['kernels'].items():
+        cells = ''.join(f" {r['executed']:>11} {r['cost']:>10}" for r in results.values())
+        print(f"{name:12}{cells}")
+    for version in versions[2:]:
+        before = sum(r[versions[1]]['executed'] for r in report['kernels'].values())
+        after = sum(r[version]['executed'] for r in report['kernels'].values())
+        print(f"\n{version} executes {1 - after / before:.1%} fewer instructions than {versions[1]}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Count executed instructions of loop kernels per pipeline.')
+    parser.add_argument('-n', type=int, default=100, help='Trip count of the kernels')
+    parser.add_argument('-m', type=int, default=7, help='Second kernel argument')
+    parser.add_argument('--passes', default=','.join(LOOP_PIPELINE),
+                        help='Comma-separated pipeline compared with the default one')
+    parser.add_argument('--target', default=None,
+                        help=f"Target profile for the cost-weighted counts: {', '.join(PROFILES)}")
+    parser.add_argument('-o', '--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    target = get_target(args.target)
+    pipelines = {'default': DEFAULT_PIPELINE, 'loops': args.passes.split(',')}
+    arguments = {'n': args.n, 'm': args.m}
+    kernels = {name: measure(name, source, pipelines, arguments, target.costs) for name, source in KERNELS.items()}
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+        },
+        'target': target.name,
+        'arguments': arguments,
+        'pipelines': pipelines,
+        'kernels': kernels,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print_summary(report)
+    wrong = [name for name, results in kernels.items()
+             if len({r['value'] for r in results.values()}) != 1]
+    for name in wrong:
+        print(f"error: {name} returns different values after optimization", file=sys.stderr)
+    if args.output:
+        print(f"\nReport saved to {args.output}")
+    return 1 if wrong else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# peephole.py - Time the peephole pass as its rule set grows
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+# Allow running as a script from anywhere in the checkout
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.workload import generate_c_program
+from optimizer.peephole_optimization import RULES, PeepholeOptimizer, Rule
+from parser.parser import generate_ir, parse_c_text
+
+COMMUTATIVE = ['+', '*', '&', '|', '^']
+OPERATORS = COMMUTATIVE + ['-', '/', '%', '<<', '>>', '<', '<=', '==', '!=']
+
+def synthetic_rules(count):
+    """
+    Extra rules shaped like the built-in ones: identities on a particular
+    constant, and two-instruction windows. They are correct (they only
+    swap the operands of commutative operators) but never match the
+    generated programs, whose constants are small.
+
+    Args:
+        count (int): Number of rules
+
+    Returns:
+        list: The rules
+    """
+    rules = []
+    for number in range(count):
+        constant = 10 ** 9 + number
+        op = COMMUTATIVE[number % len(COMMUTATIVE)]
+        before = OPERATORS[(number // len(COMMUTATIVE)) % len(OPERATORS)]
+        kind = number % 3
+        if kind == 0:
+            rules.append(Rule(f'synthetic {number}', (f'd = x {op} {constant}',), f'd = {constant} {op} x'))
+        elif kind == 1:
+            rules.append(Rule(f'synthetic {number}', (f'd = {constant} {op} x',), f'd = x {op} {constant}'))
+        else:
+            rules.append(Rule(f'synthetic {number}', (f't = x {before} {constant}', f'd = t {op} y'),
+                              f'd = y {op} t'))
+    return rules
+
+def time_pass(program, rules, repeat):
+    """
+    Run the peephole pass over the whole program with a rule set.
+
+    Returns:
+        tuple: Best wall-clock seconds of a run, and the optimized program
+    """
+    optimizer = PeepholeOptimizer(rules)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        optimized = optimizer.optimize(program)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, optimized
+
+def print_summary(report):
+    print(f"Peephole pass over {report['instructions']} instructions:")
+    print(f"{'Rules':>8} {'ms':>10} {'vs built-in':>12}")
+    base = report['runs'][0]['seconds']
+    for run in report['runs']:
+        print(f"{run['rules']:>8} {run['seconds'] * 1000:>10.1f} {run['seconds'] / base:>11.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the peephole pass with growing rule sets.')
+    parser.add_argument('-n', '--statements', type=int, default=20000, help='Statements in the generated program')
+    parser.add_argument('--extra', default='0,100,1000,10000',
+                        help='Comma-separated numbers of synthetic rules added to the built-in ones')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per rule set (the best is reported)')
+    parser.add_argument('-o', '--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    program = generate_ir(parse_c_text(generate_c_program(args.statements, constant_density=0.5, functions=10)))
+    runs = []
+    reference = None
+    for extra in [int(count) for count in args.extra.split(',')]:
+        rules = RULES + synthetic_rules(extra)
+        seconds, optimized = time_pass(program, rules, args.repeat)
+        instructions = [instr.key() for instr in optimized.instructions]
+        if reference is None:
+            reference = instructions
+        elif instructions != reference:
+            print(f"error: {len(rules)} rules rewrite differently from the built-in ones", file=sys.stderr)
+            return 1
+        runs.append({'rules': len(rules), 'seconds': seconds})
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+        },
+        'statements': args.statements,
+        'instructions': len(program.instructions),
+        'runs': runs,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print_summary(report)
+    if args.output:
+        print(f"\nReport saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# scaling.py - Time the parser, TAC generation and every pass over growing synthetic programs
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Allow running as a script from anywhere in the checkout
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.workload import generate_c_program
+from parser.parser import parse_c_file, generate_ir
+from optimizer.pass_manager import PASS_REGISTRY
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Runs shorter than this are dominated by timer noise and left out of the fit
+MIN_FIT_SECONDS = 1e-3
+# Shorter runs vary too much between two runs to compare against a baseline
+MIN_COMPARE_SECONDS = 0.05
+
+def measure(func, *args, memory=True):
+    """
+    Time a call and, optionally, measure its peak allocation in a second run.
+
+    Args:
+        func: Function to call
+        args: Arguments to pass to it
+        memory (bool): Whether to also measure peak memory with tracemalloc
+
+    Returns:
+        tuple: (result, seconds, peak bytes or None)
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        # Tracing slows the call down, so it gets a run of its own
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+def fit_exponent(points):
+    """
+    Fit time = c * n^k by least squares on a log-log scale.
+
+    Args:
+        points (list): (size, seconds) pairs
+
+    Returns:
+        float: The exponent k, or None with fewer than two usable points
+    """
+    usable = [(math.log(n), math.log(t)) for n, t in points if t >= MIN_FIT_SECONDS]
+    if len(usable) < 2:
+        return None
+    mean_x = sum(x for x, _ in usable) / len(usable)
+    mean_y = sum(y for _, y in usable) / len(usable)
+    spread = sum((x - mean_x) ** 2 for x, _ in usable)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in usable) / spread
+
+def projected_seconds(points, size):
+    """Extrapolate the time for a size from the largest measured run (at least linearly)."""
+    last_size, last_time = points[-1]
+    exponent = max(fit_exponent(points) or 1.0, 1.0)
+    return last_time * (size / last_size) ** exponent
+
+def run_benchmark(sizes, passes, workload, time_limit=None, memory=True, verbose=False):
+    """
+    Time every stage at every size.
+
+    A stage is skipped at the remaining sizes once its projected time exceeds
+    the time limit, so a quadratic pass does not stall the whole run.
+
+    Args:
+        sizes (list): Statement counts to generate
+        passes (list): Names of passes from PASS_REGISTRY to time
+        workload (dict): Keyword arguments for generate_c_program
+        time_limit (float): Seconds a single stage may be expected to take
+        memory (bool): Whether to measure peak memory
+        verbose (bool): Print each measurement as it is taken
+
+    Returns:
+        dict: Measurements per stage and the fitted scaling exponents
+    """
+    stages = ['parse', 'generate'] + list(passes)
+    results = {stage: [] for stage in stages}
+    skipped = {}
+
+    def allowed(stage, size):
+        points = [(r['statements'], r['seconds']) for r in results[stage]]
+        if time_limit is None or not points:
+            return True
+        if projected_seconds(points, size) <= time_limit:
+            return True
+        skipped.setdefault(stage, size)
+        return False
+
+    def record(stage, size, instructions, seconds, peak):
+        entry = {
+            'statements': size,
+            'instructions': instructions,
+            'seconds': seconds,
+            'statements_per_second': size / seconds if seconds else None,
+            'instructions_per_second': instructions / seconds if seconds and instructions else None,
+            'peak_bytes': peak,
+        }
+        results[stage].append(entry)
+        if verbose:
+            memory_text = f" {peak / 1e6:9.2f} MB" if peak is not None else ''
+            print(f"{stage:22} {size:>9} {seconds:10.4f}s{memory_text}", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            if not allowed('parse', size) or not allowed('generate', size):
+                continue
+            path = os.path.join(directory, f"workload_{size}.c")
+            with open(path, 'w') as f:
+                f.write(generate_c_program(size, **workload))
+
+            ast, seconds, peak = measure(parse_c_file, path, memory=memory)
+            if ast is None:
+                print(f"Error: could not parse the generated program of {size} statements")
+                break
+            record('parse', size, None, seconds, peak)
+
+            program, seconds, peak = measure(generate_ir, ast, memory=memory)
+            del ast
+            instructions = len(program)
+            record('generate', size, instructions, seconds, peak)
+
+            for name in passes:
+                if not allowed(name, size):
+                    continue
+                # Every pass starts from the unoptimized program
+                _, seconds, peak = measure(PASS_REGISTRY[name]().optimize, program, memory=memory)
+                record(name, size, instructions, seconds, peak)
+
+    exponents = {
+        stage: fit_exponent([(r['statements'], r['seconds']) for r in entries])
+        for stage, entries in results.items()
+    }
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+        },
+        'workload': workload,
+        'sizes': list(sizes),
+        'results': results,
+        'exponents': exponents,
+        'skipped': skipped,
+    }
+
+def compare(report, baseline, threshold=1.25):
+    """
+    Compare a report against a baseline report.
+
+    Args:
+        report (dict): Output of run_benchmark
+        baseline (dict): An earlier report
+        threshold (float): Slowdown ratio above which a measurement counts as a regression
+
+    Returns:
+        dict: Time ratios per stage and size, exponent changes, and the regressions found
+    """
+    ratios = {}
+    exponent_changes = {}
+    regressions = []
+    for stage, entries in report['results'].items():
+        previous = {r['statements']: r['seconds'] for r in baseline.get('results', {}).get(stage, [])}
+        paired = []
+        for entry in entries:
+            before = previous.get(entry['statements'])
+            if not before or before < MIN_COMPARE_SECONDS:
+                continue
+            paired.append((entry['statements'], entry['seconds'], before))
+            ratio = entry['seconds'] / before
+            ratios.setdefault(stage, {})[str(entry['statements'])] = ratio
+            if ratio > threshold:
+                regressions.append(f"{stage} at {entry['statements']} statements: {ratio:.2f}x slower")
+
+        # Exponents are only comparable when fitted over the same sizes
+        exponent = fit_exponent([(n, now) for n, now, _ in paired])
+        before = fit_exponent([(n, then) for n, _, then in paired])
+        if exponent is None or before is None:
+            continue
+        exponent_changes[stage] = exponent - before
+        if exponent - before > 0.2:
+            regressions.append(f"{stage} scales as n^{exponent:.2f} (was n^{before:.2f})")
+    return {'ratios': ratios, 'exponent_changes': exponent_changes, 'regressions': regressions}
+
+def print_summary(report):
+    print(f"{'Stage':22} {'Exponent':>8} {'Largest n':>10} {'Seconds':>10} {'Kinstr/s':>10} {'Peak MB':>9}")
+    for stage, entries in report['results'].items():
+        if not entries:
+            continue
+        last = entries[-1]
+        exponent = report['exponents'][stage]
+        exponent_text = f"{exponent:8.2f}" if exponent is not None else f"{'-':>8}"
+        rate = last['instructions_per_second']
+        rate_text = f"{rate / 1e3:10.1f}" if rate else f"{'-':>10}"
+        peak_text = f"{last['peak_bytes'] / 1e6:9.2f}" if last['peak_bytes'] is not None else f"{'-':>9}"
+        print(f"{stage:22} {exponent_text} {last['statements']:>10} {last['seconds']:10.4f} {rate_text} {peak_text}")
+    for stage, size in report['skipped'].items():
+        print(f"{stage}: skipped from {size} statements on (projected over the time limit)")
+
+    comparison = report.get('comparison')
+    if comparison is not None:
+        print()
+        if comparison['regressions']:
+            print("Regressions against the baseline:")
+            for regression in comparison['regressions']:
+                print(f"  {regression}")
+        else:
+            print("No regressions against the baseline")
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how the parser and passes scale with program size.')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma-separated statement counts to generate')
+    parser.add_argument('--passes', default=','.join(PASS_REGISTRY),
+                        help='Comma-separated passes to time')
+    parser.add_argument('--depth', type=int, default=3, help='Maximum expression depth')
+    parser.add_argument('--redundancy', type=float, default=0.2, help='Ratio of repeated expressions')
+    parser.add_argument('--constants', type=float, default=0.3, help='Ratio of literal operands')
+    parser.add_argument('--functions', type=int, default=1, help='Number of functions per program')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--time-limit', type=float, default=120.0,
+                        help='Skip a stage at sizes it is projected to take longer than this (seconds)')
+    parser.add_argument('--no-memory', action='store_true', help='Do not measure peak memory')
+    parser.add_argument('-o', '--output', help='Write the JSON report to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline report to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown ratio against the baseline that counts as a regression')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print each measurement')
+    args = parser.parse_args()
+
+    sizes = [int(float(s)) for s in args.sizes.split(',') if s.strip()]
+    passes = [p.strip() for p in args.passes.split(',') if p.strip()]
+    unknown = [p for p in passes if p not in PASS_REGISTRY]
+    if unknown:
+        print(f"Error: unknown pass(es): {', '.join(unknown)}")
+        return 1
+
+    workload = {
+        'depth': args.depth,
+        'redundancy': args.redundancy,
+        'constant_density': args.constants,
+        'functions': args.functions,
+        'seed': args.seed,
+    }
+    report = run_benchmark(sizes, passes, workload, args.time_limit, not args.no_memory, args.verbose)
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f), args.threshold)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print_summary(report)
+    if args.output:
+        print(f"\nReport saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# startup.py - Measure cold-start time and the fixed per-file cost of parsing
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Allow running as a script from anywhere in the checkout
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from pycparser import parse_file
+
+from benchmarks.workload import generate_c_program
+from parser.parser import CPP_ARGS, CPP_PATH, parse_c_text, preprocess_c_file, read_c_file, read_c_files
+
+SAMPLE = os.path.join(ROOT, 'input', 'sample.c')
+
+# Modules whose import time is reported on its own
+IMPORTS = ['pycparser', 'parser.parser', 'optimizer.pass_manager']
+
+def time_command(command, repeat):
+    """
+    Run a command repeatedly and time each run.
+
+    Returns:
+        float: Median wall-clock seconds of a run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def time_import(module, repeat):
+    """Median seconds a fresh interpreter takes to import a module, excluding interpreter startup."""
+    script = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True)
+        times.append(float(result.stdout))
+    return statistics.median(times)
+
+def cold_start(repeat):
+    """
+    Time whole runs of main.py against an interpreter that does nothing.
+
+    Args:
+        repeat (int): Runs per command, of which the median is reported
+
+    Returns:
+        dict: Seconds per command and per import
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'tac.txt')
+        commands = {
+            'python': [sys.executable, '-c', 'pass'],
+            'main.py --help': [sys.executable, 'main.py', '--help'],
+            'main.py': [sys.executable, 'main.py', '-i', SAMPLE, '-o', output],
+            'main.py -O': [sys.executable, 'main.py', '-i', SAMPLE, '-o', output, '-O'],
+        }
+        runs = {name: time_command(command, repeat) for name, command in commands.items()}
+    imports = {module: time_import(module, repeat) for module in IMPORTS}
+    return {'commands': runs, 'imports': imports}
+
+def write_files(directory, count, statements, preprocessed):
+    """Write count small C files, with a comment and a macro if they must go through cpp."""
+    paths = []
+    for i in range(count):
+        text = generate_c_program(statements, seed=i)
+        if preprocessed:
+            text = f"/* file {i} */\n#define SEED {i}\n{text}int seed(void) {{ return SEED; }}\n"
+        path = os.path.join(directory, f"file_{i}.c")
+        with open(path, 'w') as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+def per_file(count, statements):
+    """
+    Time reading and parsing many small files, with and without the startup shortcuts.
+
+    The strategies are: pycparser.parse_file (a new parser and a cpp run per
+    file), cpp per file into one reused parser, read_c_file (cpp only when a
+    file needs it) and read_c_files (one cpp run for every file that needs it).
+
+    Args:
+        count (int): Number of files
+        statements (int): Statements per file
+
+    Returns:
+        dict: Milliseconds per file, per strategy, for files that need cpp and files that do not
+    """
+    def parse_file_each(paths):
+        for path in paths:
+            parse_file(path, use_cpp=True, cpp_path=CPP_PATH, cpp_args=CPP_ARGS)
+
+    def cpp_each(paths):
+        for path in paths:
+            parse_c_text(preprocess_c_file(path), path)
+
+    def read_each(paths):
+        for path in paths:
+            parse_c_text(read_c_file(path), path)
+
+    def read_batched(paths):
+        for path, text in zip(paths, read_c_files(paths)):
+            parse_c_text(text if text is not None else read_c_file(path), path)
+
+    strategies = {
+        'parse_file': parse_file_each,
+        'cpp per file': cpp_each,
+        'read_c_file': read_each,
+        'read_c_files': read_batched,
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for preprocessed in (False, True):
+            kind = 'needs cpp' if preprocessed else 'plain'
+            subdirectory = os.path.join(directory, kind.replace(' ', '_'))
+            os.mkdir(subdirectory)
+            paths = write_files(subdirectory, count, statements, preprocessed)
+            for name, strategy in strategies.items():
+                start = time.perf_counter()
+                strategy(paths)
+                results.setdefault(name, {})[kind] = (time.perf_counter() - start) / count * 1000
+    return results
+
+def print_summary(report):
+    commands = report['cold_start']['commands']
+    interpreter = commands['python']
+    print(f"{'Command':22} {'ms':>8} {'over python':>12}")
+    for name, seconds in commands.items():
+        print(f"{name:22} {seconds * 1000:8.1f} {(seconds - interpreter) * 1000:12.1f}")
+    print()
+    print(f"{'Import':22} {'ms':>8}")
+    for module, seconds in report['cold_start']['imports'].items():
+        print(f"{module:22} {seconds * 1000:8.1f}")
+    print()
+    print(f"Per file ({report['files']} files of {report['statements']} statements), ms:")
+    print(f"{'Strategy':22} {'plain':>10} {'needs cpp':>10}")
+    for name, times in report['per_file'].items():
+        print(f"{name:22} {times['plain']:10.2f} {times['needs cpp']:10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold start and per-file parsing overhead.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per command; the median is reported')
+    parser.add_argument('--files', type=int, default=100, help='Number of small files for the per-file timings')
+    parser.add_argument('--statements', type=int, default=20, help='Statements per small file')
+    parser.add_argument('-o', '--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+        },
+        'files': args.files,
+        'statements': args.statements,
+        'cold_start': cold_start(args.repeat),
+        'per_file': per_file(args.files, args.statements),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print_summary(report)
+    if args.output:
+        print(f"\nReport saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# workload.py - Generate synthetic C programs for benchmarking the parser and passes
+
+import argparse
+import random
+import sys
+
+ARITHMETIC_OPS = ('+', '-', '*', '/', '%', '&', '|', '^', '<<', '>>')
+COMPARISON_OPS = ('<', '>', '<=', '>=', '==', '!=')
+
+# Control-flow statements never nest deeper than this
+MAX_NESTING = 3
+
+class _FunctionWriter:
+    """Writes the body of one generated function."""
+
+    def __init__(self, rng, depth, redundancy, constant_density, variables):
+        self.rng = rng
+        self.depth = depth
+        self.redundancy = redundancy
+        self.constant_density = constant_density
+        self.names = [f"v{i}" for i in range(variables)]
+        self.lines = []
+        # Expressions computed in the current block whose operands have not
+        # been reassigned since, so repeating one is genuinely redundant
+        self.available = []
+
+    def literal(self):
+        return str(self.rng.randint(0, 9))
+
+    def leaf(self):
+        if self.rng.random() < self.constant_density:
+            return self.literal()
+        return self.rng.choice(self.names)
+
+    def expression(self, depth):
+        if depth <= 0 or self.rng.random() < 0.25:
+            return self.leaf()
+        op = self.rng.choice(ARITHMETIC_OPS)
+        if op in ('<<', '>>'):
+            # Keep shift counts small constants so the C stays well defined
+            return f"({self.expression(depth - 1)} {op} {self.rng.randint(0, 7)})"
+        return f"({self.expression(depth - 1)} {op} {self.expression(depth - 1)})"
+
+    def condition(self):
+        left = self.leaf() if self.rng.random() < 0.5 else self.rng.choice(self.names)
+        return f"{left} {self.rng.choice(COMPARISON_OPS)} {self.literal()}"
+
+    def assignment(self, indent):
+        target = self.rng.choice(self.names)
+        if self.available and self.rng.random() < self.redundancy:
+            expression = self.rng.choice(self.available)
+        elif self.rng.random() < self.constant_density / 2:
+            expression = self.literal()
+        else:
+            expression = self.expression(self.depth)
+        self.lines.append(f"{indent}{target} = {expression};")
+        # Anything reading the target no longer has the same value
+        self.available = [e for e in self.available if target not in _operands(e)]
+        if expression not in self.available and expression.startswith('('):
+            self.available.append(expression)
+            del self.available[:-32]
+
+    def block(self, statements, nesting):
+        """Write a block of the given number of statements; returns how many it wrote."""
+        indent = '    ' * (nesting + 1)
+        written = 0
+        while written < statements:
+            remaining = statements - written
+            if nesting < MAX_NESTING and remaining > 4 and self.rng.random() < 0.08:
+                inner = self.rng.randint(2, min(remaining - 1, 12))
+                kind = self.rng.random()
+                self.available = []
+                if kind < 0.5:
+                    self.lines.append(f"{indent}if ({self.condition()}) {{")
+                elif kind < 0.8:
+                    counter = f"i{nesting}"
+                    self.lines.append(f"{indent}for ({counter} = 0; {counter} < n; {counter}++) {{")
+                else:
+                    self.lines.append(f"{indent}while ({self.condition()}) {{")
+                written += 1 + self.block(inner, nesting + 1)
+                self.lines.append(f"{indent}}}")
+                self.available = []
+            else:
+                self.assignment(indent)
+                written += 1
+        return written
+
+def _operands(expression):
+    return set(expression.replace('(', ' ').replace(')', ' ').split())
+
+def generate_c_program(statements, depth=3, redundancy=0.2, constant_density=0.3,
+                       functions=1, variables=16, seed=0):
+    """
+    Generate a C program in the subset the TAC generator understands.
+
+    Args:
+        statements (int): Number of statements (assignments and loop/branch
+            headers) across all functions
+        depth (int): Maximum depth of generated expression trees
+        redundancy (float): Probability that an assignment repeats an
+            expression already computed, with unchanged operands, in the same block
+        constant_density (float): Probability that an expression leaf is a
+            literal rather than a variable
+        functions (int): Number of functions to spread the statements over
+        variables (int): Number of local variables per function
+        seed (int): Random seed
+
+    Returns:
+        str: The C source
+    """
+    rng = random.Random(seed)
+    functions = max(1, min(functions, statements))
+    out = []
+    for index in range(functions):
+        count = statements // functions + (1 if index < statements % functions else 0)
+        writer = _FunctionWriter(rng, depth, redundancy, constant_density, variables)
+        writer.block(count, 0)
+        declarations = ' '.join(f"int {name} = {rng.randint(0, 9)};" for name in writer.names)
+        counters = ' '.join(f"int i{level};" for level in range(MAX_NESTING))
+        out.append(f"int f{index}(int n) {{")
+        out.append(f"    {declarations} {counters}")
+        out.extend(writer.lines)
+        out.append(f"    return {' + '.join(writer.names)};")
+        out.append("}")
+    return '\n'.join(out) + '\n'
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic C program to stdout.')
+    parser.add_argument('-n', '--statements', type=int, default=1000, help='Number of statements')
+    parser.add_argument('--depth', type=int, default=3, help='Maximum expression depth')
+    parser.add_argument('--redundancy', type=float, default=0.2, help='Ratio of repeated expressions')
+    parser.add_argument('--constants', type=float, default=0.3, help='Ratio of literal operands')
+    parser.add_argument('--functions', type=int, default=1, help='Number of functions')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+    sys.stdout.write(generate_c_program(args.statements, args.depth, args.redundancy, args.constants,
+                                        args.functions, seed=args.seed))
+
+if __name__ == "__main__":
+    main()
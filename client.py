@@ -0,0 +1,135 @@
+# client.py - Thin command-line client for the optimizer daemon
+
+# Only the standard library is imported here: the client's startup time is
+# what every request through the daemon pays on top of the daemon's own work.
+import argparse
+import json
+import os
+import socket
+import sys
+
+def default_socket_path():
+    """Socket the daemon listens on unless told otherwise."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'tac-optimizer.sock')
+    return os.path.join('/tmp', f'tac-optimizer-{os.getuid()}.sock')
+
+class DaemonClient:
+    """
+    A connection to the daemon, sending requests and reading their responses.
+
+    Requests and responses are JSON objects, one per line. A connection can
+    carry any number of requests; each is answered in order.
+    """
+
+    def __init__(self, socket_path=None, timeout=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(self.socket_path)
+        self.reader = self.sock.makefile('rb')
+
+    def request(self, message):
+        """
+        Send one request and wait for its response.
+
+        Args:
+            message (dict): The request, e.g. {'op': 'optimize', 'file': '/abs/path.c'}
+
+        Returns:
+            dict: The daemon's response
+        """
+        self.sock.sendall(json.dumps(message).encode() + b'\n')
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('The daemon closed the connection')
+        return json.loads(line)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate or optimize TAC through a running daemon.py.')
+    parser.add_argument('files', nargs='*', help='C files to process')
+    parser.add_argument('-s', '--socket', default=None,
+                        help='Socket of the daemon (default: under $XDG_RUNTIME_DIR or /tmp)')
+    parser.add_argument('-O', '--optimize', action='store_true', help='Optimize the generated TAC')
+    parser.add_argument('--passes', default=None, help='Comma-separated optimization pipeline (implies --optimize)')
+    parser.add_argument('--max-iterations', type=int, default=10,
+                        help='Maximum number of pipeline iterations when optimizing')
+    parser.add_argument('--target', default=None,
+                        help='Target profile guiding strength reduction (default: the daemon\'s default)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the formatted TAC of a single input file here instead of stdout')
+    parser.add_argument('--json', action='store_true', help='Print the TAC instructions as JSON')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print the time the daemon took per file')
+    parser.add_argument('--ping', action='store_true', help='Check that the daemon is running')
+    parser.add_argument('--stats', action='store_true', help='Print the daemon\'s request statistics')
+    parser.add_argument('--shutdown', action='store_true', help='Stop the daemon')
+    args = parser.parse_args()
+
+    if args.output and len(args.files) != 1:
+        print("Error: --output needs exactly one input file")
+        return 1
+    if not args.files and not (args.ping or args.stats or args.shutdown):
+        parser.print_usage()
+        return 1
+
+    try:
+        client = DaemonClient(args.socket)
+    except OSError as e:
+        print(f"Error: cannot connect to the daemon at {args.socket or default_socket_path()}: {e}")
+        return 1
+
+    status = 0
+    with client:
+        if args.ping:
+            response = client.request({'op': 'ping'})
+            print(f"Daemon running (pid {response.get('pid')}, {response.get('workers')} worker(s))")
+
+        for input_file in args.files:
+            request = {
+                'op': 'optimize' if args.optimize or args.passes else 'parse',
+                'file': os.path.abspath(input_file),
+                'format': 'json' if args.json else 'text',
+            }
+            if args.passes:
+                request['passes'] = [p.strip() for p in args.passes.split(',') if p.strip()]
+            if request['op'] == 'optimize':
+                request['max_iterations'] = args.max_iterations
+                if args.target:
+                    request['target'] = args.target
+            response = client.request(request)
+
+            if not response.get('ok'):
+                print(f"Error: {input_file}: {response.get('error')}")
+                status = 1
+                continue
+            text = json.dumps(response['tac'], indent=2) if args.json else response['text']
+            if args.output:
+                with open(args.output, 'w') as f:
+                    f.write(text)
+            else:
+                print(text)
+            if args.verbose:
+                print(f"{input_file}: {response['instructions']} instructions in "
+                      f"{response['seconds'] * 1000:.1f} ms", file=sys.stderr)
+
+        if args.stats:
+            response = client.request({'op': 'stats'})
+            print(json.dumps(response['stats'], indent=2))
+        if args.shutdown:
+            client.request({'op': 'shutdown'})
+            print("Daemon stopped")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
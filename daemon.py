@@ -0,0 +1,291 @@
+# daemon.py - Long-running optimizer daemon with a warm parser behind a Unix socket
+
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+# Allow running as a script from anywhere in the checkout
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pycparser import c_parser
+
+from client import default_socket_path
+from optimizer.optimization_log import LOG_OFF, configure
+from optimizer.pass_manager import DEFAULT_PIPELINE, PassManager
+from parser.parser import CPP_ARGS, CPP_PATH, generate_module, needs_cpp
+from tac_utils.formatter import iter_format_tac
+
+# Operations answered by a worker, and by the server itself
+WORK_OPS = ('parse', 'optimize')
+CONTROL_OPS = ('ping', 'stats', 'shutdown')
+
+# Per-thread parser and pass managers. Workers run one request at a time in
+# their main thread; without workers every connection thread gets its own.
+_local = threading.local()
+
+def preprocess(text: str, path: Optional[str] = None) -> Tuple[Optional[str], str]:
+    """
+    Run cpp with the options process_file() uses.
+
+    Args:
+        text: Source text, sent to cpp on stdin when there is no path
+        path: The file the text was read from, so quoted includes resolve next to it
+
+    Returns:
+        (preprocessed text, '') or (None, error message)
+    """
+    filename = path or '<source>'
+    try:
+        result = subprocess.run([CPP_PATH, *CPP_ARGS, path or '-'], input=None if path else text,
+                                capture_output=True, text=True)
+    except OSError as e:
+        return None, f"Error preprocessing {filename}: {e}"
+    if result.returncode != 0:
+        return None, f"Error preprocessing {filename}: {result.stderr.strip()}"
+    return result.stdout, ''
+
+def _pass_manager(pipeline: List[str], max_iterations: int, target: Optional[str]) -> PassManager:
+    # Pass objects reset themselves on every run, so each thread keeps one
+    # manager per pipeline instead of building the passes per request
+    managers = getattr(_local, 'managers', None)
+    if managers is None:
+        managers = _local.managers = {}
+    key = (tuple(pipeline), max_iterations, target)
+    if key not in managers:
+        managers[key] = PassManager(pipeline, max_iterations=max_iterations, target=target)
+    return managers[key]
+
+def handle_work(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answer a parse or optimize request.
+
+    The source comes from ``source`` (text) or ``file`` (a path readable by
+    the daemon). Optimize requests may name ``passes``, ``max_iterations``
+    and a ``target`` profile. With ``format`` 'text' the response carries
+    the formatted TAC in ``text``; otherwise the instructions themselves in
+    ``tac``.
+
+    Args:
+        request (dict): The decoded request
+
+    Returns:
+        dict: The response, with ``ok`` False and an ``error`` on failure
+    """
+    start = time.perf_counter()
+    filename = request.get('file') or '<source>'
+    text = request.get('source')
+    path = None
+    if text is None:
+        if 'file' not in request:
+            return {'ok': False, 'error': "Request needs a 'file' or a 'source'"}
+        try:
+            with open(filename, 'r') as f:
+                text = f.read()
+            path = filename
+        except OSError as e:
+            return {'ok': False, 'error': f"Cannot read {filename}: {e}"}
+
+    preprocessed = needs_cpp(text)
+    if preprocessed:
+        text, error = preprocess(text, path)
+        if text is None:
+            return {'ok': False, 'error': error}
+
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = c_parser.CParser()
+    try:
+        ast = parser.parse(text, filename)
+    except Exception as e:
+        return {'ok': False, 'error': f"Error parsing {filename}: {e}"}
+
+    module = generate_module(ast)
+    del ast
+    iterations = None
+    if request['op'] == 'optimize':
+        try:
+            pass_manager = _pass_manager(request.get('passes') or DEFAULT_PIPELINE,
+                                         int(request.get('max_iterations', 10)), request.get('target'))
+        except ValueError as e:
+            return {'ok': False, 'error': str(e)}
+        module = pass_manager.run_module(module)
+        iterations = pass_manager.iterations
+    tac = module.to_program().to_dicts()
+
+    response = {
+        'ok': True,
+        'instructions': len(tac),
+        'preprocessed': preprocessed,
+        'iterations': iterations,
+        'seconds': time.perf_counter() - start,
+    }
+    if request.get('format') == 'text':
+        response['text'] = '\n'.join(iter_format_tac(tac))
+    else:
+        response['tac'] = tac
+    return response
+
+def _warm_worker(_=None) -> int:
+    # Build this worker's parser before its first request
+    _local.parser = c_parser.CParser()
+    return os.getpid()
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Reads requests from one client connection, one JSON object per line, and answers each in order."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.answer(line)
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+class OptimizerDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server answering parse and optimize requests.
+
+    Every connection gets a thread. With ``workers`` > 0, the threads hand
+    parse and optimize requests to a pool of worker processes, each keeping
+    its parser and pass managers between requests, so several clients are
+    served in parallel. With no workers the requests run in the connection
+    threads, which saves the hop to another process but serializes them.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, workers: int = 1, verbose: bool = False):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.verbose = verbose
+        self.started = time.time()
+        self.stats = {'requests': 0, 'errors': 0, 'seconds': 0.0, 'by_op': {}}
+        self._stats_lock = threading.Lock()
+        self.executor = None
+        if workers > 0:
+            # Start (fork) the workers now, while this process has no other threads
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+            list(self.executor.map(_warm_worker, range(workers)))
+
+        # Only the user running the daemon may connect
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def answer(self, line: bytes) -> Dict[str, Any]:
+        """Decode and answer one request line."""
+        start = time.perf_counter()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request must be a JSON object')
+        except ValueError as e:
+            return {'ok': False, 'error': f"Invalid request: {e}"}
+
+        op = request.get('op')
+        if op in WORK_OPS:
+            try:
+                if self.executor is not None:
+                    response = self.executor.submit(handle_work, request).result()
+                else:
+                    response = handle_work(request)
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        elif op == 'ping':
+            response = {'ok': True, 'pid': os.getpid(), 'workers': self.workers}
+        elif op == 'stats':
+            with self._stats_lock:
+                stats = json.loads(json.dumps(self.stats))
+            stats['uptime_seconds'] = time.time() - self.started
+            response = {'ok': True, 'stats': stats}
+        elif op == 'shutdown':
+            # shutdown() waits for serve_forever() to return, so it cannot run in this thread's caller
+            threading.Thread(target=self.shutdown).start()
+            response = {'ok': True}
+        else:
+            response = {'ok': False, 'error': f"Unknown op {op!r}. Available ops: {', '.join(WORK_OPS + CONTROL_OPS)}"}
+
+        if 'id' in request:
+            response['id'] = request['id']
+        if op in WORK_OPS:
+            seconds = time.perf_counter() - start
+            self._record(op, response['ok'], seconds)
+            if self.verbose:
+                status = 'ok' if response['ok'] else f"FAILED: {response['error']}"
+                print(f"{op} {request.get('file') or '<source>'} ({seconds * 1000:.1f} ms) {status}", flush=True)
+        return response
+
+    def _record(self, op: str, ok: bool, seconds: float) -> None:
+        with self._stats_lock:
+            stats = self.stats
+            stats['requests'] += 1
+            stats['errors'] += not ok
+            stats['seconds'] += seconds
+            stats['by_op'][op] = stats['by_op'].get(op, 0) + 1
+
+    def server_close(self):
+        super().server_close()
+        if self.executor is not None:
+            self.executor.shutdown()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+def claim_socket(socket_path: str) -> bool:
+    """
+    Remove a socket file left behind by a daemon that is no longer running.
+
+    Returns:
+        bool: False if a daemon is still listening on socket_path
+    """
+    if not os.path.exists(socket_path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path)
+        return True
+    finally:
+        probe.close()
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve TAC generation and optimization over a Unix socket.')
+    parser.add_argument('-s', '--socket', default=default_socket_path(), help='Socket to listen on')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (0 answers requests in the connection threads)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print a line per request served')
+    args = parser.parse_args()
+
+    if not claim_socket(args.socket):
+        print(f"Error: a daemon is already listening on {args.socket}")
+        return 1
+
+    # Log records are never sent to clients, so the passes need not keep them
+    configure(LOG_OFF)
+    server = OptimizerDaemon(args.socket, max(0, args.workers), args.verbose)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Listening on {args.socket} with {args.workers} worker(s)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,8 @@
 
 import os
 import sys
+import time
 import argparse
-from pathlib import Path
 
 # Get the directory where this script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -11,14 +11,101 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 # Add the project root to the Python path
 sys.path.append(script_dir)
 
-try:
-    from parser.parser import process_file
-    from tac_utils.formatter import print_tac
-    from tac_utils.io import save_tac_to_file
-except ImportError as e:
-    print(f"Import error: {e}")
-    print(f"Python path: {sys.path}")
-    sys.exit(1)
+# The parser and the passes are imported where they are first needed:
+# pycparser and the pass modules take longer to import than a small file
+# takes to process, and --help or a run without -O needs only some of them.
+
+def get_pipeline(args):
+    """Pass names to optimize with, from --passes or the default pipeline."""
+    from optimizer.pass_manager import PassManager, DEFAULT_PIPELINE
+    return PassManager.parse_pipeline(args.passes) if args.passes else list(DEFAULT_PIPELINE)
+
+def make_cache(args):
+    """Create the TAC cache requested on the command line, if any."""
+    if not args.cache_dir:
+        return None
+    from tac_utils.cache import TACCache
+    return TACCache(args.cache_dir, max_bytes=args.cache_max_size * 1024 * 1024)
+
+def configure_logging(args):
+    """
+    Apply the --log-* options to the passes created from now on.
+    
+    Returns:
+        The sink streaming records to --log-file, or None
+    """
+    from optimizer.optimization_log import JSONLinesSink, configure
+    sink = JSONLinesSink(args.log_file) if args.log_file else None
+    # --metrics counts rewrites per rule whatever the log keeps
+    configure(args.log_level, capacity=args.log_buffer, sink=sink, count_rules=bool(args.metrics))
+    return sink
+
+def write_metrics(path, metrics_format):
+    """
+    Write the pass metrics collected during this run.
+    
+    Returns:
+        bool: True if the metrics were written
+    """
+    from optimizer.metrics import collector
+    text = collector.to_prometheus() if metrics_format == 'prometheus' else collector.to_json() + '\n'
+    if path == '-':
+        sys.stdout.write(text)
+        return True
+    try:
+        with open(path, 'w') as f:
+            f.write(text)
+    except OSError as e:
+        print(f"Error writing metrics: {e}")
+        return False
+    return True
+
+def run_batch_mode(args, optimize):
+    """
+    Process every file named by args.batch and print a summary.
+    
+    Returns:
+        int: 0 if every file succeeded, 1 otherwise
+    """
+    from batch import collect_inputs, format_summary, run_batch
+    
+    try:
+        input_files = collect_inputs(args.batch)
+    except OSError as e:
+        print(f"Error reading batch inputs: {e}")
+        return 1
+    
+    if not input_files:
+        print("No input files matched.")
+        return 1
+    
+    pipeline = get_pipeline(args) if optimize else None
+    if optimize:
+        from optimizer.target import get_target
+        try:
+            get_target(args.target)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+    output_dir = os.path.abspath(args.output_dir)
+    jobs = max(1, min(args.jobs or 1, len(input_files)))
+    
+    if args.verbose or args.debug:
+        print(f"Processing {len(input_files)} file(s) with {jobs} worker(s) into {output_dir}")
+    
+    start = time.perf_counter()
+    results = []
+    cache_config = (os.path.abspath(args.cache_dir), args.cache_max_size * 1024 * 1024) if args.cache_dir else None
+    for result in run_batch(input_files, output_dir, jobs=jobs, max_in_flight=args.max_in_flight,
+                            pipeline=pipeline, max_iterations=args.max_iterations, target=args.target,
+                            cache_config=cache_config, raw_format=args.raw_format):
+        results.append(result)
+        if args.verbose or args.debug:
+            status = 'ok' if result.ok else f"FAILED: {result.error}"
+            print(f"[{len(results)}/{len(input_files)}] {result.input_file} ({result.seconds:.3f}s) {status}")
+    
+    print(format_summary(results, time.perf_counter() - start, jobs, cache_enabled=cache_config is not None))
+    return 0 if all(r.ok for r in results) else 1
 
 def main():
     """
@@ -34,9 +121,51 @@ def main():
     parser.add_argument('-o', '--output', default=default_output, help='Output TAC file')
     parser.add_argument('-v', '--verbose', action='store_true', help='Print verbose output')
     parser.add_argument('-d', '--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--raw-format', choices=['jsonl', 'json', 'tacb'], default='jsonl',
+                        help='Format of the raw TAC written next to the text output')
+    parser.add_argument('-O', '--optimize', action='store_true', help='Optimize the generated TAC')
+    parser.add_argument('--passes', default=None,
+                        help='Comma-separated optimization pipeline (implies --optimize; '
+                             'default: the standard pipeline)')
+    parser.add_argument('--max-iterations', type=int, default=10,
+                        help='Maximum number of pipeline iterations when optimizing')
+    parser.add_argument('--target', default=None,
+                        help='Target profile whose integer widths and instruction costs guide strength '
+                             'reduction: x86-64 (default), aarch64, cortex-m0 or avr')
+    parser.add_argument('-b', '--batch', nargs='+', metavar='SPEC',
+                        help='Process many files: C files, directories, globs or @manifest files')
+    parser.add_argument('--output-dir', default=os.path.join(script_dir, 'output'),
+                        help='Directory for per-file outputs in batch mode')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes: files in batch mode, functions of a single file otherwise')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='Maximum files queued to workers at once in batch mode (default: 2 * jobs)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Cache generated and optimized TAC in this directory')
+    parser.add_argument('--cache-max-size', type=int, default=512,
+                        help='Maximum cache size in MB before least recently used entries are evicted')
+    parser.add_argument('--cache-stats', action='store_true', help='Print cache hit/miss statistics')
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help="Write per-pass timings and counters to FILE ('-' for stdout)")
+    parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+                        help='Format of the --metrics output')
+    parser.add_argument('--log-level', choices=['off', 'changes', 'full'], default='changes',
+                        help='What the passes log: nothing, their rewrites, or every instruction')
+    parser.add_argument('--log-file', metavar='FILE', default=None,
+                        help='Stream optimization log records to FILE as JSON lines')
+    parser.add_argument('--log-buffer', type=int, metavar='N', default=None,
+                        help='Keep only the last N log records of each pass run in memory')
     
     args = parser.parse_args()
     
+    optimize = args.optimize or args.passes is not None
+    if args.batch:
+        if args.metrics or args.log_file:
+            # Batch workers run in other processes, out of the collector's reach
+            print("Error: --metrics and --log-file are only supported for single files")
+            return 1
+        return run_batch_mode(args, optimize)
+    
     # Get absolute paths
     input_file = os.path.abspath(args.input)
     output_file = os.path.abspath(args.output)
@@ -61,17 +190,46 @@ def main():
                     print(f"{sub_indent}{f}")
         return 1
     
+    # Set up optional optimization and caching
+    log_sink = configure_logging(args)
+    pass_manager = None
+    if optimize:
+        try:
+            from optimizer.pass_manager import PassManager
+            pass_manager = PassManager(get_pipeline(args), max_iterations=args.max_iterations,
+                                       target=args.target)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+    cache = make_cache(args)
+    report = None
+    if cache is not None:
+        from parser.incremental import UnitReport
+        report = UnitReport()
+    if args.metrics:
+        from optimizer.metrics import collector
+        collector.enable()
+    
     # Process the input file
     try:
-        tac_instructions = process_file(input_file)
+        from parser.parser import process_file
+        # Metrics and log records are collected in this process, so they keep the passes here
+        jobs = 1 if args.metrics or args.log_file else max(1, args.jobs or 1)
+        functions = []
+        tac_instructions = process_file(input_file, cache=cache, pass_manager=pass_manager, jobs=jobs,
+                                        report=report, functions=functions)
     except Exception as e:
         print(f"Error during processing: {e}")
         if args.debug:
             import traceback
             traceback.print_exc()
         return 1
+    finally:
+        if log_sink is not None:
+            log_sink.close()
     
-    if not tac_instructions:
+    # Optimization may legitimately remove every instruction
+    if tac_instructions is None or (not tac_instructions and pass_manager is None):
         print("No TAC instructions generated. This could be due to:")
         print("1. The parser couldn't understand the C code")
         print("2. The C code didn't contain any supported operations")
@@ -81,17 +239,32 @@ def main():
     
     # Print the TAC instructions if verbose
     if args.verbose or args.debug:
-        print("\nGenerated TAC:")
+        if pass_manager is None:
+            print("\nGenerated TAC:")
+        else:
+            print()
+            print(pass_manager.summary() if pass_manager.history else "Optimized TAC loaded from cache.")
+            print("\nOptimized TAC:")
+        from tac_utils.formatter import print_tac
         print_tac(tac_instructions)
     
+    if cache is not None and (args.cache_stats or args.verbose or args.debug):
+        print(cache.stats.format())
+        if report.units:
+            print(report.format())
+    
+    if args.metrics and not write_metrics(args.metrics, args.metrics_format):
+        return 1
+    
     # Create output directory if it doesn't exist
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
     
     # Save the TAC instructions to a file
     try:
-        if save_tac_to_file(tac_instructions, output_file):
+        from tac_utils.io import raw_tac_path, save_tac_to_file
+        if save_tac_to_file(tac_instructions, output_file, raw_format=args.raw_format, functions=functions):
             print(f"\nTAC successfully saved to {output_file}")
-            print(f"Raw TAC saved to {Path(output_file).with_suffix('.json')}")
+            print(f"Raw TAC saved to {raw_tac_path(output_file, args.raw_format)}")
         else:
             print("Failed to save TAC to file.")
             return 1
@@ -1,78 +1,136 @@
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
 
-@dataclass
-class OptimizationInfo:
-    original_tac: Dict[str, str]
-    optimized_tac: Optional[Dict[str, str]] = None
-    reason: str = ''
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.cfg import region_starts
+from tac_utils.ir import ASSIGN, BINOP, JUMP, LABEL, RETURN, UNARYOP, Instruction, TACProgram, assign, ir_pass
+
+# Operators whose operands can be swapped without changing the result
+COMMUTATIVE_OPS = frozenset(('+', '*', '&', '|', '^', '==', '!='))
 
 class CommonSubexpressionEliminator:
+    """
+    Local value numbering.
+
+    Every operand gets a value number; names holding the same value share
+    one, so copies and reordered operands of commutative operators are
+    seen through. Expressions are hash-consed on (op, value number, value
+    number), and a computation whose key is already in the table becomes
+    a copy from a name that still holds the value. Redefining a name only
+    moves that name to a new value number: the table never needs to be
+    scanned, which keeps the pass linear in the length of the block.
+    """
+
+    # Facts are reset at every label, so basic blocks can be optimized independently
+    block_local = True
+
     def __init__(self):
-        self.optimization_log: List[OptimizationInfo] = []
-        self.expression_map: Dict[Tuple[str, str, str], str] = {}
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        # (op, value number[, value number]) -> value number of the result
+        self.expression_map: Dict[Tuple, int] = {}
+        # Operand -> its current value number
+        self.value_numbers: Dict[int, int] = {}
+        # Value number -> names currently holding it, oldest first
+        self.holders: Dict[int, Dict[int, None]] = {}
+        self._next_value_number = 0
+
+    def _reset(self) -> None:
+        self.expression_map.clear()
+        self.value_numbers.clear()
+        self.holders.clear()
+
+    def _value_number(self, operand: int) -> int:
+        vn = self.value_numbers.get(operand)
+        if vn is None:
+            # First sight of a name in this block: its incoming value
+            vn = self._new_value_number()
+            self.value_numbers[operand] = vn
+            if operand >= 0:
+                self.holders[vn] = {operand: None}
+        return vn
 
-    def _get_expression_key(self, instr: Dict[str, str]) -> Optional[Tuple[str, str, str]]:
-        if 'arg2' in instr and instr['op'] != '=':
-            return (instr['op'], instr['arg1'], instr['arg2'])
+    def _new_value_number(self) -> int:
+        self._next_value_number += 1
+        return self._next_value_number
+
+    def _get_expression_key(self, instr: Instruction) -> Optional[Tuple]:
+        if instr.opcode is BINOP:
+            if instr.arg1 is None or instr.arg2 is None:
+                return None
+            vn1, vn2 = self._value_number(instr.arg1), self._value_number(instr.arg2)
+            if instr.op in COMMUTATIVE_OPS and vn2 < vn1:
+                vn1, vn2 = vn2, vn1
+            return (instr.op, vn1, vn2)
+        if instr.opcode is UNARYOP and instr.arg1 is not None:
+            return (instr.op, self._value_number(instr.arg1))
         return None
 
-    def _is_expression_valid(self, key: Tuple[str, str, str], var: str) -> bool:
-        # Check if the variables in the expression are not modified
-        arg1, arg2 = key[1], key[2]
-        return not (self._is_variable_modified(arg1) or self._is_variable_modified(arg2))
-
-    def _is_variable_modified(self, var: str) -> bool:
-        # In a basic implementation, we conservatively assume variables might be modified
-        # A more sophisticated implementation would track variable modifications
-        try:
-            float(var)
-            return False  # Constants are never modified
-        except ValueError:
-            return True  # Variables might be modified
-
-    def optimize(self, tac_instructions: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    def _define(self, var: int, vn: int) -> None:
+        # Only the redefined name's own entry changes; expressions over its
+        # old value stay valid for any other name still holding that value
+        old = self.value_numbers.get(var)
+        if old is not None:
+            names = self.holders.get(old)
+            if names is not None:
+                names.pop(var, None)
+                if not names:
+                    del self.holders[old]
+        self.value_numbers[var] = vn
+        self.holders.setdefault(vn, {})[var] = None
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
         optimized = []
-        self.optimization_log.clear()
-        self.expression_map.clear()
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
+        self._reset()
+        self._next_value_number = 0
+        expression_map = self.expression_map
+        holders = self.holders
+        text = program.symbols.text
+        regions = region_starts(program)
+        after_branch = False
+
+        for idx, instr in enumerate(program.instructions):
+            opcode = instr.opcode
+            # Values are only known within a basic block
+            if opcode is LABEL or after_branch or idx in regions:
+                self._reset()
+            after_branch = opcode is JUMP or opcode is RETURN
 
-        for instr in tac_instructions:
             expr_key = self._get_expression_key(instr)
-            
-            if expr_key is not None:
-                # Check if we've seen this expression before
-                if expr_key in self.expression_map and self._is_expression_valid(expr_key, self.expression_map[expr_key]):
+            opt_instr = instr
+            if expr_key is not None and instr.dest is not None:
+                vn = expression_map.get(expr_key)
+                names = holders.get(vn) if vn is not None else None
+                if names is None:
+                    # New expression (or no name holds its value any more)
+                    vn = self._new_value_number()
+                    expression_map[expr_key] = vn
+                elif instr.dest not in names:
                     # Reuse the previous result
-                    opt_instr = {
-                        'lhs': instr['lhs'],
-                        'op': '=',
-                        'arg1': self.expression_map[expr_key]
-                    }
-                    self.optimization_log.append(
-                        OptimizationInfo(
-                            original_tac=instr,
-                            optimized_tac=opt_instr,
-                            reason=f'Reused common subexpression: {expr_key[1]} {expr_key[0]} {expr_key[2]} -> {self.expression_map[expr_key]}'
-                        )
-                    )
-                    optimized.append(opt_instr)
-                else:
-                    # New expression, store it
-                    self.expression_map[expr_key] = instr['lhs']
-                    optimized.append(instr)
-                    self.optimization_log.append(OptimizationInfo(original_tac=instr))
-            else:
-                # For assignments and other operations, clear affected expressions
-                if 'lhs' in instr:
-                    # Remove expressions that use the modified variable
-                    self.expression_map = {
-                        k: v for k, v in self.expression_map.items()
-                        if k[1] != instr['lhs'] and k[2] != instr['lhs']
-                    }
-                optimized.append(instr)
-                self.optimization_log.append(OptimizationInfo(original_tac=instr))
-
-        return optimized
-
-    def get_optimization_log(self) -> List[OptimizationInfo]:
-        return self.optimization_log
\ No newline at end of file
+                    source = next(iter(names))
+                    opt_instr = assign(instr.dest, source)
+                    if log.changes:
+                        operands = f'{text(instr.arg1)} {instr.op} {text(instr.arg2)}' if opcode is BINOP \
+                            else f'{instr.op}{text(instr.arg1)}'
+                        log.change(instr, opt_instr, f'Reused common subexpression: {operands} -> {text(source)}')
+                    self.touched.append(len(optimized))
+                self._define(instr.dest, vn)
+            elif opcode is ASSIGN and instr.dest is not None and instr.arg1 is not None:
+                # A copy holds the same value as its source
+                self._define(instr.dest, self._value_number(instr.arg1))
+            elif instr.dest is not None:
+                self._define(instr.dest, self._new_value_number())
+
+            optimized.append(opt_instr)
+            if opt_instr is instr and log.full:
+                log.keep(instr)
+
+        self.changed = bool(self.touched)
+        return program.derive(optimized) if self.changed else program
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
@@ -0,0 +1,305 @@
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from optimizer.constant_folding import Typed, fold_binary, fold_unary
+from optimizer.optimization_log import OptimizationLog
+from optimizer.target import TargetProfile, get_target
+from tac_utils.c_types import convert, literal_text, literal_type, operand_types
+from tac_utils.ir import (
+    ASSIGN, BINOP, COND_JUMP, RETURN, UNARYOP, Instruction, TACProgram, assign, ir_pass, jump,
+)
+from tac_utils.ssa import Phi, SSAForm
+
+class _Overdefined:
+    """Lattice value of a name that can hold more than one value."""
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return 'OVERDEFINED'
+
+OVERDEFINED = _Overdefined()
+
+# A name's lattice value: None until something is known, then a constant
+# operand, then OVERDEFINED
+Value = Union[None, int, _Overdefined]
+
+class ConditionalConstantPropagator:
+    """
+    Sparse conditional constant propagation over SSA form.
+
+    Constant propagation and folding run together in one worklist pass,
+    along with reachability: a conditional jump whose condition is a
+    constant only makes the edge it takes executable, and phis only look
+    at operands arriving along executable edges. So a value that is only
+    non-constant on a path that is never taken is still found constant.
+    Afterwards constant names are replaced by their values, branches with
+    constant conditions become plain jumps (or disappear) and blocks that
+    cannot run are deleted.
+
+    Constants are folded and assigned in the C types of the names holding
+    them (see fold_binary()), and a name's constant is spelled as a
+    literal of its type, so the uses that read it keep computing in the
+    same type.
+    """
+
+    # Built for a target profile (see PassManager): constants are folded in its integer widths
+    targeted = True
+
+    def __init__(self, target: Union[str, TargetProfile, None] = None):
+        self.target = get_target(target)
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        # Lattice value of each SSA name
+        self.lattice: Dict[int, Value] = {}
+        self.ssa: Optional[SSAForm] = None
+        self.types: Dict[int, Optional[str]] = {}
+
+    def _value(self, operand: Optional[int]) -> Value:
+        if operand is None:
+            return None
+        if operand < 0:
+            return operand
+        # Memory variables and the values names have on entry are unknown
+        if not self.ssa.is_name(operand) or operand < self.ssa.first_version:
+            return OVERDEFINED
+        return self.lattice.get(operand)
+
+    def _same_constant(self, a: int, b: int) -> bool:
+        values = self.ssa.symbols.values
+        return a == b or (type(values[~a]) is type(values[~b]) and values[~a] == values[~b])
+
+    def _type_of(self, operand: int) -> Optional[str]:
+        if operand < 0:
+            symbols = self.ssa.symbols
+            return literal_type(symbols.text(operand), symbols.value(operand), self.target.bits)
+        return self.types.get(self.ssa.base_of(operand))
+
+    def _typed(self, constant: int) -> Typed:
+        return self.ssa.symbols.value(constant), self._type_of(constant)
+
+    def _fold(self, dest: int, result: Typed) -> Value:
+        """The constant a destination holds after being assigned a typed result."""
+        bits = self.target.bits
+        value, c_type = result
+        dest_type = self._type_of(dest)
+        if value is not None and dest_type is not None and dest_type != c_type:
+            # The assignment converts the value to the type of its destination
+            value, c_type = convert(value, dest_type, bits), dest_type
+        if value is None:
+            return OVERDEFINED
+        return self.ssa.symbols.constant(literal_text(value, c_type, bits), value)
+
+    def _evaluate(self, instr: Instruction) -> Value:
+        """Lattice value of the result of an instruction."""
+        bits = self.target.bits
+        opcode = instr.opcode
+        if opcode is ASSIGN:
+            arg = self._value(instr.arg1)
+            if arg is None or arg is OVERDEFINED:
+                return arg
+            if self._type_of(instr.dest) is None or self._type_of(arg) is None:
+                return OVERDEFINED
+            return self._fold(instr.dest, self._typed(arg))
+        if opcode is BINOP:
+            arg1, arg2 = self._value(instr.arg1), self._value(instr.arg2)
+            if arg1 is OVERDEFINED or arg2 is OVERDEFINED:
+                return OVERDEFINED
+            if arg1 is None or arg2 is None:
+                return None
+            return self._fold(instr.dest, fold_binary(instr.op, *self._typed(arg1), *self._typed(arg2), bits))
+        if opcode is UNARYOP:
+            arg = self._value(instr.arg1)
+            if arg is None or arg is OVERDEFINED:
+                return arg
+            return self._fold(instr.dest, fold_unary(instr.op, *self._typed(arg), bits))
+        return OVERDEFINED
+
+    def _meet(self, a: Value, b: Value) -> Value:
+        if a is None:
+            return b
+        if b is None:
+            return a
+        if a is OVERDEFINED or b is OVERDEFINED or not self._same_constant(a, b):
+            return OVERDEFINED
+        return a
+
+    def _taken(self, block: int, instr: Instruction, condition: Value) -> List[int]:
+        """Successors of a block ending in a conditional jump that the condition can lead to."""
+        succs = self.ssa.cfg.blocks[block].succs
+        if condition is None:
+            return []
+        if condition is OVERDEFINED:
+            return list(succs)
+        target = self.ssa.cfg.label_blocks[instr.label]
+        if self.ssa.symbols.values[~condition]:
+            return [target]
+        return [s for s in succs if s != target] or [target]
+
+    def _propagate(self, ssa: SSAForm) -> Tuple[Set[int], Set[Tuple[Optional[int], int]]]:
+        """Run the worklist to a fixed point; returns the executable blocks and edges."""
+        cfg = ssa.cfg
+        lattice = self.lattice
+        uses: Dict[int, List[Tuple[int, Union[int, Phi]]]] = {}
+        for b in ssa.order:
+            for phi in ssa.phis[b]:
+                for arg in phi.args:
+                    if ssa.is_name(arg):
+                        uses.setdefault(arg, []).append((b, phi))
+            for pos, instr in enumerate(ssa.blocks[b]):
+                for arg in (instr.arg1, instr.arg2):
+                    if ssa.is_name(arg):
+                        uses.setdefault(arg, []).append((b, pos))
+
+        executable: Set[int] = set()
+        edges: Set[Tuple[Optional[int], int]] = set()
+        flow: List[Tuple[Optional[int], int]] = [(None, entry) for entry in reversed(cfg.entries)]
+        changed_names: List[int] = []
+
+        def update(name: int, value: Value) -> None:
+            old = lattice.get(name)
+            if old is OVERDEFINED or value is None:
+                return
+            if old is not None and value is not OVERDEFINED and self._same_constant(old, value):
+                return
+            # Values only move down the lattice
+            lattice[name] = value if old is None else OVERDEFINED
+            changed_names.append(name)
+
+        def visit_phi(b: int, phi: Phi) -> None:
+            preds = cfg.blocks[b].preds
+            value: Value = None
+            for pos, arg in enumerate(phi.args):
+                pred = preds[pos] if pos < len(preds) else None
+                if (pred, b) in edges:
+                    value = self._meet(value, self._value(arg))
+            update(phi.dest, value)
+
+        def visit(b: int, pos: int) -> None:
+            instr = ssa.blocks[b][pos]
+            if instr.opcode is COND_JUMP:
+                flow.extend((b, s) for s in self._taken(b, instr, self._value(instr.arg1)))
+            elif ssa.is_name(instr.dest):
+                update(instr.dest, self._evaluate(instr))
+
+        while flow or changed_names:
+            while flow:
+                edge = flow.pop()
+                if edge in edges:
+                    continue
+                edges.add(edge)
+                b = edge[1]
+                if ssa.blocks[b] is None:
+                    # SSA only renames blocks reached from an entry; there is nothing to evaluate
+                    continue
+                for phi in ssa.phis[b]:
+                    visit_phi(b, phi)
+                if b in executable:
+                    continue
+                executable.add(b)
+                block = ssa.blocks[b]
+                for pos in range(len(block)):
+                    visit(b, pos)
+                last = block[-1] if block else None
+                if last is None or (last.opcode is not COND_JUMP and last.opcode is not RETURN):
+                    flow.extend((b, s) for s in cfg.blocks[b].succs)
+            while changed_names:
+                for b, use in uses.get(changed_names.pop(), ()):
+                    if b not in executable:
+                        continue
+                    if isinstance(use, Phi):
+                        visit_phi(b, use)
+                    else:
+                        visit(b, use)
+        return executable, edges
+
+    def _constant(self, operand: Optional[int]) -> Optional[int]:
+        """The operand itself, or the constant it is known to hold."""
+        value = self._value(operand)
+        return value if value is not None and value is not OVERDEFINED else operand
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        self.optimization_log.begin(program)
+        self.lattice.clear()
+        self.types = operand_types(program, self.target.bits)
+        self.ssa = ssa = SSAForm(program)
+        # Rewritten instructions use SSA names
+        self.optimization_log.text = ssa.name
+        cfg = ssa.cfg
+        text = ssa.name
+        executable, edges = self._propagate(ssa)
+
+        # Branches that always go the same way
+        for b in ssa.order:
+            if b not in executable:
+                continue
+            for s in list(cfg.blocks[b].succs):
+                if (b, s) in edges:
+                    continue
+                ssa.remove_edge(b, s)
+                block = ssa.blocks[b]
+                branch = block[-1]
+                if s == cfg.label_blocks.get(branch.label):
+                    block[-1] = None
+                    reason = f'Removed branch never taken: {text(branch.arg1)} is always false'
+                else:
+                    block[-1] = jump(branch.label)
+                    reason = f'Branch always taken: {text(branch.arg1)} is always true'
+                if self.optimization_log.changes:
+                    self.optimization_log.change(ssa.origins[b][-1], block[-1], reason)
+
+        dead = {b for b in ssa.order if b not in executable}
+        for b in sorted(dead):
+            for origin in ssa.origins[b]:
+                if self.optimization_log.changes:
+                    self.optimization_log.change(origin, None, 'Removed unreachable code')
+        ssa.remove_blocks(dead)
+
+        constant = self._constant
+        for b in ssa.order:
+            kept = []
+            for phi in ssa.phis[b]:
+                if constant(phi.dest) == phi.dest:
+                    phi.args = [constant(arg) for arg in phi.args]
+                    kept.append(phi)
+            ssa.phis[b] = kept
+
+            block = ssa.blocks[b]
+            for pos, instr in enumerate(block):
+                if instr is None:
+                    continue
+                value = constant(instr.dest) if ssa.is_name(instr.dest) else instr.dest
+                if value is not None and value < 0:
+                    # Every use reads the constant instead
+                    block[pos] = None
+                    if self.optimization_log.changes:
+                        self.optimization_log.change(
+                            ssa.origins[b][pos], None,
+                            f'Propagated constant: {text(instr.dest)} = {text(value)}'
+                        )
+                    continue
+                arg1, arg2 = constant(instr.arg1), constant(instr.arg2)
+                if arg1 == instr.arg1 and arg2 == instr.arg2:
+                    continue
+                rewritten = Instruction(instr.opcode, instr.dest, instr.op, arg1, arg2, instr.label)
+                if instr.opcode is BINOP or instr.opcode is UNARYOP:
+                    # A store to a memory variable can still be folded
+                    folded = self._evaluate(rewritten)
+                    if folded is not None and folded is not OVERDEFINED:
+                        rewritten = assign(instr.dest, folded)
+                block[pos] = rewritten
+                if self.optimization_log.changes:
+                    self.optimization_log.change(
+                        ssa.origins[b][pos], rewritten,
+                        'Replaced variables with constant values'
+                    )
+
+        optimized = ssa.to_program()
+        self.touched = ssa.touched
+        self.changed = optimized is not program
+        self.ssa = None
+        self.types = {}
+        return optimized
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
@@ -1,77 +1,200 @@
 from typing import List, Dict, Any
+import math
 import operator
-from dataclasses import dataclass
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterable, List, Mapping, Tuple, Union
 
-@dataclass
-class OptimizationInfo:
-    original_tac: Dict[str, str]
-    optimized_tac: Optional[Dict[str, str]] = None
-    reason: str = ''
+from optimizer.optimization_log import OptimizationLog
+from optimizer.target import TargetProfile, get_target
+from tac_utils.c_types import (SHIFT_OPS, binary_result_type, convert, literal_text, literal_type, promote,
+                               unary_result_type, usual_arithmetic_type, width)
+from tac_utils.ir import BINOP, UNARYOP, Number, TACProgram, assign, ir_pass
 
-class ConstantFolder:
-    def __init__(self):
-        self.operators = {
-            '+': operator.add,
-            '-': operator.sub,
-            '*': operator.mul,
-            '/': operator.truediv,
-            '%': operator.mod,
-            '<<': operator.lshift,
-            '>>': operator.rshift,
-            '&': operator.and_,
-            '|': operator.or_,
-            '^': operator.xor
-        }
-        self.optimization_log: List[OptimizationInfo] = []
-
-    def _is_numeric(self, value: str) -> bool:
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
-
-    def _evaluate_constant(self, op: str, arg1: str, arg2: str) -> Optional[str]:
-        if op not in self.operators:
+# Shift counts beyond this are undefined for every C integer type
+MAX_SHIFT = 64
+
+def _c_div(a: int, b: int) -> int:
+    # C integer division truncates toward zero
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def _c_mod(a: int, b: int) -> int:
+    # The remainder takes the sign of the dividend, so a == (a / b) * b + a % b
+    return a - b * _c_div(a, b)
+
+# Operators folded when both operands are integer constants
+INT_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': _c_div,
+    '%': _c_mod,
+    '<<': operator.lshift,
+    '>>': operator.rshift,
+    '&': operator.and_,
+    '|': operator.or_,
+    '^': operator.xor,
+    # Comparisons and logical operators yield an int 0 or 1
+    '<': lambda a, b: int(a < b),
+    '>': lambda a, b: int(a > b),
+    '<=': lambda a, b: int(a <= b),
+    '>=': lambda a, b: int(a >= b),
+    '==': lambda a, b: int(a == b),
+    '!=': lambda a, b: int(a != b),
+    '&&': lambda a, b: int(bool(a) and bool(b)),
+    '||': lambda a, b: int(bool(a) or bool(b)),
+}
+
+# Operators folded when either operand is a floating-point constant
+FLOAT_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '<': INT_OPERATORS['<'],
+    '>': INT_OPERATORS['>'],
+    '<=': INT_OPERATORS['<='],
+    '>=': INT_OPERATORS['>='],
+    '==': INT_OPERATORS['=='],
+    '!=': INT_OPERATORS['!='],
+    '&&': INT_OPERATORS['&&'],
+    '||': INT_OPERATORS['||'],
+}
+
+def evaluate_binary(op: str, val1: Optional[Number], val2: Optional[Number]) -> Optional[Number]:
+    """Compute val1 op val2 as C would, or None if it cannot be folded."""
+    if val1 is None or val2 is None:
+        return None
+    if type(val1) is int and type(val2) is int:
+        if op not in INT_OPERATORS:
+            return None
+        if op in ('/', '%') and val2 == 0:
             return None
-        
-        try:
-            val1 = float(arg1)
-            val2 = float(arg2)
-            result = self.operators[op](val1, val2)
-            return str(int(result) if result.is_integer() else result)
-        except (ValueError, ZeroDivisionError):
+        if op in ('<<', '>>') and not 0 <= val2 < MAX_SHIFT:
             return None
+        return INT_OPERATORS[op](val1, val2)
+
+    if op not in FLOAT_OPERATORS:
+        return None
+    try:
+        result = FLOAT_OPERATORS[op](float(val1), float(val2))
+    except ZeroDivisionError:
+        return None
+    # Results that have no literal spelling are left for run time
+    return result if math.isfinite(result) else None
+
+def evaluate_unary(op: str, val: Optional[Number]) -> Optional[Number]:
+    """Compute op val as C would, or None if it cannot be folded."""
+    if val is None:
+        return None
+    if op == '!':
+        return int(not val)
+    if op == '-':
+        return -val
+    if op == '~' and type(val) is int:
+        return ~val
+    return None
+
+# A folded constant and its C type, or (None, None)
+Typed = Tuple[Optional[Number], Optional[str]]
+
+def fold_binary(op: str, val1: Number, type1: Optional[str], val2: Number, type2: Optional[str],
+                bits: Mapping[str, int]) -> Typed:
+    """
+    Compute val1 op val2 in the C types of the operands.
+
+    The operands are converted to the type the operation computes in (the
+    common type, or the promoted left operand of a shift), so whether the
+    arithmetic is integer or floating-point, and how it wraps, follows
+    the types rather than how the constants happen to be spelled.
+
+    Returns:
+        The result and its type, or (None, None) if a type is not known or
+        the result is not defined
+    """
+    result_type = binary_result_type(op, type1, type2, bits)
+    if result_type is None:
+        return None, None
+    if op in SHIFT_OPS:
+        val1, val2 = convert(val1, result_type, bits), convert(val2, promote(type2, bits), bits)
+        if not 0 <= val2 < width(result_type, bits):
+            return None, None
+    elif op != '&&' and op != '||':
+        common = usual_arithmetic_type(type1, type2, bits)
+        if common is None:
+            return None, None
+        val1, val2 = convert(val1, common, bits), convert(val2, common, bits)
+    result = evaluate_binary(op, val1, val2)
+    if result is not None:
+        result = convert(result, result_type, bits)
+    return (None, None) if result is None else (result, result_type)
+
+def fold_unary(op: str, val: Number, c_type: Optional[str], bits: Mapping[str, int]) -> Typed:
+    """Compute op val in the C type of the operand; see fold_binary()."""
+    result_type = unary_result_type(op, c_type, bits)
+    if result_type is None:
+        return None, None
+    if op != '!':
+        val = convert(val, result_type, bits)
+    result = evaluate_unary(op, val)
+    if result is not None:
+        result = convert(result, result_type, bits)
+    return (None, None) if result is None else (result, result_type)
+
+class ConstantFolder:
+    # Rewrites depend on a single instruction, so only dirty indices need revisiting
+    local = True
+    # Built for a target profile (see PassManager): constants are folded in its integer widths
+    targeted = True
+
+    def __init__(self, target: Union[str, TargetProfile, None] = None):
+        self.target = get_target(target)
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+
+    @ir_pass
+    def optimize(self, program: TACProgram, dirty: Optional[Iterable[int]] = None) -> TACProgram:
+        instructions = program.instructions
+        optimized = None  # Copied on first rewrite
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
+        symbols = program.symbols
+        values = symbols.values
+        bits = self.target.bits
+
+        def typed(operand: int):
+            return values[~operand], literal_type(symbols.text(operand), values[~operand], bits)
 
-    def optimize(self, tac_instructions: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        optimized = []
-        self.optimization_log.clear()
-
-        for instr in tac_instructions:
-            if 'arg2' in instr and instr['op'] in self.operators:
-                if self._is_numeric(instr['arg1']) and self._is_numeric(instr['arg2']):
-                    result = self._evaluate_constant(instr['op'], instr['arg1'], instr['arg2'])
-                    if result is not None:
-                        opt_instr = {
-                            'lhs': instr['lhs'],
-                            'op': '=',
-                            'arg1': result
-                        }
-                        self.optimization_log.append(
-                            OptimizationInfo(
-                                original_tac=instr,
-                                optimized_tac=opt_instr,
-                                reason=f'Folded constant expression: {instr["arg1"]} {instr["op"]} {instr["arg2"]} = {result}'
-                            )
-                        )
-                        optimized.append(opt_instr)
-                        continue
+        indices = range(len(instructions)) if dirty is None else sorted(dirty)
+        for idx in indices:
+            instr = instructions[idx]
+            # Constants are interned with negative IDs
+            result = None
+            if instr.opcode is BINOP and instr.arg1 < 0 and instr.arg2 < 0:
+                result, c_type = fold_binary(instr.op, *typed(instr.arg1), *typed(instr.arg2), bits)
+            elif instr.opcode is UNARYOP and instr.arg1 < 0:
+                result, c_type = fold_unary(instr.op, *typed(instr.arg1), bits)
+            if result is not None:
+                text = literal_text(result, c_type, bits)
+                opt_instr = assign(instr.dest, symbols.constant(text, result))
+                if log.changes:
+                    if instr.opcode is BINOP:
+                        expression = f'{symbols.text(instr.arg1)} {instr.op} {symbols.text(instr.arg2)}'
+                    else:
+                        expression = f'{instr.op}{symbols.text(instr.arg1)}'
+                    log.change(instr, opt_instr, f'Folded constant expression: {expression} = {text}')
+                if optimized is None:
+                    optimized = list(instructions)
+                optimized[idx] = opt_instr
+                self.touched.append(idx)
+                continue
             
-            optimized.append(instr)
-            self.optimization_log.append(OptimizationInfo(original_tac=instr))
+            if log.full:
+                log.keep(instr)
 
-        return optimized
+        self.changed = optimized is not None
+        return program.derive(optimized) if self.changed else program
 
-    def get_optimization_log(self) -> List[OptimizationInfo]:
-        return self.optimization_log
\ No newline at end of file
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
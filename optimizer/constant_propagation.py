@@ -1,85 +1,113 @@
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
 
-@dataclass
-class OptimizationInfo:
-    original_tac: Dict[str, str]
-    optimized_tac: Optional[Dict[str, str]] = None
-    reason: str = ''
+from optimizer.optimization_log import OptimizationLog
+from optimizer.target import TargetProfile, get_target
+from tac_utils.c_types import assigned_constant, operand_types
+from tac_utils.cfg import region_starts
+from tac_utils.ir import ASSIGN, BINOP, COND_JUMP, LABEL, RETURN, UNARYOP, Instruction, TACProgram, ir_pass
 
 class ConstantPropagator:
-    def __init__(self):
-        self.constant_map: Dict[str, str] = {}
-        self.optimization_log: List[OptimizationInfo] = []
+    # Facts are reset at every label, so basic blocks can be optimized independently
+    block_local = True
+    # Built for a target profile (see PassManager): constants are converted in its integer widths
+    targeted = True
 
-    def _is_numeric(self, value: str) -> bool:
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+    def __init__(self, target: Union[str, TargetProfile, None] = None):
+        self.target = get_target(target)
+        # Maps variable IDs to the constant operand IDs they currently hold,
+        # converted to the variable's type
+        self.constant_map: Dict[int, int] = {}
+        self.types: Dict[int, Optional[str]] = {}
+        self.program: Optional[TACProgram] = None
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
 
-    def _update_constant_map(self, lhs: str, arg1: str) -> None:
-        if self._is_numeric(arg1):
-            self.constant_map[lhs] = arg1
+    def _update_constant_map(self, lhs: int, arg1: int) -> None:
+        # If arg1 is a variable that maps to a constant, propagate that constant
+        constant = arg1 if arg1 < 0 else self.constant_map.get(arg1)
+        if constant is not None:
+            # The assignment converts the constant to the type of lhs
+            constant = assigned_constant(self.program.symbols, constant, self.types.get(lhs), self.target.bits)
+        if constant is not None:
+            self.constant_map[lhs] = constant
         else:
-            # If arg1 is a variable that maps to a constant, propagate that constant
-            if arg1 in self.constant_map:
-                self.constant_map[lhs] = self.constant_map[arg1]
-            else:
-                # If arg1 is not a constant or doesn't map to one, remove any previous mapping
-                self.constant_map.pop(lhs, None)
+            # If arg1 is not a constant or doesn't map to one, remove any previous mapping
+            self.constant_map.pop(lhs, None)
 
-    def optimize(self, tac_instructions: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
         optimized = []
-        self.optimization_log.clear()
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
         self.constant_map.clear()
+        self.program = program
+        self.types = operand_types(program, self.target.bits)
+        constant_map = self.constant_map
+        text = program.symbols.text
+
+        regions = region_starts(program)
+        for idx, instr in enumerate(program.instructions):
+            opcode = instr.opcode
+
+            # Control can reach a label from elsewhere, so nothing known
+            # about variables survives into a new basic block (or function)
+            if opcode is LABEL or idx in regions:
+                constant_map.clear()
 
-        for instr in tac_instructions:
-            opt_instr = instr.copy()
-            
             # Handle simple assignments
-            if instr['op'] == '=' and 'arg2' not in instr:
-                self._update_constant_map(instr['lhs'], instr['arg1'])
+            if opcode is ASSIGN:
+                arg1 = instr.arg1
+                self._update_constant_map(instr.dest, arg1)
                 
                 # If we're assigning from a variable that maps to a constant
-                if instr['arg1'] in self.constant_map:
-                    opt_instr['arg1'] = self.constant_map[instr['arg1']]
-                    self.optimization_log.append(
-                        OptimizationInfo(
-                            original_tac=instr,
-                            optimized_tac=opt_instr,
-                            reason=f'Propagated constant: {instr["arg1"]} -> {opt_instr["arg1"]}'
-                        )
-                    )
+                if arg1 in constant_map:
+                    opt_instr = Instruction(opcode, instr.dest, None, constant_map[arg1])
+                    if log.changes:
+                        log.change(instr, opt_instr, f'Propagated constant: {text(arg1)} -> {text(opt_instr.arg1)}')
+                    self.touched.append(len(optimized))
                     optimized.append(opt_instr)
                     continue
+
+                optimized.append(instr)
+                if log.full:
+                    log.keep(instr)
+                continue
             
-            # Handle binary operations
-            if 'arg2' in instr:
-                # Replace variables with their constant values if available
-                if instr['arg1'] in self.constant_map:
-                    opt_instr['arg1'] = self.constant_map[instr['arg1']]
-                if instr['arg2'] in self.constant_map:
-                    opt_instr['arg2'] = self.constant_map[instr['arg2']]
-                
-                # If both operands are now constants, this will be handled by constant folding
-                if opt_instr != instr:
-                    self.optimization_log.append(
-                        OptimizationInfo(
-                            original_tac=instr,
-                            optimized_tac=opt_instr,
-                            reason='Replaced variables with constant values'
-                        )
-                    )
-                    optimized.append(opt_instr)
-                    continue
+            # Replace operands with their constant values if available
+            opt_instr = instr
+            if opcode is BINOP:
+                arg1 = constant_map.get(instr.arg1, instr.arg1)
+                arg2 = constant_map.get(instr.arg2, instr.arg2)
+                if arg1 != instr.arg1 or arg2 != instr.arg2:
+                    opt_instr = Instruction(opcode, instr.dest, instr.op, arg1, arg2)
+            elif opcode is UNARYOP or opcode is COND_JUMP or (opcode is RETURN and instr.arg1 is not None):
+                arg1 = constant_map.get(instr.arg1, instr.arg1)
+                if arg1 != instr.arg1:
+                    opt_instr = Instruction(opcode, instr.dest, instr.op, arg1, None, instr.label)
+
+            # The result of an operation is no longer a known constant
+            if instr.dest is not None:
+                constant_map.pop(instr.dest, None)
+
+            # If both operands are now constants, this will be handled by constant folding
+            if opt_instr is not instr:
+                if log.changes:
+                    log.change(instr, opt_instr, 'Replaced variables with constant values')
+                self.touched.append(len(optimized))
+                optimized.append(opt_instr)
+                continue
             
             # If no optimization was possible, keep the original instruction
             optimized.append(instr)
-            self.optimization_log.append(OptimizationInfo(original_tac=instr))
+            if log.full:
+                log.keep(instr)
 
-        return optimized
+        self.program = None
+        self.types = {}
+        self.changed = bool(self.touched)
+        return program.derive(optimized) if self.changed else program
 
-    def get_optimization_log(self) -> List[OptimizationInfo]:
-        return self.optimization_log
\ No newline at end of file
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
@@ -1,40 +1,35 @@
 from typing import Dict, List, Optional, Set
-from dataclasses import dataclass
 
-@dataclass
-class OptimizationInfo:
-    original_tac: Dict[str, str]
-    optimized_tac: Optional[Dict[str, str]] = None
-    reason: str = ''
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.c_types import LP64_BITS, operand_types
+from tac_utils.cfg import region_starts
+from tac_utils.ir import ASSIGN, LABEL, Instruction, TACProgram, ir_pass
 
 class CopyPropagator:
-    def __init__(self):
-        self.optimization_log: List[OptimizationInfo] = []
-        self.copy_map: Dict[str, str] = {}
-        self.modified_variables: Set[str] = set()
-
-    def _is_copy_instruction(self, instr: Dict[str, str]) -> bool:
-        return (
-            'op' in instr and
-            instr['op'] == '=' and
-            'arg2' not in instr and
-            not self._is_numeric(instr['arg1'])
-        )
-
-    def _is_numeric(self, value: str) -> bool:
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+    # Facts are reset at every label, so basic blocks can be optimized independently
+    block_local = True
 
-    def _update_copy_map(self, lhs: str, rhs: str) -> None:
-        # If rhs is already mapped, use its mapping
-        actual_rhs = self.copy_map.get(rhs, rhs)
-        self.copy_map[lhs] = actual_rhs
-
-    def _invalidate_copies(self, var: str) -> None:
-        # Remove all mappings that use the modified variable
+    def __init__(self):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        self.copy_map: Dict[int, int] = {}
+        self.modified_variables: Set[int] = set()
+        self.types: Dict[int, Optional[str]] = {}
+
+    def _is_copy_instruction(self, instr: Instruction) -> bool:
+        # Constants are interned with negative IDs
+        return instr.opcode is ASSIGN and instr.arg1 >= 0
+
+    def _update_copy_map(self, lhs: int, rhs: int) -> None:
+        # rhs has already been resolved through the map by the caller. A copy
+        # to a variable of another type converts the value, so lhs is not rhs.
+        if rhs != lhs and self.types.get(lhs) == self.types.get(rhs):
+            self.copy_map[lhs] = rhs
+
+    def _invalidate_copies(self, var: int) -> None:
+        # Remove the variable's own mapping and all mappings that use it
+        self.copy_map.pop(var, None)
         invalid_copies = [
             v for v, mapped in self.copy_map.items()
             if mapped == var
@@ -42,64 +37,71 @@ class CopyPropagator:
         for v in invalid_copies:
             self.copy_map.pop(v)
 
-    def optimize(self, tac_instructions: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        self.optimization_log.clear()
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
         self.copy_map.clear()
         self.modified_variables.clear()
+        self.types = operand_types(program, LP64_BITS)
+        copy_map = self.copy_map
+        text = program.symbols.text
 
         optimized = []
-        for instr in tac_instructions:
+        regions = region_starts(program)
+        for idx, instr in enumerate(program.instructions):
+            # Copies made in other basic blocks may not hold at a label, and
+            # none carry over from one function into the next
+            if instr.opcode is LABEL or idx in regions:
+                copy_map.clear()
+
             if self._is_copy_instruction(instr):
                 # Handle copy instruction
-                lhs, rhs = instr['lhs'], instr['arg1']
-                self._update_copy_map(lhs, rhs)
+                lhs, rhs = instr.dest, instr.arg1
+                actual_rhs = copy_map.get(rhs, rhs)
+                self._invalidate_copies(lhs)
+                self.modified_variables.add(lhs)
+                self._update_copy_map(lhs, actual_rhs)
 
                 # If we can propagate a copy
-                if rhs in self.copy_map:
-                    opt_instr = instr.copy()
-                    opt_instr['arg1'] = self.copy_map[rhs]
+                if actual_rhs != rhs:
+                    opt_instr = Instruction(ASSIGN, lhs, None, actual_rhs)
+                    self.touched.append(len(optimized))
                     optimized.append(opt_instr)
-                    self.optimization_log.append(
-                        OptimizationInfo(
-                            original_tac=instr,
-                            optimized_tac=opt_instr,
-                            reason=f'Propagated copy: {rhs} -> {self.copy_map[rhs]}'
-                        )
-                    )
-                    continue
+                    if log.changes:
+                        log.change(instr, opt_instr, f'Propagated copy: {text(rhs)} -> {text(actual_rhs)}')
+                else:
+                    optimized.append(instr)
+                    if log.full:
+                        log.keep(instr)
+                continue
+
+            # Try to propagate copies in arguments (uses happen before the definition)
+            arg1 = copy_map.get(instr.arg1, instr.arg1)
+            arg2 = copy_map.get(instr.arg2, instr.arg2)
+            modified = arg1 != instr.arg1 or arg2 != instr.arg2
 
             # For non-copy instructions
-            if 'lhs' in instr:
+            if instr.dest is not None:
                 # Variable is being modified, invalidate copies
-                self._invalidate_copies(instr['lhs'])
-                self.modified_variables.add(instr['lhs'])
-
-            # Try to propagate copies in arguments
-            opt_instr = instr.copy()
-            modified = False
-
-            if 'arg1' in instr and instr['arg1'] in self.copy_map:
-                opt_instr['arg1'] = self.copy_map[instr['arg1']]
-                modified = True
-
-            if 'arg2' in instr and instr['arg2'] in self.copy_map:
-                opt_instr['arg2'] = self.copy_map[instr['arg2']]
-                modified = True
+                self._invalidate_copies(instr.dest)
+                self.modified_variables.add(instr.dest)
 
             if modified:
+                opt_instr = Instruction(instr.opcode, instr.dest, instr.op, arg1, arg2, instr.label)
+                self.touched.append(len(optimized))
                 optimized.append(opt_instr)
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        optimized_tac=opt_instr,
-                        reason='Propagated copied variables in expression'
-                    )
-                )
+                if log.changes:
+                    log.change(instr, opt_instr, 'Propagated copied variables in expression')
             else:
                 optimized.append(instr)
-                self.optimization_log.append(OptimizationInfo(original_tac=instr))
+                if log.full:
+                    log.keep(instr)
 
-        return optimized
+        self.types = {}
+        self.changed = bool(self.touched)
+        return program.derive(optimized) if self.changed else program
 
-    def get_optimization_log(self) -> List[OptimizationInfo]:
-        return self.optimization_log
\ No newline at end of file
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
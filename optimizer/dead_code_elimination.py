@@ -1,90 +1,125 @@
-from typing import Dict, List, Optional, Set
-from dataclasses import dataclass
+from typing import Dict, List, Set
 
-@dataclass
-class OptimizationInfo:
-    original_tac: Dict[str, str]
-    optimized_tac: Optional[Dict[str, str]] = None
-    reason: str = ''
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.cfg import ControlFlowGraph
+from tac_utils.ir import Instruction, TACProgram, ir_pass
 
 class DeadCodeEliminator:
-    def __init__(self):
-        self.optimization_log: List[OptimizationInfo] = []
-        self.used_variables: Set[str] = set()
-        self.defined_variables: Dict[str, List[int]] = {}
+    """
+    Deletes assignments whose value is never needed.
 
-    def _mark_used_variables(self, instr: Dict[str, str], idx: int) -> None:
-        # Mark variables used in arguments
-        if 'arg1' in instr and not self._is_numeric(instr['arg1']):
-            self.used_variables.add(instr['arg1'])
-        if 'arg2' in instr and not self._is_numeric(instr['arg2']):
-            self.used_variables.add(instr['arg2'])
-        
-        # Record variable definitions
-        if 'lhs' in instr:
-            if instr['lhs'] not in self.defined_variables:
-                self.defined_variables[instr['lhs']] = []
-            self.defined_variables[instr['lhs']].append(idx)
+    A backward liveness analysis over the control-flow graph finds, for
+    every definition, whether the value can still be read. Only reads by
+    instructions that are themselves kept count (strong liveness), so a
+    chain of temporaries feeding a dead store, or a variable that only
+    updates itself in a loop, goes in a single run. Labels, jumps and
+    returns are always kept, as are stores to variables shared with
+    top-level code.
 
-    def _is_numeric(self, value: str) -> bool:
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+    Names that can be live across a block boundary are tracked in integer
+    bitsets (one bit per name, see ControlFlowGraph.number_names); names
+    that never leave their block only need a set during the block's scan.
+    """
 
-    def _is_critical_instruction(self, instr: Dict[str, str]) -> bool:
-        # Instructions that must be preserved (e.g., function calls, I/O operations)
-        critical_ops = {'call', 'return', 'print', 'input', 'goto', 'if', 'label'}
-        return instr['op'] in critical_ops
+    def __init__(self):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
 
-    def optimize(self, tac_instructions: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        self.optimization_log.clear()
-        self.used_variables.clear()
-        self.defined_variables.clear()
-        
-        # First pass: Mark all used variables and collect definitions
-        for idx, instr in enumerate(tac_instructions):
-            if self._is_critical_instruction(instr):
-                self._mark_used_variables(instr, idx)
-                if 'lhs' in instr:
-                    self.used_variables.add(instr['lhs'])
-            else:
-                self._mark_used_variables(instr, idx)
+    @staticmethod
+    def _scan_block(instructions: List[Instruction], start: int, end: int, live: int,
+                    name_bits: Dict[int, int], shared: Set[int], dead: bytearray) -> int:
+        """
+        Walk a block backwards from the names live at its end, flagging dead
+        definitions in ``dead``; returns the names live at its start.
+        """
+        local: Set[int] = set()
+        for idx in range(end - 1, start - 1, -1):
+            instr = instructions[idx]
+            dest = instr.dest
+            if dest is not None and dest not in shared:
+                bit = name_bits.get(dest)
+                if bit is None:
+                    needed = dest in local
+                    local.discard(dest)
+                else:
+                    mask = 1 << bit
+                    needed = live & mask
+                    if needed:
+                        live ^= mask
+                if not needed:
+                    dead[idx] = 1
+                    continue
+            dead[idx] = 0
+            for arg in (instr.arg1, instr.arg2):
+                if arg is not None and arg >= 0:
+                    bit = name_bits.get(arg)
+                    if bit is None:
+                        local.add(arg)
+                    else:
+                        live |= 1 << bit
+        return live
 
-        # Second pass: Eliminate dead code
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
+        tac_instructions = program.instructions
+        text = program.symbols.text
+
+        # Iterate the liveness equations to a fixed point. A block is
+        # rescanned only when the names live at its end change; live sets
+        # only grow, so a definition found live stays live.
+        cfg = ControlFlowGraph(program)
+        name_bits = cfg.number_names()
+        shared = cfg.shared_names()
+        blocks = cfg.blocks
+        live_in = [0] * len(blocks)
+        live_out = [0] * len(blocks)
+        scanned = [False] * len(blocks)
+        dead = bytearray(len(tac_instructions))
+        order = cfg.postorder()
+        changed = True
+        while changed:
+            changed = False
+            for b in order:
+                block = blocks[b]
+                out = 0
+                for s in block.succs:
+                    out |= live_in[s]
+                if scanned[b] and out == live_out[b]:
+                    continue
+                live_out[b] = out
+                scanned[b] = True
+                new_in = self._scan_block(tac_instructions, block.start, block.end, out, name_bits, shared, dead)
+                if new_in != live_in[b]:
+                    live_in[b] = new_in
+                    changed = True
+
+        # Drop the dead definitions, remembering where function boundaries end up
         optimized = []
+        boundaries = {pos for _, start, end in program.functions for pos in (start, end)}
+        moved: Dict[int, int] = {}
         for idx, instr in enumerate(tac_instructions):
-            if self._is_critical_instruction(instr):
-                # Keep all critical instructions
-                optimized.append(instr)
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        optimized_tac=instr,
-                        reason='Critical instruction preserved'
-                    )
-                )
-            elif 'lhs' in instr and instr['lhs'] not in self.used_variables:
-                # Skip instructions that define unused variables
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        reason=f'Eliminated dead code: variable {instr["lhs"]} is never used'
-                    )
-                )
+            if idx in boundaries:
+                moved[idx] = len(optimized)
+            if dead[idx]:
+                # The instruction that ends up in this position gets a new neighbour
+                if not self.touched or self.touched[-1] != len(optimized):
+                    self.touched.append(len(optimized))
+                if log.changes:
+                    log.change(instr, None, f'Eliminated dead code: value of {text(instr.dest)} is never used')
             else:
-                # Keep instructions with used variables
                 optimized.append(instr)
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        optimized_tac=instr,
-                        reason='Instruction uses live variables'
-                    )
-                )
+                if log.full:
+                    log.keep(instr)
+
+        moved[len(tac_instructions)] = len(optimized)
+        functions = [(name, moved[start], moved[end]) for name, start, end in program.functions]
 
-        return optimized
+        self.changed = bool(self.touched)
+        return program.derive(optimized, functions) if self.changed else program
 
-    def get_optimization_log(self) -> List[OptimizationInfo]:
-        return self.optimization_log
\ No newline at end of file
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
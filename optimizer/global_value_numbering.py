@@ -0,0 +1,141 @@
+from typing import Dict, List, Optional, Tuple
+
+from optimizer.common_subexpression_elimination import COMMUTATIVE_OPS
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.ir import ASSIGN, BINOP, UNARYOP, Instruction, TACProgram, ir_pass
+from tac_utils.ssa import SSAForm
+
+class GlobalValueNumberer:
+    """
+    Dominator-based global value numbering over SSA form.
+
+    The dominator tree is walked with a scoped table of expressions keyed
+    on (opcode, op, value number, value number), so a computation is
+    reused anywhere its first occurrence dominates it. A name's value
+    number is the name whose value it is known to hold: copies take their
+    source's, and phis whose operands all have the same value number
+    (or that repeat another phi of the same block) take that one. Copies
+    are left alone; only redundant computations and phis are deleted and
+    their uses rewritten.
+    """
+
+    def __init__(self):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        # Maps SSA names to the name (or constant) holding the same value
+        self.values: Dict[int, int] = {}
+        # Maps deleted names to the name that replaces them
+        self.replaced: Dict[int, int] = {}
+
+    def _number(self, operand: Optional[int]) -> Optional[int]:
+        return self.values.get(operand, operand)
+
+    def _expression_key(self, ssa: SSAForm, instr: Instruction) -> Optional[Tuple]:
+        opcode = instr.opcode
+        if (opcode is not BINOP and opcode is not UNARYOP) or not ssa.is_name(instr.dest):
+            return None
+        arg1, arg2 = self._number(instr.arg1), self._number(instr.arg2)
+        for arg in (arg1, arg2):
+            # Memory variables may change between two computations
+            if arg is not None and arg >= 0 and not ssa.is_name(arg):
+                return None
+        if arg1 is None or (opcode is BINOP and arg2 is None):
+            return None
+        if instr.op in COMMUTATIVE_OPS and arg2 is not None and arg2 < arg1:
+            arg1, arg2 = arg2, arg1
+        return (opcode, instr.op, arg1, arg2)
+
+    def _replace(self, name: int, leader: int) -> None:
+        self.values[name] = leader
+        self.replaced[name] = leader
+
+    def _number_block(self, ssa: SSAForm, b: int, available: Dict[Tuple, int]) -> List[Tuple]:
+        """Value-number block b, deleting redundant phis and computations; returns the keys it added."""
+        added = []
+        kept = []
+        for phi in ssa.phis[b]:
+            args = tuple(self._number(arg) for arg in phi.args)
+            operands = {arg for arg in args if arg is not None and arg != phi.dest}
+            if len(operands) == 1:
+                # Every path brings the same value
+                self._replace(phi.dest, operands.pop())
+                continue
+            key = ('phi', b, args)
+            previous = available.get(key)
+            if previous is not None:
+                self._replace(phi.dest, previous)
+                continue
+            available[key] = phi.dest
+            added.append(key)
+            kept.append(phi)
+        ssa.phis[b] = kept
+
+        block = ssa.blocks[b]
+        for pos, instr in enumerate(block):
+            if instr.opcode is ASSIGN:
+                if ssa.is_name(instr.dest) and (instr.arg1 < 0 or ssa.is_name(instr.arg1)):
+                    self.values[instr.dest] = self._number(instr.arg1)
+                continue
+            key = self._expression_key(ssa, instr)
+            if key is None:
+                continue
+            previous = available.get(key)
+            if previous is None:
+                available[key] = instr.dest
+                added.append(key)
+                continue
+            self._replace(instr.dest, previous)
+            block[pos] = None
+            if self.optimization_log.changes:
+                self.optimization_log.change(
+                    ssa.origins[b][pos], None,
+                    f'Eliminated redundant computation: {ssa.name(instr.dest)} = {ssa.name(previous)}'
+                )
+        return added
+
+    def _rewrite_uses(self, ssa: SSAForm) -> None:
+        """Replace every use of a deleted name by the name it was found equal to."""
+        replaced = self.replaced
+        if not replaced:
+            return
+        for b in ssa.order:
+            for phi in ssa.phis[b]:
+                phi.args = [replaced.get(arg, arg) for arg in phi.args]
+            block = ssa.blocks[b]
+            for pos, instr in enumerate(block):
+                if instr is None:
+                    continue
+                arg1, arg2 = replaced.get(instr.arg1, instr.arg1), replaced.get(instr.arg2, instr.arg2)
+                if arg1 != instr.arg1 or arg2 != instr.arg2:
+                    block[pos] = Instruction(instr.opcode, instr.dest, instr.op, arg1, arg2, instr.label)
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        self.optimization_log.begin(program)
+        self.values.clear()
+        self.replaced.clear()
+        ssa = SSAForm(program)
+        cfg = ssa.cfg
+
+        # Walk the dominator tree, dropping a block's expressions when
+        # leaving its subtree
+        available: Dict[Tuple, int] = {}
+        work: List[Tuple[int, Optional[List[Tuple]]]] = [(entry, None) for entry in reversed(cfg.entries)]
+        while work:
+            b, added = work.pop()
+            if added is not None:
+                for key in added:
+                    del available[key]
+                continue
+            work.append((b, self._number_block(ssa, b, available)))
+            work.extend((child, None) for child in reversed(cfg.dom_children[b]))
+
+        self._rewrite_uses(ssa)
+        optimized = ssa.to_program()
+        self.touched = ssa.touched
+        self.changed = optimized is not program
+        return optimized
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
@@ -0,0 +1,592 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.c_types import LP64_BITS, SHIFT_OPS, is_integer, is_unsigned, operand_types
+from tac_utils.cfg import ControlFlowGraph, Loop
+from tac_utils.ir import (
+    ASSIGN, BINOP, COND_JUMP, JUMP, LABEL, UNARYOP, Instruction, TACProgram, assign, binop, cond_jump, ir_pass,
+    jump, label,
+)
+
+# Operators that trap on a zero divisor or on a shift count that is negative
+# or not below the width of the shifted value, so they are only computed on
+# paths that computed them before
+TRAPPING_OPS = frozenset(('/', '%')) | SHIFT_OPS
+
+# Each relation and the one that holds with both sides multiplied by a
+# negative number (or with its operands swapped)
+MIRRORED = {'<': '>', '>': '<', '<=': '>=', '>=': '<=', '==': '==', '!=': '!='}
+
+def loops_inner_first(cfg: ControlFlowGraph) -> List[Loop]:
+    """Natural loops, innermost first, so code hoisted out of a loop can be hoisted again by its parent."""
+    return sorted(cfg.loops, key=lambda loop: (-loop.depth, cfg.blocks[loop.header].start))
+
+def touched_positions(original: List[Instruction], optimized: List[Instruction]) -> List[int]:
+    """
+    Positions of new instructions in ``optimized``, and of the instructions
+    right after a deletion, given that the instructions kept from
+    ``original`` are the same objects in the same order.
+    """
+    index = {id(instr): pos for pos, instr in enumerate(original)}
+    touched = []
+    expected = 0
+    for pos, instr in enumerate(optimized):
+        old = index.get(id(instr))
+        if old is None:
+            touched.append(pos)
+            continue
+        if old != expected:
+            touched.append(pos)
+        expected = old + 1
+    if expected != len(original):
+        touched.append(len(optimized))
+    return touched
+
+class LoopEdits:
+    """
+    Insertions, replacements and deletions planned against one program and
+    applied together, so positions found in the analysis stay valid.
+
+    Code for a loop's preheader goes right in front of the loop header. If
+    control can also reach the header by jumping to it from outside the
+    loop, the code gets a new label and those jumps are retargeted to it.
+    """
+
+    def __init__(self, program: TACProgram):
+        self.program = program
+        self.before: Dict[int, List[Instruction]] = {}
+        self.after: Dict[int, List[Instruction]] = {}
+        self.replace: Dict[int, Instruction] = {}
+        self.delete: Set[int] = set()
+        self._preheaders: Dict[int, int] = {}
+        labels = [instr.label for instr in program.instructions if instr.opcode is LABEL]
+        self._next_label = 1 + max((int(l) for l in labels if l.isdigit()), default=-1)
+
+    def __bool__(self) -> bool:
+        return bool(self.before or self.after or self.replace or self.delete)
+
+    def preheader(self, cfg: ControlFlowGraph, loop: Loop) -> Optional[int]:
+        """
+        Position before which code runs once each time the loop is entered,
+        or None when the loop has no such place (a block inside the loop
+        falls through into the header).
+        """
+        if loop.header in self._preheaders:
+            return self._preheaders[loop.header]
+        instructions = self.program.instructions
+        header = cfg.blocks[loop.header]
+        previous = header.index - 1
+        if (previous in loop.blocks and previous in header.preds
+                and instructions[cfg.blocks[previous].end - 1].opcode is not JUMP):
+            return None
+
+        jumpers = []
+        for p in header.preds:
+            last = instructions[cfg.blocks[p].end - 1]
+            if (p not in loop.blocks and (last.opcode is JUMP or last.opcode is COND_JUMP)
+                    and last.label == header.label):
+                jumpers.append(cfg.blocks[p].end - 1)
+        if jumpers:
+            name = str(self._next_label)
+            self._next_label += 1
+            self.before.setdefault(header.start, []).insert(0, label(name))
+            for pos in jumpers:
+                last = instructions[pos]
+                self.replace[pos] = jump(name) if last.opcode is JUMP else cond_jump(last.arg1, name)
+        self._preheaders[loop.header] = header.start
+        return header.start
+
+    def apply(self) -> TACProgram:
+        """Build the edited program, moving function ranges along with their code."""
+        program = self.program
+        out: List[Instruction] = []
+        new_start: List[int] = []
+        for pos, instr in enumerate(program.instructions):
+            new_start.append(len(out))
+            out.extend(self.before.get(pos, ()))
+            if pos not in self.delete:
+                out.append(self.replace.get(pos, instr))
+            out.extend(self.after.get(pos, ()))
+        new_start.append(len(out))
+        functions = [(name, new_start[start], new_start[end]) for name, start, end in program.functions]
+        return program.derive(out, functions)
+
+def can_trap(symbols, instr: Instruction) -> bool:
+    """Whether ``instr`` traps for some values of its operands."""
+    if instr.op not in TRAPPING_OPS:
+        return False
+    if instr.op in SHIFT_OPS:
+        # The shifted value is promoted to at least int, so any count below
+        # the width of int is in range
+        count = symbols.int_value(instr.arg2)
+        return count is None or not 0 <= count < LP64_BITS['int']
+    return not symbols.value(instr.arg2)
+
+def _copy(instr: Instruction) -> Instruction:
+    return Instruction(instr.opcode, instr.dest, instr.op, instr.arg1, instr.arg2, instr.label)
+
+class LoopInvariantCodeMotion:
+    """
+    Moves computations whose value does not change inside a loop into the
+    loop's preheader, so they run once per entry instead of once per
+    iteration.
+
+    A computation is invariant when each operand is a constant, has no
+    definition in the loop, or is the result of an invariant computation
+    that was moved. It is moved when its destination has no other
+    definition in the loop and is not live into the header (no use in the
+    loop can see an older value), and either its block dominates every
+    exit of the loop or the destination is dead after the loop (so a loop
+    that runs zero times leaves no trace). Division, modulo and shifts,
+    which can trap, are only moved from blocks dominating the exits unless
+    the divisor is a non-zero constant or the shift count a constant below
+    the width of int. Loops are processed innermost first,
+    repeating until nothing moves, so code travels out of a whole nest.
+    """
+
+    def __init__(self):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+
+    def _hoist(self, cfg: ControlFlowGraph, loop: Loop, edits: LoopEdits, order: Dict[int, int]) -> bool:
+        program = cfg.program
+        instructions = program.instructions
+        live_in, _ = cfg.liveness()
+        name_bits = cfg.name_bits
+        blocks = sorted((b for b in loop.blocks if b in order), key=order.__getitem__)
+
+        defs: Dict[int, int] = {}
+        for b in blocks:
+            for instr in cfg.instructions(b):
+                if instr.dest is not None:
+                    defs[instr.dest] = defs.get(instr.dest, 0) + 1
+
+        exits = loop.exits(cfg)
+        exit_live = 0
+        for _, outside in exits:
+            exit_live |= live_in[outside]
+        header_live = live_in[loop.header]
+
+        moved: List[int] = []
+        hoisted: Set[int] = set()
+        for b in blocks:
+            dominates_exits = all(cfg.dominates(b, inside) for inside, _ in exits)
+            block = cfg.blocks[b]
+            for pos in range(block.start, block.end):
+                instr = instructions[pos]
+                dest = instr.dest
+                opcode = instr.opcode
+                if (opcode is not BINOP and opcode is not UNARYOP and opcode is not ASSIGN) or dest is None:
+                    continue
+                if defs[dest] != 1:
+                    continue
+                if not all(arg is None or arg < 0 or arg not in defs or arg in hoisted
+                           for arg in (instr.arg1, instr.arg2)):
+                    continue
+                bit = name_bits.get(dest)
+                if bit is not None and header_live >> bit & 1:
+                    continue
+                if not dominates_exits:
+                    if (bit is not None and exit_live >> bit & 1) or dest in cfg.shared_names():
+                        continue
+                    if can_trap(program.symbols, instr):
+                        continue
+                moved.append(pos)
+                hoisted.add(dest)
+
+        if not moved:
+            return False
+        site = edits.preheader(cfg, loop)
+        if site is None:
+            return False
+        header = cfg.blocks[loop.header]
+        target = f'L{header.label}' if header.label is not None else f'block {header.index}'
+        code = edits.before.setdefault(site, [])
+        for pos in moved:
+            instr = instructions[pos]
+            new = _copy(instr)
+            code.append(new)
+            edits.delete.add(pos)
+            if self.optimization_log.changes:
+                self.optimization_log.change(instr, new, f'Hoisted loop-invariant computation: out of the loop at {target}')
+        return True
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        self.optimization_log.begin(program)
+        original = program.instructions
+        self.changed = False
+        while True:
+            cfg = ControlFlowGraph(program)
+            order = {b: i for i, b in enumerate(cfg.reverse_postorder())}
+            edits = LoopEdits(program)
+            # A loop's analysis is stale once code moved out of a loop nested in it
+            stale: Set[int] = set()
+            for loop in loops_inner_first(cfg):
+                if loop.header in stale:
+                    continue
+                if self._hoist(cfg, loop, edits, order):
+                    parent = loop.parent
+                    while parent is not None:
+                        stale.add(parent.header)
+                        parent = parent.parent
+            if not edits:
+                break
+            program = edits.apply()
+            self.changed = True
+
+        self.touched = touched_positions(original, program.instructions) if self.changed else []
+        return program
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
+
+class _InductionVariable:
+    """A basic induction variable: a name changed by a constant step once per pass through its update."""
+    __slots__ = ('name', 'step', 'update', 'chain')
+
+    def __init__(self, name: int, step: int, update: int, chain: List[int]):
+        self.name = name
+        self.step = step
+        self.update = update  # Position of the instruction that assigns the new value
+        self.chain = chain    # Positions of the instructions computing it
+
+class _Linear:
+    """
+    A derived induction variable, ``(i + offset) * coefficient * factors``
+    for a basic variable ``i``, invariant ``factors`` and some invariant offset.
+    """
+    __slots__ = ('iv', 'coefficient', 'factors', 'chain')
+
+    def __init__(self, iv: _InductionVariable, coefficient: int, factors: Tuple[int, ...], chain: Tuple[int, ...]):
+        self.iv = iv
+        self.coefficient = coefficient
+        self.factors = factors  # Loop-invariant variables multiplied in
+        self.chain = chain      # Positions of the instructions computing it from i, in order
+
+class InductionVariableOptimizer:
+    """
+    Strength-reduces multiplications of induction variables in loops and
+    removes induction variables that are no longer needed.
+
+    A basic induction variable ``i`` has a single definition in the loop,
+    ``i = i + c`` or ``i = i - c`` for a constant ``c`` (or the generator's
+    ``t = i + c; i = t``). Values computed from ``i`` with loop invariants
+    by ``+``, ``-`` and ``*`` are linear in ``i``. Each multiplication
+    among them, such as ``j = i * k`` or ``j = (i + b) << 2``, becomes a
+    copy of a new temporary that is set to the same expression in the
+    preheader and advanced by ``c * k`` right after every update of ``i``.
+    If ``i`` is then only used by its update and by comparisons with loop
+    invariants, and is dead after the loop, the comparisons are rewritten
+    to test a temporary ``i * k`` for a constant ``k`` against the invariant
+    times ``k`` (linear function test replacement) and the update of ``i``
+    is deleted. Only values of a known integer type are considered, as
+    repeated floating-point additions would round differently, and tests are
+    only replaced for signed variables, whose scaled values cannot wrap around.
+    """
+
+    def __init__(self):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        self.types: Dict[int, Optional[str]] = {}
+
+    def _step(self, program: TACProgram, instr: Instruction, name: int) -> Optional[int]:
+        """The constant c of ``name + c``, ``c + name`` or ``name - c``, or None."""
+        if instr.opcode is not BINOP:
+            return None
+        value = program.symbols.int_value
+        if instr.op == '+':
+            if instr.arg1 == name:
+                return value(instr.arg2)
+            if instr.arg2 == name:
+                return value(instr.arg1)
+        elif instr.op == '-' and instr.arg1 == name:
+            c = value(instr.arg2)
+            return -c if c is not None else None
+        return None
+
+    def _basic_variables(self, program: TACProgram, cfg: ControlFlowGraph,
+                         defs: Dict[int, List[int]]) -> Dict[int, _InductionVariable]:
+        instructions = program.instructions
+        found = {}
+        for name, positions in defs.items():
+            if len(positions) != 1 or not is_integer(self.types.get(name)):
+                continue
+            pos = positions[0]
+            instr = instructions[pos]
+            step = self._step(program, instr, name)
+            if step is not None and instr.dest == name:
+                found[name] = _InductionVariable(name, step, pos, [pos])
+                continue
+            # t = i + c; i = t, with t set once in the loop, earlier in the same block
+            if instr.opcode is not ASSIGN or instr.arg1 < 0 or len(defs.get(instr.arg1, ())) != 1:
+                continue
+            source = defs[instr.arg1][0]
+            if source < pos and cfg.block_of(source) is cfg.block_of(pos):
+                step = self._step(program, instructions[source], name)
+                if step is not None:
+                    found[name] = _InductionVariable(name, step, pos, [source, pos])
+        return found
+
+    def _linear_values(self, program: TACProgram, cfg: ControlFlowGraph, loop: Loop, defs: Dict[int, List[int]],
+                       variables: Dict[int, _InductionVariable]) -> Dict[int, _Linear]:
+        """Find the derived induction variables of a loop, by the position of their definition."""
+        instructions = program.instructions
+        symbols = program.symbols
+        types = self.types
+        linear: Dict[int, _Linear] = {}
+        by_name: Dict[int, int] = {}
+
+        def invariant(operand: int) -> bool:
+            if operand < 0:
+                return symbols.int_value(operand) is not None
+            return operand not in defs and is_integer(types.get(operand))
+
+        for b in sorted(loop.blocks):
+            block = cfg.blocks[b]
+            for pos in range(block.start, block.end):
+                instr = instructions[pos]
+                dest = instr.dest
+                if (instr.opcode is not BINOP and instr.opcode is not UNARYOP) or dest in variables:
+                    continue
+                if len(defs[dest]) != 1 or not is_integer(types.get(dest)):
+                    continue
+
+                def source(operand: int) -> Optional[_Linear]:
+                    """The operand as a linear value, if its value at ``pos`` is the one the analysis knows."""
+                    if operand in variables:
+                        return _Linear(variables[operand], 1, (), ())
+                    at = by_name.get(operand)
+                    if at is None or cfg.block_of(at) is not block:
+                        return None
+                    found = linear[at]
+                    # i must not change between the computation of the operand and its use
+                    if at < found.iv.update < pos:
+                        return None
+                    return found
+
+                op, arg1, arg2 = instr.op, instr.arg1, instr.arg2
+                if instr.opcode is UNARYOP:
+                    a = source(arg1) if op == '-' else None
+                    if a is None:
+                        continue
+                    found = _Linear(a.iv, -a.coefficient, a.factors, a.chain + (pos,))
+                else:
+                    a = source(arg1)
+                    inverse = False
+                    if a is not None and invariant(arg2):
+                        other = arg2
+                    else:
+                        a = source(arg2) if op in ('+', '*', '-') else None
+                        if a is None or not invariant(arg1):
+                            continue
+                        other, inverse = arg1, True
+                    coefficient, factors = a.coefficient, a.factors
+                    if op == '*':
+                        value = symbols.int_value(other)
+                        if value is None:
+                            factors = factors + (other,)
+                        else:
+                            coefficient *= value
+                    elif op == '<<':
+                        shift = symbols.int_value(other)
+                        if shift is None or not 0 <= shift < 63:
+                            continue
+                        coefficient <<= shift
+                    elif op == '-':
+                        if inverse:
+                            coefficient = -coefficient
+                    elif op != '+':
+                        continue
+                    if not coefficient:
+                        continue
+                    found = _Linear(a.iv, coefficient, factors, a.chain + (pos,))
+                linear[pos] = found
+                by_name[dest] = pos
+        return linear
+
+    def _emit_increment(self, symbols, preheader: List[Instruction], value: _Linear) -> Tuple[str, int]:
+        """
+        The operator and operand that advance a reduced value by one step of
+        its variable, computing the operand in the preheader if it is not a constant.
+        """
+        scale = value.iv.step * value.coefficient
+        if not value.factors:
+            return ('+' if scale >= 0 else '-'), symbols.constant(str(abs(scale)))
+        product = value.factors[0]
+        for factor in value.factors[1:]:
+            temp = symbols.new_temp()
+            preheader.append(binop(temp, '*', product, factor))
+            product = temp
+        if scale in (1, -1):
+            return ('+' if scale == 1 else '-'), product
+        temp = symbols.new_temp()
+        preheader.append(binop(temp, '*', product, symbols.constant(str(scale))))
+        return '+', temp
+
+    def _reduce(self, cfg: ControlFlowGraph, loop: Loop, edits: LoopEdits) -> bool:
+        program = cfg.program
+        instructions = program.instructions
+        symbols = program.symbols
+        log = self.optimization_log
+        blocks = sorted(loop.blocks)
+
+        defs: Dict[int, List[int]] = {}
+        uses: Dict[int, List[int]] = {}
+        for b in blocks:
+            block = cfg.blocks[b]
+            for pos in range(block.start, block.end):
+                instr = instructions[pos]
+                if instr.dest is not None:
+                    defs.setdefault(instr.dest, []).append(pos)
+                for arg in (instr.arg1, instr.arg2):
+                    if arg is not None and arg >= 0:
+                        uses.setdefault(arg, []).append(pos)
+
+        variables = self._basic_variables(program, cfg, defs)
+        if not variables:
+            return False
+        linear = self._linear_values(program, cfg, loop, defs, variables)
+        # Only multiplications are worth replacing; the additions feeding them go dead
+        reduced_at = {pos: value for pos, value in linear.items() if instructions[pos].op in ('*', '<<')}
+        # Direct multiples i * k by a constant, usable to rewrite tests of i
+        multiples: Dict[int, int] = {}
+        for pos, value in reduced_at.items():
+            if len(value.chain) == 1 and not value.factors:
+                multiples.setdefault(value.iv.name, pos)
+
+        live_in, _ = cfg.liveness()
+        name_bits = cfg.name_bits
+        exit_live = 0
+        for _, outside in loop.exits(cfg):
+            exit_live |= live_in[outside]
+
+        def dead_after_loop(name: int) -> bool:
+            bit = name_bits.get(name)
+            return (bit is None or not exit_live >> bit & 1) and name not in cfg.shared_names()
+
+        # Induction variables left with nothing but their update and tests against loop invariants
+        removable: List[Tuple[_InductionVariable, List[int]]] = []
+        for iv in variables.values():
+            if not dead_after_loop(iv.name):
+                continue
+            if len(iv.chain) == 2:
+                temp = instructions[iv.chain[0]].dest
+                if not dead_after_loop(temp) or any(p != iv.update for p in uses.get(temp, ())):
+                    continue
+            # Scaled comparisons only agree with the originals if nothing wraps around
+            signed = not is_unsigned(self.types[iv.name])
+            tests = []
+            for pos in uses.get(iv.name, ()):
+                if pos in iv.chain or pos in reduced_at:
+                    continue
+                instr = instructions[pos]
+                other = instr.arg2 if instr.arg1 == iv.name else instr.arg1
+                if (instr.opcode is not BINOP or instr.op not in MIRRORED or other == iv.name
+                        or (other >= 0 and (other in defs or not is_integer(self.types.get(other))))
+                        or (other < 0 and symbols.int_value(other) is None)):
+                    break
+                tests.append(pos)
+            else:
+                if not tests or (signed and iv.name in multiples):
+                    removable.append((iv, tests))
+
+        if not reduced_at and not removable:
+            return False
+        if reduced_at or any(tests for _, tests in removable):
+            site = edits.preheader(cfg, loop)
+            if site is None:
+                return False
+            preheader = edits.before.setdefault(site, [])
+        header = cfg.blocks[loop.header]
+        where = f'L{header.label}' if header.label is not None else f'block {header.index}'
+
+        # One new temporary per distinct computation, set in the preheader and advanced with its variable
+        temps: Dict[Tuple, int] = {}
+        temp_at: Dict[int, int] = {}
+        for pos in sorted(reduced_at):
+            value = reduced_at[pos]
+            instr = instructions[pos]
+            key = tuple((instructions[p].op, instructions[p].arg1, instructions[p].arg2) for p in value.chain)
+            temp = temps.get(key)
+            if temp is None:
+                temp = temps[key] = symbols.new_temp()
+                # Recompute the chain from the variable's value on entry
+                renamed: Dict[int, int] = {}
+                for p in value.chain:
+                    step = instructions[p]
+                    dest = temp if p == pos else symbols.new_temp()
+                    args = [renamed.get(arg, arg) if arg is not None else None for arg in (step.arg1, step.arg2)]
+                    preheader.append(Instruction(step.opcode, dest, step.op, args[0], args[1]))
+                    renamed[step.dest] = dest
+                op, increment = self._emit_increment(symbols, preheader, value)
+                edits.after.setdefault(value.iv.update, []).append(binop(temp, op, temp, increment))
+            temp_at[pos] = temp
+            new = assign(instr.dest, temp)
+            edits.replace[pos] = new
+            if log.changes:
+                log.change(instr, new, f'Reduced induction variable multiplication to addition: '
+                                       f'{symbols.text(temp)} advances with {symbols.text(value.iv.name)}')
+
+        for iv, tests in removable:
+            bounds: Dict[int, int] = {}
+            for pos in tests:
+                instr = instructions[pos]
+                multiple = multiples[iv.name]
+                factor = reduced_at[multiple].coefficient
+                temp = temp_at[multiple]
+                other = instr.arg2 if instr.arg1 == iv.name else instr.arg1
+                bound = bounds.get(other)
+                if bound is None:
+                    if other < 0:
+                        bound = symbols.constant(str(symbols.int_value(other) * factor))
+                    else:
+                        bound = symbols.new_temp()
+                        preheader.append(binop(bound, '*', other, symbols.constant(str(factor))))
+                    bounds[other] = bound
+                op = instr.op if factor > 0 else MIRRORED[instr.op]
+                if instr.arg1 == iv.name:
+                    new = binop(instr.dest, op, temp, bound)
+                else:
+                    new = binop(instr.dest, op, bound, temp)
+                edits.replace[pos] = new
+                if log.changes:
+                    log.change(instr, new, f'Replaced induction variable in loop test: '
+                                           f'{symbols.text(iv.name)} by {symbols.text(temp)}')
+            for pos in iv.chain:
+                edits.delete.add(pos)
+                if log.changes:
+                    log.change(instructions[pos], None,
+                               f'Removed dead induction variable: {symbols.text(iv.name)} in the loop at {where}')
+        return True
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        self.optimization_log.begin(program)
+        original = program.instructions
+        self.changed = False
+        while True:
+            self.types = operand_types(program, LP64_BITS)
+            cfg = ControlFlowGraph(program)
+            edits = LoopEdits(program)
+            stale: Set[int] = set()
+            for loop in loops_inner_first(cfg):
+                if loop.header in stale:
+                    continue
+                if self._reduce(cfg, loop, edits):
+                    parent = loop.parent
+                    while parent is not None:
+                        stale.add(parent.header)
+                        parent = parent.parent
+            if not edits:
+                break
+            program = edits.apply()
+            self.changed = True
+
+        self.touched = touched_positions(original, program.instructions) if self.changed else []
+        return program
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
@@ -0,0 +1,146 @@
+import json
+import time
+from typing import Dict, Optional
+from dataclasses import asdict, dataclass, field
+
+from tac_utils.ir import TACProgram, set_pass_observer
+
+@dataclass
+class PassMetrics:
+    name: str
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    instructions_in: int = 0
+    instructions_out: int = 0
+    # Logged rewrites per rule (the text of a log reason before its colon)
+    rewrites: Dict[str, int] = field(default_factory=dict)
+    # Largest size each of the pass's maps and sets had at the end of a call
+    map_sizes: Dict[str, int] = field(default_factory=dict)
+
+def _pass_name(opt_pass) -> str:
+    # Imported here: the registry imports every pass module
+    from optimizer.pass_manager import PASS_REGISTRY
+    for name, pass_class in PASS_REGISTRY.items():
+        if type(opt_pass) is pass_class:
+            return name
+    return type(opt_pass).__name__
+
+def _escape(label: str) -> str:
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class PassMetricsCollector:
+    """
+    Per-pass timings and counters for every optimize() call.
+
+    While enabled, every call of an optimizer's ``optimize()`` (any method
+    decorated with ``ir_pass``) is timed in wall-clock and CPU time, and
+    the pass's instruction counts, logged rewrites and the sizes of its
+    dict and set attributes (``expression_map``, ``copy_map``,
+    ``constant_map``, ...) are added to that pass's totals. While disabled
+    nothing is wrapped and the only cost is one global lookup per call.
+    """
+
+    def __init__(self):
+        self.passes: Dict[str, PassMetrics] = {}
+        self._names: Dict[type, str] = {}
+        self.enabled = False
+
+    def enable(self) -> None:
+        set_pass_observer(self._observe)
+        self.enabled = True
+
+    def disable(self) -> None:
+        set_pass_observer(None)
+        self.enabled = False
+
+    def reset(self) -> None:
+        self.passes.clear()
+
+    def _observe(self, optimize, opt_pass, program: TACProgram, args, kwargs) -> TACProgram:
+        instructions_in = len(program)
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        result = optimize(opt_pass, program, *args, **kwargs)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        pass_class = type(opt_pass)
+        name = self._names.get(pass_class)
+        if name is None:
+            name = self._names[pass_class] = _pass_name(opt_pass)
+        metrics = self.passes.get(name)
+        if metrics is None:
+            metrics = self.passes[name] = PassMetrics(name)
+        metrics.calls += 1
+        metrics.wall_seconds += wall
+        metrics.cpu_seconds += cpu
+        metrics.instructions_in += instructions_in
+        metrics.instructions_out += len(result)
+
+        log = getattr(opt_pass, 'optimization_log', None)
+        if log is not None:
+            # Counted as the pass logs them, so records dropped by a sink or ring buffer still count
+            rewrites = metrics.rewrites
+            for rule, count in log.rule_counts.items():
+                rewrites[rule] = rewrites.get(rule, 0) + count
+        map_sizes = metrics.map_sizes
+        for attribute, value in vars(opt_pass).items():
+            if isinstance(value, (dict, set)):
+                map_sizes[attribute] = max(map_sizes.get(attribute, 0), len(value))
+        return result
+
+    def to_dict(self) -> Dict[str, Dict]:
+        return {name: asdict(metrics) for name, metrics in self.passes.items()}
+
+    def to_json(self, indent: Optional[int] = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        families = [
+            ('tac_pass_calls_total', 'counter', 'Number of optimize() calls', 'calls'),
+            ('tac_pass_wall_seconds_total', 'counter', 'Wall-clock time spent in optimize()', 'wall_seconds'),
+            ('tac_pass_cpu_seconds_total', 'counter', 'CPU time spent in optimize()', 'cpu_seconds'),
+            ('tac_pass_instructions_in_total', 'counter', 'Instructions handed to optimize()', 'instructions_in'),
+            ('tac_pass_instructions_out_total', 'counter', 'Instructions returned by optimize()', 'instructions_out'),
+        ]
+        lines = []
+        for metric, kind, help_text, attribute in families:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, metrics in self.passes.items():
+                lines.append(f'{metric}{{pass="{_escape(name)}"}} {getattr(metrics, attribute)}')
+
+        lines.append('# HELP tac_pass_rewrites_total Rewrites logged by a pass, per rule')
+        lines.append('# TYPE tac_pass_rewrites_total counter')
+        for name, metrics in self.passes.items():
+            for rule, count in metrics.rewrites.items():
+                lines.append(f'tac_pass_rewrites_total{{pass="{_escape(name)}",rule="{_escape(rule)}"}} {count}')
+
+        lines.append('# HELP tac_pass_map_size Largest size of a pass data structure at the end of a call')
+        lines.append('# TYPE tac_pass_map_size gauge')
+        for name, metrics in self.passes.items():
+            for attribute, size in metrics.map_sizes.items():
+                lines.append(f'tac_pass_map_size{{pass="{_escape(name)}",map="{_escape(attribute)}"}} {size}')
+        return '\n'.join(lines) + '\n'
+
+# Shared collector used by main.py --metrics
+collector = PassMetricsCollector()
+
+if __name__ == "__main__":
+    from optimizer.pass_manager import PassManager
+
+    example_tac = [
+        {'type': 'assign', 'lhs': 'a', 'rhs': '5'},
+        {'type': 'binop', 'lhs': 't0', 'op': '+', 'arg1': 'a', 'arg2': '3'},
+        {'type': 'binop', 'lhs': 't1', 'op': '+', 'arg1': 'a', 'arg2': '3'},
+        {'type': 'binop', 'lhs': 't2', 'op': '*', 'arg1': 't1', 'arg2': '8'},
+        {'type': 'return', 'value': 't2'},
+    ]
+
+    collector.enable()
+    PassManager().run(example_tac)
+    collector.disable()
+    print(collector.to_json())
+    print(collector.to_prometheus())
@@ -0,0 +1,198 @@
+import json
+from collections import Counter, deque
+from typing import Callable, Deque, Iterator, List, Optional, TextIO, Union
+from dataclasses import dataclass
+
+from tac_utils.ir import (
+    ASSIGN, BINOP, COND_JUMP, JUMP, LABEL, RETURN, UNARYOP, Instruction, TACProgram,
+)
+
+# Log levels: nothing, only rewrites, or every instruction a pass looked at
+LOG_OFF = 'off'
+LOG_CHANGES = 'changes'
+LOG_FULL = 'full'
+LOG_LEVELS = (LOG_OFF, LOG_CHANGES, LOG_FULL)
+
+@dataclass
+class OptimizationInfo:
+    __slots__ = ('original_tac', 'optimized_tac', 'reason')
+    original_tac: Instruction
+    optimized_tac: Optional[Instruction]
+    reason: str
+
+    def __init__(self, original_tac: Instruction, optimized_tac: Optional[Instruction] = None, reason: str = ''):
+        self.original_tac = original_tac
+        self.optimized_tac = optimized_tac
+        self.reason = reason
+
+def rules_of(reason: str) -> List[str]:
+    """Split a log reason into the names of the rules it reports."""
+    return [part.split(':', 1)[0].strip() for part in reason.split('; ') if part.strip()]
+
+def format_instruction(instr: Optional[Instruction], text: Callable[[int], str]) -> Optional[str]:
+    """Format an instruction the way tac_utils.formatter prints it, naming operands with text()."""
+    if instr is None:
+        return None
+    opcode = instr.opcode
+    if opcode is ASSIGN:
+        return f'{text(instr.dest)} = {text(instr.arg1)}'
+    if opcode is BINOP:
+        return f'{text(instr.dest)} = {text(instr.arg1)} {instr.op} {text(instr.arg2)}'
+    if opcode is UNARYOP:
+        return f'{text(instr.dest)} = {instr.op}{text(instr.arg1)}'
+    if opcode is LABEL:
+        return f'L{instr.label}:'
+    if opcode is JUMP:
+        return f'goto L{instr.label}'
+    if opcode is COND_JUMP:
+        return f'if {text(instr.arg1)} goto L{instr.label}'
+    if opcode is RETURN:
+        return 'return' if instr.arg1 is None else f'return {text(instr.arg1)}'
+    return repr(instr)
+
+class JSONLinesSink:
+    """Writes log records to a file, one JSON object per line, as they are produced."""
+
+    def __init__(self, target: Union[str, TextIO]):
+        if isinstance(target, str):
+            self.file = open(target, 'w')
+            self._owned = True
+        else:
+            self.file = target
+            self._owned = False
+
+    def write(self, pass_name: str, info: OptimizationInfo, text: Callable[[int], str]) -> None:
+        record = {
+            'pass': pass_name,
+            'original': format_instruction(info.original_tac, text),
+            'optimized': format_instruction(info.optimized_tac, text),
+            'reason': info.reason,
+        }
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self) -> None:
+        if self._owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+@dataclass
+class LogConfig:
+    level: str = LOG_CHANGES
+    # Keep only the most recent records of each run (None keeps them all)
+    capacity: Optional[int] = None
+    sink: Optional[JSONLinesSink] = None
+    # Count rewrites per rule even when records are not kept, or logging is off
+    count_rules: bool = False
+
+# Settings picked up by every OptimizationLog created afterwards
+default_config = LogConfig()
+
+def configure(level: Optional[str] = None, capacity: Optional[int] = None,
+              sink: Optional[JSONLinesSink] = None, count_rules: bool = False) -> LogConfig:
+    """
+    Set the logging defaults for passes created from now on.
+
+    Args:
+        level: One of LOG_LEVELS
+        capacity: Keep at most this many records per pass run, dropping the oldest
+        sink: Stream every record to this sink; unless a capacity is given the
+            records are then not kept in memory at all
+        count_rules: Count rewrites per rule in ``rule_counts`` whatever the
+            level, e.g. for the metrics collector
+
+    Returns:
+        The new default configuration
+    """
+    global default_config
+    level = level or default_config.level
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Unknown log level '{level}'. Available levels: {', '.join(LOG_LEVELS)}")
+    default_config = LogConfig(level, capacity, sink, count_rules)
+    return default_config
+
+class OptimizationLog:
+    """
+    The record of what one optimizer pass did in its last run.
+
+    Passes check ``changes`` before building a record for a rewrite and
+    ``full`` before recording an instruction they left alone, so at the
+    default level (changes only) an unchanged instruction costs nothing,
+    and with logging off neither does a rewrite. Records go to a list, to
+    a ring buffer of the latest ``capacity`` records, or straight to a sink.
+    """
+
+    def __init__(self, pass_name: str, config: Optional[LogConfig] = None):
+        config = config or default_config
+        self.pass_name = pass_name
+        self.level = config.level
+        # Passes report rewrites when they are logged or only counted
+        self.changes = config.level != LOG_OFF or config.count_rules
+        self.full = config.level == LOG_FULL
+        self.capacity = config.capacity
+        self.sink = config.sink
+        self.records: Union[List[OptimizationInfo], Deque[OptimizationInfo]] = []
+        # Rewrites recorded in the current run, including any no longer kept
+        self.change_count = 0
+        # Rewrites per rule in the current run, kept even where records are not
+        self.rule_counts: Counter = Counter()
+        self.text: Callable[[int], str] = str
+        self._record = config.level != LOG_OFF
+        self._keep = self.sink is None or self.capacity is not None
+        self._reset_records()
+
+    def _reset_records(self) -> None:
+        if self.capacity is not None:
+            self.records = deque(maxlen=self.capacity)
+        else:
+            self.records = []
+
+    def begin(self, program: TACProgram) -> None:
+        """Start the log of a new run over program."""
+        self._reset_records()
+        self.change_count = 0
+        self.rule_counts.clear()
+        self.text = program.symbols.text
+
+    def _add(self, info: OptimizationInfo) -> None:
+        if self._keep:
+            self.records.append(info)
+        if self.sink is not None:
+            self.sink.write(self.pass_name, info, self.text)
+
+    def change(self, original_tac: Instruction, optimized_tac: Optional[Instruction], reason: str) -> None:
+        """Record a rewrite (optimized_tac is None for a deletion)."""
+        self.change_count += 1
+        if reason:
+            self.rule_counts.update(rules_of(reason))
+        if self._record:
+            self._add(OptimizationInfo(original_tac, optimized_tac, reason))
+
+    def keep(self, original_tac: Instruction) -> None:
+        """Record an instruction the pass left as it was."""
+        self._add(OptimizationInfo(original_tac, original_tac))
+
+    def clear(self) -> None:
+        self._reset_records()
+        self.change_count = 0
+        self.rule_counts.clear()
+
+    def __iter__(self) -> Iterator[OptimizationInfo]:
+        return iter(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+if __name__ == "__main__":
+    import sys
+    from optimizer.constant_folding import ConstantFolder
+    # The passes see the imported module, not this __main__ copy of it
+    from optimizer.optimization_log import JSONLinesSink, LOG_FULL, configure
+
+    example_tac = [
+        {'type': 'binop', 'lhs': 't0', 'op': '+', 'arg1': '2', 'arg2': '3'},
+        {'type': 'binop', 'lhs': 't1', 'op': '*', 'arg1': 't0', 'arg2': 'a'},
+    ]
+
+    configure(LOG_FULL, sink=JSONLinesSink(sys.stdout))
+    ConstantFolder().optimize(example_tac)
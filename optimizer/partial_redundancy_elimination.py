@@ -0,0 +1,407 @@
+from typing import Dict, List, Optional, Tuple
+
+from optimizer.common_subexpression_elimination import COMMUTATIVE_OPS
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.cfg import ControlFlowGraph
+from tac_utils.ir import (
+    BINOP, COND_JUMP, JUMP, LABEL, RETURN, UNARYOP, Instruction, TACProgram, assign, cond_jump, ir_pass, jump,
+    label,
+)
+
+# An edge of the CFG; the source is None for control entering a region
+Edge = Tuple[Optional[int], int]
+
+def _bits(mask: int):
+    """Yield the indices of the bits set in mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class PartialRedundancyEliminator:
+    """
+    Partial redundancy elimination by lazy code motion.
+
+    Available and anticipated expressions are computed over the CFG as
+    integer bitsets, one bit per expression of a connected part of the
+    graph (usually a function). A computation that is already available on
+    some paths into it is made available on the others by inserting it on
+    the incoming edges, as late as possible, and the computation itself
+    becomes a copy of a new temporary holding the value; a computation
+    available on every path is simply replaced. An expression is only
+    inserted where every path on from there computes it anyway, so no path
+    computes anything more often than before and nothing that could trap
+    is moved onto a path that did not evaluate it.
+
+    The copies this leaves are for copy propagation and dead code
+    elimination to clean up, e.g. ``--passes gvn,pre,copy-propagation,dce``.
+    """
+
+    def __init__(self):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+
+    @staticmethod
+    def _expression_key(instr: Instruction) -> Optional[Tuple]:
+        opcode = instr.opcode
+        if (opcode is not BINOP and opcode is not UNARYOP) or instr.dest is None or instr.arg1 is None:
+            return None
+        arg1, arg2 = instr.arg1, instr.arg2
+        if opcode is BINOP:
+            if arg2 is None:
+                return None
+            if instr.op in COMMUTATIVE_OPS and arg2 < arg1:
+                arg1, arg2 = arg2, arg1
+        return (opcode, instr.op, arg1, arg2)
+
+    @staticmethod
+    def _components(cfg: ControlFlowGraph) -> List[List[int]]:
+        """Reachable blocks grouped into connected parts of the graph, each in reverse postorder."""
+        order = cfg.reverse_postorder()
+        parent = {b: b for b in order}
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for b in order:
+            for s in cfg.blocks[b].succs:
+                ra, rb = find(b), find(s)
+                if ra != rb:
+                    parent[ra] = rb
+        components: Dict[int, List[int]] = {}
+        for b in order:
+            components.setdefault(find(b), []).append(b)
+        return list(components.values())
+
+    def _plan(self, cfg: ControlFlowGraph, blocks: List[int], program: TACProgram,
+              deleted: Dict[int, int], saved: Dict[int, int], inserts: Dict[Edge, List[Instruction]]) -> None:
+        """Run lazy code motion on one connected part of the CFG, recording its rewrites."""
+        instructions = program.instructions
+        entries = set(cfg.entries)
+        in_part = set(blocks)
+        preds = {b: [p for p in cfg.blocks[b].preds if p in in_part] for b in blocks}
+
+        # A computation can only be replaced if it is computed before any
+        # operand changes in its block (upward exposed) and the value may
+        # arrive from a computation with no operand changing after it in its
+        # block (downward exposed). Expressions without both kinds of
+        # occurrence are left out, so the bitsets only hold the few that may
+        # be redundant rather than every expression of the function.
+        found: List[Tuple[int, Tuple]] = []
+        upward = set()
+        downward = set()
+        for b in blocks:
+            block = cfg.blocks[b]
+            first_def: Dict[int, int] = {}
+            last_def: Dict[int, int] = {}
+            for pos in range(block.start, block.end):
+                dest = instructions[pos].dest
+                if dest is not None:
+                    first_def.setdefault(dest, pos)
+                    last_def[dest] = pos
+            for pos in range(block.start, block.end):
+                key = self._expression_key(instructions[pos])
+                if key is None:
+                    continue
+                found.append((pos, key))
+                operands = [arg for arg in key[2:] if arg is not None and arg >= 0]
+                if all(first_def.get(arg, pos) >= pos for arg in operands):
+                    upward.add(key)
+                if all(last_def.get(arg, -1) < pos for arg in operands):
+                    downward.add(key)
+
+        # Number the expressions, and note which ones each variable is an operand of
+        keys: Dict[Tuple, int] = {}
+        expression_at: Dict[int, int] = {}
+        operand_of: Dict[int, int] = {}
+        for pos, key in found:
+            if key not in upward or key not in downward:
+                continue
+            e = keys.setdefault(key, len(keys))
+            expression_at[pos] = e
+            for arg in key[2:]:
+                if arg is not None and arg >= 0:
+                    operand_of[arg] = operand_of.get(arg, 0) | (1 << e)
+        if not keys:
+            return
+        full = (1 << len(keys)) - 1
+
+        # Local properties: computed before any operand changes (antloc),
+        # computed with no operand changing afterwards (comp), no operand
+        # changed at all (transp). Occurrences of an expression with no
+        # operand changing in between form one run.
+        antloc: Dict[int, int] = {}
+        comp: Dict[int, int] = {}
+        transp: Dict[int, int] = {}
+        runs: Dict[int, Dict[int, List[List[int]]]] = {}
+        for b in blocks:
+            block = cfg.blocks[b]
+            up = down = killed = 0
+            runs[b] = block_runs = {}
+            for pos in range(block.start, block.end):
+                e = expression_at.get(pos)
+                if e is not None:
+                    bit = 1 << e
+                    if not killed & bit:
+                        up |= bit
+                    if down & bit:
+                        block_runs[e][-1].append(pos)
+                    else:
+                        block_runs.setdefault(e, []).append([pos])
+                    down |= bit
+                dest = instructions[pos].dest
+                if dest is not None and dest in operand_of:
+                    killed |= operand_of[dest]
+                    down &= ~operand_of[dest]
+            antloc[b], comp[b], transp[b] = up, down, full & ~killed
+
+        avout = {b: full for b in blocks}
+        changed = True
+        while changed:
+            changed = False
+            for b in blocks:
+                avin = 0 if b in entries or not preds[b] else full
+                for p in preds[b]:
+                    avin &= avout[p]
+                new = comp[b] | (avin & transp[b])
+                if new != avout[b]:
+                    avout[b] = new
+                    changed = True
+
+        antin = {b: full for b in blocks}
+        antout = {b: 0 for b in blocks}
+        changed = True
+        while changed:
+            changed = False
+            for b in reversed(blocks):
+                succs = cfg.blocks[b].succs
+                out = full if succs else 0
+                for s in succs:
+                    out &= antin[s]
+                antout[b] = out
+                new = antloc[b] | (out & transp[b])
+                if new != antin[b]:
+                    antin[b] = new
+                    changed = True
+
+        def earliest(i: Optional[int], j: int) -> int:
+            if i is None:
+                return antin[j]
+            return antin[j] & ~avout[i] & (~transp[i] | ~antout[i])
+
+        def later(i: Optional[int], j: int) -> int:
+            if i is None:
+                return antin[j]
+            return earliest(i, j) | (laterin[i] & ~antloc[i])
+
+        def in_edges(j: int) -> List[Edge]:
+            edges: List[Edge] = [(p, j) for p in preds[j]]
+            if j in entries:
+                edges.append((None, j))
+            return edges
+
+        laterin = {b: full for b in blocks}
+        changed = True
+        while changed:
+            changed = False
+            for j in blocks:
+                new = full
+                for i, _ in in_edges(j):
+                    new &= later(i, j)
+                if new != laterin[j]:
+                    laterin[j] = new
+                    changed = True
+
+        insert: Dict[Edge, int] = {}
+        delete = {b: antloc[b] & ~laterin[b] for b in blocks}
+        for j in blocks:
+            edges = in_edges(j)
+            for i, _ in edges:
+                bits = later(i, j) & ~laterin[j]
+                if len(edges) == 1:
+                    # Inserting right ahead of the block's own computation
+                    # would only add a copy: leave the computation alone
+                    isolated = bits & delete[j]
+                    bits &= ~isolated
+                    delete[j] &= ~isolated
+                if bits:
+                    insert[(i, j)] = bits
+
+        # Which values a block must leave in the holding temporary, because a
+        # replaced computation further on relies on it
+        needin = {b: 0 for b in blocks}
+        needout = {b: 0 for b in blocks}
+        changed = True
+        while changed:
+            changed = False
+            for b in reversed(blocks):
+                out = 0
+                for s in cfg.blocks[b].succs:
+                    out |= needin[s] & ~insert.get((b, s), 0)
+                needout[b] = out
+                new = delete[b] | (out & transp[b] & ~antloc[b])
+                if new != needin[b]:
+                    needin[b] = new
+                    changed = True
+
+        moved = 0
+        for b in blocks:
+            moved |= delete[b]
+        if not moved:
+            return
+        key_of = {e: key for key, e in keys.items()}
+        holder = {e: program.symbols.new_temp() for e in _bits(moved)}
+        for b in blocks:
+            for e, block_runs in runs[b].items():
+                if not (moved >> e) & 1:
+                    continue
+                for k, run in enumerate(block_runs):
+                    # The first run starts with the block's upward exposed
+                    # computation; the rest of a run recomputes its head
+                    head_replaced = k == 0 and (delete[b] >> e) & 1
+                    if head_replaced:
+                        deleted[run[0]] = holder[e]
+                    for pos in run[1:]:
+                        deleted[pos] = holder[e]
+                    leaves_block = k == len(block_runs) - 1 and (comp[b] & needout[b]) >> e & 1
+                    if not head_replaced and (len(run) > 1 or leaves_block):
+                        saved[run[0]] = holder[e]
+        for edge, bits in insert.items():
+            for e in _bits(bits & moved):
+                opcode, op, arg1, arg2 = key_of[e]
+                inserts.setdefault(edge, []).append(Instruction(opcode, holder[e], op, arg1, arg2))
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        self.optimization_log.begin(program)
+        self.touched = []
+        instructions = program.instructions
+        text = program.symbols.text
+        cfg = ControlFlowGraph(program)
+
+        deleted: Dict[int, int] = {}  # Replaced computation -> temporary holding its value
+        saved: Dict[int, int] = {}    # Computation whose value must also go in a temporary
+        inserts: Dict[Edge, List[Instruction]] = {}
+        for blocks in self._components(cfg):
+            self._plan(cfg, blocks, program, deleted, saved, inserts)
+        if not deleted:
+            self.changed = False
+            return program
+
+        # Place each edge's insertions: at the top of its target when that
+        # has no other way in, at the bottom of its source when that has no
+        # other way out, and in a new block otherwise
+        labels = [instr.label for instr in instructions if instr.opcode is LABEL]
+        next_label = 1 + max((int(l) for l in labels if l.isdigit()), default=-1)
+        entries = set(cfg.entries)
+        reachable = cfg.reachable()
+        top: Dict[int, List[Instruction]] = {}
+        bottom: Dict[int, List[Instruction]] = {}
+        after: Dict[int, List[Instruction]] = {}     # ... after a conditional jump (fall-through)
+        entering: Dict[int, List[Instruction]] = {}  # ... ahead of an entry block, on entering its region
+        splits: Dict[int, List[Tuple[str, List[Instruction]]]] = {}
+        retarget: Dict[int, str] = {}
+        for (i, j), code in sorted(inserts.items(), key=lambda item: (item[0][1], -1 if item[0][0] is None else item[0][0])):
+            block = cfg.blocks[j]
+            ways_in = sum(1 for p in block.preds if p in reachable) + (j in entries)
+            if ways_in == 1:
+                top.setdefault(j, []).extend(code)
+            elif i is None:
+                entering[j] = code
+            elif len(cfg.blocks[i].succs) == 1:
+                bottom.setdefault(i, []).extend(code)
+            elif j == cfg.blocks[i].succs[0]:
+                after[i] = code
+            else:
+                name = str(next_label)
+                next_label += 1
+                splits.setdefault(j, []).append((name, code))
+                retarget[i] = name
+            for instr in code:
+                target = f'L{block.label}' if block.label is not None else f'block {j}'
+                if self.optimization_log.changes:
+                    self.optimization_log.change(
+                        instr, instr,
+                        f'Inserted computation: {text(instr.dest)} on the way into {target}'
+                    )
+
+        out: List[Instruction] = []
+        new_start: Dict[int, int] = {}
+
+        def emit(instr: Instruction, new: bool = True) -> None:
+            if new:
+                self.touched.append(len(out))
+            out.append(instr)
+
+        def emit_all(code: List[Instruction]) -> None:
+            for instr in code:
+                emit(instr)
+
+        for block in cfg.blocks:
+            b = block.index
+            new_start[b] = len(out)
+            emit_all(entering.get(b, ()))
+            if b in splits:
+                # Control must not enter the split blocks by falling into
+                # them, nor by entering the region when b starts it
+                if b in entries or (out and out[-1].opcode is not JUMP and out[-1].opcode is not RETURN):
+                    emit(jump(block.label))
+                for name, code in splits[b]:
+                    emit(label(name))
+                    emit_all(code)
+                    emit(jump(block.label))
+
+            pending_top = top.get(b)
+            pending_bottom = bottom.get(b)
+            for pos in range(block.start, block.end):
+                instr = instructions[pos]
+                if pending_top and instr.opcode is not LABEL:
+                    emit_all(pending_top)
+                    pending_top = None
+                if pending_bottom and pos == block.end - 1 and (instr.opcode is JUMP or instr.opcode is COND_JUMP):
+                    emit_all(pending_bottom)
+                    pending_bottom = None
+
+                holding = deleted.get(pos)
+                if holding is not None:
+                    new = assign(instr.dest, holding)
+                    if self.optimization_log.changes:
+                        self.optimization_log.change(
+                            instr, new,
+                            f'Eliminated partially redundant computation: value is in {text(holding)}'
+                        )
+                    emit(new)
+                elif pos in saved:
+                    holding = saved[pos]
+                    emit(Instruction(instr.opcode, holding, instr.op, instr.arg1, instr.arg2))
+                    emit(assign(instr.dest, holding))
+                    if self.optimization_log.changes:
+                        self.optimization_log.change(
+                            instr, None,
+                            f'Kept value for later computations: {text(holding)}'
+                        )
+                elif instr.opcode is COND_JUMP and b in retarget:
+                    emit(cond_jump(instr.arg1, retarget[b]))
+                else:
+                    emit(instr, new=False)
+            emit_all(pending_top or ())
+            emit_all(pending_bottom or ())
+            emit_all(after.get(b, ()))
+
+        new_start[len(cfg.blocks)] = len(out)
+        block_at = {block.start: block.index for block in cfg.blocks}
+        block_at[len(instructions)] = len(cfg.blocks)
+        functions = [
+            (name, new_start[block_at[start]], new_start[block_at[end]])
+            for name, start, end in program.functions
+        ]
+
+        self.changed = True
+        return program.derive(out, functions)
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
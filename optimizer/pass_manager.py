@@ -0,0 +1,462 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass
+
+from tac_utils.cfg import split_blocks
+from tac_utils.ir import TAC, TACProgram
+from tac_utils.module import TACModule, pack_unit, unpack_unit
+from optimizer.constant_folding import ConstantFolder
+from optimizer.constant_propagation import ConstantPropagator
+from optimizer.copy_propagation import CopyPropagator
+from optimizer.common_subexpression_elimination import CommonSubexpressionEliminator
+from optimizer.conditional_constant_propagation import ConditionalConstantPropagator
+from optimizer.dead_code_elimination import DeadCodeEliminator
+from optimizer.global_value_numbering import GlobalValueNumberer
+from optimizer.loop_optimization import InductionVariableOptimizer, LoopInvariantCodeMotion
+from optimizer.partial_redundancy_elimination import PartialRedundancyEliminator
+from optimizer.peephole_optimization import PeepholeOptimizer
+from optimizer.reassociation import FastMathReassociator, Reassociator
+from optimizer.ssa_optimization import SSAOptimizer
+from optimizer.strength_reduction import StrengthReducer
+from optimizer.temp_allocation import TempAllocator
+from optimizer.target import get_target
+
+# Pipeline names accepted by PassManager and main.py --passes
+PASS_REGISTRY = {
+    'constant-propagation': ConstantPropagator,
+    'constant-folding': ConstantFolder,
+    'sccp': ConditionalConstantPropagator,
+    'copy-propagation': CopyPropagator,
+    'cse': CommonSubexpressionEliminator,
+    'gvn': GlobalValueNumberer,
+    'pre': PartialRedundancyEliminator,
+    'licm': LoopInvariantCodeMotion,
+    'induction-variables': InductionVariableOptimizer,
+    'reassociate': Reassociator,
+    'reassociate-fast-math': FastMathReassociator,
+    'peephole': PeepholeOptimizer,
+    'strength-reduction': StrengthReducer,
+    'dce': DeadCodeEliminator,
+    'ssa': SSAOptimizer,
+    'temp-allocation': TempAllocator,
+}
+
+DEFAULT_PIPELINE = [
+    'sccp',
+    'copy-propagation',
+    'cse',
+    'peephole',
+    'strength-reduction',
+    'dce',
+]
+
+# Modules smaller than this are optimized in-process; starting workers costs more
+PARALLEL_MIN_INSTRUCTIONS = 4096
+
+@dataclass
+class PassRun:
+    iteration: int
+    name: str
+    examined: int
+    touched: int
+    skipped: bool = False
+    # Counters a pass reports about one call in its ``statistics`` dict
+    statistics: Optional[Dict[str, int]] = None
+
+class RunRecord(NamedTuple):
+    """A PassRun as a plain tuple, the way workers send their history back."""
+    iteration: int
+    name: str
+    examined: int
+    touched: int
+    skipped: bool
+    statistics: Optional[Dict[str, int]]
+
+def run_records(history: Sequence[PassRun]) -> List[RunRecord]:
+    """Flatten a pass history into RunRecords."""
+    return [RunRecord(r.iteration, r.name, r.examined, r.touched, r.skipped, r.statistics) for r in history]
+
+def merge_statistics(totals: Optional[Dict[str, int]], statistics: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+    """Add up the statistics of runs over several units; counters named peak_* take the maximum instead."""
+    if not statistics:
+        return totals
+    merged = dict(totals or {})
+    for key, value in statistics.items():
+        if key.startswith('peak'):
+            merged[key] = max(merged.get(key, value), value)
+        else:
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+class PassManager:
+    """
+    Runs a pipeline of optimizer passes over a TACProgram until nothing changes.
+
+    Every pass reports whether it ``changed`` the program and the output
+    positions it ``touched``. Unchanged instructions are carried through
+    passes as the same objects, so the manager can tell, per pass, which
+    instructions appeared since that pass last finished. A pass with no new
+    instructions in its input is skipped; passes marked ``local`` are handed
+    just the dirty indices instead of rescanning the whole program.
+
+    Passes marked ``targeted`` weigh their rewrites with the costs of the
+    ``target`` profile (see optimizer.target) they are built for.
+    """
+
+    def __init__(self, pipeline: Optional[Sequence[Union[str, object]]] = None, max_iterations: int = 10,
+                 target: Optional[str] = None):
+        self.target = get_target(target).name
+        self.passes = [self._make_pass(p, self.target) for p in (pipeline or DEFAULT_PIPELINE)]
+        self.pipeline = [self._pass_name(p) for p in self.passes]
+        self.max_iterations = max_iterations
+        self.history: List[PassRun] = []
+        self.iterations = 0
+        self.converged = False
+
+    @staticmethod
+    def _make_pass(spec: Union[str, object], target: str):
+        if isinstance(spec, str):
+            if spec not in PASS_REGISTRY:
+                raise ValueError(f"Unknown pass '{spec}'. Available passes: {', '.join(PASS_REGISTRY)}")
+            pass_class = PASS_REGISTRY[spec]
+            return pass_class(target=target) if getattr(pass_class, 'targeted', False) else pass_class()
+        return spec
+
+    @staticmethod
+    def parse_pipeline(text: str) -> List[str]:
+        """Split a comma-separated pipeline description into pass names."""
+        return [name.strip() for name in text.split(',') if name.strip()]
+
+    @staticmethod
+    def _pass_name(opt_pass) -> str:
+        for name, pass_class in PASS_REGISTRY.items():
+            if type(opt_pass) is pass_class:
+                return name
+        return type(opt_pass).__name__
+
+    def run(self, tac_instructions: TAC) -> TAC:
+        """
+        Optimize TAC to a fixed point.
+
+        Passes marked ``final`` are left out of the fixed-point iterations
+        and run once each afterwards, in pipeline order.
+
+        Args:
+            tac_instructions: A TACProgram or a list of TAC dicts
+
+        Returns:
+            The optimized program, in the same form as the input
+        """
+        if not isinstance(tac_instructions, TACProgram):
+            return self.run(TACProgram.from_dicts(tac_instructions)).to_dicts()
+
+        program = tac_instructions
+        self.history.clear()
+        self.iterations = 0
+        self.converged = False
+
+        # Every pass execution is a step. born maps id(instruction) to the step
+        # that produced it (input instructions count as step 0); done_at[i] is
+        # the step after which pass i has nothing left to do with instructions
+        # born up to then. Passes report every new instruction in ``touched``,
+        # so an id in born always refers to the live object with that id.
+        born: Dict[int, int] = {}
+        done_at: List[int] = [-1 for _ in self.passes]
+        last_change = 0
+        step = 0
+
+        for iteration in range(1, self.max_iterations + 1):
+            self.iterations = iteration
+            changed = False
+
+            for index, opt_pass in enumerate(self.passes):
+                if getattr(opt_pass, 'final', False):
+                    continue
+                step += 1
+                name = self.pipeline[index]
+                seen_until = done_at[index]
+
+                if seen_until >= last_change:
+                    dirty = None
+                else:
+                    dirty = [
+                        idx for idx, instr in enumerate(program.instructions)
+                        if born.get(id(instr), 0) > seen_until
+                    ]
+
+                if not dirty:
+                    done_at[index] = step
+                    self.history.append(PassRun(iteration, name, 0, 0, skipped=True))
+                    continue
+
+                local = getattr(opt_pass, 'local', False)
+                if local:
+                    examined = len(dirty)
+                    program = opt_pass.optimize(program, dirty=dirty)
+                else:
+                    examined = len(program.instructions)
+                    program = opt_pass.optimize(program)
+
+                touched = opt_pass.touched
+                statistics = getattr(opt_pass, 'statistics', None)
+                self.history.append(PassRun(iteration, name, examined, len(touched),
+                                            statistics=dict(statistics) if statistics else None))
+
+                if opt_pass.changed:
+                    changed = True
+                    last_change = step
+                    # Rewritten instructions are new objects; positions next to a
+                    # deletion keep their old objects but get a new neighbour.
+                    # Either way they are dirty for every other pass.
+                    instructions = program.instructions
+                    for idx in touched:
+                        if idx < len(instructions):
+                            born[id(instructions[idx])] = step
+
+                # Local passes apply their rules to a fixed point per instruction,
+                # so everything they examined is done, rewrites included. A
+                # global pass is only known to be done with its input once a
+                # run leaves it unchanged (e.g. DCE exposes new dead code).
+                if local or not opt_pass.changed:
+                    done_at[index] = step
+                else:
+                    done_at[index] = -1
+
+            if not changed:
+                self.converged = True
+                break
+
+        for index, opt_pass in enumerate(self.passes):
+            if getattr(opt_pass, 'final', False):
+                examined = len(program.instructions)
+                program = opt_pass.optimize(program)
+                statistics = getattr(opt_pass, 'statistics', None)
+                self.history.append(PassRun(self.max_iterations + 1, self.pipeline[index], examined,
+                                            len(opt_pass.touched), statistics=dict(statistics) if statistics else None))
+        return program
+
+    @staticmethod
+    def is_block_local(opt_pass) -> bool:
+        """Return True if a pass never looks past the basic block it is rewriting."""
+        return getattr(opt_pass, 'block_local', False) or getattr(opt_pass, 'local', False)
+
+    def run_blocks(self, tac_instructions: TAC, jobs: int = 1, blocks_per_task: int = 256) -> TAC:
+        """
+        Optimize each basic block on its own, then the whole program.
+
+        The block-local passes of the pipeline run to a fixed point on every
+        basic block independently, in ``jobs`` worker processes when jobs > 1.
+        The remaining passes (e.g. dead code elimination, which needs every
+        use in the program) then run to a fixed point over the stitched result,
+        with the function ranges moved along with the blocks.
+
+        Args:
+            tac_instructions: A TACProgram or a list of TAC dicts
+            jobs: Number of worker processes for the block phase
+            blocks_per_task: Blocks sent to a worker at a time
+
+        Returns:
+            The optimized program, in the same form as the input
+        """
+        if not isinstance(tac_instructions, TACProgram):
+            return self.run_blocks(TACProgram.from_dicts(tac_instructions), jobs, blocks_per_task).to_dicts()
+
+        program = tac_instructions
+        block_passes = [p for p in self.passes if self.is_block_local(p)]
+        global_passes = [p for p in self.passes if not self.is_block_local(p)]
+        block_names = [self._pass_name(p) for p in block_passes]
+        ranges = split_blocks(program)
+
+        self.history.clear()
+        self.iterations = 0
+        self.converged = True
+        totals: Dict[str, List[int]] = {name: [0, 0] for name in block_names}
+
+        def record(manager: 'PassManager') -> None:
+            self.iterations = max(self.iterations, manager.iterations)
+            self.converged = self.converged and manager.converged
+            for run in manager.history:
+                totals[run.name][0] += run.examined
+                totals[run.name][1] += run.touched
+
+        instructions = program.instructions
+        if block_passes and ranges:
+            optimized = []
+            # Where each block starts in the output, to move the function ranges
+            new_start: Dict[int, int] = {}
+            starts = iter(start for start, _ in ranges)
+            parallel = jobs > 1 and len(ranges) > blocks_per_task and all(n in PASS_REGISTRY for n in block_names)
+            if parallel:
+                chunks = [
+                    [program.derive(instructions[start:end]).to_dicts() for start, end in ranges[i:i + blocks_per_task]]
+                    for i in range(0, len(ranges), blocks_per_task)
+                ]
+                # Blocks travel as dicts, so the declared types go along by name
+                text = program.symbols.text
+                declared = {text(operand): c_type for operand, c_type in program.types.items()}
+                tasks = [(block_names, self.max_iterations, self.target, chunk, declared) for chunk in chunks]
+                # Imported here: the pool machinery is slow to import and most runs never need it
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    for blocks, stats in executor.map(_optimize_block_chunk, tasks):
+                        self.iterations = max(self.iterations, stats[0])
+                        self.converged = self.converged and stats[1]
+                        for name, (examined, touched) in stats[2].items():
+                            totals[name][0] += examined
+                            totals[name][1] += touched
+                        for block in blocks:
+                            new_start[next(starts)] = len(optimized)
+                            optimized.extend(program.instruction_from_dict(d) for d in block)
+            else:
+                manager = PassManager(block_passes, max_iterations=self.max_iterations, target=self.target)
+                for start, end in ranges:
+                    block = manager.run(program.derive(instructions[start:end]))
+                    record(manager)
+                    new_start[next(starts)] = len(optimized)
+                    optimized.extend(block.instructions)
+            if any(a is not b for a, b in zip(optimized, instructions)) or len(optimized) != len(instructions):
+                new_start[len(instructions)] = len(optimized)
+                functions = [(name, new_start[start], new_start[end]) for name, start, end in program.functions]
+                program = program.derive(optimized, functions)
+
+        for name in block_names:
+            examined, touched = totals[name]
+            self.history.append(PassRun(0, name, examined, touched))
+
+        if global_passes:
+            manager = PassManager(global_passes, max_iterations=self.max_iterations, target=self.target)
+            program = manager.run(program)
+            self.iterations = max(self.iterations, manager.iterations)
+            self.converged = self.converged and manager.converged
+            self.history.extend(manager.history)
+        return program
+
+    def run_module(self, module: TACModule, jobs: int = 1, tasks_per_job: int = 4) -> TACModule:
+        """
+        Optimize every unit of a module (one per function) on its own.
+
+        Units are independent once they know the globals they share (see
+        TACModule.share_globals), so with jobs > 1 and a large enough module
+        they are optimized in ``jobs`` worker processes. Units travel to and
+        from the workers in the packed form of tac_utils.module, in roughly
+        ``jobs * tasks_per_job`` tasks of similar instruction counts. The
+        history adds up the runs over all units, per iteration and pass.
+
+        Args:
+            module: Units generated by parser.generate_module
+            jobs: Number of worker processes
+            tasks_per_job: Tasks to split the units into per worker, so
+                workers finishing early can take more
+
+        Returns:
+            TACModule: The optimized units, in the same order
+        """
+        self.history.clear()
+        self.iterations = 0
+        self.converged = True
+        runs: Dict[Tuple[int, int], PassRun] = {}
+
+        def record(history: List[RunRecord]) -> None:
+            """Add up the history of one unit; a pass is keyed by its position in an iteration."""
+            slot, last = 0, None
+            for iteration, name, examined, touched, skipped, statistics in history:
+                slot = slot + 1 if iteration == last else 0
+                last = iteration
+                run = runs.get((iteration, slot))
+                if run is None:
+                    runs[(iteration, slot)] = PassRun(iteration, name, examined, touched, skipped, statistics)
+                else:
+                    run.examined += examined
+                    run.touched += touched
+                    run.skipped = run.skipped and skipped
+                    run.statistics = merge_statistics(run.statistics, statistics)
+
+        total = module.instruction_count()
+        parallel = (jobs > 1 and len(module) > 1 and total >= PARALLEL_MIN_INSTRUCTIONS
+                    and all(name in PASS_REGISTRY for name in self.pipeline))
+        if parallel:
+            # Contiguous chunks of about equal size keep the units in order
+            target = max(1, total // (jobs * tasks_per_job))
+            chunks: List[List[bytes]] = [[]]
+            size = 0
+            for unit in module:
+                if size >= target:
+                    chunks.append([])
+                    size = 0
+                chunks[-1].append(pack_unit(unit))
+                size += len(unit)
+            tasks = [(self.pipeline, self.max_iterations, self.target, chunk) for chunk in chunks]
+            units = []
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+                for packed, (iterations, converged, histories) in executor.map(_optimize_unit_chunk, tasks):
+                    self.iterations = max(self.iterations, iterations)
+                    self.converged = self.converged and converged
+                    for history in histories:
+                        record(history)
+                    units.extend(unpack_unit(data) for data in packed)
+        else:
+            manager = PassManager(self.passes, max_iterations=self.max_iterations, target=self.target)
+            units = []
+            for unit in module:
+                units.append(unit.derive(manager.run(unit.program)))
+                self.iterations = max(self.iterations, manager.iterations)
+                self.converged = self.converged and manager.converged
+                record(run_records(manager.history))
+
+        self.history.extend(runs[key] for key in sorted(runs))
+        return module.derive(units)
+
+    def summary(self) -> str:
+        """Return a short human-readable report of the last run."""
+        if self.converged:
+            lines = [f"Optimization converged after {self.iterations} iteration(s):"]
+        else:
+            lines = [f"Optimization stopped after {self.iterations} iteration(s) without converging:"]
+        for run in self.history:
+            if run.iteration == 0:
+                lines.append(f"  [blocks] {run.name:18} examined {run.examined}, changed {run.touched}")
+            elif run.iteration > self.max_iterations:
+                lines.append(f"  [final] {run.name:19} examined {run.examined}, changed {run.touched}")
+            elif run.skipped:
+                lines.append(f"  [{run.iteration}] {run.name:20} skipped (input unchanged)")
+            else:
+                lines.append(f"  [{run.iteration}] {run.name:20} examined {run.examined}, changed {run.touched}")
+            if run.statistics and not run.skipped:
+                details = ', '.join(f"{key.replace('_', ' ')} {value}" for key, value in run.statistics.items())
+                lines.append(f"  {'':24}{details}")
+        return "\n".join(lines)
+
+def _optimize_block_chunk(task: Tuple[List[str], int, str, List[List[Dict[str, str]]], Dict[str, Optional[str]]]):
+    """Worker entry point for PassManager.run_blocks: optimize a chunk of blocks."""
+    names, max_iterations, target, blocks, declared = task
+    manager = PassManager(names, max_iterations=max_iterations, target=target)
+    iterations, converged = 0, True
+    totals: Dict[str, List[int]] = {name: [0, 0] for name in names}
+    results = []
+    for block in blocks:
+        program = TACProgram.from_dicts(block)
+        for operand, name in enumerate(program.symbols.names):
+            if name in declared:
+                program.types[operand] = declared[name]
+        results.append(manager.run(program).to_dicts())
+        iterations = max(iterations, manager.iterations)
+        converged = converged and manager.converged
+        for run in manager.history:
+            totals[run.name][0] += run.examined
+            totals[run.name][1] += run.touched
+    return results, (iterations, converged, totals)
+
+def _optimize_unit_chunk(task: Tuple[List[str], int, str, List[bytes]]):
+    """Worker entry point for PassManager.run_module: optimize a chunk of packed units."""
+    names, max_iterations, target, packed = task
+    manager = PassManager(names, max_iterations=max_iterations, target=target)
+    iterations, converged = 0, True
+    histories = []
+    results = []
+    for data in packed:
+        unit = unpack_unit(data)
+        results.append(pack_unit(unit.derive(manager.run(unit.program))))
+        iterations = max(iterations, manager.iterations)
+        converged = converged and manager.converged
+        histories.append(run_records(manager.history))
+    return results, (iterations, converged, histories)
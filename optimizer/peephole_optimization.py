@@ -1,113 +1,549 @@
-from typing import Dict, List, Optional
+import re
 from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
-@dataclass
-class OptimizationInfo:
-    original_tac: Dict[str, str]
-    optimized_tac: Optional[Dict[str, str]] = None
-    reason: str = ''
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.c_types import (FLOAT_TYPES, LP64_BITS, binary_result_type, convert, is_integer, is_unsigned,
+                               literal_text, literal_type, operand_types, unary_result_type)
+from tac_utils.ir import ASSIGN, BINOP, UNARYOP, Instruction, Opcode, SymbolTable, TACProgram, ir_pass
 
-class PeepholeOptimizer:
-    def __init__(self):
-        self.optimization_log: List[OptimizationInfo] = []
+# Kinds of rewrite, the rule names in the log and the pass metrics
+IDENTITY = 'Simplified algebraic identity'
+REDUNDANT = 'Eliminated redundant operation'
 
-    def _is_numeric(self, value: str) -> bool:
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
+# Rules applied to one instruction in a row, at most (every rule below
+# simplifies, so they never get there)
+MAX_REWRITES = 8
 
-    def _simplify_algebraic_identity(self, instr: Dict[str, str]) -> Optional[Dict[str, str]]:
-        if 'arg2' not in instr:
-            return None
+_NAME = re.compile(r'[A-Za-z_]\w*$')
+
+class OperandTypes:
+    """C types of the operands of the program a rule is matched in, worked out on first use."""
+
+    def __init__(self, program: TACProgram):
+        self.program = program
+        self._types: Optional[Dict[int, Optional[str]]] = None
+
+    def of(self, operand: int) -> Optional[str]:
+        symbols = self.program.symbols
+        if operand < 0:
+            return literal_type(symbols.text(operand), symbols.value(operand), LP64_BITS)
+        # Declared variables keep their declared type; only the rest needs the sweep
+        if operand in self.program.types:
+            return self.program.types[operand]
+        if self._types is None:
+            self._types = operand_types(self.program, LP64_BITS)
+        return self._types.get(operand)
+
+    def result(self, instr: Instruction) -> Optional[str]:
+        """The type of the value an instruction computes, before it is assigned."""
+        if instr.opcode is BINOP:
+            return binary_result_type(instr.op, self.of(instr.arg1), self.of(instr.arg2), LP64_BITS)
+        if instr.opcode is UNARYOP:
+            return unary_result_type(instr.op, self.of(instr.arg1), LP64_BITS)
+        return self.of(instr.arg1)
+
+# A guard gets the bindings of a match and the operand types, and can veto it
+Guard = Callable[[Dict[str, int], OperandTypes], bool]
+
+def integer(*names: str) -> Guard:
+    """Guard: the operands bound to names all have a known integer type."""
+    def guard(bindings: Dict[str, int], types: OperandTypes) -> bool:
+        return all(is_integer(types.of(bindings[name])) for name in names)
+    return guard
+
+def signed(*names: str) -> Guard:
+    """Guard: the operands bound to names all have a known signed integer or floating type."""
+    def guard(bindings: Dict[str, int], types: OperandTypes) -> bool:
+        for name in names:
+            c_type = types.of(bindings[name])
+            if c_type not in FLOAT_TYPES and not (is_integer(c_type) and not is_unsigned(c_type)):
+                return False
+        return True
+    return guard
+
+def same_type(*names: str) -> Guard:
+    """Guard: the operands bound to names all have the same known type."""
+    def guard(bindings: Dict[str, int], types: OperandTypes) -> bool:
+        found = {types.of(bindings[name]) for name in names}
+        return len(found) == 1 and None not in found
+    return guard
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    A peephole rewrite, declared as text.
+
+    ``pattern`` is a window of consecutive instructions in one basic
+    block, the last of which is rewritten. Each is written like the TAC
+    it matches, with tokens separated by spaces: ``d = x``, ``d = - x``
+    or ``d = x + y``. An operand is either a name, which matches any
+    operand (the same one wherever the name appears), ``#name``, which
+    matches any integer constant, or an integer, which matches an integer
+    constant of that value. ``rewrite`` replaces the last instruction
+    and may use the names bound by the pattern; None deletes it.
+
+    A name read in several instructions of the window stands for one
+    value, so a match is rejected when another instruction in between
+    writes the operand bound to it. ``guards`` can reject a match too,
+    e.g. on the C types of the bound operands.
+    """
+    name: str
+    pattern: Tuple[str, ...]
+    rewrite: Optional[str]
+    kind: str = IDENTITY
+    guards: Tuple[Guard, ...] = ()
 
-        # x + 0 = x or x - 0 = x
-        if (instr['op'] in ['+', '-']) and instr['arg2'] == '0':
-            return {
-                'lhs': instr['lhs'],
-                'op': '=',
-                'arg1': instr['arg1']
-            }
-
-        # x * 1 = x or x / 1 = x
-        if (instr['op'] in ['*', '/']) and instr['arg2'] == '1':
-            return {
-                'lhs': instr['lhs'],
-                'op': '=',
-                'arg1': instr['arg1']
-            }
-
-        # x * 0 = 0
-        if instr['op'] == '*' and (instr['arg1'] == '0' or instr['arg2'] == '0'):
-            return {
-                'lhs': instr['lhs'],
-                'op': '=',
-                'arg1': '0'
-            }
-
-        return None
-
-    def _simplify_redundant_operations(self, instr: Dict[str, str], prev_instr: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
-        if not prev_instr:
+# A compiled operand: ('var', name), ('const', name) or ('int', value)
+Operand = Tuple[str, object]
+
+class _Shape:
+    """One instruction of a pattern or rewrite."""
+    __slots__ = ('opcode', 'op', 'dest', 'arg1', 'arg2')
+
+    def __init__(self, opcode: Opcode, op: Optional[str], dest: str, arg1: Operand, arg2: Optional[Operand]):
+        self.opcode = opcode
+        self.op = op
+        self.dest = dest
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def reads(self) -> List[str]:
+        return [arg[1] for arg in (self.arg1, self.arg2) if arg is not None and arg[0] != 'int']
+
+def _parse_operand(token: str, text: str) -> Operand:
+    if token.startswith('#') and _NAME.match(token[1:]):
+        return ('const', token[1:])
+    if _NAME.match(token):
+        return ('var', token)
+    try:
+        return ('int', int(token))
+    except ValueError:
+        raise ValueError(f"Bad operand '{token}' in peephole rule '{text}'") from None
+
+def _parse(text: str) -> _Shape:
+    tokens = text.split()
+    if len(tokens) < 3 or tokens[1] != '=' or not _NAME.match(tokens[0]):
+        raise ValueError(f"Peephole rule instruction must look like 'd = x op y', got '{text}'")
+    dest, rhs = tokens[0], tokens[2:]
+    if len(rhs) == 1:
+        return _Shape(ASSIGN, None, dest, _parse_operand(rhs[0], text), None)
+    if len(rhs) == 2:
+        return _Shape(UNARYOP, rhs[0], dest, _parse_operand(rhs[1], text), None)
+    if len(rhs) == 3:
+        return _Shape(BINOP, rhs[1], dest, _parse_operand(rhs[0], text), _parse_operand(rhs[2], text))
+    raise ValueError(f"Peephole rule instruction must look like 'd = x op y', got '{text}'")
+
+class _CompiledRule:
+    """A rule parsed into shapes, with the write checks its window needs."""
+
+    def __init__(self, rule: Rule):
+        self.rule = rule
+        self.reason = f'{rule.kind}: {rule.name}'
+        if not rule.pattern:
+            raise ValueError(f"Peephole rule '{rule.name}' has an empty pattern")
+        self.shapes = [_parse(text) for text in rule.pattern]
+        self.rewrite = _parse(rule.rewrite) if rule.rewrite is not None else None
+        self.guards = rule.guards
+        last = len(self.shapes) - 1
+        # Instructions the window needs before the rewritten one
+        self.reach = last
+
+        bound: Set[str] = set()
+        for shape in self.shapes:
+            bound.add(shape.dest)
+            bound.update(shape.reads())
+        if self.rewrite is not None:
+            unbound = [name for name in [self.rewrite.dest] + self.rewrite.reads() if name not in bound]
+            if unbound:
+                raise ValueError(f"Peephole rule '{rule.name}' rewrites with unbound {', '.join(unbound)}")
+
+        # Every name read more than once stands for one value: nothing in the
+        # window may write it between its first read (or the write it reads)
+        # and its last read. The rewrite reads at the last position.
+        reads: Dict[str, List[int]] = {}
+        for pos, shape in enumerate(self.shapes):
+            for name in shape.reads():
+                reads.setdefault(name, []).append(pos)
+        if self.rewrite is not None:
+            for name in self.rewrite.reads():
+                reads.setdefault(name, []).append(last)
+        self.checks: List[Tuple[str, str]] = []
+        for name, positions in reads.items():
+            first, final = min(positions), max(positions)
+            writes = [pos for pos, shape in enumerate(self.shapes) if shape.dest == name and pos < first]
+            start = writes[-1] + 1 if writes else first
+            for pos in range(start, final):
+                writer = self.shapes[pos].dest
+                if writer == name:
+                    raise ValueError(f"Peephole rule '{rule.name}' reads {name} both before and after writing it")
+                if (name, writer) not in self.checks:
+                    self.checks.append((name, writer))
+
+        # match(instr, previous, int_value, types) -> bindings or None, where
+        # previous are the instructions before instr, nearest first. The
+        # caller has checked the opcode and operator of instr.
+        self.match = _compile_matcher(self.shapes, self.checks, self.guards)
+
+    def build(self, bindings: Dict[str, int], symbols: SymbolTable) -> Optional[Instruction]:
+        shape = self.rewrite
+        if shape is None:
             return None
 
-        # Check for x = y followed by z = x, convert to z = y
-        if (
-            prev_instr['op'] == '=' and
-            'arg2' not in prev_instr and
-            instr['op'] == '=' and
-            'arg2' not in instr and
-            instr['arg1'] == prev_instr['lhs']
-        ):
-            return {
-                'lhs': instr['lhs'],
-                'op': '=',
-                'arg1': prev_instr['arg1']
-            }
-
-        return None
-
-    def optimize(self, tac_instructions: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        optimized = []
-        self.optimization_log.clear()
-        prev_instr = None
-
-        for instr in tac_instructions:
-            # Try algebraic identity simplification
-            opt_instr = self._simplify_algebraic_identity(instr)
-            if opt_instr:
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        optimized_tac=opt_instr,
-                        reason='Simplified algebraic identity'
-                    )
-                )
-                optimized.append(opt_instr)
-                prev_instr = opt_instr
+        def operand(arg: Optional[Operand]) -> Optional[int]:
+            if arg is None:
+                return None
+            if arg[0] == 'int':
+                return symbols.constant(str(arg[1]))
+            return bindings[arg[1]]
+
+        return Instruction(shape.opcode, bindings[shape.dest], shape.op, operand(shape.arg1), operand(shape.arg2))
+
+def _compile_matcher(shapes: List[_Shape], checks: List[Tuple[str, str]], guards: Tuple[Guard, ...]) -> Callable:
+    """
+    Turn a pattern into straight-line Python: one comparison per opcode,
+    operator, repeated name, integer and write check, and no bindings
+    dict until the whole pattern has matched.
+    """
+    lines = ['def match(i0, previous, int_value, types):']
+    seen: Set[str] = set()
+    for pos, shape in enumerate(reversed(shapes)):
+        instr = f'i{pos}'
+        if pos:
+            lines.append(f'    {instr} = previous[{pos - 1}]')
+            lines.append(f'    if {instr}.opcode is not Opcode.{shape.opcode.name} or {instr}.op != {shape.op!r}: return None')
+        for field, arg in (('dest', ('var', shape.dest)), ('arg1', shape.arg1), ('arg2', shape.arg2)):
+            if arg is None:
                 continue
+            kind, key = arg
+            value = f'{instr}.{field}'
+            if kind == 'int':
+                lines.append(f'    if int_value({value}) != {key!r}: return None')
+            elif key in seen:
+                lines.append(f'    if {value} != v_{key}: return None')
+            else:
+                seen.add(key)
+                lines.append(f'    v_{key} = {value}')
+                if kind == 'const':
+                    lines.append(f'    if int_value(v_{key}) is None: return None')
+    for name, writer in checks:
+        lines.append(f'    if v_{name} == v_{writer}: return None')
+    lines.append('    bindings = {' + ', '.join(f'{name!r}: v_{name}' for name in sorted(seen)) + '}')
+    namespace: Dict[str, object] = {'Opcode': Opcode}
+    for number, guard in enumerate(guards):
+        namespace[f'guard{number}'] = guard
+        lines.append(f'    if not guard{number}(bindings, types): return None')
+    lines.append('    return bindings')
+    exec('\n'.join(lines), namespace)
+    return namespace['match']
 
-            # Try redundant operation elimination
-            opt_instr = self._simplify_redundant_operations(instr, prev_instr)
-            if opt_instr:
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        optimized_tac=opt_instr,
-                        reason='Eliminated redundant operation'
-                    )
-                )
-                optimized.append(opt_instr)
-                prev_instr = opt_instr
+class _Group:
+    """Rules filed by the integer their pattern has in one instruction, if any."""
+    __slots__ = ('by_arg2', 'by_arg1', 'rest')
+
+    def __init__(self):
+        self.by_arg2: Dict[int, List[_CompiledRule]] = {}
+        self.by_arg1: Dict[int, List[_CompiledRule]] = {}
+        self.rest: List[_CompiledRule] = []
+
+    def add(self, rule: _CompiledRule, shape: _Shape) -> None:
+        if shape.arg2 is not None and shape.arg2[0] == 'int':
+            self.by_arg2.setdefault(shape.arg2[1], []).append(rule)
+        elif shape.arg1[0] == 'int':
+            self.by_arg1.setdefault(shape.arg1[1], []).append(rule)
+        else:
+            self.rest.append(rule)
+
+    def collect(self, instr: Instruction, int_value: Callable[[int], Optional[int]],
+                found: List[_CompiledRule]) -> None:
+        """Add the rules that could match instr to found: by integer, then the rest."""
+        if self.by_arg2 and instr.arg2 is not None and instr.arg2 < 0:
+            found.extend(self.by_arg2.get(int_value(instr.arg2), ()))
+        if self.by_arg1 and instr.arg1 < 0:
+            found.extend(self.by_arg1.get(int_value(instr.arg1), ()))
+        found.extend(self.rest)
+
+class _Bucket:
+    """The rules whose last instruction has one opcode and operator."""
+    __slots__ = ('windowed', 'single')
+
+    def __init__(self):
+        # Rules over several instructions: opcode -> operator -> group, for the
+        # instruction before the last, filed by the integer in that one
+        self.windowed: Dict[Opcode, Dict[Optional[str], _Group]] = {}
+        # Single-instruction rules, filed by the integer in the pattern
+        self.single = _Group()
+
+class RuleIndex:
+    """
+    A rule set compiled for dispatch: rules are filed under the opcode and
+    operator of the instruction they rewrite, and within that under the
+    opcode and operator of the instruction before it (for windows) and
+    the integer constant in the pattern, so an instruction is only
+    matched against rules that could apply to it.
+    """
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules = [_CompiledRule(rule) for rule in rules]
+        self.window = max((len(rule.shapes) for rule in self.rules), default=1)
+        # Opcode -> operator -> bucket
+        self.buckets: Dict[Opcode, Dict[Optional[str], _Bucket]] = {}
+        for rule in self.rules:
+            anchor = rule.shapes[-1]
+            bucket = self.buckets.setdefault(anchor.opcode, {}).setdefault(anchor.op, _Bucket())
+            if len(rule.shapes) > 1:
+                before = rule.shapes[-2]
+                group = bucket.windowed.setdefault(before.opcode, {}).setdefault(before.op, _Group())
+                group.add(rule, before)
+            else:
+                bucket.single.add(rule, anchor)
+
+    def bucket(self, instr: Instruction) -> Optional[_Bucket]:
+        by_op = self.buckets.get(instr.opcode)
+        return by_op.get(instr.op) if by_op is not None else None
+
+    @staticmethod
+    def candidates(bucket: _Bucket, instr: Instruction, before: Optional[Instruction],
+                   int_value: Callable[[int], Optional[int]]) -> List[_CompiledRule]:
+        """
+        The rules of instr's bucket that could rewrite it, given the
+        instruction before it: windows first, each group in declaration order.
+        """
+        single = bucket.single
+        group = None
+        if bucket.windowed and before is not None:
+            by_op = bucket.windowed.get(before.opcode)
+            if by_op is not None:
+                group = by_op.get(before.op)
+        if group is None and not single.by_arg2 and not single.by_arg1:
+            return single.rest
+        found: List[_CompiledRule] = []
+        if group is not None:
+            group.collect(before, int_value, found)
+        single.collect(instr, int_value, found)
+        return found
+
+def _comparison_rules() -> List[Rule]:
+    rules = []
+    # !(a < b) is a >= b only without NaNs; == and != invert either way
+    for op, inverse in (('==', '!='), ('!=', '=='), ('<', '>='), ('>=', '<'), ('>', '<='), ('<=', '>')):
+        guards = () if op in ('==', '!=') else (integer('a', 'b'),)
+        rules.append(Rule(f'!(a {op} b) = a {inverse} b', (f't = a {op} b', 'd = ! t'), f'd = a {inverse} b',
+                          guards=guards))
+    for op, value in (('==', 1), ('<=', 1), ('>=', 1), ('!=', 0), ('<', 0), ('>', 0)):
+        rules.append(Rule(f'x {op} x = {value}', (f'd = x {op} x',), f'd = {value}', guards=(integer('x'),)))
+    return rules
+
+# Integer constants only: with a float constant the result type changes.
+# Bitwise operators and % take integer operands in C, so their rules need no guard.
+RULES: List[Rule] = [
+    Rule('x + 0 = x', ('d = x + 0',), 'd = x'),
+    Rule('0 + x = x', ('d = 0 + x',), 'd = x'),
+    Rule('x - 0 = x', ('d = x - 0',), 'd = x'),
+    Rule('x * 1 = x', ('d = x * 1',), 'd = x'),
+    Rule('1 * x = x', ('d = 1 * x',), 'd = x'),
+    Rule('x / 1 = x', ('d = x / 1',), 'd = x'),
+    Rule('x * 0 = 0', ('d = x * 0',), 'd = 0'),
+    Rule('0 * x = 0', ('d = 0 * x',), 'd = 0'),
+    Rule('x * -1 = -x', ('d = x * -1',), 'd = - x'),
+    Rule('-1 * x = -x', ('d = -1 * x',), 'd = - x'),
+    # 0.0 - 0.0 is +0.0 but -0.0 is -0.0, and NaN - NaN is not 0
+    Rule('0 - x = -x', ('d = 0 - x',), 'd = - x', guards=(integer('x'),)),
+    Rule('x - x = 0', ('d = x - x',), 'd = 0', guards=(integer('x'),)),
+    Rule('x % 1 = 0', ('d = x % 1',), 'd = 0'),
+    Rule('x & 0 = 0', ('d = x & 0',), 'd = 0'),
+    Rule('0 & x = 0', ('d = 0 & x',), 'd = 0'),
+    Rule('x & -1 = x', ('d = x & -1',), 'd = x'),
+    Rule('-1 & x = x', ('d = -1 & x',), 'd = x'),
+    Rule('x & x = x', ('d = x & x',), 'd = x'),
+    Rule('x | 0 = x', ('d = x | 0',), 'd = x'),
+    Rule('0 | x = x', ('d = 0 | x',), 'd = x'),
+    # An unsigned x | -1 is the largest unsigned value, not -1
+    Rule('x | -1 = -1', ('d = x | -1',), 'd = -1', guards=(signed('x'),)),
+    Rule('x | x = x', ('d = x | x',), 'd = x'),
+    Rule('x ^ 0 = x', ('d = x ^ 0',), 'd = x'),
+    Rule('0 ^ x = x', ('d = 0 ^ x',), 'd = x'),
+    Rule('x ^ x = 0', ('d = x ^ x',), 'd = 0'),
+    Rule('x << 0 = x', ('d = x << 0',), 'd = x'),
+    Rule('x >> 0 = x', ('d = x >> 0',), 'd = x'),
+    Rule('0 << x = 0', ('d = 0 << x',), 'd = 0'),
+    Rule('0 >> x = 0', ('d = 0 >> x',), 'd = 0'),
+    Rule('x && 0 = 0', ('d = x && 0',), 'd = 0'),
+    Rule('0 && x = 0', ('d = 0 && x',), 'd = 0'),
+    Rule('x || 1 = 1', ('d = x || 1',), 'd = 1'),
+    Rule('1 || x = 1', ('d = 1 || x',), 'd = 1'),
+    *_comparison_rules(),
+    Rule('double negation', ('t = - x', 'd = - t'), 'd = x'),
+    Rule('double complement', ('t = ~ x', 'd = ~ t'), 'd = x'),
+    Rule('triple logical not', ('t = ! x', 'u = ! t', 'd = ! u'), 'd = ! x'),
+    # An unsigned -x converted to a wider type is not the negated value
+    Rule('a + -x = a - x', ('t = - x', 'd = a + t'), 'd = a - x', guards=(signed('x'),)),
+    Rule('-x + a = a - x', ('t = - x', 'd = t + a'), 'd = a - x', guards=(signed('x'),)),
+    Rule('a - -x = a + x', ('t = - x', 'd = a - t'), 'd = a + x', guards=(signed('x'),)),
+    Rule('(x + y) - y = x', ('t = x + y', 'd = t - y'), 'd = x', guards=(integer('x'), same_type('x', 'y'))),
+    Rule('(x - y) + y = x', ('t = x - y', 'd = t + y'), 'd = x', guards=(integer('x'), same_type('x', 'y'))),
+    Rule('(x ^ y) ^ y = x', ('t = x ^ y', 'd = t ^ y'), 'd = x', guards=(same_type('x', 'y'),)),
+    # x = y converts y to the type of x, which the copy back or y itself need not have
+    Rule('copy back', ('x = y', 'y = x'), None, kind=REDUNDANT, guards=(same_type('x', 'y'),)),
+    Rule('repeated copy', ('x = y', 'x = y'), None, kind=REDUNDANT),
+    Rule('copy of a copy', ('x = y', 'd = x'), 'd = y', kind=REDUNDANT, guards=(same_type('x', 'y'),)),
+    Rule('self copy', ('x = x',), None, kind=REDUNDANT),
+]
+
+_default_index: Optional[RuleIndex] = None
+
+def default_index() -> RuleIndex:
+    """The compiled RULES, built once."""
+    global _default_index
+    if _default_index is None:
+        _default_index = RuleIndex(RULES)
+    return _default_index
+
+class PeepholeOptimizer:
+    """
+    Rewrites instructions matched by declarative rules (see Rule and
+    RULES) over windows of consecutive instructions in a basic block.
+
+    The rules are compiled into a RuleIndex, so each instruction is only
+    matched against the rules filed under its opcode and operator. Rules
+    are applied to an instruction until none matches; the rewritten
+    instruction is seen by the windows of the ones after it.
+    """
+
+    # Rewrites look at an instruction and the ones before it, so a dirty index
+    # also makes the following instructions worth revisiting
+    local = True
+
+    def __init__(self, rules: Optional[Iterable[Rule]] = None):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        self.index = default_index() if rules is None else RuleIndex(rules)
+
+    @ir_pass
+    def optimize(self, program: TACProgram, dirty: Optional[Iterable[int]] = None) -> TACProgram:
+        instructions = program.instructions
+        count = len(instructions)
+        # Copied on first rewrite; deleted instructions become None until the end
+        optimized: Optional[List[Optional[Instruction]]] = None
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
+        index = self.index
+        symbols = program.symbols
+        int_value = symbols.int_value
+        types = OperandTypes(program)
+        buckets = index.buckets
+        # Windows do not reach back into the previous function
+        starts = {start for _, start, _ in program.functions}
+
+        if dirty is None:
+            indices: Iterable[int] = range(count)
+        else:
+            window = set(dirty)
+            span = index.window - 1
+            if span:
+                window.update([idx + k for idx in list(window) for k in range(1, span + 1) if idx + k < count])
+            indices = sorted(window)
+
+        rewritten: List[int] = []
+        for idx in indices:
+            instr = instructions[idx]
+            by_op = buckets.get(instr.opcode)
+            bucket = by_op.get(instr.op) if by_op is not None else None
+            current: Optional[Instruction] = instr
+            reasons: List[str] = []
+            previous: Optional[List[Instruction]] = None
+            while bucket is not None:
+                if previous is None and bucket.windowed:
+                    # Earlier rewrites are visible to the window
+                    previous = self._before(optimized or instructions, idx, 1, starts)
+                before = previous[0] if previous else None
+                for rule in index.candidates(bucket, current, before, int_value):
+                    reach = rule.reach
+                    if reach and reach > len(previous):
+                        previous = self._before(optimized or instructions, idx, reach, starts)
+                        if reach > len(previous):
+                            continue
+                    bindings = rule.match(current, previous, int_value, types)
+                    if bindings is None:
+                        continue
+                    replacement = rule.build(bindings, symbols)
+                    if replacement is not None:
+                        replacement = self._same_result_type(current, replacement, types, symbols)
+                    if replacement is not None and replacement == current:
+                        continue
+                    reasons.append(rule.reason)
+                    current = replacement
+                    break
+                else:
+                    break
+                if current is None or len(reasons) == MAX_REWRITES:
+                    break
+                bucket = index.bucket(current)
+
+            if reasons:
+                if log.changes:
+                    log.change(instr, current, '; '.join(reasons))
+                if optimized is None:
+                    optimized = list(instructions)
+                optimized[idx] = current
+                rewritten.append(idx)
                 continue
 
             # No optimization possible
-            optimized.append(instr)
-            self.optimization_log.append(OptimizationInfo(original_tac=instr))
-            prev_instr = instr
+            if log.full:
+                log.keep(instr)
+
+        self.changed = optimized is not None
+        if not self.changed:
+            return program
+        if all(instr is not None for instr in optimized):
+            self.touched = rewritten
+            return program.derive(optimized)
+
+        # Some instructions were deleted: compact and move the function ranges
+        new_start: List[int] = []
+        kept: List[Instruction] = []
+        for instr in optimized:
+            new_start.append(len(kept))
+            if instr is not None:
+                kept.append(instr)
+        new_start.append(len(kept))
+        # A deletion touches the instruction that now follows its predecessor
+        self.touched = [new_start[idx] for idx in rewritten]
+        functions = [(name, new_start[start], new_start[end]) for name, start, end in program.functions]
+        return program.derive(kept, functions)
+
+    @staticmethod
+    def _same_result_type(instr: Instruction, replacement: Instruction, types: OperandTypes,
+                          symbols: SymbolTable) -> Instruction:
+        """
+        The replacement, computing a value of the same type as instr: a
+        constant is spelled in that type, and a replacement of another type
+        gives back instr (so the rule is skipped). ``x + 0u`` is not ``x``
+        for an int x, as it converts x to unsigned int.
+        """
+        c_type = types.result(instr)
+        if c_type is None or types.result(replacement) == c_type:
+            return replacement
+        if replacement.opcode is ASSIGN and replacement.arg1 < 0:
+            value = convert(symbols.value(replacement.arg1), c_type, LP64_BITS)
+            if value is not None:
+                constant = symbols.constant(literal_text(value, c_type, LP64_BITS), value)
+                return Instruction(ASSIGN, replacement.dest, None, constant, None)
+        return instr
 
-        return optimized
+    @staticmethod
+    def _before(instructions: List[Optional[Instruction]], idx: int, span: int, starts: Set[int]) -> List[Instruction]:
+        """Up to span instructions before idx in its function, nearest first, skipping deleted ones."""
+        previous: List[Instruction] = []
+        pos = idx
+        while len(previous) < span and pos not in starts and pos > 0:
+            pos -= 1
+            if instructions[pos] is not None:
+                previous.append(instructions[pos])
+        return previous
 
-    def get_optimization_log(self) -> List[OptimizationInfo]:
-        return self.optimization_log
\ No newline at end of file
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
@@ -0,0 +1,427 @@
+import math
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from optimizer.optimization_log import OptimizationLog
+from optimizer.target import TargetProfile, get_target
+from tac_utils.c_types import (FLOAT_TYPES, RANKS, binary_result_type, is_unsigned, literal_type, operand_types,
+                               promote, usual_arithmetic_type, width)
+from tac_utils.cfg import split_blocks
+from tac_utils.ir import BINOP, UNARYOP, Instruction, Number, SymbolTable, TACProgram, assign, binop, ir_pass, unaryop
+
+# The chain every operator belongs to: a - b joins the + chain as a + (-b)
+CHAIN_OF = {'+': '+', '-': '+', '*': '*', '&': '&', '|': '|', '^': '^'}
+# Chains fast-math also regroups when they compute in a floating-point type
+FLOAT_CHAINS = frozenset(('+', '*'))
+
+# A leaf of a chain: operand, sign (-1 when it is subtracted), position of the operation reading it
+Leaf = Tuple[int, int, int]
+
+class Reassociator:
+    """
+    Regroups chains of an associative and commutative integer operator
+    (+ with -, *, &, |, ^) so that their constants fold together and equal
+    sums, products, ... are computed the same way.
+
+    A chain is a tree of such operations within one basic block whose
+    inner results are temporaries used only by the next operation up.
+    Its leaves are ranked: values from outside the block first (ordered
+    by operand), then values computed in the block in the order they were
+    computed, then the constants, which are folded into one. The chain is
+    rebuilt at its root as a left-leaning sequence over the ranked leaves,
+    so ``a + 1 + 2`` becomes ``a + 3``, ``x - y + y`` becomes ``x``, and
+    ``c + b + a`` and ``a + c + b`` both start with ``a + b``, which CSE
+    can then share.
+
+    Every operation of a chain must compute in the same C type, and every
+    leaf must convert to it, so regrouping never changes the type (and
+    width) an intermediate result is computed in; integer arithmetic wraps
+    around, which makes any grouping give the same bits. Floating-point
+    chains round differently when regrouped and are left alone unless
+    ``fast_math`` is set (see FastMathReassociator).
+    """
+
+    # Built for a target profile (see PassManager): constants are folded in its integer widths
+    targeted = True
+    # Also regroup floating-point + and * chains
+    fast_math = False
+
+    def __init__(self, target: Union[str, TargetProfile, None] = None):
+        self.target = get_target(target)
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        self.symbols: Optional[SymbolTable] = None
+        self.types: Dict[int, Optional[str]] = {}
+
+    def _type_of(self, operand: int) -> Optional[str]:
+        if operand < 0:
+            return literal_type(self.symbols.text(operand), self.symbols.value(operand), self.target.bits)
+        return self.types.get(operand)
+
+    def _wrap(self, value: int, c_type: str) -> int:
+        """Convert an integer to c_type, wrapping around like the machine does."""
+        bits = width(c_type, self.target.bits)
+        value &= (1 << bits) - 1
+        if not is_unsigned(c_type) and value >= 1 << (bits - 1):
+            value -= 1 << bits
+        return value
+
+    def _chain_type(self, op: str, nodes: List[Instruction], leaves: List[Leaf]) -> Optional[str]:
+        """The C type every operation of the chain computes in, or None if the chain cannot be regrouped."""
+        bits = self.target.bits
+        node_types: Dict[int, Optional[str]] = {}
+        for instr in nodes:
+            arg1 = node_types[instr.arg1] if instr.arg1 in node_types else self._type_of(instr.arg1)
+            arg2 = node_types[instr.arg2] if instr.arg2 in node_types else self._type_of(instr.arg2)
+            node_types[instr.dest] = binary_result_type(instr.op, arg1, arg2, bits)
+        found = set(node_types.values())
+        if len(found) != 1:
+            return None
+        c_type = found.pop()
+        if c_type in FLOAT_TYPES:
+            if not self.fast_math or op not in FLOAT_CHAINS:
+                return None
+        elif c_type not in RANKS:
+            return None
+        # Each leaf meets a value of the chain's type wherever it ends up, except in the
+        # first operation, which _typed() checks once the chain is rebuilt
+        for operand, _, _ in leaves:
+            if usual_arithmetic_type(self._type_of(operand), c_type, bits) != c_type:
+                return None
+        return c_type
+
+    def _full(self, operand: int, c_type: str) -> bool:
+        """Whether an operand has the chain's type c_type once promoted."""
+        operand_type = self._type_of(operand)
+        if operand_type in RANKS:
+            operand_type = promote(operand_type, self.target.bits)
+        return operand_type == c_type
+
+    def _typed(self, code: List[Instruction], c_type: str) -> bool:
+        """Whether every instruction of a rebuilt chain computes in c_type."""
+        bits = self.target.bits
+        results = set()
+        for instr in code:
+            if instr.opcode is not BINOP:
+                continue
+            arg1 = c_type if instr.arg1 in results else self._type_of(instr.arg1)
+            arg2 = c_type if instr.arg2 in results else self._type_of(instr.arg2)
+            if binary_result_type(instr.op, arg1, arg2, bits) != c_type:
+                return False
+            results.add(instr.dest)
+        first = code[0]
+        if first.opcode is not BINOP:
+            # A lone copy, or the negation a chain of subtractions starts with
+            operand = self._type_of(first.arg1)
+            if operand != c_type and (first.opcode is not UNARYOP or operand not in RANKS
+                                      or promote(operand, bits) != c_type):
+                return False
+        return True
+
+    def _fold(self, op: str, constants: List[Leaf], c_type: str) -> Optional[Number]:
+        """The constant leaves combined in c_type, or None if they do not fold."""
+        result = None
+        for operand, sign, _ in constants:
+            value = self.symbols.value(operand)
+            if c_type in FLOAT_TYPES:
+                value = float(value)
+            elif type(value) is not int:
+                return None
+            if sign < 0:
+                value = -value
+            if result is None:
+                result = value
+            elif op == '+':
+                result += value
+            elif op == '*':
+                result *= value
+            elif op == '&':
+                result &= value
+            elif op == '|':
+                result |= value
+            else:
+                result ^= value
+        if c_type in FLOAT_TYPES:
+            return result if math.isfinite(result) else None
+        return self._wrap(result, c_type)
+
+    def _constant(self, value: Number, c_type: str, exact: bool = False) -> Optional[int]:
+        """
+        Intern a literal for value that converts to c_type when combined
+        with an operand of that type, or that has exactly that type.
+        """
+        bits = self.target.bits
+        if c_type in FLOAT_TYPES:
+            texts = [repr(value), f'{value!r}f']
+        else:
+            texts = [str(value), f'{value}u', f'{value}l', f'{value}ul', f'{value}ll', f'{value}ull']
+        for text in texts:
+            literal = literal_type(text, value, bits)
+            if literal == c_type or (not exact and literal in RANKS and usual_arithmetic_type(literal, c_type, bits) == c_type):
+                return self.symbols.constant(text, value)
+        return None
+
+    @staticmethod
+    def _cancel(op: str, terms: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Drop integer terms that cancel out: x and -x in a sum, pairs of x in an exclusive or."""
+        if op not in ('+', '^'):
+            return terms
+        net: Dict[int, int] = {}
+        for operand, sign in terms:
+            net[operand] = net.get(operand, 0) + (sign if op == '+' else 1)
+        kept = []
+        for operand, count in net.items():
+            if op == '^':
+                count %= 2
+            kept.extend([(operand, 1 if count > 0 else -1)] * abs(count))
+        return kept
+
+    def _emit(self, op: str, terms: List[Tuple[int, int]], constant: Optional[Number], c_type: str,
+              temps: List[int], dest: int) -> Optional[List[Instruction]]:
+        """
+        Rebuild a chain as a left-leaning sequence: the terms (operand,
+        sign) in order, then the constant. The intermediate results go to
+        temps and the last one to dest.
+        """
+        if constant is not None and c_type in RANKS:
+            all_ones = self._wrap(-1, c_type)
+            if (op in ('*', '&') and constant == 0) or (op == '|' and constant == all_ones):
+                # The constant decides the result on its own
+                terms = []
+            elif op == '+' and is_unsigned(c_type) and constant > all_ones >> 1:
+                # x - 3u rather than x + 4294967293u
+                constant -= all_ones + 1
+            if terms and constant == {'+': 0, '*': 1, '&': all_ones, '|': 0, '^': 0}[op]:
+                constant = None
+
+        # Steps (operator, operand); the first one has no operator, or is a negation
+        steps: List[Tuple[Optional[str], int]] = []
+        rest = terms
+        if any(sign > 0 for _, sign in terms):
+            first = next(term for term in terms if term[1] > 0)
+            rest = list(terms)
+            rest.remove(first)
+            steps.append((None, first[0]))
+        elif constant is not None and (constant >= 0 or not terms):
+            value = self._constant(constant, c_type, exact=not terms)
+            if value is None:
+                return None
+            steps.append((None, value))
+            constant = None
+        else:
+            steps.append(('-', terms[0][0]))
+            rest = terms[1:]
+        for operand, sign in rest:
+            steps.append(('-' if sign < 0 else op, operand))
+        if constant is not None:
+            subtract = op == '+' and constant < 0
+            value = self._constant(-constant if subtract else constant, c_type)
+            if value is None:
+                return None
+            steps.append(('-' if subtract else op, value))
+
+        if len(steps) == 1:
+            kind, operand = steps[0]
+            return [assign(dest, operand) if kind is None else unaryop(dest, kind, operand)]
+        if len(steps) - 2 > len(temps):
+            return None
+        code: List[Instruction] = []
+        free = iter(temps)
+        acc = None
+        for index, (kind, operand) in enumerate(steps):
+            if kind is None:
+                acc = operand
+                continue
+            result = dest if index == len(steps) - 1 else next(free)
+            code.append(unaryop(result, kind, operand) if acc is None else binop(result, kind, acc, operand))
+            acc = result
+        return code
+
+    @staticmethod
+    def _describe(op: str, terms: List[Tuple[str, int]]) -> str:
+        parts = []
+        for text, sign in terms:
+            if not parts:
+                parts.append(f'-{text}' if sign < 0 else text)
+            else:
+                parts.append(f"{'-' if sign < 0 else op} {text}")
+        return ' '.join(parts)
+
+    @staticmethod
+    def _describe_code(code: List[Instruction], text) -> str:
+        first = code[0]
+        if first.opcode is BINOP:
+            parts = [text(first.arg1), first.op, text(first.arg2)]
+        else:
+            parts = [f'{first.op}{text(first.arg1)}' if first.opcode is UNARYOP else text(first.arg1)]
+        for instr in code[1:]:
+            parts += [instr.op, text(instr.arg2)]
+        return ' '.join(parts)
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        instructions = program.instructions
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
+        self.changed = False
+        symbols = self.symbols = program.symbols
+
+        blocks = split_blocks(program)
+        block_of: List[int] = []
+        for index, (start, end) in enumerate(blocks):
+            block_of.extend([index] * (end - start))
+
+        # Where every name is written, and how often and (last) where it is read
+        writes: Dict[int, List[int]] = {}
+        uses: Dict[int, int] = {}
+        used_at: Dict[int, int] = {}
+        for pos, instr in enumerate(instructions):
+            for arg in (instr.arg1, instr.arg2):
+                if arg is not None and arg >= 0:
+                    uses[arg] = uses.get(arg, 0) + 1
+                    used_at[arg] = pos
+            if instr.dest is not None:
+                writes.setdefault(instr.dest, []).append(pos)
+
+        # Temporaries computed once and read once, later in the block, by an operation of the same chain
+        shared = program.shared
+        declared = program.types
+        temps = symbols.temps
+        inner: Set[int] = set()
+        for pos, instr in enumerate(instructions):
+            dest = instr.dest
+            if (instr.opcode is BINOP and instr.op in CHAIN_OF and dest in temps and dest not in shared
+                    and dest not in declared and uses.get(dest) == 1 and len(writes[dest]) == 1):
+                user_pos = used_at[dest]
+                user = instructions[user_pos]
+                if (user_pos > pos and block_of[user_pos] == block_of[pos] and user.opcode is BINOP
+                        and CHAIN_OF.get(user.op) == CHAIN_OF[instr.op] and user.dest != dest):
+                    inner.add(pos)
+        if not inner:
+            return program
+        types = self.types = operand_types(program, self.target.bits)
+        for pos in list(inner):
+            dest = instructions[pos].dest
+            if types.get(dest) is None or types.get(dest) != types.get(instructions[used_at[dest]].dest):
+                inner.discard(pos)
+
+        # Position -> instructions replacing it (an empty list deletes it)
+        replace: Dict[int, List[Instruction]] = {}
+        text = symbols.text
+        for root, instr in enumerate(instructions):
+            if instr.opcode is not BINOP or instr.op not in CHAIN_OF or root in inner:
+                continue
+            op = CHAIN_OF[instr.op]
+            nodes: List[int] = []
+            leaves: List[Leaf] = []
+
+            # Walk the tree left to right without recursion, long chains nest deep;
+            # a stack entry is (node, sign, index of its next operand)
+            stack: List[Tuple[int, int, int]] = [(root, 1, 0)]
+            while stack:
+                pos, sign, arg_index = stack.pop()
+                if arg_index == 2:
+                    nodes.append(pos)
+                    continue
+                node = instructions[pos]
+                arg = node.arg2 if arg_index else node.arg1
+                arg_sign = -sign if arg_index and node.op == '-' else sign
+                stack.append((pos, sign, arg_index + 1))
+                child = writes[arg][0] if arg in temps and arg in writes else None
+                if child is not None and child in inner and used_at[arg] == pos:
+                    stack.append((child, arg_sign, 0))
+                else:
+                    leaves.append((arg, arg_sign, pos))
+            if len(nodes) < 2:
+                continue
+            c_type = self._chain_type(op, [instructions[pos] for pos in nodes], leaves)
+            if c_type is None:
+                continue
+
+            # Every leaf is now read at the root, so nothing may write it in between
+            clobbered = False
+            for operand, _, read in leaves:
+                if operand >= 0:
+                    positions = writes.get(operand, ())
+                    later = bisect_left(positions, read)
+                    if later < len(positions) and positions[later] < root:
+                        clobbered = True
+                        break
+            if clobbered:
+                continue
+
+            start = blocks[block_of[root]][0]
+
+            def rank(leaf: Leaf) -> Tuple[int, int, int]:
+                operand, sign, read = leaf
+                positions = writes.get(operand, ())
+                before = bisect_left(positions, read) - 1
+                defined = positions[before] if before >= 0 and positions[before] >= start else None
+                return (0 if defined is None else 1 + defined - start, operand, -sign)
+
+            constants = [leaf for leaf in leaves if leaf[0] < 0]
+            constant = self._fold(op, constants, c_type) if constants else None
+            if constants and constant is None:
+                continue
+            terms = [(operand, sign) for operand, sign, _ in sorted((leaf for leaf in leaves if leaf[0] >= 0), key=rank)]
+            if c_type in RANKS:
+                terms = self._cancel(op, terms)
+                if not terms and constant is None:
+                    constant = 0
+            # Narrower terms must not meet each other in the first operation
+            first = next((term for term in terms if term[1] > 0), None)
+            if first is not None and not self._full(first[0], c_type):
+                wide = next((term for term in terms if term[1] > 0 and self._full(term[0], c_type)), None)
+                if wide is not None:
+                    terms.remove(wide)
+                    terms.insert(0, wide)
+            nodes.sort()
+            code = self._emit(op, terms, constant, c_type, [instructions[pos].dest for pos in nodes[:-1]],
+                              instr.dest)
+            if code is None or code == [instructions[pos] for pos in nodes] or not self._typed(code, c_type):
+                continue
+
+            for pos in nodes:
+                replace[pos] = []
+            replace[root] = code
+            if log.changes:
+                rule = 'Folded constant chain' if len(constants) > 1 else 'Reassociated expression'
+                before = self._describe(op, [(text(operand), sign) for operand, sign, _ in leaves])
+                after = self._describe_code(code, text)
+                for pos in nodes[:-1]:
+                    log.change(instructions[pos], None,
+                               f'{rule}: {text(instructions[pos].dest)} merged into {text(instr.dest)}')
+                log.change(instr, code[-1], f'{rule}: {before} regrouped as {after}')
+
+        if not replace:
+            return program
+
+        optimized: List[Instruction] = []
+        new_start: List[int] = []
+        for pos, instr in enumerate(instructions):
+            new_start.append(len(optimized))
+            code = replace.get(pos)
+            if code is None:
+                if log.full:
+                    log.keep(instr)
+                optimized.append(instr)
+                continue
+            self.touched.append(len(optimized))
+            for new in code:
+                self.touched.append(len(optimized))
+                optimized.append(new)
+        new_start.append(len(optimized))
+
+        self.changed = True
+        functions = [(name, new_start[start], new_start[end]) for name, start, end in program.functions]
+        return program.derive(optimized, functions)
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
+
+class FastMathReassociator(Reassociator):
+    """Reassociator that also regroups floating-point + and * chains, accepting different rounding."""
+
+    fast_math = True
@@ -0,0 +1,212 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+from optimizer.optimization_log import OptimizationLog
+from optimizer.target import TargetProfile, get_target
+from tac_utils.c_types import assigned_constant, literal_type, operand_types
+from tac_utils.ir import ASSIGN, BINOP, COND_JUMP, JUMP, LABEL, RETURN, UNARYOP, Instruction, TACProgram, ir_pass
+from tac_utils.ssa import Phi, SSAForm
+
+class SSAOptimizer:
+    """
+    Constant and copy propagation, common subexpression elimination and
+    dead code elimination over SSA form.
+
+    Each value has exactly one definition in SSA form, so none of these
+    needs to track redefinitions: propagation and CSE record which names
+    are equal to which (``values``), every use is then rewritten once, and
+    DCE marks what the program's jumps, returns and stores to memory
+    variables depend on. All three run across basic blocks.
+
+    A copy to a name of another C type converts the value, so its
+    destination is only equal to its source when both have the same type;
+    a copied constant is converted to the type of the destination.
+    """
+
+    # Built for a target profile (see PassManager): constants are converted in its integer widths
+    targeted = True
+
+    def __init__(self, target: Union[str, TargetProfile, None] = None):
+        self.target = get_target(target)
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        # Maps SSA names to the operand (constant or name) they are equal to
+        self.values: Dict[int, int] = {}
+        self.ssa: Optional[SSAForm] = None
+        self.types: Dict[int, Optional[str]] = {}
+
+    def _type_of(self, operand: int) -> Optional[str]:
+        if operand < 0:
+            symbols = self.ssa.symbols
+            return literal_type(symbols.text(operand), symbols.value(operand), self.target.bits)
+        return self.types.get(self.ssa.base_of(operand))
+
+    def _resolve(self, operand: Optional[int]) -> Optional[int]:
+        values = self.values
+        root = operand
+        while root in values:
+            root = values[root]
+        # Path compression keeps later lookups short
+        while operand in values and values[operand] != root:
+            values[operand], operand = root, values[operand]
+        return root
+
+    def _propagate(self, ssa: SSAForm) -> None:
+        """Record copies of constants and names, including phis whose operands all agree."""
+        values = self.values
+        resolve = self._resolve
+        is_name = ssa.is_name
+        users: Dict[int, List[Phi]] = {}
+        work: List[Phi] = []
+
+        def equate(name: int, value: int, origin: Optional[Instruction] = None) -> None:
+            values[name] = value
+            # Phis have no instruction of their own to log
+            if origin is not None:
+                if self.optimization_log.changes:
+                    self.optimization_log.change(
+                        origin, None,
+                        f'Propagated value: {ssa.name(name)} -> {ssa.name(value)}'
+                    )
+            work.extend(users.get(name, ()))
+
+        for b in ssa.order:
+            for phi in ssa.phis[b]:
+                work.append(phi)
+                for arg in phi.args:
+                    if is_name(arg):
+                        users.setdefault(arg, []).append(phi)
+
+        for b in ssa.order:
+            for instr, origin in zip(ssa.blocks[b], ssa.origins[b]):
+                if instr.opcode is ASSIGN and is_name(instr.dest) and (instr.arg1 < 0 or is_name(instr.arg1)):
+                    value = resolve(instr.arg1)
+                    c_type = self._type_of(instr.dest)
+                    if value < 0:
+                        value = assigned_constant(ssa.symbols, value, c_type, self.target.bits)
+                    elif self._type_of(value) != c_type:
+                        value = None
+                    if value is not None and value != instr.dest:
+                        equate(instr.dest, value, origin)
+
+        while work:
+            phi = work.pop()
+            if phi.dest in values:
+                continue
+            operands = {resolve(arg) for arg in phi.args if arg is not None}
+            operands.discard(phi.dest)
+            if len(operands) == 1:
+                equate(phi.dest, operands.pop())
+
+    def _eliminate_common_subexpressions(self, ssa: SSAForm) -> None:
+        """Reuse a computation available from a dominating block."""
+        values = self.values
+        resolve = self._resolve
+        is_name = ssa.is_name
+        cfg = ssa.cfg
+        available: Dict[Tuple, int] = {}
+        work: List[Tuple[int, Optional[List[Tuple]]]] = [(entry, None) for entry in reversed(cfg.entries)]
+        while work:
+            b, added = work.pop()
+            if added is not None:
+                for key in added:
+                    del available[key]
+                continue
+
+            added = []
+            for instr, origin in zip(ssa.blocks[b], ssa.origins[b]):
+                opcode = instr.opcode
+                if (opcode is not BINOP and opcode is not UNARYOP) or not is_name(instr.dest):
+                    continue
+                arg1, arg2 = resolve(instr.arg1), resolve(instr.arg2)
+                # Memory variables may change between two computations
+                if (arg1 >= 0 and not is_name(arg1)) or (arg2 is not None and arg2 >= 0 and not is_name(arg2)):
+                    continue
+                # Both results are assigned, and so converted, to the same type
+                key = (opcode, instr.op, arg1, arg2, self._type_of(instr.dest))
+                previous = available.get(key)
+                if previous is None:
+                    available[key] = instr.dest
+                    added.append(key)
+                else:
+                    values[instr.dest] = previous
+                    if self.optimization_log.changes:
+                        self.optimization_log.change(
+                            origin, None,
+                            f'Eliminated common subexpression: {ssa.name(instr.dest)} = {ssa.name(previous)}'
+                        )
+
+            work.append((b, added))
+            work.extend((child, None) for child in reversed(cfg.dom_children[b]))
+
+    def _rewrite_uses(self, ssa: SSAForm) -> None:
+        """Replace every use of a name by the operand it is known to equal."""
+        resolve = self._resolve
+        for b in ssa.order:
+            for phi in ssa.phis[b]:
+                phi.args = [resolve(arg) for arg in phi.args]
+            block = ssa.blocks[b]
+            for pos, instr in enumerate(block):
+                arg1, arg2 = resolve(instr.arg1), resolve(instr.arg2)
+                if arg1 != instr.arg1 or arg2 != instr.arg2:
+                    block[pos] = Instruction(instr.opcode, instr.dest, instr.op, arg1, arg2, instr.label)
+
+    def _eliminate_dead_code(self, ssa: SSAForm) -> None:
+        """Delete definitions that no jump, return or memory store depends on."""
+        is_name = ssa.is_name
+        definitions: Dict[int, Union[Instruction, Phi]] = {}
+        work: List[int] = []
+        for b in ssa.order:
+            for phi in ssa.phis[b]:
+                definitions[phi.dest] = phi
+            for instr in ssa.blocks[b]:
+                opcode = instr.opcode
+                if is_name(instr.dest):
+                    definitions[instr.dest] = instr
+                elif opcode is LABEL or opcode is JUMP or opcode is COND_JUMP or opcode is RETURN or instr.dest is not None:
+                    work.extend(arg for arg in (instr.arg1, instr.arg2) if is_name(arg))
+
+        live = set()
+        while work:
+            name = work.pop()
+            if name in live:
+                continue
+            live.add(name)
+            definition = definitions.get(name)
+            if isinstance(definition, Phi):
+                work.extend(arg for arg in definition.args if is_name(arg))
+            elif definition is not None:
+                work.extend(arg for arg in (definition.arg1, definition.arg2) if is_name(arg))
+
+        text = ssa.name
+        for b in ssa.order:
+            ssa.phis[b] = [phi for phi in ssa.phis[b] if phi.dest in live]
+            block = ssa.blocks[b]
+            for pos, instr in enumerate(block):
+                if is_name(instr.dest) and instr.dest not in live:
+                    block[pos] = None
+                    if self.optimization_log.changes:
+                        self.optimization_log.change(
+                            ssa.origins[b][pos], None,
+                            f'Eliminated dead code: {text(instr.dest)} is never used'
+                        )
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        self.optimization_log.begin(program)
+        self.values.clear()
+        self.types = operand_types(program, self.target.bits)
+        self.ssa = ssa = SSAForm(program)
+        self._propagate(ssa)
+        self._eliminate_common_subexpressions(ssa)
+        self._rewrite_uses(ssa)
+        self._eliminate_dead_code(ssa)
+        optimized = ssa.to_program()
+        self.touched = ssa.touched
+        self.changed = optimized is not program
+        self.ssa = None
+        self.types = {}
+        return optimized
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
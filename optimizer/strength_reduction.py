@@ -1,95 +1,338 @@
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
-@dataclass
-class OptimizationInfo:
-    original_tac: Dict[str, str]
-    optimized_tac: Optional[Dict[str, str]] = None
-    reason: str = ''
+from optimizer.optimization_log import OptimizationLog
+from optimizer.target import TargetProfile, get_target
+from tac_utils.c_types import (FLOAT_TYPES, binary_result_type, fits, is_integer, is_unsigned, literal_text,
+                               literal_type, operand_types, promote, usual_arithmetic_type, width)
+from tac_utils.ir import BINOP, Instruction, SymbolTable, TACProgram, binop, ir_pass, unaryop
+
+# TAC has no multiply-high, so magic-number division takes the full product
+# of the dividend and the magic number, with the magic number written as a
+# long long so that C computes the product in 64 bits. For types of up to
+# 32 bits that product cannot overflow.
+MAX_MAGIC_BITS = 32
+
+# An operand of a replacement sequence: an operand ID, ('step', index) for
+# the result of an earlier step, ('const', value) for an integer constant or
+# ('literal', text) for a constant spelled with a suffix
+Value = Union[int, Tuple[str, Union[int, str]]]
+
+def _naf(value: int) -> List[int]:
+    """Non-adjacent form of a positive integer: digits in {-1, 0, 1}, least significant first, fewest non-zero."""
+    digits = []
+    while value:
+        digit = 2 - (value & 3) if value & 1 else 0
+        digits.append(digit)
+        value = (value - digit) >> 1
+    return digits
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+def unsigned_magic(divisor: int, bits: int) -> Tuple[int, int]:
+    """
+    Magic number for unsigned division by a constant that is not a power of two.
+
+    Returns:
+        (m, s) such that x // divisor == (x * m) >> (bits + s) for every
+        0 <= x < 2**bits. m needs bits + 1 bits for some divisors (e.g. 7).
+    """
+    for s in range((divisor - 1).bit_length() + 1):
+        p = bits + s
+        m = _ceil_div(1 << p, divisor)
+        # The rounding error of m, times any dividend, stays below one step of the result
+        if m * divisor - (1 << p) <= 1 << s:
+            return m, s
+    raise AssertionError('unreachable: s = ceil(log2(divisor)) always qualifies')
+
+def signed_magic(divisor: int, bits: int) -> Tuple[int, int]:
+    """
+    Magic number for signed division by a positive constant that is not a power of two.
+
+    Returns:
+        (m, p) such that C's truncating x / divisor == ((x * m) >> p) - (x >> (bits - 1))
+        for every -2**(bits-1) <= x < 2**(bits-1), with m <= 2**bits
+    """
+    for s in range((divisor - 1).bit_length() + 1):
+        p = bits - 1 + s
+        m = _ceil_div(1 << p, divisor)
+        if m * divisor - (1 << p) <= 1 << s:
+            return m, p
+    raise AssertionError('unreachable: s = ceil(log2(divisor)) always qualifies')
+
+class _Sequence:
+    """Straight-line code computing one value; its temporaries are only allocated when it is emitted."""
 
-class StrengthReducer:
     def __init__(self):
-        self.optimization_log: List[OptimizationInfo] = []
-
-    def _is_power_of_two(self, value: str) -> Optional[int]:
-        try:
-            num = float(value)
-            if num.is_integer() and num > 0:
-                num = int(num)
-                if num & (num - 1) == 0:  # Check if number is power of 2
-                    return num.bit_length() - 1  # Return the power (e.g., 8 -> 3 because 2^3 = 8)
-        except ValueError:
-            pass
-        return None
-
-    def _can_reduce_multiplication(self, instr: Dict[str, str]) -> bool:
-        return (
-            instr['op'] == '*' and
-            ('arg2' in instr) and
-            (self._is_power_of_two(instr['arg1']) is not None or
-             self._is_power_of_two(instr['arg2']) is not None)
-        )
-
-    def _can_reduce_division(self, instr: Dict[str, str]) -> bool:
-        return (
-            instr['op'] == '/' and
-            'arg2' in instr and
-            self._is_power_of_two(instr['arg2']) is not None
-        )
-
-    def optimize(self, tac_instructions: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        optimized = []
-        self.optimization_log.clear()
-
-        for instr in tac_instructions:
-            if self._can_reduce_multiplication(instr):
-                # Convert multiplication by power of 2 to left shift
-                power = self._is_power_of_two(instr['arg2'])
-                if power is None:
-                    # If arg2 is not power of 2, check arg1
-                    power = self._is_power_of_two(instr['arg1'])
-                    shift_arg = instr['arg2']
-                else:
-                    shift_arg = instr['arg1']
-
-                opt_instr = {
-                    'lhs': instr['lhs'],
-                    'op': '<<',
-                    'arg1': shift_arg,
-                    'arg2': str(power)
-                }
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        optimized_tac=opt_instr,
-                        reason=f'Reduced multiplication by {2**power} to left shift by {power}'
-                    )
-                )
-                optimized.append(opt_instr)
-
-            elif self._can_reduce_division(instr):
-                # Convert division by power of 2 to right shift
-                power = self._is_power_of_two(instr['arg2'])
-                opt_instr = {
-                    'lhs': instr['lhs'],
-                    'op': '>>',
-                    'arg1': instr['arg1'],
-                    'arg2': str(power)
-                }
-                self.optimization_log.append(
-                    OptimizationInfo(
-                        original_tac=instr,
-                        optimized_tac=opt_instr,
-                        reason=f'Reduced division by {2**power} to right shift by {power}'
-                    )
-                )
-                optimized.append(opt_instr)
+        self.steps: List[Tuple[str, Value, Optional[Value]]] = []
+        # Set when the steps compute in a wider type than the operation they replace
+        self.wide = False
+        # Type the destination is declared with so that the wide result converts back to it
+        self.narrow: Optional[str] = None
 
+    def add(self, op: str, arg1: Value, arg2: Optional[Value] = None) -> Value:
+        self.steps.append((op, arg1, arg2))
+        return ('step', len(self.steps) - 1)
+
+    @staticmethod
+    def const(value: int) -> Value:
+        return ('const', value)
+
+    @staticmethod
+    def literal(text: str) -> Value:
+        return ('literal', text)
+
+    def cost(self, target: TargetProfile) -> int:
+        return sum(target.cost(op) for op, _, _ in self.steps)
+
+    def emit(self, symbols: SymbolTable, dest: int) -> List[Instruction]:
+        """Build the instructions; the last one assigns dest."""
+        results: List[int] = []
+        instructions = []
+
+        def operand(value: Value) -> int:
+            if isinstance(value, int):
+                return value
+            kind, payload = value
+            if kind == 'step':
+                return results[payload]
+            return symbols.constant(payload if kind == 'literal' else str(payload))
+
+        last = len(self.steps) - 1
+        for index, (op, arg1, arg2) in enumerate(self.steps):
+            result = dest if index == last else symbols.new_temp()
+            if op == 'neg':
+                instructions.append(unaryop(result, '-', operand(arg1)))
             else:
-                optimized.append(instr)
-                self.optimization_log.append(OptimizationInfo(original_tac=instr))
+                instructions.append(binop(result, op, operand(arg1), operand(arg2)))
+            results.append(result)
+        return instructions
+
+class StrengthReducer:
+    """
+    Replaces multiplication, division and modulo by constants with cheaper
+    instruction sequences, where the target's cost table says they are cheaper.
+
+    Multiplication becomes shifts and adds (or subtracts). Division and
+    modulo by a power of two become shifts and masks, with the fix-ups
+    signed operands need to round toward zero; by other constants they
+    become a multiplication by a magic number. Division and modulo are only
+    rewritten when the operation's C type is known, since the sequence
+    depends on its signedness and width.
+    """
+    # Rewrites depend on a single instruction, so only dirty indices need revisiting
+    local = True
+    # Built for a target profile (see PassManager)
+    targeted = True
+
+    def __init__(self, target: Union[str, TargetProfile, None] = None):
+        self.target = get_target(target)
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        self.symbols: Optional[SymbolTable] = None
+        self.types: Optional[Dict[int, Optional[str]]] = None
+        self.literal_types: Dict[int, Optional[str]] = {}
 
-        return optimized
+    def _type_of(self, program: TACProgram, operand: int) -> Optional[str]:
+        if operand < 0:
+            if operand not in self.literal_types:
+                symbols = self.symbols
+                self.literal_types[operand] = literal_type(symbols.text(operand), symbols.value(operand),
+                                                           self.target.bits)
+            return self.literal_types[operand]
+        if operand in program.types:
+            return program.types[operand]
+        if self.types is None:
+            # Only worked out once the program has something to reduce
+            self.types = operand_types(program, self.target.bits)
+        return self.types.get(operand)
+
+    def _multiply_cost(self, factor: int) -> int:
+        """Cost of multiplying by a constant other than 0 with shifts and adds."""
+        terms = [shift for shift, digit in enumerate(_naf(abs(factor))) if digit]
+        cost = sum(self.target.cost('<<') for shift in terms if shift) + (len(terms) - 1) * self.target.cost('+')
+        return cost + self.target.cost('neg') if factor < 0 else cost
+
+    def _multiply(self, seq: _Sequence, x: Value, factor: int, shifts_only: bool = False) -> Value:
+        """Emit x * factor as shifts and adds, or as a multiplication where that is cheaper."""
+        if not shifts_only and self.target.cost('*') <= self._multiply_cost(factor):
+            return seq.add('*', x, seq.const(factor))
+        terms = [(shift, digit) for shift, digit in enumerate(_naf(abs(factor))) if digit]
+        terms.reverse()
+
+        def shifted(shift: int) -> Value:
+            return seq.add('<<', x, seq.const(shift)) if shift else x
+
+        # The leading digit of a positive number's non-adjacent form is 1
+        product = shifted(terms[0][0])
+        for shift, digit in terms[1:]:
+            product = seq.add('+' if digit > 0 else '-', product, shifted(shift))
+        return seq.add('neg', product) if factor < 0 else product
+
+    def _magic(self, seq: _Sequence, x: Value, m: int, unsigned: bool) -> Value:
+        """Emit the full product x * m, computed in a 64-bit type."""
+        seq.wide = True
+        c_type = 'unsigned long long' if unsigned else 'long long'
+        return seq.add('*', x, seq.literal(literal_text(m, c_type, self.target.bits)))
+
+    def _sign_bias(self, seq: _Sequence, x: Value, power: int, bits: int) -> Value:
+        """2**power - 1 for negative x and 0 otherwise, so shifts round toward zero."""
+        return seq.add('&', seq.add('>>', x, seq.const(bits - 1)), seq.const((1 << power) - 1))
+
+    def _divide(self, seq: _Sequence, x: Value, divisor: int, unsigned: bool, bits: int) -> Optional[Tuple[Value, str]]:
+        """Emit C's x / divisor; return the quotient and the rule used, or None if there is no sequence."""
+        magnitude = abs(divisor)
+        power = magnitude.bit_length() - 1
+        if magnitude == 1 << power:
+            if unsigned:
+                return seq.add('>>', x, seq.const(power)), 'Reduced division to right shift'
+            quotient = seq.add('>>', seq.add('+', x, self._sign_bias(seq, x, power, bits)), seq.const(power))
+            rule = 'Reduced signed division to shifts'
+        elif bits > MAX_MAGIC_BITS:
+            return None
+        elif unsigned:
+            m, s = unsigned_magic(magnitude, bits)
+            if m < 1 << bits:
+                quotient = seq.add('>>', self._magic(seq, x, m, unsigned), seq.const(bits + s))
+            else:
+                # m has bits + 1 bits: multiply by its low bits and add x back
+                # in without overflowing, as (x + t) >> s == ((x - t) >> 1 + t) >> (s - 1)
+                t = seq.add('>>', self._magic(seq, x, m - (1 << bits), unsigned), seq.const(bits))
+                quotient = seq.add('+', seq.add('>>', seq.add('-', x, t), seq.const(1)), t)
+                if s > 1:
+                    quotient = seq.add('>>', quotient, seq.const(s - 1))
+            return quotient, 'Reduced division to multiplication by magic number'
+        else:
+            m, p = signed_magic(magnitude, bits)
+            # Subtracting the sign (-1 or 0) turns the rounding down into rounding toward zero
+            quotient = seq.add('-', seq.add('>>', self._magic(seq, x, m, unsigned), seq.const(p)),
+                               seq.add('>>', x, seq.const(bits - 1)))
+            rule = 'Reduced division to multiplication by magic number'
+        return (seq.add('neg', quotient) if divisor < 0 else quotient), rule
+
+    def _modulo(self, seq: _Sequence, x: Value, divisor: int, unsigned: bool, bits: int) -> Optional[Tuple[Value, str]]:
+        """Emit C's x % divisor; the result has the sign of x."""
+        magnitude = abs(divisor)
+        power = magnitude.bit_length() - 1
+        if magnitude == 1 << power:
+            mask = seq.const(magnitude - 1)
+            if unsigned:
+                return seq.add('&', x, mask), 'Reduced modulo to mask'
+            bias = self._sign_bias(seq, x, power, bits)
+            return seq.add('-', seq.add('&', seq.add('+', x, bias), mask), bias), 'Reduced signed modulo to masks'
+        division = self._divide(seq, x, magnitude, unsigned, bits)
+        if division is None:
+            return None
+        quotient, _ = division
+        return seq.add('-', x, self._multiply(seq, quotient, magnitude)), 'Reduced modulo to multiplication by magic number'
+
+    def _reduce(self, program: TACProgram, instr: Instruction) -> Optional[Tuple[_Sequence, str]]:
+        """Find a cheaper sequence for a multiplication, division or modulo by a constant."""
+        if instr.opcode is not BINOP or instr.op not in ('*', '/', '%'):
+            return None
+        symbols = self.symbols
+        bits = self.target.bits
+        seq = _Sequence()
+
+        if instr.op == '*':
+            factor = symbols.int_value(instr.arg2)
+            x = instr.arg1
+            if factor is None:
+                factor = symbols.int_value(instr.arg1)
+                x = instr.arg2
+            if factor is None or factor in (0, 1) or x < 0:
+                return None
+            x_type = self._type_of(program, x)
+            if x_type in FLOAT_TYPES:
+                # The factor is an integer, so only a floating multiplicand makes this a floating product
+                return None
+            factor_type = self._type_of(program, instr.arg2 if x == instr.arg1 else instr.arg1)
+            if is_integer(x_type) and promote(x_type, bits) != binary_result_type('*', x_type, factor_type, bits):
+                # The shifts would compute in the narrower type of x, not in the type of the product
+                return None
+            self._multiply(seq, x, factor, shifts_only=True)
+            if len(seq.steps) == 1 and seq.steps[0][0] == '<<':
+                rule = f'Reduced multiplication to left shift: * {factor} -> << {seq.steps[0][2][1]}'
+            else:
+                rule = f'Reduced multiplication to shifts and adds: * {factor} -> {len(seq.steps)} instructions'
+            return seq, rule
+
+        divisor = symbols.int_value(instr.arg2)
+        x = instr.arg1
+        if divisor is None or divisor in (0, 1, -1) or x < 0:
+            return None
+        x_type = self._type_of(program, x)
+        op_type = usual_arithmetic_type(x_type, self._type_of(program, instr.arg2), bits)
+        if not is_integer(op_type) or not fits(divisor, op_type, bits):
+            return None
+        unsigned = is_unsigned(op_type)
+        if unsigned and not is_unsigned(promote(x_type, bits)):
+            # A negative x would wrap around on conversion, which TAC values do not
+            return None
+        reduce = self._divide if instr.op == '/' else self._modulo
+        result = reduce(seq, x, divisor, unsigned, width(op_type, bits))
+        if result is None:
+            return None
+        if seq.wide and instr.dest not in program.types:
+            # Declaring the destination makes the last step convert the wide result back
+            if self._type_of(program, instr.dest) != op_type:
+                return None
+            seq.narrow = op_type
+        _, rule = result
+        return seq, f'{rule}: {instr.op} {divisor} -> {len(seq.steps)} instructions ({op_type})'
+
+    @ir_pass
+    def optimize(self, program: TACProgram, dirty: Optional[Iterable[int]] = None) -> TACProgram:
+        instructions = program.instructions
+        log = self.optimization_log
+        log.begin(program)
+        self.touched = []
+        self.symbols = program.symbols
+        self.types = None
+        self.literal_types = {}
+        replacements: Dict[int, List[Instruction]] = {}
+
+        indices = range(len(instructions)) if dirty is None else sorted(dirty)
+        for idx in indices:
+            instr = instructions[idx]
+            found = self._reduce(program, instr)
+            if found is None or found[0].cost(self.target) >= self.target.cost(instr.op):
+                if log.full:
+                    log.keep(instr)
+                continue
+            seq, reason = found
+            replacements[idx] = seq.emit(self.symbols, instr.dest)
+            if seq.narrow is not None:
+                program.declare(instr.dest, seq.narrow)
+            if log.changes:
+                log.change(instr, replacements[idx][-1], reason)
+
+        self.changed = bool(replacements)
+        if not self.changed:
+            return program
+
+        if all(len(seq) == 1 for seq in replacements.values()):
+            optimized = list(instructions)
+            for idx, seq in replacements.items():
+                optimized[idx] = seq[0]
+                self.touched.append(idx)
+            return program.derive(optimized)
+
+        # Sequences grow the program: rebuild it and move the function ranges
+        optimized = []
+        new_start = []
+        for idx, instr in enumerate(instructions):
+            new_start.append(len(optimized))
+            seq = replacements.get(idx)
+            if seq is None:
+                optimized.append(instr)
+            else:
+                self.touched.extend(range(len(optimized), len(optimized) + len(seq)))
+                optimized.extend(seq)
+        new_start.append(len(optimized))
+        functions = [(name, new_start[start], new_start[end]) for name, start, end in program.functions]
+        return program.derive(optimized, functions)
 
-    def get_optimization_log(self) -> List[OptimizationInfo]:
-        return self.optimization_log
\ No newline at end of file
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
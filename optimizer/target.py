@@ -0,0 +1,61 @@
+# target.py - Target profiles: integer widths and instruction costs for cost-driven passes
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Union
+
+from tac_utils.c_types import LP64_BITS
+
+# Widths of the integer types where long is 32 bits (ILP32 microcontrollers)
+ILP32_BITS = {'_Bool': 1, 'char': 8, 'short': 16, 'int': 32, 'long': 32, 'long long': 64}
+# ... and where int is 16 bits (8-bit microcontrollers)
+IP16_BITS = {'_Bool': 1, 'char': 8, 'short': 16, 'int': 16, 'long': 32, 'long long': 64}
+
+@dataclass(frozen=True)
+class TargetProfile:
+    """
+    What a cost-driven pass needs to know about the machine the code is for.
+
+    ``costs`` gives the rough cost, in cycles, of one TAC operation per
+    operator ('neg' is unary minus). A rewrite is only worth it if the
+    instructions it emits cost less in total than the one they replace.
+    """
+    name: str
+    description: str
+    bits: Dict[str, int]
+    costs: Dict[str, int]
+
+    def cost(self, op: str) -> int:
+        return self.costs[op]
+
+def _costs(simple: int, multiply: int, divide: int, modulo: int, shift: Optional[int] = None) -> Dict[str, int]:
+    shift = simple if shift is None else shift
+    return {
+        '+': simple, '-': simple, '&': simple, '|': simple, '^': simple, 'neg': simple,
+        '<<': shift, '>>': shift,
+        '*': multiply, '/': divide, '%': modulo,
+    }
+
+PROFILES: Dict[str, TargetProfile] = {profile.name: profile for profile in (
+    TargetProfile('x86-64', 'Out-of-order x86-64, 32-bit idiv', LP64_BITS, _costs(1, 3, 26, 26)),
+    TargetProfile('aarch64', 'ARMv8-A cores with a fast divider', LP64_BITS, _costs(1, 3, 12, 14)),
+    TargetProfile('cortex-m0', 'ARMv6-M: single-cycle multiplier, no divide instruction',
+                  ILP32_BITS, _costs(1, 1, 40, 45)),
+    TargetProfile('avr', '8-bit AVR: 16-bit int, software multiply and divide',
+                  IP16_BITS, _costs(2, 10, 220, 220, shift=4)),
+)}
+
+DEFAULT_TARGET = 'x86-64'
+
+def get_target(target: Union[str, TargetProfile, None] = None) -> TargetProfile:
+    """
+    Look up a target profile by name (None for the default).
+
+    Raises:
+        ValueError: If there is no profile of that name
+    """
+    if isinstance(target, TargetProfile):
+        return target
+    name = target or DEFAULT_TARGET
+    if name not in PROFILES:
+        raise ValueError(f"Unknown target '{name}'. Available targets: {', '.join(PROFILES)}")
+    return PROFILES[name]
@@ -0,0 +1,269 @@
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+
+from optimizer.optimization_log import OptimizationLog
+from tac_utils.c_types import LP64_BITS, operand_types
+from tac_utils.cfg import ControlFlowGraph
+from tac_utils.ir import ASSIGN, BINOP, TEMP_PATTERN, UNARYOP, Instruction, TACProgram, ir_pass
+
+# Opcodes whose destination can be redirected to the target of a copy
+COMPUTING_OPCODES = (ASSIGN, BINOP, UNARYOP)
+
+def peak_live(cfg: ControlFlowGraph, names: Set[int]) -> int:
+    """
+    The largest number of ``names`` that are live at the same time anywhere in the program.
+
+    Args:
+        cfg: Control-flow graph of the program
+        names: The names to count (e.g. the temporaries)
+
+    Returns:
+        int: The peak count
+    """
+    instructions = cfg.program.instructions
+    _, live_out = cfg.liveness()
+    peak = 0
+    for block in cfg.blocks:
+        live = {name for name in cfg.names_in(live_out[block.index]) if name in names}
+        peak = max(peak, len(live))
+        for pos in range(block.end - 1, block.start - 1, -1):
+            instr = instructions[pos]
+            live.discard(instr.dest)
+            for arg in (instr.arg1, instr.arg2):
+                if arg in names:
+                    live.add(arg)
+            peak = max(peak, len(live))
+    return peak
+
+class TempAllocator:
+    """
+    Gives temporaries whose live ranges do not overlap the same name, so a
+    function needs as few temporaries as it has values live at once.
+
+    First a copy ``x = t`` out of a temporary that is computed once, used
+    only by the copy and computed earlier in the same block is folded into
+    the computation (``t = a + b; x = t`` becomes ``x = a + b``), provided
+    nothing touches ``x`` in between. Then every remaining temporary gets
+    a live interval over the instruction positions, from its first
+    definition or use to its last, widened to the start of each block it
+    is live into and the end of each block it is live out of. A linear
+    scan over the intervals in order of their start hands each one the
+    lowest free slot, preferring the slot of a temporary it is copied from
+    if that one ends at the copy, so the copy becomes ``t = t`` and is
+    deleted. Slots are kept apart per C type, so every slot keeps a single
+    type for passes that use types. Slot k is named ``tk``.
+
+    Declared variables and shared names are never renamed. ``statistics``
+    reports the number of temporaries and the peak number live at once,
+    before and after, and the copies removed, for the last call.
+    """
+
+    # SSA-based passes split shared slots again, so the pass manager runs
+    # this pass once after the rest of the pipeline has converged
+    final = True
+
+    def __init__(self):
+        self.optimization_log = OptimizationLog(type(self).__name__)
+        self.touched: List[int] = []
+        self.changed = False
+        self.statistics: Dict[str, int] = {}
+
+    def _fold_copies(self, program: TACProgram, cfg: ControlFlowGraph, temps: Set[int]) -> Dict[int, int]:
+        """Find copies out of single-use temporaries that can be folded: copy position -> definition position."""
+        instructions = program.instructions
+        defs: Dict[int, int] = {}
+        def_at: Dict[int, int] = {}
+        uses: Dict[int, int] = {}
+        for pos, instr in enumerate(instructions):
+            for arg in (instr.arg1, instr.arg2):
+                if arg in temps:
+                    uses[arg] = uses.get(arg, 0) + 1
+            if instr.dest in temps:
+                defs[instr.dest] = defs.get(instr.dest, 0) + 1
+                def_at[instr.dest] = pos
+
+        folds: Dict[int, int] = {}
+        folded_defs: Set[int] = set()
+        # Last position at which each name was read or written
+        last_access: Dict[int, int] = {}
+        for pos, instr in enumerate(instructions):
+            temp = instr.arg1
+            if (instr.opcode is ASSIGN and temp in temps and temp != instr.dest
+                    and defs.get(temp) == 1 and uses[temp] == 1):
+                source = def_at[temp]
+                if (source < pos and source not in folds and source not in folded_defs
+                        and instructions[source].opcode in COMPUTING_OPCODES
+                        and last_access.get(instr.dest, -1) <= source
+                        and cfg.block_of(source) is cfg.block_of(pos)):
+                    folds[pos] = source
+                    folded_defs.add(source)
+            for name in (instr.dest, instr.arg1, instr.arg2):
+                if name is not None and name >= 0:
+                    last_access[name] = pos
+        return folds
+
+    def _intervals(self, program: TACProgram, cfg: ControlFlowGraph, temps: Set[int],
+                   folds: Dict[int, int]) -> Dict[int, List[int]]:
+        """
+        Live interval of every temporary once the copies are folded, as
+        [first, last] in half steps: instruction p reads at 2p and writes at 2p + 1.
+        """
+        instructions = program.instructions
+        intervals: Dict[int, List[int]] = {}
+
+        def cover(name: int, time: int) -> None:
+            interval = intervals.get(name)
+            if interval is None:
+                intervals[name] = [time, time]
+            elif time < interval[0]:
+                interval[0] = time
+            elif time > interval[1]:
+                interval[1] = time
+
+        live_in, live_out = cfg.liveness()
+        for block in cfg.blocks:
+            for name in cfg.names_in(live_in[block.index]):
+                if name in temps:
+                    cover(name, 2 * block.start)
+            for name in cfg.names_in(live_out[block.index]):
+                if name in temps:
+                    cover(name, 2 * block.end - 1)
+
+        gone = {instructions[source].dest for source in folds.values()}
+        for pos, instr in enumerate(instructions):
+            for arg in (instr.arg1, instr.arg2):
+                if arg in temps:
+                    cover(arg, 2 * pos)
+            if instr.dest in temps:
+                cover(instr.dest, 2 * pos + 1)
+        for pos, source in folds.items():
+            dest = instructions[pos].dest
+            if dest in temps:
+                # The copy's target is now written where its source was computed
+                cover(dest, 2 * source + 1)
+        for name in gone:
+            intervals.pop(name, None)
+        return intervals
+
+    def _allocate(self, program: TACProgram, intervals: Dict[int, List[int]],
+                  copied_from: Dict[int, int]) -> Dict[int, int]:
+        """Linear scan: map every temporary to a slot number."""
+        types = operand_types(program, LP64_BITS)
+        slot_of: Dict[int, int] = {}
+        slot_type: List[Optional[str]] = []
+        free: Dict[Optional[str], List[int]] = {}
+        free_slots: Set[int] = set()
+        active: List[Tuple[int, int]] = []
+        for first, last, temp in sorted((first, last, temp) for temp, (first, last) in intervals.items()):
+            while active and active[0][0] < first:
+                _, slot = heapq.heappop(active)
+                heapq.heappush(free.setdefault(slot_type[slot], []), slot)
+                free_slots.add(slot)
+            c_type = types.get(temp)
+            slot = None
+            source = copied_from.get(temp)
+            if source is not None and slot_of.get(source) in free_slots and slot_type[slot_of[source]] == c_type:
+                slot = slot_of[source]
+            else:
+                pool = free.get(c_type)
+                while pool:
+                    candidate = heapq.heappop(pool)
+                    if candidate in free_slots:
+                        slot = candidate
+                        break
+            if slot is None:
+                slot = len(slot_type)
+                slot_type.append(c_type)
+            else:
+                free_slots.discard(slot)
+            slot_of[temp] = slot
+            heapq.heappush(active, (last, slot))
+        return slot_of
+
+    @ir_pass
+    def optimize(self, program: TACProgram) -> TACProgram:
+        log = self.optimization_log
+        log.begin(program)
+        symbols = program.symbols
+        instructions = program.instructions
+        self.touched = []
+        self.changed = False
+
+        cfg = ControlFlowGraph(program)
+        declared = program.types
+        shared = program.shared
+        temps = {
+            name for instr in instructions for name in (instr.dest, instr.arg1, instr.arg2)
+            if name is not None and name in symbols.temps
+        }
+        temps = {t for t in temps if t not in declared and t not in shared and TEMP_PATTERN.match(symbols.names[t])}
+        peak_before = peak_live(cfg, temps)
+
+        folds = self._fold_copies(program, cfg, temps)
+        retarget = {source: instructions[pos].dest for pos, source in folds.items()}
+        intervals = self._intervals(program, cfg, temps, folds)
+        copied_from = {}
+        for pos, instr in enumerate(instructions):
+            if instr.opcode is ASSIGN and instr.dest in intervals and instr.arg1 in intervals:
+                if intervals[instr.arg1][1] == 2 * pos:
+                    copied_from[instr.dest] = instr.arg1
+        slot_of = self._allocate(program, intervals, copied_from)
+
+        # Slot k is named tk, skipping names something else already uses
+        slot_names: List[int] = []
+        number = 0
+        for _ in range(1 + max(slot_of.values(), default=-1)):
+            while True:
+                name = f't{number}'
+                number += 1
+                existing = symbols._name_ids.get(name)
+                if existing is None or existing in temps:
+                    break
+            slot_names.append(symbols.temp(name))
+        rename = {temp: slot_names[slot] for temp, slot in slot_of.items()}
+
+        optimized: List[Instruction] = []
+        new_start: List[int] = []
+        text = symbols.text
+        for pos, instr in enumerate(instructions):
+            new_start.append(len(optimized))
+            if pos in folds:
+                if log.changes:
+                    log.change(instr, None, f'Coalesced copy: {text(instr.arg1)} computed into {text(instr.dest)}')
+                self.touched.append(len(optimized))
+                continue
+            dest = retarget.get(pos, instr.dest)
+            dest = rename.get(dest, dest)
+            arg1 = rename.get(instr.arg1, instr.arg1)
+            arg2 = rename.get(instr.arg2, instr.arg2)
+            if instr.opcode is ASSIGN and dest == arg1:
+                if log.changes:
+                    log.change(instr, None, f'Coalesced copy: {text(instr.arg1)} and {text(instr.dest)} share a slot')
+                self.touched.append(len(optimized))
+                continue
+            if dest != instr.dest or arg1 != instr.arg1 or arg2 != instr.arg2:
+                # Renaming is not logged per instruction; statistics sums it up
+                self.touched.append(len(optimized))
+                optimized.append(Instruction(instr.opcode, dest, instr.op, arg1, arg2, instr.label))
+            else:
+                optimized.append(instr)
+        new_start.append(len(optimized))
+
+        self.changed = bool(self.touched)
+        if self.changed:
+            functions = [(name, new_start[start], new_start[end]) for name, start, end in program.functions]
+            program = program.derive(optimized, functions)
+            peak_after = peak_live(ControlFlowGraph(program), set(slot_names))
+        else:
+            peak_after = peak_before
+        self.statistics = {
+            'temps_before': len(temps),
+            'temps_after': len(slot_names),
+            'copies_removed': len(instructions) - len(optimized),
+            'peak_live_before': peak_before,
+            'peak_live_after': peak_after,
+        }
+        return program
+
+    def get_optimization_log(self) -> OptimizationLog:
+        return self.optimization_log
@@ -0,0 +1,204 @@
+# incremental.py - Reuse the cached TAC of functions that did not change since the last run
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import List
+
+from pycparser import c_ast
+
+from parser.parser import TACGenerator
+from tac_utils.cache import pipeline_variant, tool_fingerprint
+from tac_utils.module import TACModule, unit_from_state, unit_state
+
+# Name reported for units of top-level declarations
+TOP_LEVEL = '<top level>'
+
+# What happened to a unit on a run with the cache
+REUSED = 'reused'            # Everything came from the cache
+REGENERATED = 'regenerated'  # TAC generated from the AST
+REOPTIMIZED = 'reoptimized'  # Cached TAC, optimized again
+
+@dataclass
+class UnitReport:
+    """Which units of a file came from the cache and which had to be redone."""
+    # [unit name, status] in module order
+    units: List[List[str]] = field(default_factory=list)
+
+    def names(self, status):
+        return [name for name, unit_status in self.units if unit_status == status]
+
+    @property
+    def reused(self):
+        return self.names(REUSED)
+
+    @property
+    def regenerated(self):
+        return self.names(REGENERATED)
+
+    @property
+    def reoptimized(self):
+        return self.names(REOPTIMIZED)
+
+    def format(self):
+        lines = [f"Functions reused from the cache: {len(self.reused)} of {len(self.units)}"]
+        for status in (REGENERATED, REOPTIMIZED):
+            names = self.names(status)
+            if names:
+                lines.append(f"  {status}: {', '.join(names)}")
+        return '\n'.join(lines)
+
+def ast_fingerprint(nodes):
+    """
+    Hash the structure of AST subtrees.
+
+    Node types, attributes (names, operators, literal spellings) and the
+    shape of the tree go into the hash; source coordinates do not, so a
+    function that only moved within the file keeps its fingerprint.
+
+    Args:
+        nodes (list): pycparser nodes, hashed in order
+
+    Returns:
+        str: Hex digest
+    """
+    parts = []
+    append = parts.append
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if node is None:
+            append('')
+            continue
+        append(type(node).__name__)
+        for name in node.attr_names:
+            append(repr(getattr(node, name)))
+        children = node.children()
+        # Child slot names ('left', 'iftrue', 'block_items[0]', ...) give the shape
+        append(' '.join(name for name, _ in children))
+        stack.extend(child for _, child in reversed(children))
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+def split_units(ast):
+    """
+    Group the top-level nodes of a file the way the TAC generator splits it into units.
+
+    Returns:
+        list: (function name or None, nodes) pairs, in source order
+    """
+    groups = []
+    for node in ast.ext or []:
+        if isinstance(node, c_ast.FuncDef):
+            groups.append((node.decl.name, [node]))
+        elif groups and groups[-1][0] is None:
+            groups[-1][1].append(node)
+        else:
+            groups.append((None, [node]))
+    return groups
+
+def generate_unit(nodes):
+    """
+    Generate the TAC unit of one group of top-level nodes.
+
+    Returns:
+        TACUnit, or None if the nodes produce no code (e.g. prototypes)
+    """
+    generator = TACGenerator()
+    for node in nodes:
+        generator.visit(node)
+    generator.finish_unit()
+    return generator.module.units[0] if generator.module.units else None
+
+def _unit_key(fingerprint):
+    # Generated TAC depends on the generator as well as the AST
+    digest = hashlib.sha256(tool_fingerprint().encode())
+    digest.update(b'\0' + fingerprint.encode())
+    return digest.hexdigest()
+
+def generate_module_cached(ast, cache, report=None):
+    """
+    Generate a module, taking the TAC of unchanged units from the cache.
+
+    Args:
+        ast: The AST generated by pycparser
+        cache (TACCache): Cache holding the TAC of previously seen units
+        report (UnitReport): Optional report to add every unit to
+
+    Returns:
+        tuple: (TACModule, cache key of each of its units)
+    """
+    module = TACModule()
+    keys = []
+    for name, nodes in split_units(ast):
+        key = _unit_key(ast_fingerprint(nodes))
+        entry = cache.get(key, 'unit')
+        if entry is None:
+            unit = generate_unit(nodes)
+            # Remember groups without code too, so they are not generated again
+            cache.put(key, unit_state(unit) if unit is not None else {'name': name, 'records': None}, 'unit')
+            status = REGENERATED
+        else:
+            unit = unit_from_state(entry) if entry['records'] is not None else None
+            status = REUSED
+        if unit is not None:
+            module.append(unit)
+            keys.append(key)
+            if report is not None:
+                report.units.append([name or TOP_LEVEL, status])
+
+    # Which globals a unit shares, and their types, depend on the other units,
+    # so they are never cached
+    module.share_globals()
+    module.share_types()
+    return module, keys
+
+def optimize_module_cached(module, keys, cache, pass_manager, jobs=1, report=None):
+    """
+    Optimize a module, taking the optimized TAC of unchanged units from the cache.
+
+    A unit's optimized TAC depends on the pipeline, on the globals it
+    shares with the rest of the file and on the types of the globals it
+    uses, so all of them are part of its cache variant.
+    Only the units missing from the cache are handed to the pass manager.
+
+    Args:
+        module (TACModule): Module from generate_module_cached
+        keys (list): Cache key of each unit
+        cache (TACCache): Cache holding optimized TAC of previously seen units
+        pass_manager (PassManager): Pipeline to optimize with
+        jobs (int): Worker processes for the units that are optimized
+        report (UnitReport): Optional report from generate_module_cached to update
+
+    Returns:
+        TACModule: The optimized module
+    """
+    base_variant = 'opt-unit:' + pipeline_variant(pass_manager.pipeline, pass_manager.max_iterations,
+                                                 pass_manager.target)
+    units = []
+    missing = []
+    for unit, key in zip(module, keys):
+        symbols = unit.program.symbols
+        shared = ','.join(sorted(symbols.text(name) for name in unit.program.shared))
+        types = ','.join(sorted(f"{symbols.text(name)}:{c_type}" for name, c_type in unit.program.types.items()))
+        variant = f"{base_variant}:{shared}:{types}"
+        entry = cache.get(key, variant)
+        if entry is None:
+            missing.append((len(units), unit, key, variant))
+            units.append(None)
+        else:
+            units.append(unit_from_state(entry))
+
+    if report is not None:
+        for index, _, _, _ in missing:
+            if report.units[index][1] == REUSED:
+                report.units[index][1] = REOPTIMIZED
+
+    if missing:
+        optimized = pass_manager.run_module(TACModule([unit for _, unit, _, _ in missing]), jobs)
+        for (index, _, key, variant), unit in zip(missing, optimized):
+            units[index] = unit
+            cache.put(key, unit_state(unit), variant)
+    else:
+        pass_manager.history.clear()
+        pass_manager.iterations = 0
+        pass_manager.converged = True
+    return module.derive(units)
@@ -1,26 +1,70 @@
 # parser.py - Parse C code using pycparser and generate 3-address code
 
 import os
+import re
+import subprocess
 import sys
-from pycparser import c_parser, c_ast, parse_file
-import pycparser.c_generator
+from pycparser import c_parser, c_ast, preprocess_file
+
+from tac_utils.c_types import canonical_type
+from tac_utils.ir import (
+    TACProgram, assign, binop, cond_jump, jump, label, parse_literal, return_, unaryop,
+)
+from tac_utils.module import TACModule, TACUnit
 
 class TACGenerator(c_ast.NodeVisitor):
     """
     Node visitor that generates Three Address Code (TAC) from C code AST.
+    
+    Every function becomes a unit of its own in ``self.module``, as does
+    each run of top-level code between functions. A unit has its own
+    symbol table and numbers its temporaries and labels from 0.
     """
     
     def __init__(self):
-        """Initialize the TAC generator with empty lists for instructions and temp variables."""
-        self.instructions = []  # List to store all TAC instructions
-        self.temp_counter = 0   # Counter for generating temporary variables
+        """Initialize the TAC generator with an empty module and a top-level unit."""
+        self.module = TACModule()  # Finished units, in source order
         self.var_declarations = set()  # Track declared variables
+        self.loops = []  # [continue label, break label, continue used] of enclosing loops
+        self.start_unit(None)
+    
+    def start_unit(self, name):
+        """Start collecting instructions for a new unit (a function, or top-level code if name is None)."""
+        self.unit_name = name
+        self.program = TACProgram()  # Interned TAC instructions of the current unit
+        self.symbols = self.program.symbols
+        self.temp_counter = 0   # Counter for generating temporary variables
+        self.label_counter = 0  # Counter for generating labels
+    
+    def finish_unit(self):
+        """Add the current unit to the module, unless it is top-level code that produced and declared nothing."""
+        program = self.program
+        if (self.unit_name is not None or program.instructions or program.types
+                or self.temp_counter or self.label_counter):
+            self.module.append(TACUnit(self.unit_name, program, self.temp_counter, self.label_counter))
         
     def new_temp(self):
-        """Generate a new temporary variable name."""
+        """Generate a new temporary variable and return its operand ID."""
         temp = f"t{self.temp_counter}"
         self.temp_counter += 1
-        return temp
+        return self.symbols.temp(temp)
+    
+    def new_label(self):
+        """Generate a new label name."""
+        name = str(self.label_counter)
+        self.label_counter += 1
+        return name
+    
+    def branch_unless(self, condition, target):
+        """Emit a jump to target taken when condition is false."""
+        negated = self.new_temp()
+        self.program.append(unaryop(negated, '!', condition))
+        self.program.append(cond_jump(negated, target))
+    
+    def declare(self, node):
+        """Record the type of a declared variable in the current unit."""
+        names = getattr(node.type.type, 'names', None)
+        self.program.declare(self.symbols.variable(node.name), canonical_type(names) if names else None)
     
     def visit_Decl(self, node):
         """Process variable declarations."""
@@ -28,15 +72,12 @@ class TACGenerator(c_ast.NodeVisitor):
             # Track the variable as declared
             var_name = node.name
             self.var_declarations.add(var_name)
+            self.declare(node)
             
             # If there's an initialization value, process it
             if node.init:
                 result = self.visit(node.init)
-                self.instructions.append({
-                    'type': 'assign',
-                    'lhs': var_name,
-                    'rhs': result
-                })
+                self.program.append(assign(self.symbols.variable(var_name), result))
                 return var_name
             return var_name
         return None
@@ -46,20 +87,23 @@ class TACGenerator(c_ast.NodeVisitor):
         # Visit the right side to get the value
         rhs = self.visit(node.rvalue)
         
-        # Get the left side variable name
-        lhs = node.lvalue.name if isinstance(node.lvalue, c_ast.ID) else self.visit(node.lvalue)
+        # Get the left side operand
+        lhs = self.visit(node.lvalue)
         
-        # Create an assignment instruction
-        self.instructions.append({
-            'type': 'assign',
-            'lhs': lhs,
-            'rhs': rhs
-        })
+        # Create an assignment instruction; compound assignments such as
+        # x += y update the variable in place
+        if node.op == '=':
+            self.program.append(assign(lhs, rhs))
+        else:
+            self.program.append(binop(lhs, node.op[:-1], lhs, rhs))
         
         return lhs
     
     def visit_BinaryOp(self, node):
         """Process binary operations like addition, subtraction, etc."""
+        if node.op in ('&&', '||'):
+            return self.visit_logical(node)
+        
         # Visit left and right operands
         left = self.visit(node.left)
         right = self.visit(node.right)
@@ -68,105 +112,452 @@ class TACGenerator(c_ast.NodeVisitor):
         result = self.new_temp()
         
         # Create a binary operation instruction
-        self.instructions.append({
-            'type': 'binop',
-            'lhs': result,
-            'op': node.op,
-            'arg1': left,
-            'arg2': right
-        })
+        self.program.append(binop(result, node.op, left, right))
+        
+        return result
+    
+    def visit_logical(self, node):
+        """Lower && and || to jumps that skip the right operand when the left one decides the result."""
+        left = self.visit(node.left)
+        result = self.new_temp()
+        end_label = self.new_label()
+        zero = self.symbols.constant('0', 0)
+        
+        # The left operand alone decides: 0 for a false &&, 1 for a true ||
+        if node.op == '&&':
+            self.program.append(assign(result, zero))
+            self.branch_unless(left, end_label)
+        else:
+            self.program.append(assign(result, self.symbols.constant('1', 1)))
+            self.program.append(cond_jump(left, end_label))
         
+        right = self.visit(node.right)
+        self.program.append(binop(result, '!=', right, zero))
+        self.program.append(label(end_label))
         return result
     
+    def visit_UnaryOp(self, node):
+        """Process unary operations, including increments and decrements."""
+        if node.op in ('++', '--', 'p++', 'p--'):
+            var = self.visit(node.expr)
+            op = '+' if '+' in node.op else '-'
+            one = self.symbols.constant('1', 1)
+            if node.op.startswith('p'):
+                # Postfix: the expression's value is the old value
+                old = self.new_temp()
+                self.program.append(assign(old, var))
+                self.program.append(binop(var, op, var, one))
+                return old
+            self.program.append(binop(var, op, var, one))
+            return var
+        
+        if node.op == '+':
+            return self.visit(node.expr)
+        
+        if node.op in ('-', '~', '!'):
+            arg = self.visit(node.expr)
+            result = self.new_temp()
+            self.program.append(unaryop(result, node.op, arg))
+            return result
+        
+        # Address-of, dereference and sizeof are not supported
+        return None
+    
     def visit_ID(self, node):
-        """Process variable references."""
-        return node.name
+        """Process variable references, returning the variable's operand ID."""
+        return self.symbols.variable(node.name)
     
     def visit_Constant(self, node):
-        """Process constant values."""
-        return node.value
+        """Process constant values, returning the constant's operand ID."""
+        # Parse the literal once here; passes work with the typed value
+        return self.symbols.constant(node.value, parse_literal(node.value))
     
     def visit_FuncDef(self, node):
-        """Visit function definitions to process their bodies."""
-        # Process the function body
+        """Visit function definitions to process their bodies, each into a unit of its own."""
+        self.finish_unit()
+        self.start_unit(node.decl.name)
+        args = getattr(node.decl.type, 'args', None)
+        for param in (args.params if args else []):
+            if isinstance(param, c_ast.Decl) and isinstance(param.type, c_ast.TypeDecl) and param.name:
+                self.declare(param)
         if node.body:
             self.visit(node.body)
+        self.program.functions.append((node.decl.name, 0, len(self.program)))
+        self.finish_unit()
+        # Anything after the function is top-level code again
+        self.start_unit(None)
     
     def visit_Compound(self, node):
         """Visit compound statements (blocks of code)."""
         if node.block_items:
             for stmt in node.block_items:
                 self.visit(stmt)
+    
+    def visit_If(self, node):
+        """Lower if/else to conditional and unconditional jumps."""
+        condition = self.visit(node.cond)
+        else_label = self.new_label()
+        self.branch_unless(condition, else_label)
+        
+        if node.iftrue:
+            self.visit(node.iftrue)
+        
+        if node.iffalse:
+            end_label = self.new_label()
+            self.program.append(jump(end_label))
+            self.program.append(label(else_label))
+            self.visit(node.iffalse)
+            self.program.append(label(end_label))
+        else:
+            self.program.append(label(else_label))
+    
+    def visit_While(self, node):
+        """Lower while loops: test at the top, jump back after the body."""
+        start_label = self.new_label()
+        end_label = self.new_label()
+        
+        self.program.append(label(start_label))
+        self.branch_unless(self.visit(node.cond), end_label)
+        self.visit_loop_body(node.stmt, start_label, end_label)
+        self.program.append(jump(start_label))
+        self.program.append(label(end_label))
+    
+    def visit_DoWhile(self, node):
+        """Lower do/while loops: body first, test at the bottom."""
+        body_label = self.new_label()
+        cond_label = self.new_label()
+        end_label = self.new_label()
+        
+        self.program.append(label(body_label))
+        self.visit_loop_body(node.stmt, cond_label, end_label)
+        self.program.append(label(cond_label))
+        self.program.append(cond_jump(self.visit(node.cond), body_label))
+        self.program.append(label(end_label))
+    
+    def visit_For(self, node):
+        """Lower for loops like while loops, with the step before the back edge."""
+        if node.init:
+            self.visit(node.init)
+        
+        start_label = self.new_label()
+        next_label = self.new_label()
+        end_label = self.new_label()
+        
+        self.program.append(label(start_label))
+        if node.cond:
+            self.branch_unless(self.visit(node.cond), end_label)
+        if self.visit_loop_body(node.stmt, next_label, end_label):
+            self.program.append(label(next_label))
+        if node.next:
+            self.visit(node.next)
+        self.program.append(jump(start_label))
+        self.program.append(label(end_label))
+    
+    def visit_loop_body(self, stmt, continue_label, break_label):
+        """Visit a loop body; returns True if it contains a continue."""
+        self.loops.append([continue_label, break_label, False])
+        if stmt:
+            self.visit(stmt)
+        return self.loops.pop()[2]
+    
+    def visit_Break(self, node):
+        """Jump past the innermost loop."""
+        if self.loops:
+            self.program.append(jump(self.loops[-1][1]))
+    
+    def visit_Continue(self, node):
+        """Jump to the next iteration of the innermost loop."""
+        if self.loops:
+            self.loops[-1][2] = True
+            self.program.append(jump(self.loops[-1][0]))
+    
+    def visit_Return(self, node):
+        """Process return statements."""
+        value = self.visit(node.expr) if node.expr else None
+        self.program.append(return_(value))
 
-def parse_c_file(filename):
+# Preprocessor invocation used for every input file
+CPP_PATH = 'cpp'
+CPP_ARGS = ['-E', r'-Ipycparser/utils/fake_libc_include']
+# cpp takes a single input file; the compiler driver preprocesses several in one run
+BATCH_CPP_PATH = 'gcc'
+
+# Line markers gcc -E writes at the start of each input file's output
+_FILE_START = re.compile(r'^# [01] "((?:[^"\\]|\\.)*)"\n# [01] "<built-in>"\n', re.MULTILINE)
+
+# pycparser 3 parsers reset themselves on every parse() call, so one is reused
+_parser = None
+
+def needs_cpp(text):
     """
-    Parse a C file and return the AST using pycparser's built-in
-    preprocessor handling.
+    Check whether C source has to go through the preprocessor before parsing.
+    
+    Source without directives, comments or line continuations parses the
+    same without cpp, and the cpp process is most of a small file's cost.
+    A '#' or '//' inside a string literal merely sends the file through cpp.
     
     Args:
-        filename (str): Path to the C file to parse
+        text (str): C source
+        
+    Returns:
+        bool: True if the source must be preprocessed
+    """
+    return '#' in text or '/*' in text or '//' in text or '\\\n' in text
+
+def preprocess_c_file(filename):
+    """
+    Run the C preprocessor over a file.
+    
+    Args:
+        filename (str): Path to the C file to preprocess
+        
+    Returns:
+        str: The preprocessed source, or None if there's an error
+    """
+    try:
+        return preprocess_file(filename, cpp_path=CPP_PATH, cpp_args=CPP_ARGS)
+    except Exception as e:
+        print(f"Error preprocessing file: {e}")
+        return None
+
+def read_c_file(filename):
+    """
+    Read a C file ready for parsing, running cpp only if the file needs it.
+    
+    Args:
+        filename (str): Path to the C file
+        
+    Returns:
+        str: Source to parse, or None if there's an error
+    """
+    try:
+        with open(filename, 'r') as f:
+            text = f.read()
+    except OSError as e:
+        print(f"Error reading file: {e}")
+        return None
+    return preprocess_c_file(filename) if needs_cpp(text) else text
+
+def read_c_files(filenames):
+    """
+    Read many C files ready for parsing, preprocessing all that need it in one run.
+    
+    Files that cannot be read, or that fail to preprocess together, are
+    left as None for the caller to retry on their own with read_c_file(),
+    which reports the error.
+    
+    Args:
+        filenames (list): Paths to the C files
+        
+    Returns:
+        list: Source to parse for each file, or None
+    """
+    texts = []
+    for filename in filenames:
+        try:
+            with open(filename, 'r') as f:
+                texts.append(f.read())
+        except OSError:
+            texts.append(None)
+    
+    pending = [i for i, text in enumerate(texts) if text is not None and needs_cpp(text)]
+    for i in pending:
+        texts[i] = None
+    if len(pending) < 2:
+        # A single file gains nothing from the batch run
+        return texts
+    
+    try:
+        result = subprocess.run([BATCH_CPP_PATH] + CPP_ARGS + [filenames[i] for i in pending],
+                                capture_output=True, text=True)
+    except OSError:
+        return texts
+    if result.returncode != 0:
+        return texts
+    
+    # Split the output at the markers opening each file, checking they come in order
+    starts = list(_FILE_START.finditer(result.stdout))
+    expected = [filenames[i].replace('\\', '\\\\').replace('"', '\\"') for i in pending]
+    if [m.group(1) for m in starts] != expected:
+        return texts
+    ends = [m.start() for m in starts[1:]] + [len(result.stdout)]
+    for i, start, end in zip(pending, starts, ends):
+        texts[i] = result.stdout[start.start():end]
+    return texts
+
+def parse_c_text(text, filename='<stdin>'):
+    """
+    Parse preprocessed C source and return the AST.
+    
+    Args:
+        text (str): Preprocessed C source
+        filename (str): Name used in error messages
         
     Returns:
         The AST generated by pycparser or None if there's an error
     """
+    global _parser
     try:
-        # Use pycparser's parse_file with cpp_args to handle preprocessor directives
-        ast = parse_file(
-            filename, 
-            use_cpp=True,
-            cpp_args=['-E', r'-Ipycparser/utils/fake_libc_include']
-        )
-        return ast
+        if _parser is None:
+            _parser = c_parser.CParser()
+        return _parser.parse(text, filename)
     except Exception as e:
         print(f"Error parsing file: {e}")
         return None
 
-def generate_tac(ast):
+def parse_c_file(filename):
     """
-    Generate 3-address code from an AST.
+    Parse a C file and return the AST, preprocessing it if it needs it.
+    
+    Args:
+        filename (str): Path to the C file to parse
+        
+    Returns:
+        The AST generated by pycparser or None if there's an error
+    """
+    text = read_c_file(filename)
+    if text is None:
+        return None
+    return parse_c_text(text, filename)
+
+def generate_module(ast):
+    """
+    Generate 3-address code from an AST as one unit per function.
     
     Args:
         ast: The AST generated by pycparser
         
     Returns:
-        List of TAC instructions
+        TACModule holding a unit per function and per run of top-level code
     """
     if ast is None:
-        return []
+        return TACModule()
     
     # Create a TAC generator
     generator = TACGenerator()
     
     # Visit all nodes in the AST
     generator.visit(ast)
+    generator.finish_unit()
     
-    return generator.instructions
+    # Units are optimized apart, so each must know which globals it shares
+    # and what types they have
+    generator.module.share_globals()
+    generator.module.share_types()
+    return generator.module
 
-def process_file(input_file):
+def generate_ir(ast):
+    """
+    Generate 3-address code from an AST in its interned form.
+    
+    Args:
+        ast: The AST generated by pycparser
+        
+    Returns:
+        TACProgram holding the generated instructions
+    """
+    return generate_module(ast).to_program()
+
+def generate_tac(ast):
+    """
+    Generate 3-address code from an AST.
+    
+    Args:
+        ast: The AST generated by pycparser
+        
+    Returns:
+        List of TAC instructions
+    """
+    return generate_ir(ast).to_dicts()
+
+def process_file(input_file, cache=None, pass_manager=None, jobs=1, report=None, source=None, functions=None):
     """
     Process a C file and generate 3-address code.
     
+    With a cache, a file seen before in the same form is answered from the
+    cache. Otherwise each function's TAC and optimized TAC are looked up by
+    a fingerprint of the function's AST, so after an edit only the changed
+    functions are generated and optimized again.
+    
     Args:
         input_file (str): Path to the input C file
+        cache (TACCache): Optional cache consulted before parsing/optimizing
+        pass_manager (PassManager): Optional pipeline to optimize the TAC with
+        jobs (int): Worker processes to optimize the file's functions in
+        report (UnitReport): Optional report of the functions reused from the cache
+        source (str): The file's source as read_c_file() returns it, if already read
+        functions (list): Optional list to fill with the (name, start, end)
+            instruction range of every function in the returned TAC
         
     Returns:
-        List of TAC instructions
+        List of TAC instructions, or None if the file could not be processed
     """
-    # Parse the file to get the AST
-    ast = parse_c_file(input_file)
+    def done(program):
+        """The TAC dicts of program, reporting its function ranges."""
+        if functions is not None:
+            functions[:] = program.functions
+        return program.to_dicts()
+
+    text = source if source is not None else read_c_file(input_file)
+    if text is None:
+        print(f"Failed to preprocess {input_file}.")
+        return None
+    
+    key = None
+    if cache is not None:
+        # The cache is keyed by the text handed to the parser
+        key = cache.source_key(text, CPP_ARGS, CPP_PATH)
+        entry = cache.get(key, _cache_variant(pass_manager) if pass_manager is not None else 'tac')
+        if entry is not None:
+            # Entries written before function ranges were stored are plain lists
+            if isinstance(entry, list):
+                return entry
+            if functions is not None:
+                functions[:] = [tuple(r) for r in entry['functions']]
+            return entry['instructions']
+    
+    # Parse the source to get the AST
+    ast = parse_c_text(text, input_file)
     
     if ast is None:
         print(f"Failed to parse {input_file}. Check the file for syntax errors.")
-        return []
+        return None
     
-    # Generate TAC from the AST
-    tac = generate_tac(ast)
+    # Generate TAC from the AST; the optimizer gets the module itself so it
+    # can optimize each function on its own
+    if cache is None:
+        module = generate_module(ast)
+    else:
+        from parser.incremental import generate_module_cached
+        module, unit_keys = generate_module_cached(ast, cache, report)
+    # Drop the AST: the collector would otherwise keep walking it while passes run
+    del ast
+    program = module.to_program()
+    tac = done(program)
     
     if not tac:
         print(f"Warning: No TAC instructions generated from {input_file}.")
+        return tac
+    
+    if cache is not None:
+        cache.put(key, {'instructions': tac, 'functions': program.functions})
     
+    if pass_manager is None:
+        return tac
+    
+    if cache is None:
+        return done(pass_manager.run_module(module, jobs).to_program())
+    
+    from parser.incremental import optimize_module_cached
+    optimized = optimize_module_cached(module, unit_keys, cache, pass_manager, jobs, report).to_program()
+    tac = done(optimized)
+    cache.put(key, {'instructions': tac, 'functions': optimized.functions}, _cache_variant(pass_manager))
     return tac
 
+def _cache_variant(pass_manager):
+    from tac_utils.cache import pipeline_variant
+    return pipeline_variant(pass_manager.pipeline, pass_manager.max_iterations, pass_manager.target)
+
 if __name__ == "__main__":
     # If this script is run directly, process the default input file
     default_input = "../input/sample.c"
@@ -176,7 +567,7 @@ if __name__ == "__main__":
     else:
         input_file = default_input
     
-    tac_instructions = process_file(input_file)
+    tac_instructions = process_file(input_file) or []
     
     # Print the TAC instructions
     for i, instr in enumerate(tac_instructions):
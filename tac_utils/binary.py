@@ -0,0 +1,403 @@
+# binary.py - Memory-mapped binary container for large TAC dumps
+
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from tac_utils.ir import LEGACY, TEMP_PATTERN, TYPED, Instruction, Opcode, SymbolTable, TACProgram
+
+# File layout (all integers little-endian):
+#
+#   header    HEADER (64 bytes)
+#   records   record_count * RECORD, one per instruction
+#   index     string_count * STRING_ENTRY (blob offset, byte length)
+#   blob      UTF-8 string data
+#   functions function_count * FUNCTION_ENTRY (name string, start, end)
+#
+# Record operands (dest, arg1, arg2) are 0 for "none", +(i + 1) for a name
+# at string index i, and -(i + 1) for a constant at string index i, so the
+# IR's constant/variable split survives a round trip. Names spelled like
+# the generator's temporaries (t0, t1, ...) are read back as temporaries,
+# as when loading JSON. op and label are string index + 1, or 0.
+MAGIC = b'TACB'
+FORMAT_VERSION = 1
+SUFFIX = '.tacb'
+
+HEADER = struct.Struct('<4sHHIQQQQQQ12x')
+RECORD = struct.Struct('<BxxxiIiiI')
+STRING_ENTRY = struct.Struct('<QI')
+FUNCTION_ENTRY = struct.Struct('<III')
+
+FLAG_LEGACY = 1
+
+_OPCODES = list(Opcode)
+
+class _StringCodes(dict):
+    """Maps strings to string table index + 1, assigning new entries on demand."""
+
+    def __init__(self):
+        super().__init__({None: 0})
+
+    def __missing__(self, text: str) -> int:
+        code = len(self)
+        self[text] = code
+        return code
+
+class _OperandCodes(dict):
+    """Maps operand IDs of one SymbolTable to record operand codes."""
+
+    def __init__(self, symbols: SymbolTable, strings: _StringCodes):
+        super().__init__({None: 0})
+        self.symbols = symbols
+        self.strings = strings
+
+    def __missing__(self, operand: int) -> int:
+        code = self.strings[self.symbols.text(operand)]
+        if operand < 0:
+            code = -code
+        self[operand] = code
+        return code
+
+class BinaryTACWriter:
+    """
+    Streams instructions into a binary TAC file.
+
+    Records are written as instructions arrive; the string table, function
+    table and header are written on close(), so memory use is bounded by
+    the number of distinct strings rather than the number of instructions.
+    """
+
+    def __init__(self, output_file: str, style: str = TYPED):
+        self.output_file = output_file
+        self.style = style
+        self.count = 0
+        self.functions: List[Tuple[int, int, int]] = []
+        self._strings = _StringCodes()
+        self._codes: Optional[_OperandCodes] = None
+        self._f = open(output_file, 'wb')
+        self._f.write(b'\0' * HEADER.size)
+        self._pack = RECORD.pack
+        # Used to intern dict instructions
+        self._program = TACProgram()
+
+    def write_instruction(self, instr: Instruction, symbols: SymbolTable) -> None:
+        """Append an IR instruction whose operands belong to ``symbols``."""
+        codes = self._codes
+        if codes is None or codes.symbols is not symbols:
+            codes = self._codes = _OperandCodes(symbols, self._strings)
+        strings = self._strings
+        self._f.write(self._pack(
+            instr.opcode, codes[instr.dest], strings[instr.op],
+            codes[instr.arg1], codes[instr.arg2], strings[instr.label],
+        ))
+        self.count += 1
+
+    def write(self, instruction: Dict[str, str]) -> None:
+        """Append a TAC dict."""
+        if self.count == 0 and 'type' not in instruction:
+            self.style = LEGACY
+        program = self._program
+        self.write_instruction(program.instruction_from_dict(instruction), program.symbols)
+
+    def add_function(self, name: str, start: int, end: int) -> None:
+        """Record that instructions [start, end) belong to function ``name``."""
+        self.functions.append((self._strings[name], start, end))
+
+    def close(self) -> None:
+        f = self._f
+        if f.closed:
+            return
+        encoded = [s.encode('utf-8') for s in self._strings if s is not None]
+
+        index_offset = f.tell()
+        blob_offset = index_offset + len(encoded) * STRING_ENTRY.size
+        offset = 0
+        for data in encoded:
+            f.write(STRING_ENTRY.pack(offset, len(data)))
+            offset += len(data)
+        for data in encoded:
+            f.write(data)
+
+        functions_offset = f.tell()
+        for name, start, end in self.functions:
+            f.write(FUNCTION_ENTRY.pack(name, start, end))
+
+        f.seek(0)
+        f.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, FLAG_LEGACY if self.style == LEGACY else 0, RECORD.size,
+            self.count, len(encoded), index_offset, blob_offset, functions_offset, len(self.functions),
+        ))
+        f.close()
+
+    def __enter__(self) -> 'BinaryTACWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def write_binary_tac(tac: Union[TACProgram, Iterable[Dict[str, str]]], output_file: str,
+                     functions: Optional[Sequence[Tuple[str, int, int]]] = None) -> int:
+    """
+    Write TAC to a binary TAC file.
+
+    Args:
+        tac: A TACProgram (whose ``functions`` ranges are stored) or an
+            iterable of TAC dicts
+        output_file: Path to the .tacb file
+        functions: Optional (name, start, end) ranges, overriding the program's
+
+    Returns:
+        int: Number of instructions written
+    """
+    if isinstance(tac, TACProgram):
+        functions = tac.functions if functions is None else functions
+        with BinaryTACWriter(output_file, tac.style) as writer:
+            for name, start, end in functions or ():
+                writer.add_function(name, start, end)
+            symbols = tac.symbols
+            for instr in tac.instructions:
+                writer.write_instruction(instr, symbols)
+        return writer.count
+
+    with BinaryTACWriter(output_file) as writer:
+        for name, start, end in functions or ():
+            writer.add_function(name, start, end)
+        for instr in tac:
+            writer.write(instr)
+    return writer.count
+
+class BinaryTAC:
+    """
+    Read-only, memory-mapped view of a binary TAC file.
+
+    Opening the file only parses the header; instructions, strings and
+    function ranges are decoded on access. Indexing returns TAC dicts and
+    slicing returns a lazy TACView over a range of instructions.
+    """
+
+    def __init__(self, input_file: str):
+        self.input_file = input_file
+        self._file = open(input_file, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f"{input_file} is too small to be a binary TAC file")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        (magic, version, flags, record_size, self.record_count, self.string_count,
+         self._index_offset, self._blob_offset, self._functions_offset,
+         self.function_count) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{input_file} is not a binary TAC file")
+        if version != FORMAT_VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"Unsupported binary TAC version {version} in {input_file}")
+
+        self.style = LEGACY if flags & FLAG_LEGACY else TYPED
+        self._texts = _Texts(self)
+        self._functions: Optional[Dict[str, Tuple[int, int]]] = None
+        # Scratch program that single-instruction reads are decoded through,
+        # so the dict layout matches TACProgram.to_dicts exactly
+        self._dict_program = TACProgram(style=self.style)
+        self._dict_operands = _OperandIDs(self._texts, self._dict_program.symbols)
+
+    def close(self) -> None:
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> 'BinaryTAC':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def string(self, index: int) -> str:
+        """Decode entry ``index`` of the string table (cached)."""
+        return self._texts[index + 1]
+
+    def _read_string(self, index: int) -> str:
+        if not 0 <= index < self.string_count:
+            raise ValueError(f"Corrupt binary TAC file {self.input_file}: bad string index {index}")
+        offset, length = STRING_ENTRY.unpack_from(self._mm, self._index_offset + index * STRING_ENTRY.size)
+        start = self._blob_offset + offset
+        return self._mm[start:start + length].decode('utf-8')
+
+    def record(self, index: int) -> Tuple[int, int, int, int, int, int]:
+        """Return the raw record fields of instruction ``index``."""
+        if not 0 <= index < self.record_count:
+            raise IndexError('instruction index out of range')
+        return RECORD.unpack_from(self._mm, HEADER.size + index * RECORD.size)
+
+    def instruction(self, index: int) -> Dict[str, str]:
+        """Decode instruction ``index`` into its dict form."""
+        opcode, dest, op, arg1, arg2, label = self.record(index)
+        operands, texts = self._dict_operands, self._texts
+        instr = Instruction(_OPCODES[opcode], operands[dest], texts[op], operands[arg1], operands[arg2], texts[label])
+        return self._dict_program.instruction_to_dict(instr, self.style)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.record_count)
+            if step != 1:
+                raise ValueError('binary TAC slices must be contiguous')
+            return TACView(self, start, stop)
+        if index < 0:
+            index += self.record_count
+        return self.instruction(index)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for index in range(self.record_count):
+            yield self.instruction(index)
+
+    @property
+    def functions(self) -> Dict[str, Tuple[int, int]]:
+        """Map of function name to its [start, end) instruction range."""
+        if self._functions is None:
+            self._functions = {}
+            for i in range(self.function_count):
+                name, start, end = FUNCTION_ENTRY.unpack_from(
+                    self._mm, self._functions_offset + i * FUNCTION_ENTRY.size)
+                self._functions[self.string(name - 1) if name else f'<function {i}>'] = (start, end)
+        return self._functions
+
+    def function(self, name: str) -> 'TACView':
+        """Return a lazy view of one function's instructions."""
+        if name not in self.functions:
+            raise KeyError(f"No function named '{name}'")
+        start, end = self.functions[name]
+        return TACView(self, start, end)
+
+    def to_program(self, start: int = 0, stop: Optional[int] = None) -> TACProgram:
+        """
+        Load a range of instructions into a TACProgram.
+
+        Records are unpacked in bulk and each distinct string is decoded and
+        interned once.
+        """
+        stop = self.record_count if stop is None else stop
+        program = TACProgram(style=self.style)
+        operands, texts = _OperandIDs(self._texts, program.symbols), self._texts
+
+        view = memoryview(self._mm)[HEADER.size + start * RECORD.size:HEADER.size + stop * RECORD.size]
+        try:
+            program.instructions = [
+                Instruction(_OPCODES[opcode], operands[dest], texts[op], operands[arg1], operands[arg2], texts[label])
+                for opcode, dest, op, arg1, arg2, label in RECORD.iter_unpack(view)
+            ]
+        finally:
+            view.release()
+
+        if start == 0 and stop == self.record_count:
+            program.functions = [(name, fstart, fend) for name, (fstart, fend) in self.functions.items()]
+        return program
+
+class _Texts(dict):
+    """Maps string table index + 1 to decoded text; 0 is None."""
+
+    def __init__(self, tac: BinaryTAC):
+        super().__init__({0: None})
+        self.tac = tac
+
+    def __missing__(self, code: int) -> str:
+        text = self.tac._read_string(code - 1)
+        self[code] = text
+        return text
+
+class _OperandIDs(dict):
+    """Maps record operand codes to operand IDs interned in a SymbolTable."""
+
+    def __init__(self, texts: _Texts, symbols: SymbolTable):
+        super().__init__({0: None})
+        self.texts = texts
+        self.symbols = symbols
+
+    def __missing__(self, code: int) -> int:
+        if code < 0:
+            operand = self.symbols.constant(self.texts[-code])
+        elif TEMP_PATTERN.match(self.texts[code]):
+            operand = self.symbols.temp(self.texts[code])
+        else:
+            operand = self.symbols.variable(self.texts[code])
+        self[code] = operand
+        return operand
+
+class TACView:
+    """A lazy, contiguous range of instructions in a BinaryTAC."""
+
+    def __init__(self, tac: BinaryTAC, start: int, stop: int):
+        self.tac = tac
+        self.start = start
+        self.stop = max(start, stop)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('binary TAC slices must be contiguous')
+            return TACView(self.tac, self.start + start, self.start + stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('instruction index out of range')
+        return self.tac.instruction(self.start + index)
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for index in range(self.start, self.stop):
+            yield self.tac.instruction(index)
+
+    def to_program(self) -> TACProgram:
+        return self.tac.to_program(self.start, self.stop)
+
+def is_binary_tac(path: str) -> bool:
+    """Return True if a file starts with the binary TAC magic number."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+if __name__ == "__main__":
+    # Run as: python -m tac_utils.binary {convert,show} ...
+    import argparse
+
+    from tac_utils.io import convert_tac_file
+    from tac_utils.formatter import format_instruction
+
+    parser = argparse.ArgumentParser(description='Convert and inspect binary TAC files.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    convert = sub.add_parser('convert', help='Convert between .json/.jsonl and .tacb by extension')
+    convert.add_argument('source')
+    convert.add_argument('destination')
+    show = sub.add_parser('show', help='Print instructions from a .tacb file')
+    show.add_argument('file')
+    show.add_argument('--function', help='Only show this function')
+    show.add_argument('--range', help='Only show instructions START:STOP')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        count = convert_tac_file(args.source, args.destination)
+        print(f"Converted {count} instructions to {args.destination}")
+    else:
+        with BinaryTAC(args.file) as tac:
+            view = tac[:]
+            if args.function:
+                view = tac.function(args.function)
+            if args.range:
+                start, _, stop = args.range.partition(':')
+                view = view[int(start or 0):int(stop) if stop else None]
+            print(f"{len(tac)} instructions, {tac.string_count} strings, functions: {', '.join(tac.functions) or 'none'}")
+            for i, instr in enumerate(view, start=view.start):
+                print(f"{i}: {format_instruction(instr)}")
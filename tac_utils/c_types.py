@@ -0,0 +1,289 @@
+# c_types.py - C arithmetic types of TAC operands: declarations, literals, promotions and conversions
+
+import math
+import struct
+from typing import Dict, Iterable, Mapping, Optional
+
+from tac_utils.ir import ASSIGN, BINOP, UNARYOP, Number, SymbolTable, TACProgram
+
+# Conversion rank of every integer type; the widths come from a target's data model
+RANKS = {
+    '_Bool': 0,
+    'char': 1, 'signed char': 1, 'unsigned char': 1,
+    'short': 2, 'unsigned short': 2,
+    'int': 3, 'unsigned int': 3,
+    'long': 4, 'unsigned long': 4,
+    'long long': 5, 'unsigned long long': 5,
+}
+FLOAT_TYPES = ('float', 'double', 'long double')
+
+# Widths of the integer types on an LP64 target such as x86-64 Linux
+LP64_BITS = {'_Bool': 1, 'char': 8, 'short': 16, 'int': 32, 'long': 64, 'long long': 64}
+
+ARITHMETIC_OPS = frozenset(('+', '-', '*', '/', '%'))
+BITWISE_OPS = frozenset(('&', '|', '^'))
+SHIFT_OPS = frozenset(('<<', '>>'))
+# Comparisons and logical operators yield an int 0 or 1
+INT_RESULT_OPS = frozenset(('<', '>', '<=', '>=', '==', '!=', '&&', '||'))
+
+_INTEGER_WORDS = frozenset(('signed', 'unsigned', 'short', 'long', 'int'))
+
+def canonical_type(names: Iterable[str]) -> Optional[str]:
+    """
+    Spell an arithmetic type the one way the rest of the tool uses.
+
+    Args:
+        names: The type specifiers, as in pycparser's IdentifierType.names
+            (e.g. ['long', 'unsigned', 'int'])
+
+    Returns:
+        'unsigned long' for the example, or None for anything that is not a
+        built-in arithmetic type (typedef names, structs, ...)
+    """
+    words = list(names)
+    longs = words.count('long')
+    if 'double' in words:
+        return 'long double' if longs else 'double'
+    if 'float' in words:
+        return 'float'
+    if '_Bool' in words:
+        return '_Bool'
+    if 'char' in words:
+        if 'unsigned' in words:
+            return 'unsigned char'
+        return 'signed char' if 'signed' in words else 'char'
+    if not words or not set(words) <= _INTEGER_WORDS:
+        return None
+    base = 'short' if 'short' in words else 'long long' if longs > 1 else 'long' if longs else 'int'
+    return f'unsigned {base}' if 'unsigned' in words else base
+
+def is_integer(c_type: Optional[str]) -> bool:
+    return c_type in RANKS
+
+def is_unsigned(c_type: str) -> bool:
+    return c_type.startswith('unsigned') or c_type == '_Bool'
+
+def width(c_type: str, bits: Mapping[str, int]) -> int:
+    """Number of value bits (including the sign bit) of an integer type."""
+    if c_type.startswith('unsigned '):
+        c_type = c_type[9:]
+    elif c_type == 'signed char':
+        c_type = 'char'
+    return bits[c_type]
+
+def type_range(c_type: str, bits: Mapping[str, int]):
+    """Smallest and largest value of an integer type."""
+    n = width(c_type, bits)
+    if is_unsigned(c_type):
+        return 0, (1 << n) - 1
+    return -(1 << (n - 1)), (1 << (n - 1)) - 1
+
+def fits(value: int, c_type: str, bits: Mapping[str, int]) -> bool:
+    low, high = type_range(c_type, bits)
+    return low <= value <= high
+
+def promote(c_type: str, bits: Mapping[str, int]) -> str:
+    """Apply the integer promotions: types ranked below int become int, or unsigned int if int cannot hold them."""
+    if RANKS[c_type] >= RANKS['int']:
+        return c_type
+    low, high = type_range(c_type, bits)
+    return 'int' if fits(low, 'int', bits) and fits(high, 'int', bits) else 'unsigned int'
+
+def usual_arithmetic_type(a: Optional[str], b: Optional[str], bits: Mapping[str, int]) -> Optional[str]:
+    """The common type two operands are converted to, or None if either type is unknown."""
+    if a is None or b is None:
+        return None
+    if a in FLOAT_TYPES or b in FLOAT_TYPES:
+        return max((t for t in (a, b) if t in FLOAT_TYPES), key=FLOAT_TYPES.index)
+    if a not in RANKS or b not in RANKS:
+        return None
+    a, b = promote(a, bits), promote(b, bits)
+    if a == b:
+        return a
+    if is_unsigned(a) == is_unsigned(b):
+        return a if RANKS[a] > RANKS[b] else b
+    unsigned, signed = (a, b) if is_unsigned(a) else (b, a)
+    if RANKS[unsigned] >= RANKS[signed]:
+        return unsigned
+    if width(signed, bits) > width(unsigned, bits):
+        return signed
+    return f'unsigned {signed}'
+
+def literal_type(text: str, value: Optional[Number], bits: Mapping[str, int]) -> Optional[str]:
+    """
+    The type C gives a numeric literal: the first of the candidate types for
+    its suffix and base that can hold its value.
+    """
+    if value is None:
+        return None
+    if type(value) is float:
+        return 'float' if text[-1:] in 'fF' and not text.lower().startswith('0x') else 'double'
+    body = text.lstrip('+-').lower()
+    if "'" in body:
+        # Character constants have type int
+        return 'int'
+    suffix = body[len(body.rstrip('ul')):]
+    decimal = not (body.startswith('0') and len(body) > 1)
+    if 'll' in suffix:
+        candidates = ['long long', 'unsigned long long']
+    elif 'l' in suffix:
+        candidates = ['long', 'unsigned long', 'long long', 'unsigned long long']
+    else:
+        candidates = ['int', 'unsigned int', 'long', 'unsigned long', 'long long', 'unsigned long long']
+    if 'u' in suffix:
+        candidates = [t for t in candidates if is_unsigned(t)]
+    elif decimal:
+        # Decimal literals without a u suffix never become unsigned
+        candidates = [t for t in candidates if not is_unsigned(t)]
+    for c_type in candidates:
+        if fits(value, c_type, bits):
+            return c_type
+    return None
+
+def binary_result_type(op: str, a: Optional[str], b: Optional[str], bits: Mapping[str, int]) -> Optional[str]:
+    """The type of ``a op b``, or None if it is not known."""
+    if op in INT_RESULT_OPS:
+        return 'int'
+    if a is None or b is None:
+        return None
+    if op in SHIFT_OPS:
+        return promote(a, bits) if a in RANKS and b in RANKS else None
+    if op in BITWISE_OPS and (a not in RANKS or b not in RANKS):
+        return None
+    if op in ARITHMETIC_OPS or op in BITWISE_OPS:
+        return usual_arithmetic_type(a, b, bits)
+    return None
+
+def unary_result_type(op: str, a: Optional[str], bits: Mapping[str, int]) -> Optional[str]:
+    """The type of ``op a``, or None if it is not known."""
+    if op == '!':
+        return 'int'
+    if a is None:
+        return None
+    if op in ('-', '+') and a in FLOAT_TYPES:
+        return a
+    if op in ('-', '+', '~') and a in RANKS:
+        return promote(a, bits)
+    return None
+
+def convert(value: Number, c_type: str, bits: Mapping[str, int]) -> Optional[Number]:
+    """
+    Convert a constant to an arithmetic type the way an assignment does.
+
+    Integers wrap around to the width of unsigned (and, as on every
+    target we know of, signed) types; floating-point values are truncated
+    toward zero, and float values are rounded to single precision.
+
+    Returns:
+        The converted value, or None where C leaves the result undefined
+        (a floating-point value out of the integer type's range, or one
+        that overflows a float)
+    """
+    if c_type in FLOAT_TYPES:
+        value = float(value)
+        if c_type == 'float':
+            try:
+                value = struct.unpack('f', struct.pack('f', value))[0]
+            except OverflowError:
+                return None
+        return value
+    if c_type == '_Bool':
+        return int(value != 0)
+    if type(value) is float:
+        if not math.isfinite(value) or not fits(int(value), c_type, bits):
+            return None
+        return int(value)
+    n = width(c_type, bits)
+    value &= (1 << n) - 1
+    if not is_unsigned(c_type) and value >= 1 << (n - 1):
+        value -= 1 << n
+    return value
+
+def literal_text(value: Number, c_type: str, bits: Mapping[str, int]) -> str:
+    """
+    Spell a constant so that literal_type() gives it c_type back (or, for
+    types ranked below int, the type they promote to).
+    """
+    text = repr(value)
+    if c_type in FLOAT_TYPES:
+        return text + {'float': 'f', 'double': '', 'long double': 'L'}[c_type]
+    c_type = promote(c_type, bits)
+    suffix = {'int': '', 'long': 'l', 'long long': 'll'}[c_type[9:] if c_type.startswith('unsigned ') else c_type]
+    return text + ('u' if is_unsigned(c_type) else '') + suffix
+
+def assigned_constant(symbols: SymbolTable, constant: int, c_type: Optional[str],
+                      bits: Mapping[str, int]) -> Optional[int]:
+    """
+    The constant a name of type c_type holds once ``constant`` is assigned
+    to it, as a literal of that type (see convert() and literal_text()).
+
+    Returns:
+        The constant's ID: ``constant`` itself when it already has that type
+        or c_type is not known, and None where the conversion is undefined
+    """
+    text, value = symbols.text(constant), symbols.value(constant)
+    if c_type is None or value is None or literal_type(text, value, bits) == c_type:
+        return constant
+    value = convert(value, c_type, bits)
+    if value is None:
+        return None
+    return symbols.constant(literal_text(value, c_type, bits), value)
+
+def operand_types(program: TACProgram, bits: Mapping[str, int]) -> Dict[int, Optional[str]]:
+    """
+    Find the C type of every operand of a program.
+
+    Variables have the types the generator recorded in ``program.types``.
+    Everything else (temporaries, and variables without a declaration) has
+    the type of the values assigned to it, found in one sweep in program
+    order. An operand assigned values of two different types, or used
+    before any assignment, has no known type. Constants are not included;
+    see literal_type().
+
+    Args:
+        program: The program
+        bits: Widths of the integer types on the target
+
+    Returns:
+        dict: Operand ID -> type name, or None where the type is not known
+    """
+    types: Dict[int, Optional[str]] = dict(program.types)
+    declared = set(types)
+    symbols = program.symbols
+    constants = symbols.constants
+    values = symbols.values
+    literals: Dict[int, Optional[str]] = {}
+
+    def type_of(operand: int) -> Optional[str]:
+        if operand >= 0:
+            return types.get(operand)
+        if operand not in literals:
+            literals[operand] = literal_type(constants[~operand], values[~operand], bits)
+        return literals[operand]
+
+    for instr in program.instructions:
+        dest = instr.dest
+        if dest is None or dest in declared:
+            continue
+        opcode = instr.opcode
+        if opcode is ASSIGN:
+            c_type = type_of(instr.arg1)
+        elif opcode is BINOP:
+            c_type = binary_result_type(instr.op, type_of(instr.arg1), type_of(instr.arg2), bits)
+        elif opcode is UNARYOP:
+            c_type = unary_result_type(instr.op, type_of(instr.arg1), bits)
+        else:
+            continue
+        if types.setdefault(dest, c_type) != c_type:
+            types[dest] = None
+    return types
+
+if __name__ == "__main__":
+    # Run as: python -m tac_utils.c_types [file.c]
+    import sys
+
+    from parser.parser import generate_ir, parse_c_file
+
+    program = generate_ir(parse_c_file(sys.argv[1] if len(sys.argv) > 1 else 'input/sample.c'))
+    for operand, c_type in sorted(operand_types(program, LP64_BITS).items()):
+        print(f"{program.symbols.text(operand)}: {c_type or 'unknown'}")
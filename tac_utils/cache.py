@@ -0,0 +1,255 @@
+# cache.py - Content-addressed on-disk cache for generated and optimized TAC
+
+import functools
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+# Bump when the cached data layout changes
+CACHE_VERSION = 1
+
+# Sources whose changes invalidate cached TAC / optimized TAC
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_GENERATOR_SOURCES = ['parser/parser.py', 'parser/incremental.py', 'tac_utils/ir.py', 'tac_utils/module.py']
+_OPTIMIZER_SOURCES = ['optimizer', 'tac_utils/cfg.py', 'tac_utils/ssa.py', 'tac_utils/c_types.py']
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# TAC dicts of a whole file, or the state of one unit (see tac_utils.module.unit_state)
+CacheEntry = Union[List[Dict[str, str]], Dict[str, Any]]
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def add(self, other: 'CacheStats') -> None:
+        self.hits += other.hits
+        self.misses += other.misses
+        self.stores += other.stores
+        self.evictions += other.evictions
+
+    def since(self, earlier: 'CacheStats') -> 'CacheStats':
+        return CacheStats(
+            self.hits - earlier.hits,
+            self.misses - earlier.misses,
+            self.stores - earlier.stores,
+            self.evictions - earlier.evictions,
+        )
+
+    def copy(self) -> 'CacheStats':
+        return CacheStats(**asdict(self))
+
+    def format(self) -> str:
+        lookups = self.hits + self.misses
+        ratio = f" ({100.0 * self.hits / lookups:.1f}% hit rate)" if lookups else ""
+        return (f"Cache: {self.hits} hit(s), {self.misses} miss(es){ratio}, "
+                f"{self.stores} store(s), {self.evictions} eviction(s)")
+
+def _hash_sources(paths: Sequence[str]) -> str:
+    digest = hashlib.sha256()
+    for rel in paths:
+        path = _PROJECT_ROOT / rel
+        files = sorted(path.rglob('*.py')) if path.is_dir() else [path]
+        for f in files:
+            digest.update(str(f.relative_to(_PROJECT_ROOT)).encode())
+            try:
+                digest.update(f.read_bytes())
+            except OSError:
+                pass
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def _cpp_version(cpp_path: str) -> str:
+    try:
+        out = subprocess.run([cpp_path, '--version'], capture_output=True, text=True, timeout=10)
+        return out.stdout.splitlines()[0] if out.stdout else ''
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+@functools.lru_cache(maxsize=None)
+def tool_fingerprint(cpp_path: str = 'cpp') -> str:
+    """
+    Identify the toolchain that produced cached TAC.
+
+    Covers the cache layout version, the pycparser and cpp versions, and the
+    source of the TAC generator, so upgrading any of them misses the cache.
+    """
+    import pycparser
+    parts = [
+        f"cache-{CACHE_VERSION}",
+        f"pycparser-{pycparser.__version__}",
+        _cpp_version(cpp_path),
+        _hash_sources(_GENERATOR_SOURCES),
+    ]
+    return '\n'.join(parts)
+
+@functools.lru_cache(maxsize=None)
+def optimizer_fingerprint() -> str:
+    """Identify the optimizer sources, for keys of optimized TAC."""
+    return _hash_sources(_OPTIMIZER_SOURCES)
+
+def pipeline_variant(pipeline: Optional[Sequence[str]], max_iterations: int, target: Optional[str] = None) -> str:
+    """Name the cache variant holding TAC optimized by a given pipeline for a given target."""
+    if not pipeline:
+        return 'tac'
+    return f"opt:{','.join(pipeline)}:{max_iterations}:{target or ''}:{optimizer_fingerprint()[:16]}"
+
+class TACCache:
+    """
+    Content-addressed cache of TAC keyed by preprocessed source.
+
+    Entries live in ``<cache_dir>/<key[:2]>/<key>-<variant hash>.json``. Writes
+    go to a temporary file that is atomically renamed into place, so
+    concurrent readers never see partial entries and concurrent writers of
+    the same key simply race to store identical data. Reads refresh the
+    entry's mtime; when the cache grows past ``max_bytes`` the least recently
+    used entries are evicted under an exclusive lock on ``<cache_dir>/.lock``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._size_estimate: Optional[int] = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def source_key(self, preprocessed_text: str, cpp_args: Sequence[str], cpp_path: str = 'cpp') -> str:
+        """Hash preprocessed source, cpp arguments and tool versions into a cache key."""
+        digest = hashlib.sha256()
+        digest.update(tool_fingerprint(cpp_path).encode())
+        digest.update(b'\0')
+        digest.update('\0'.join(cpp_args).encode())
+        digest.update(b'\0')
+        digest.update(preprocessed_text.encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str, variant: str) -> str:
+        variant_hash = hashlib.sha256(variant.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, key[:2], f"{key}-{variant_hash}.json")
+
+    def get(self, key: str, variant: str = 'tac') -> Optional[CacheEntry]:
+        """
+        Look up cached TAC.
+
+        Returns:
+            The cached TAC instructions (or unit state), or None on a miss
+        """
+        path = self._path(key, variant)
+        try:
+            with open(path, 'r') as f:
+                tac = json.load(f)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            # Missing, evicted by another process mid-read, or corrupt
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return tac
+
+    def put(self, key: str, tac: CacheEntry, variant: str = 'tac') -> bool:
+        """
+        Store TAC under a key and variant.
+
+        Returns:
+            bool: True if the entry was written
+        """
+        path = self._path(key, variant)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    # dumps() uses the C encoder; dump() streams through the Python one
+                    f.write(json.dumps(tac, separators=(',', ':')))
+                size = os.path.getsize(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError as e:
+            print(f"Warning: could not write cache entry {path}: {e}")
+            return False
+
+        self.stats.stores += 1
+        if self._size_estimate is None:
+            self._size_estimate = self._scan_size()
+        else:
+            self._size_estimate += size
+        if self._size_estimate > self.max_bytes:
+            self.evict()
+        return True
+
+    def _entries(self):
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, target_ratio: float = 0.9) -> int:
+        """
+        Evict least recently used entries until the cache is below
+        ``target_ratio * max_bytes``.
+
+        Returns:
+            int: Number of entries removed
+        """
+        lock_path = os.path.join(self.cache_dir, '.lock')
+        with open(lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = sorted(self._entries(), key=lambda e: e[2])
+                total = sum(size for _, size, _ in entries)
+                limit = int(self.max_bytes * target_ratio)
+                removed = 0
+                for path, size, _ in entries:
+                    if total <= limit:
+                        break
+                    try:
+                        os.unlink(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass  # Already evicted by another process
+                    total -= size
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+        self._size_estimate = total
+        self.stats.evictions += removed
+        return removed
+
+    def clear(self) -> None:
+        """Remove every cache entry."""
+        for path, _, _ in list(self._entries()):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._size_estimate = 0
@@ -0,0 +1,594 @@
+# cfg.py - Basic blocks, control-flow graph, dominators and loops over TAC
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from tac_utils.ir import BRANCH_OPCODES, COND_JUMP, JUMP, LABEL, RETURN, Instruction, TACProgram
+
+def region_starts(program: TACProgram) -> Set[int]:
+    """
+    Return the positions where control cannot fall into from the previous
+    instruction: the program start and the start and end of every function
+    (anything after a function is top-level code).
+    """
+    starts = {0}
+    for _, start, end in program.functions:
+        starts.add(start)
+        starts.add(end)
+    return {s for s in starts if s < len(program.instructions)}
+
+def block_boundaries(program: TACProgram) -> List[int]:
+    """
+    Return the start index of every basic block, in order.
+
+    A block starts at the first instruction of the program, at the start and
+    end of every function, at every label, and after every jump, conditional
+    jump and return.
+    """
+    instructions = program.instructions
+    leaders = region_starts(program)
+    for idx, instr in enumerate(instructions):
+        opcode = instr.opcode
+        if opcode is LABEL:
+            leaders.add(idx)
+        elif opcode in BRANCH_OPCODES and idx + 1 < len(instructions):
+            leaders.add(idx + 1)
+    return sorted(leaders)
+
+def split_blocks(program: TACProgram) -> List[Tuple[int, int]]:
+    """Return the [start, end) instruction range of every basic block."""
+    starts = block_boundaries(program)
+    return list(zip(starts, starts[1:] + [len(program.instructions)]))
+
+class BasicBlock:
+    """
+    A maximal run of instructions entered only at the top and left only at
+    the bottom.
+
+    ``start`` and ``end`` delimit the block's instructions in the program;
+    ``preds`` and ``succs`` hold indices of neighbouring blocks.
+    """
+    __slots__ = ('index', 'start', 'end', 'label', 'preds', 'succs')
+
+    def __init__(self, index: int, start: int, end: int, label: Optional[str] = None):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.label = label
+        self.preds: List[int] = []
+        self.succs: List[int] = []
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return (f'BasicBlock({self.index}, [{self.start}, {self.end}), label={self.label!r}, '
+                f'preds={self.preds}, succs={self.succs})')
+
+class Loop:
+    """
+    A natural loop: the header and every block that reaches a back edge to
+    it without passing through the header.
+    """
+    __slots__ = ('header', 'latches', 'blocks', 'parent', 'children', 'depth')
+
+    def __init__(self, header: int):
+        self.header = header
+        self.latches: List[int] = []  # Sources of back edges to the header
+        self.blocks: Set[int] = {header}
+        self.parent: Optional['Loop'] = None
+        self.children: List['Loop'] = []
+        self.depth = 1
+
+    def exits(self, cfg: 'ControlFlowGraph') -> List[Tuple[int, int]]:
+        """Return the (inside, outside) edges that leave the loop."""
+        return [
+            (b, s) for b in sorted(self.blocks)
+            for s in cfg.blocks[b].succs if s not in self.blocks
+        ]
+
+    def __repr__(self) -> str:
+        return f'Loop(header={self.header}, blocks={sorted(self.blocks)}, depth={self.depth})'
+
+class ControlFlowGraph:
+    """
+    Control-flow graph of a TACProgram.
+
+    Blocks are numbered in program order. The program start and each
+    function recorded in ``program.functions`` (and any top-level code
+    after a function) has an entry block; fall-through never crosses from
+    one function into the next. Programs without recorded functions (e.g.
+    loaded from JSON) treat every block that nothing jumps or falls into as
+    an entry, since it may start a function, unless it leads into code of
+    an earlier entry (see _unranged_entries()). Dominators, the dominator
+    tree, dominance frontiers, natural loops and liveness are computed on
+    first use.
+    """
+
+    def __init__(self, program: TACProgram):
+        self.program = program
+        self.blocks: List[BasicBlock] = []
+        self.label_blocks: Dict[str, int] = {}
+        self.entries: List[int] = []
+
+        instructions = program.instructions
+        for index, (start, end) in enumerate(split_blocks(program)):
+            first = instructions[start]
+            name = first.label if first.opcode is LABEL else None
+            self.blocks.append(BasicBlock(index, start, end, name))
+            if name is not None:
+                self.label_blocks[name] = index
+
+        self._block_at = {block.start: block.index for block in self.blocks}
+        starts = region_starts(program)
+        self._add_edges(starts)
+        if program.functions:
+            self.entries = sorted(self._block_at[s] for s in starts)
+        else:
+            self.entries = self._unranged_entries()
+
+        self._idom: Optional[List[Optional[int]]] = None
+        self._order: Optional[List[int]] = None
+        self._dom_children: Optional[List[List[int]]] = None
+        self._frontiers: Optional[List[Set[int]]] = None
+        self._loops: Optional[List[Loop]] = None
+        self._liveness: Optional[Tuple[List[int], List[int]]] = None
+        self._block_uses: Optional[List[int]] = None
+        self._block_defs: Optional[List[int]] = None
+        self._entry_of: Optional[List[Optional[int]]] = None
+        self._shared: Optional[Set[int]] = None
+        self.global_names: List[int] = []
+        self.name_bits: Dict[int, int] = {}
+
+    def _add_edges(self, starts: Set[int]) -> None:
+        instructions = self.program.instructions
+        blocks = self.blocks
+
+        def link(src: BasicBlock, dst: int) -> None:
+            if dst not in src.succs:
+                src.succs.append(dst)
+                blocks[dst].preds.append(src.index)
+
+        for block in blocks:
+            last = instructions[block.end - 1]
+            opcode = last.opcode
+            if opcode is JUMP or opcode is COND_JUMP:
+                target = self.label_blocks.get(last.label)
+                if target is None:
+                    raise ValueError(f"Jump to undefined label L{last.label}")
+                # Fall-through is listed first for conditional jumps
+                if opcode is COND_JUMP:
+                    self._link_fallthrough(block, starts, link)
+                link(block, target)
+            elif opcode is not RETURN:
+                self._link_fallthrough(block, starts, link)
+
+    def _unranged_entries(self) -> List[int]:
+        """
+        Entry blocks of a program without recorded functions: the first
+        block and every block without predecessors, in program order.
+        Functions share no code, so a block without predecessors that leads
+        into code reachable from an earlier entry (such as the statements
+        after a ``break``) is dead code rather than a function, and is left
+        unreachable.
+        """
+        blocks = self.blocks
+        entries: List[int] = []
+        seen: Set[int] = set()
+        for block in blocks:
+            if block.index and block.preds:
+                continue
+            region = {block.index}
+            stack = [block.index]
+            joins = False
+            while stack:
+                for s in blocks[stack.pop()].succs:
+                    if s in seen:
+                        joins = True
+                    elif s not in region:
+                        region.add(s)
+                        stack.append(s)
+            if not joins:
+                entries.append(block.index)
+                seen |= region
+        return entries
+
+    def _link_fallthrough(self, block: BasicBlock, starts: Set[int], link) -> None:
+        nxt = block.index + 1
+        if nxt < len(self.blocks) and self.blocks[nxt].start not in starts:
+            link(block, nxt)
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __iter__(self) -> Iterator[BasicBlock]:
+        return iter(self.blocks)
+
+    def block_of(self, index: int) -> BasicBlock:
+        """Return the block containing instruction ``index``."""
+        lo, hi = 0, len(self.blocks) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.blocks[mid].start <= index:
+                lo = mid
+            else:
+                hi = mid - 1
+        return self.blocks[lo]
+
+    def instructions(self, block: int) -> List[Instruction]:
+        """Return the instructions of a block."""
+        b = self.blocks[block]
+        return self.program.instructions[b.start:b.end]
+
+    # Orders and reachability
+
+    def reverse_postorder(self) -> List[int]:
+        """Blocks reachable from the entries, in reverse postorder."""
+        if self._order is None:
+            seen: Set[int] = set()
+            postorder: List[int] = []
+            for entry in self.entries:
+                if entry in seen:
+                    continue
+                seen.add(entry)
+                # Iterative DFS: (block, next successor position)
+                stack = [(entry, 0)]
+                while stack:
+                    node, pos = stack[-1]
+                    succs = self.blocks[node].succs
+                    if pos < len(succs):
+                        stack[-1] = (node, pos + 1)
+                        nxt = succs[pos]
+                        if nxt not in seen:
+                            seen.add(nxt)
+                            stack.append((nxt, 0))
+                    else:
+                        stack.pop()
+                        postorder.append(node)
+            postorder.reverse()
+            self._order = postorder
+        return self._order
+
+    def reachable(self) -> Set[int]:
+        return set(self.reverse_postorder())
+
+    # Dominators
+
+    @property
+    def idom(self) -> List[Optional[int]]:
+        """
+        Immediate dominator of each block; None for entries and unreachable
+        blocks.
+
+        Uses the iterative algorithm of Cooper, Harvey and Kennedy over the
+        reverse postorder.
+        """
+        if self._idom is None:
+            order = self.reverse_postorder()
+            # A virtual root above all entries keeps the walk finite when
+            # several function entries are present
+            root = len(self.blocks)
+            rpo_number = {b: i for i, b in enumerate(order)}
+            rpo_number[root] = -1
+            idom: List[Optional[int]] = [None] * (len(self.blocks) + 1)
+            idom[root] = root
+            for entry in self.entries:
+                idom[entry] = root
+
+            def intersect(a: int, b: int) -> int:
+                while a != b:
+                    while rpo_number[a] > rpo_number[b]:
+                        a = idom[a]
+                    while rpo_number[b] > rpo_number[a]:
+                        b = idom[b]
+                return a
+
+            entries = set(self.entries)
+            changed = True
+            while changed:
+                changed = False
+                for b in order:
+                    if b in entries:
+                        continue
+                    new_idom = None
+                    for p in self.blocks[b].preds:
+                        if idom[p] is None:
+                            continue
+                        new_idom = p if new_idom is None else intersect(p, new_idom)
+                    if new_idom is not None and idom[b] != new_idom:
+                        idom[b] = new_idom
+                        changed = True
+
+            self._idom = [None if d == root else d for d in idom[:root]]
+        return self._idom
+
+    def dominates(self, a: int, b: int) -> bool:
+        """Return True if block a dominates block b (every block dominates itself)."""
+        idom = self.idom
+        while b is not None:
+            if a == b:
+                return True
+            b = idom[b]
+        return False
+
+    @property
+    def dom_children(self) -> List[List[int]]:
+        """Children of each block in the dominator tree."""
+        if self._dom_children is None:
+            children: List[List[int]] = [[] for _ in self.blocks]
+            for b in self.reverse_postorder():
+                parent = self.idom[b]
+                if parent is not None:
+                    children[parent].append(b)
+            self._dom_children = children
+        return self._dom_children
+
+    def dominator_tree_preorder(self) -> List[int]:
+        """Reachable blocks in dominator-tree preorder, entries first."""
+        order: List[int] = []
+        children = self.dom_children
+        stack = list(reversed(self.entries))
+        while stack:
+            b = stack.pop()
+            order.append(b)
+            stack.extend(reversed(children[b]))
+        return order
+
+    @property
+    def dominance_frontiers(self) -> List[Set[int]]:
+        """
+        Dominance frontier of each block (where its dominance ends).
+
+        Control also enters an entry block from outside the graph, so an
+        entry with any predecessor is a join point.
+        """
+        if self._frontiers is None:
+            idom = self.idom
+            reachable = self.reachable()
+            entries = set(self.entries)
+            frontiers: List[Set[int]] = [set() for _ in self.blocks]
+            for b in reachable:
+                preds = [p for p in self.blocks[b].preds if p in reachable]
+                if len(preds) + (b in entries) < 2:
+                    continue
+                for p in preds:
+                    runner = p
+                    while runner is not None and runner != idom[b]:
+                        frontiers[runner].add(b)
+                        runner = idom[runner]
+            self._frontiers = frontiers
+        return self._frontiers
+
+    # Loops
+
+    @property
+    def loops(self) -> List[Loop]:
+        """
+        Natural loops, outermost first.
+
+        Back edges are edges whose target dominates their source; loops
+        sharing a header are merged. Each loop knows its parent, children
+        and nesting depth.
+        """
+        if self._loops is None:
+            by_header: Dict[int, Loop] = {}
+            for b in self.reverse_postorder():
+                for s in self.blocks[b].succs:
+                    if self.dominates(s, b):
+                        loop = by_header.get(s)
+                        if loop is None:
+                            loop = by_header[s] = Loop(s)
+                        loop.latches.append(b)
+                        self._collect_loop_body(loop, b)
+
+            # Nest loops: the parent is the smallest other loop containing the header
+            loops = sorted(by_header.values(), key=lambda l: len(l.blocks))
+            for i, loop in enumerate(loops):
+                for outer in loops[i + 1:]:
+                    if loop.header in outer.blocks:
+                        loop.parent = outer
+                        outer.children.append(loop)
+                        break
+            for loop in loops:
+                depth, parent = 1, loop.parent
+                while parent is not None:
+                    depth, parent = depth + 1, parent.parent
+                loop.depth = depth
+            self._loops = sorted(loops, key=lambda l: (l.depth, self.blocks[l.header].start))
+        return self._loops
+
+    def _collect_loop_body(self, loop: Loop, latch: int) -> None:
+        stack = [latch]
+        while stack:
+            b = stack.pop()
+            if b in loop.blocks:
+                continue
+            loop.blocks.add(b)
+            stack.extend(self.blocks[b].preds)
+
+    def loop_depth(self) -> List[int]:
+        """Loop nesting depth of each block (0 outside loops)."""
+        depth = [0] * len(self.blocks)
+        for loop in self.loops:
+            for b in loop.blocks:
+                depth[b] = max(depth[b], loop.depth)
+        return depth
+
+    def postorder(self) -> List[int]:
+        """Every block, reachable ones in postorder first; good for backward analyses."""
+        order = self.reverse_postorder()[::-1]
+        seen = set(order)
+        return order + [b for b in range(len(self.blocks) - 1, -1, -1) if b not in seen]
+
+    # Variables
+
+    def number_names(self) -> Dict[int, int]:
+        """
+        Give a bit to every name that can be live across a block boundary.
+
+        Only names read in some block before being written there qualify;
+        they are listed in ``global_names`` and ``name_bits[name]`` is the
+        bit standing for ``name`` in the bitsets of liveness analyses.
+        Names without a bit are only ever live inside a single block.
+        """
+        if self._block_uses is None:
+            instructions = self.program.instructions
+            name_bits = self.name_bits
+            exposed_lists: List[List[int]] = []
+            defined_sets: List[Set[int]] = []
+            for block in self.blocks:
+                defined: Set[int] = set()
+                exposed: List[int] = []
+                for instr in instructions[block.start:block.end]:
+                    for arg in (instr.arg1, instr.arg2):
+                        if arg is not None and arg >= 0 and arg not in defined:
+                            exposed.append(arg)
+                            if arg not in name_bits:
+                                name_bits[arg] = len(self.global_names)
+                                self.global_names.append(arg)
+                    if instr.dest is not None:
+                        defined.add(instr.dest)
+                exposed_lists.append(exposed)
+                defined_sets.append(defined)
+
+            uses = [0] * len(self.blocks)
+            defs = [0] * len(self.blocks)
+            for b in range(len(self.blocks)):
+                bits = 0
+                for name in exposed_lists[b]:
+                    bits |= 1 << name_bits[name]
+                uses[b] = bits
+                bits = 0
+                for name in defined_sets[b]:
+                    bit = name_bits.get(name)
+                    if bit is not None:
+                        bits |= 1 << bit
+                defs[b] = bits
+            self._block_uses, self._block_defs = uses, defs
+        return self.name_bits
+
+    def entry_of(self) -> List[Optional[int]]:
+        """The entry block each block belongs to (via the dominator tree); None if unreachable."""
+        if self._entry_of is None:
+            entry_of: List[Optional[int]] = [None] * len(self.blocks)
+            children = self.dom_children
+            for entry in self.entries:
+                stack = [entry]
+                while stack:
+                    b = stack.pop()
+                    entry_of[b] = entry
+                    stack.extend(children[b])
+            self._entry_of = entry_of
+        return self._entry_of
+
+    def shared_names(self) -> Set[int]:
+        """
+        Variables that top-level code shares with a function, i.e. globals.
+
+        Without recorded functions every entry region counts as top-level,
+        so any variable used from two entries is shared. A variable declared
+        by top-level code (``program.globals``) is shared with any function
+        that uses it, even without an initializer. Variables listed in
+        ``program.shared`` (used by code outside the program) are always
+        shared. Optimizations must assume shared variables are read after
+        the function returns.
+        """
+        if self._shared is None:
+            instructions = self.program.instructions
+            function_starts = {start for _, start, _ in self.program.functions}
+            entry_of = self.entry_of()
+            region_of: Dict[int, int] = {}
+            shared: Set[int] = set()
+            declared = self.program.globals
+            top_level: Set[int] = set(declared)
+            for block in self.blocks:
+                entry = entry_of[block.index]
+                if entry is None:
+                    continue
+                in_function = self.blocks[entry].start in function_starts
+                for instr in instructions[block.start:block.end]:
+                    for name in (instr.dest, instr.arg1, instr.arg2):
+                        if name is None or name < 0:
+                            continue
+                        if region_of.setdefault(name, entry) != entry:
+                            shared.add(name)
+                        if not in_function:
+                            top_level.add(name)
+                        elif name in declared:
+                            shared.add(name)
+            self._shared = (shared & top_level) | self.program.shared
+        return self._shared
+
+    # Liveness
+
+    def liveness(self) -> Tuple[List[int], List[int]]:
+        """
+        Variables live at the entry and exit of every block, as bitsets over
+        the bits given by number_names().
+
+        Returns the pair (live_in, live_out), computed by iterating the
+        backward dataflow equations to a fixed point.
+        """
+        if self._liveness is None:
+            self.number_names()
+            uses, defs = self._block_uses, self._block_defs
+            live_in = uses[:]
+            live_out = [0] * len(self.blocks)
+            order = self.postorder()
+            changed = True
+            while changed:
+                changed = False
+                for b in order:
+                    out = 0
+                    for s in self.blocks[b].succs:
+                        out |= live_in[s]
+                    if out != live_out[b]:
+                        live_out[b] = out
+                        new_in = uses[b] | (out & ~defs[b])
+                        if new_in != live_in[b]:
+                            live_in[b] = new_in
+                            changed = True
+            self._liveness = (live_in, live_out)
+        return self._liveness
+
+    def names_in(self, bits: int) -> List[int]:
+        """Return the names whose bits are set in a liveness bitset."""
+        names = []
+        while bits:
+            low = bits & -bits
+            names.append(self.global_names[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+    def format(self) -> str:
+        """Return a readable summary of the blocks, edges, dominators and loops."""
+        idom = self.idom
+        lines = []
+        for block in self.blocks:
+            name = f" (L{block.label})" if block.label is not None else ""
+            lines.append(
+                f"B{block.index}{name}: instructions {block.start}-{block.end - 1}, "
+                f"preds {block.preds}, succs {block.succs}, idom {idom[block.index]}"
+            )
+        for loop in self.loops:
+            lines.append(f"Loop at B{loop.header}: blocks {sorted(loop.blocks)}, depth {loop.depth}")
+        return "\n".join(lines)
+
+def build_cfg(program: TACProgram) -> ControlFlowGraph:
+    """Build the control-flow graph of a program."""
+    return ControlFlowGraph(program)
+
+if __name__ == "__main__":
+    # Run as: python -m tac_utils.cfg [file.c]
+    import sys
+
+    from parser.parser import generate_ir, parse_c_file
+    from tac_utils.formatter import format_instruction
+
+    program = generate_ir(parse_c_file(sys.argv[1] if len(sys.argv) > 1 else 'input/sample.c'))
+    cfg = build_cfg(program)
+    for block in cfg:
+        print(f"B{block.index}:")
+        for i, d in enumerate(program.to_dicts()[block.start:block.end], start=block.start):
+            print(f"  {i}: {format_instruction(d)}")
+    print()
+    print(cfg.format())
@@ -28,39 +28,55 @@ def format_instruction(instruction):
     elif instruction['type'] == 'cond_jump':
         return f"if {instruction['condition']} goto L{instruction['target']}"
     
+    elif instruction['type'] == 'return':
+        if instruction.get('value') is None:
+            return "return"
+        return f"return {instruction['value']}"
+    
     else:
         return str(instruction)  # Default case for unknown instruction types
 
-def format_tac(instructions):
+# Header lines written before formatted TAC
+TAC_HEADER = ["Three-Address Code (TAC):", "-" * 30]
+
+def iter_format_tac(instructions):
     """
-    Format a list of TAC instructions into a readable string.
+    Lazily format TAC instructions, one line at a time.
     
     Args:
-        instructions (list): List of TAC instructions
+        instructions (iterable): TAC instructions
         
-    Returns:
-        str: A readable string representation of the TAC instructions
+    Yields:
+        str: The header lines, then one numbered line per instruction
     """
-    formatted = []
-    
     # Add a header
-    formatted.append("Three-Address Code (TAC):")
-    formatted.append("-" * 30)
+    yield from TAC_HEADER
     
     # Format each instruction with line numbers
     for i, instr in enumerate(instructions):
-        formatted.append(f"{i}: {format_instruction(instr)}")
+        yield f"{i}: {format_instruction(instr)}"
+
+def format_tac(instructions):
+    """
+    Format a list of TAC instructions into a readable string.
     
-    return "\n".join(formatted)
+    Args:
+        instructions (list): List of TAC instructions
+        
+    Returns:
+        str: A readable string representation of the TAC instructions
+    """
+    return "\n".join(iter_format_tac(instructions))
 
 def print_tac(instructions):
     """
     Print TAC instructions in a readable format.
     
     Args:
-        instructions (list): List of TAC instructions
+        instructions (iterable): TAC instructions
     """
-    print(format_tac(instructions))
+    for line in iter_format_tac(instructions):
+        print(line)
 
 if __name__ == "__main__":
     # Example TAC instructions for testing
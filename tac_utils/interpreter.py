@@ -0,0 +1,167 @@
+# interpreter.py - Run a TAC function and count the instructions it executes
+
+import operator
+from collections import Counter
+from typing import Callable, Dict, Mapping, Optional
+
+from tac_utils.ir import ASSIGN, BINOP, COND_JUMP, JUMP, LABEL, RETURN, UNARYOP, Number, TACProgram
+
+DEFAULT_STEP_LIMIT = 10_000_000
+
+def _divide(a: Number, b: Number) -> Number:
+    if not b:
+        raise ZeroDivisionError
+    if type(a) is float or type(b) is float:
+        return a / b
+    # C division truncates toward zero
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def _modulo(a: Number, b: Number) -> Number:
+    if type(a) is float or type(b) is float:
+        raise TypeError('% needs integer operands')
+    return a - b * _divide(a, b)
+
+BINARY_OPS: Dict[str, Callable[[Number, Number], Number]] = {
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': _divide, '%': _modulo,
+    '<<': operator.lshift, '>>': operator.rshift, '&': operator.and_, '|': operator.or_, '^': operator.xor,
+    '<': lambda a, b: int(a < b), '>': lambda a, b: int(a > b),
+    '<=': lambda a, b: int(a <= b), '>=': lambda a, b: int(a >= b),
+    '==': lambda a, b: int(a == b), '!=': lambda a, b: int(a != b),
+    '&&': lambda a, b: int(bool(a) and bool(b)), '||': lambda a, b: int(bool(a) or bool(b)),
+}
+UNARY_OPS: Dict[str, Callable[[Number], Number]] = {
+    '-': operator.neg, '+': operator.pos, '~': operator.invert, '!': lambda a: int(not a),
+}
+
+class Execution:
+    """
+    The outcome of running a function: its return value and what it executed.
+
+    ``counts`` has one entry per kind of executed instruction: the operator
+    of a binary operation, 'neg', '~', '!' or '+' for unary ones, and
+    'copy', 'jump', 'branch' and 'return' for the rest. Labels are not
+    counted.
+    """
+
+    def __init__(self, value: Optional[Number], counts: Counter, variables: Dict[int, Number]):
+        self.value = value
+        self.counts = counts
+        self.variables = variables
+
+    @property
+    def steps(self) -> int:
+        """Number of instructions executed."""
+        return sum(self.counts.values())
+
+    def cost(self, costs: Mapping[str, int], default: int = 1) -> int:
+        """Executed instructions weighted by cost per kind, e.g. a target profile's ``costs``."""
+        return sum(n * costs.get(kind, default) for kind, n in self.counts.items())
+
+def run(program: TACProgram, function: Optional[str] = None, arguments: Optional[Mapping[str, Number]] = None,
+        limit: int = DEFAULT_STEP_LIMIT) -> Execution:
+    """
+    Run one function of a program (or the whole program if it has no functions).
+
+    Integers follow C's truncating division and have no fixed width, so the
+    result only matches C when nothing overflows.
+
+    Args:
+        program: The program
+        function: Name of the function to run (default: the first one)
+        arguments: Initial values of the function's parameters (or of any other variable), by name
+        limit: Maximum number of instructions to execute
+
+    Returns:
+        Execution: The return value and executed-instruction counts
+
+    Raises:
+        KeyError: If there is no function of that name
+        ValueError: If the function reads a variable that was never set,
+            divides by zero, jumps to a missing label or exceeds the limit
+    """
+    symbols = program.symbols
+    instructions = program.instructions
+    if program.functions:
+        if function is None:
+            _, start, end = program.functions[0]
+        else:
+            ranges = {name: (start, end) for name, start, end in program.functions}
+            if function not in ranges:
+                raise KeyError(f"No function named '{function}'")
+            start, end = ranges[function]
+    else:
+        start, end = 0, len(instructions)
+
+    labels = {instructions[pos].label: pos for pos in range(start, end) if instructions[pos].opcode is LABEL}
+    variables: Dict[int, Number] = {symbols.variable(name): value for name, value in (arguments or {}).items()}
+    counts: Counter = Counter()
+    constant = symbols.value
+
+    def read(operand: int, pos: int) -> Number:
+        if operand < 0:
+            return constant(operand)
+        if operand not in variables:
+            raise ValueError(f"Instruction {pos} reads {symbols.text(operand)}, which was never set")
+        return variables[operand]
+
+    def goto(target: str, pos: int) -> int:
+        if target not in labels:
+            raise ValueError(f"Instruction {pos} jumps to missing label L{target}")
+        return labels[target]
+
+    pc = start
+    executed = 0
+    while pc < end:
+        instr = instructions[pc]
+        opcode = instr.opcode
+        if opcode is LABEL:
+            pc += 1
+            continue
+        executed += 1
+        if executed > limit:
+            raise ValueError(f"Gave up after {limit} instructions")
+        if opcode is BINOP:
+            counts[instr.op] += 1
+            try:
+                variables[instr.dest] = BINARY_OPS[instr.op](read(instr.arg1, pc), read(instr.arg2, pc))
+            except ZeroDivisionError:
+                raise ValueError(f"Instruction {pc} divides by zero") from None
+        elif opcode is ASSIGN:
+            counts['copy'] += 1
+            variables[instr.dest] = read(instr.arg1, pc)
+        elif opcode is UNARYOP:
+            counts['neg' if instr.op == '-' else instr.op] += 1
+            variables[instr.dest] = UNARY_OPS[instr.op](read(instr.arg1, pc))
+        elif opcode is COND_JUMP:
+            counts['branch'] += 1
+            if read(instr.arg1, pc):
+                pc = goto(instr.label, pc)
+                continue
+        elif opcode is JUMP:
+            counts['jump'] += 1
+            pc = goto(instr.label, pc)
+            continue
+        elif opcode is RETURN:
+            counts['return'] += 1
+            value = read(instr.arg1, pc) if instr.arg1 is not None else None
+            return Execution(value, counts, variables)
+        pc += 1
+    return Execution(None, counts, variables)
+
+if __name__ == "__main__":
+    # Run as: python -m tac_utils.interpreter [file.c] [function] [name=value ...]
+    import sys
+
+    from parser.parser import generate_ir, parse_c_file
+
+    program = generate_ir(parse_c_file(sys.argv[1] if len(sys.argv) > 1 else 'input/sample.c'))
+    function = sys.argv[2] if len(sys.argv) > 2 else None
+    arguments = {}
+    for assignment in sys.argv[3:]:
+        name, _, value = assignment.partition('=')
+        arguments[name] = float(value) if '.' in value else int(value)
+    execution = run(program, function, arguments)
+    print(f"Returned {execution.value} after {execution.steps} instructions")
+    for kind, n in execution.counts.most_common():
+        print(f"  {kind:8} {n}")
@@ -4,14 +4,135 @@ import json
 import os
 from pathlib import Path
 
-def save_tac_to_file(instructions, output_file):
+# Size of write buffers and read chunks used when streaming TAC
+BUFFER_SIZE = 1 << 16
+
+# Raw TAC formats, chosen by file extension
+JSON_SUFFIX = '.json'    # A single JSON array (the original format)
+JSONL_SUFFIX = '.jsonl'  # One JSON object per line
+BINARY_SUFFIX = '.tacb'  # Memory-mappable binary records (see tac_utils.binary)
+RAW_SUFFIXES = (JSON_SUFFIX, JSONL_SUFFIX, BINARY_SUFFIX)
+
+def raw_tac_path(output_file, raw_format=JSON_SUFFIX):
+    """
+    Return the path of the raw TAC file written next to a text output.
+
+    Args:
+        output_file (str): Path to the text output file
+        raw_format (str): Raw format suffix, '.json', '.jsonl' or '.tacb'
+
+    Returns:
+        Path: The raw TAC path
+    """
+    if not raw_format.startswith('.'):
+        raw_format = '.' + raw_format
+    return Path(output_file).with_suffix(raw_format)
+
+def is_binary_tac_path(path):
+    """Return True if a path names a binary TAC file, by extension or content."""
+    if Path(path).suffix == BINARY_SUFFIX:
+        return True
+    from tac_utils.binary import is_binary_tac
+    return is_binary_tac(path)
+
+class _JSONArrayWriter:
+    """Writes instructions as a JSON array laid out like json.dump(indent=2)."""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, instruction):
+        text = json.dumps(instruction, indent=2).replace('\n', '\n  ')
+        self.f.write(('[\n  ' if self.count == 0 else ',\n  ') + text)
+        self.count += 1
+
+    def close(self):
+        self.f.write('[]' if self.count == 0 else '\n]')
+        self.f.close()
+
+class _JSONLinesWriter:
+    """Writes one compact JSON object per line."""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+        self._dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+    def write(self, instruction):
+        self.f.write(self._dumps(instruction))
+        self.f.write('\n')
+        self.count += 1
+
+    def close(self):
+        self.f.close()
+
+def _open_raw_writer(path, functions=None):
+    """
+    Open a writer for the raw format matching path's extension.
+
+    ``functions`` are (name, start, end) ranges for the binary format's
+    function table; the text formats have no place for them.
+    """
+    suffix = Path(path).suffix
+    if suffix == BINARY_SUFFIX:
+        from tac_utils.binary import BinaryTACWriter
+        writer = BinaryTACWriter(str(path))
+        for name, start, end in functions or ():
+            writer.add_function(name, start, end)
+        return writer
+    f = open(path, 'w', buffering=BUFFER_SIZE)
+    if suffix == JSONL_SUFFIX:
+        return _JSONLinesWriter(f)
+    return _JSONArrayWriter(f)
+
+def write_tac(instructions, output_file):
+    """
+    Stream TAC instructions to a raw TAC file.
+
+    The format is chosen by extension: '.jsonl' writes one instruction per
+    line, '.tacb' writes the binary format, anything else writes a JSON
+    array. Instructions are consumed one at a time, so any iterable (e.g.
+    TACProgram.iter_dicts()) can be saved without materializing a list.
+
+    Args:
+        instructions (iterable): TAC instructions as dicts, or a TACProgram
+        output_file (str): Path to the output file
+
+    Returns:
+        int: Number of instructions written
+    """
+    from tac_utils.ir import TACProgram
+    if isinstance(instructions, TACProgram):
+        if Path(output_file).suffix == BINARY_SUFFIX:
+            # Written straight from the IR, keeping function ranges
+            from tac_utils.binary import write_binary_tac
+            return write_binary_tac(instructions, output_file)
+        instructions = instructions.iter_dicts()
+
+    writer = _open_raw_writer(output_file)
+    try:
+        for instr in instructions:
+            writer.write(instr)
+    finally:
+        writer.close()
+    return writer.count
+
+def save_tac_to_file(instructions, output_file, raw_format=JSON_SUFFIX, functions=None):
     """
     Save TAC instructions to a file.
-    
+
+    Writes the formatted text to output_file and the raw instructions next
+    to it, in a single pass over the instructions.
+
     Args:
-        instructions (list): List of TAC instructions
+        instructions (iterable): TAC instructions as dicts, or a TACProgram
         output_file (str): Path to the output file
-        
+        raw_format (str): Raw format suffix, '.json', '.jsonl' or '.tacb'
+        functions (list): (name, start, end) range of every function, stored
+            in the function table of a binary raw file (default: the
+            program's own, for a TACProgram)
+
     Returns:
         bool: True if successful, False otherwise
     """
@@ -20,32 +141,128 @@ def save_tac_to_file(instructions, output_file):
         output_dir = os.path.dirname(output_file)
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
-        
+
         # Import the formatter properly using relative import
-        from tac_utils.formatter import format_tac
-        formatted_tac = format_tac(instructions)
-        
-        # Write formatted TAC to text file
-        with open(output_file, 'w') as f:
-            f.write(formatted_tac)
-        
-        # Save raw instructions in JSON format for potential machine processing
-        json_file = Path(output_file).with_suffix('.json')
-        with open(json_file, 'w') as f:
-            json.dump(instructions, f, indent=2)
-            
+        from tac_utils.formatter import TAC_HEADER, format_instruction
+
+        # Write formatted TAC to a text file and raw instructions alongside it
+        # for potential machine processing
+        from tac_utils.ir import TACProgram
+        if isinstance(instructions, TACProgram):
+            functions = instructions.functions if functions is None else functions
+            instructions = instructions.iter_dicts()
+
+        raw_file = raw_tac_path(output_file, raw_format)
+        with open(output_file, 'w', buffering=BUFFER_SIZE) as text_f:
+            text_f.write("\n".join(TAC_HEADER))
+            writer = _open_raw_writer(raw_file, functions)
+            try:
+                for i, instr in enumerate(instructions):
+                    text_f.write(f"\n{i}: {format_instruction(instr)}")
+                    writer.write(instr)
+            finally:
+                writer.close()
+
         return True
     except Exception as e:
         print(f"Error saving TAC to file: {e}")
         return False
 
+def _iter_json_array(f, chunk_size=BUFFER_SIZE):
+    """Incrementally decode the objects of a top-level JSON array of objects."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    started = False
+
+    while True:
+        # Skip whitespace and separators, refilling the buffer as needed
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            buf, pos = f.read(chunk_size), 0
+            eof = not buf
+            continue
+
+        if not started:
+            if buf[pos] != '[':
+                raise ValueError("Expected a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == ']':
+            return
+
+        try:
+            obj, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ValueError(str(e)) from None
+            # The object continues in the next chunk
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        yield obj
+
+def iter_tac_from_file(input_file):
+    """
+    Lazily yield TAC instructions from a raw TAC file.
+
+    The line-delimited format, the original JSON array format and the
+    binary format are understood; which one is detected from the file.
+    Only a small buffer (or, for binary files, a memory map) is held at
+    any time.
+
+    Args:
+        input_file (str): Path to a .jsonl, .json or .tacb file
+
+    Yields:
+        dict: TAC instructions
+
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If the file is not valid TAC JSON or binary TAC
+    """
+    if is_binary_tac_path(input_file):
+        from tac_utils.binary import BinaryTAC
+        with BinaryTAC(input_file) as tac:
+            yield from tac
+        return
+
+    with open(input_file, 'r', buffering=BUFFER_SIZE) as f:
+        # Sniff the first non-whitespace character
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if not first:
+            return
+
+        if first == '[':
+            f.seek(0)
+            yield from _iter_json_array(f)
+            return
+
+        line = first + f.readline()
+        lineno = 1
+        while line:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON on line {lineno}: {e}") from None
+            line = f.readline()
+            lineno += 1
+
 def load_tac_from_file(input_file):
     """
-    Load TAC instructions from a JSON file.
-    
+    Load TAC instructions from a JSON, JSONL or binary TAC file.
+
     Args:
-        input_file (str): Path to the input file (should be a .json file)
-        
+        input_file (str): Path to the input file (a .json, .jsonl or .tacb file)
+
     Returns:
         list: List of TAC instructions, or empty list if loading fails
     """
@@ -54,19 +271,38 @@ def load_tac_from_file(input_file):
         if not os.path.exists(input_file):
             print(f"Error: File {input_file} not found.")
             return []
-        
-        # Load instructions from JSON file
-        with open(input_file, 'r') as f:
-            instructions = json.load(f)
-            
-        return instructions
-    except json.JSONDecodeError:
-        print(f"Error: File {input_file} is not valid JSON.")
+
+        # Load instructions from the file
+        return list(iter_tac_from_file(input_file))
+    except ValueError as e:
+        print(f"Error: File {input_file} is not valid TAC: {e}")
         return []
     except Exception as e:
         print(f"Error loading TAC from file: {e}")
         return []
 
+def convert_tac_file(source, destination):
+    """
+    Convert a raw TAC file between formats, chosen by extension.
+
+    Binary sources are read through a memory map and binary-to-binary
+    conversion keeps function ranges.
+
+    Args:
+        source (str): Input .json, .jsonl or .tacb file
+        destination (str): Output .json, .jsonl or .tacb file
+
+    Returns:
+        int: Number of instructions converted
+    """
+    if is_binary_tac_path(source):
+        from tac_utils.binary import BinaryTAC
+        with BinaryTAC(source) as tac:
+            if Path(destination).suffix == BINARY_SUFFIX:
+                return write_tac(tac.to_program(), destination)
+            return write_tac(tac, destination)
+    return write_tac(iter_tac_from_file(source), destination)
+
 if __name__ == "__main__":
     # Example TAC instructions for testing
     example_tac = [
@@ -75,10 +311,10 @@ if __name__ == "__main__":
         {'type': 'binop', 'lhs': 't0', 'op': '+', 'arg1': 'a', 'arg2': 'b'},
         {'type': 'assign', 'lhs': 'c', 'rhs': 't0'},
     ]
-    
+
     # Save the example to a file
     test_output = "../output/test_tac.txt"
     save_tac_to_file(example_tac, test_output)
-    
+
     print(f"Example TAC saved to {test_output}")
-    print(f"Raw TAC saved to {Path(test_output).with_suffix('.json')}")
\ No newline at end of file
+    print(f"Raw TAC saved to {raw_tac_path(test_output)}")
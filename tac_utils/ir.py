@@ -0,0 +1,520 @@
+# ir.py - Compact, interned in-memory representation of TAC
+
+import functools
+import re
+from enum import IntEnum
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+
+class Opcode(IntEnum):
+    """Kinds of TAC instructions."""
+    ASSIGN = 0
+    BINOP = 1
+    UNARYOP = 2
+    LABEL = 3
+    JUMP = 4
+    COND_JUMP = 5
+    RETURN = 6
+
+
+# Module-level aliases: looking these up is much cheaper than Opcode.X in hot loops
+ASSIGN = Opcode.ASSIGN
+BINOP = Opcode.BINOP
+UNARYOP = Opcode.UNARYOP
+LABEL = Opcode.LABEL
+JUMP = Opcode.JUMP
+COND_JUMP = Opcode.COND_JUMP
+RETURN = Opcode.RETURN
+
+# Names used for each opcode in the dict form of TAC (the 'type' key)
+OPCODE_NAMES = {
+    ASSIGN: 'assign',
+    BINOP: 'binop',
+    UNARYOP: 'unaryop',
+    LABEL: 'label',
+    JUMP: 'jump',
+    COND_JUMP: 'cond_jump',
+    RETURN: 'return',
+}
+
+# Opcodes that end a basic block
+BRANCH_OPCODES = frozenset((JUMP, COND_JUMP, RETURN))
+OPCODES_BY_NAME = {name: opcode for opcode, name in OPCODE_NAMES.items()}
+
+# Dict styles understood by TACProgram.from_dicts / to_dicts:
+#   'typed'  - the parser's form, e.g. {'type': 'assign', 'lhs': 'a', 'rhs': '5'}
+#   'legacy' - the optimizer's original form, e.g. {'lhs': 'a', 'op': '=', 'arg1': '5'}
+TYPED = 'typed'
+LEGACY = 'legacy'
+
+
+def is_constant(operand: int) -> bool:
+    """Return True if an interned operand refers to the constant pool."""
+    return operand < 0
+
+
+Number = Union[int, float]
+
+# Temporaries are named t0, t1, ... by the TAC generator
+TEMP_PATTERN = re.compile(r't\d+$')
+
+_INT_LITERAL = re.compile(r'([+-]?)(0[xX][0-9a-fA-F]+|0[bB][01]+|0[0-7]*|[1-9][0-9]*)(?:[uU](?:ll|LL|[lL])?|(?:ll|LL|[lL])[uU]?)?$')
+_FLOAT_LITERAL = re.compile(r'([+-]?(?:(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+))[fFlL]?$')
+_HEX_FLOAT_LITERAL = re.compile(r'([+-]?0[xX](?:[0-9a-fA-F]+\.?[0-9a-fA-F]*|\.[0-9a-fA-F]+)[pP][+-]?\d+)[fFlL]?$')
+_CHAR_LITERAL = re.compile(r"(?:u8|[LuU])?'(.+)'$", re.DOTALL)
+_QUOTED_LITERAL = re.compile(r'(?:u8|[LuU])?["\']')
+_SIMPLE_ESCAPES = {
+    'n': 10, 't': 9, 'r': 13, '0': 0, 'a': 7, 'b': 8, 'f': 12, 'v': 11,
+    '\\': 92, "'": 39, '"': 34, '?': 63,
+}
+
+
+def _char_value(body: str) -> Optional[int]:
+    if not body.startswith('\\'):
+        return ord(body) if len(body) == 1 else None
+    escape = body[1:]
+    if escape in _SIMPLE_ESCAPES:
+        return _SIMPLE_ESCAPES[escape]
+    try:
+        if escape[:1] in 'xX':
+            return int(escape[1:], 16)
+        return int(escape, 8)
+    except ValueError:
+        return None
+
+
+def parse_literal(text: str) -> Optional[Number]:
+    """
+    Parse the text of a C numeric or character literal.
+
+    Handles decimal, hex, octal and binary integers with u/l suffixes,
+    decimal and hex floats with f/l suffixes, and character constants
+    (which have type int in C). Returns None for anything else, including
+    string literals and names.
+    """
+    match = _INT_LITERAL.match(text)
+    if match:
+        sign, digits = match.group(1), match.group(2)
+        if len(digits) > 1 and digits[0] == '0' and digits[1] not in 'xXbB':
+            value = int(digits, 8)
+        else:
+            value = int(digits, 0)
+        return -value if sign == '-' else value
+    match = _FLOAT_LITERAL.match(text)
+    if match:
+        return float(match.group(1))
+    match = _HEX_FLOAT_LITERAL.match(text)
+    if match:
+        return float.fromhex(match.group(1))
+    match = _CHAR_LITERAL.match(text)
+    if match:
+        return _char_value(match.group(1))
+    return None
+
+
+class SymbolTable:
+    """
+    Interns operand strings as small integers.
+
+    Variables and temporaries get non-negative IDs that index ``names``;
+    the IDs of temporaries are also in ``temps``. Constants live in a
+    separate pool and are encoded as negative IDs (``~index``), so telling a
+    constant from a variable is a sign check. The parsed value of each
+    constant (an int or float, or None for e.g. string literals) is kept in
+    ``values`` alongside its source text, so passes never re-parse text.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.constants: List[str] = []
+        self.values: List[Optional[Number]] = []
+        self.temps: Set[int] = set()
+        self._name_ids: Dict[str, int] = {}
+        self._constant_ids: Dict[str, int] = {}
+        self._next_temp: Optional[int] = None
+
+    def variable(self, name: str) -> int:
+        """Intern a variable or temporary name and return its ID."""
+        var_id = self._name_ids.get(name)
+        if var_id is None:
+            var_id = len(self.names)
+            self.names.append(name)
+            self._name_ids[name] = var_id
+        return var_id
+
+    def temp(self, name: str) -> int:
+        """Intern the name of a compiler-generated temporary and return its ID."""
+        var_id = self.variable(name)
+        self.temps.add(var_id)
+        return var_id
+
+    def new_temp(self) -> int:
+        """Intern a temporary named like the generator's t0, t1, ... that is not in use yet."""
+        if self._next_temp is None:
+            self._next_temp = 1 + max(
+                (int(name[1:]) for name in self.names if TEMP_PATTERN.match(name)), default=-1)
+        while f"t{self._next_temp}" in self._name_ids:
+            self._next_temp += 1
+        var_id = self.temp(f"t{self._next_temp}")
+        self._next_temp += 1
+        return var_id
+
+    def constant(self, text: str, value: Optional[Number] = None) -> int:
+        """
+        Intern a constant literal and return its (negative) ID.
+
+        ``value`` is the literal's numeric value; when omitted it is parsed
+        from ``text`` the first time the literal is seen.
+        """
+        const_id = self._constant_ids.get(text)
+        if const_id is None:
+            const_id = ~len(self.constants)
+            self.constants.append(text)
+            self.values.append(parse_literal(text) if value is None else value)
+            self._constant_ids[text] = const_id
+        return const_id
+
+    def intern(self, text: str) -> int:
+        """
+        Intern an operand string, deciding whether it is a constant, a
+        temporary or a variable.
+
+        Classification happens once per distinct string; later lookups are
+        a single dict hit.
+        """
+        operand = self._name_ids.get(text)
+        if operand is not None:
+            return operand
+        operand = self._constant_ids.get(text)
+        if operand is not None:
+            return operand
+        value = parse_literal(text)
+        if value is not None or _QUOTED_LITERAL.match(text):
+            return self.constant(text, value)
+        if TEMP_PATTERN.match(text):
+            return self.temp(text)
+        return self.variable(text)
+
+    def text(self, operand: int) -> str:
+        """Return the source text of an interned operand."""
+        if operand < 0:
+            return self.constants[~operand]
+        return self.names[operand]
+
+    def value(self, operand: int) -> Optional[Number]:
+        """Return the numeric value of a constant operand, or None."""
+        if operand < 0:
+            return self.values[~operand]
+        return None
+
+    def int_value(self, operand: int) -> Optional[int]:
+        """Return the value of an integer constant operand, or None."""
+        if operand < 0:
+            value = self.values[~operand]
+            if type(value) is int:
+                return value
+        return None
+
+    def is_temp(self, operand: int) -> bool:
+        """Return True if an operand is a compiler-generated temporary."""
+        return operand in self.temps
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class Instruction:
+    """
+    A single TAC instruction.
+
+    Operand fields (``dest``, ``arg1``, ``arg2``) hold IDs from the owning
+    program's SymbolTable. ``op`` is the operator for binary/unary
+    operations and ``label`` the label name for labels and jumps. Fields an
+    opcode does not use are None. A RETURN keeps its (optional) value in
+    ``arg1``, like the condition of a COND_JUMP.
+
+    Instructions are treated as immutable once they are part of a program;
+    passes build new instructions rather than editing shared ones.
+    """
+    __slots__ = ('opcode', 'dest', 'op', 'arg1', 'arg2', 'label')
+
+    def __init__(self, opcode: Opcode, dest: Optional[int] = None, op: Optional[str] = None,
+                 arg1: Optional[int] = None, arg2: Optional[int] = None, label: Optional[str] = None):
+        self.opcode = opcode
+        self.dest = dest
+        self.op = op
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.label = label
+
+    def key(self) -> Tuple:
+        return (self.opcode, self.dest, self.op, self.arg1, self.arg2, self.label)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Instruction):
+            return NotImplemented
+        return self.key() == other.key()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        fields = ', '.join(
+            f'{name}={getattr(self, name)!r}'
+            for name in self.__slots__[1:] if getattr(self, name) is not None
+        )
+        return f'Instruction({self.opcode.name}, {fields})'
+
+
+def assign(dest: int, src: int) -> Instruction:
+    return Instruction(ASSIGN, dest, None, src)
+
+
+def binop(dest: int, op: str, arg1: int, arg2: int) -> Instruction:
+    return Instruction(BINOP, dest, op, arg1, arg2)
+
+
+def unaryop(dest: int, op: str, arg: int) -> Instruction:
+    return Instruction(UNARYOP, dest, op, arg)
+
+
+def label(name: str) -> Instruction:
+    return Instruction(LABEL, label=name)
+
+
+def jump(target: str) -> Instruction:
+    return Instruction(JUMP, label=target)
+
+
+def cond_jump(condition: int, target: str) -> Instruction:
+    return Instruction(COND_JUMP, arg1=condition, label=target)
+
+
+def return_(value: Optional[int] = None) -> Instruction:
+    return Instruction(RETURN, arg1=value)
+
+
+class TACProgram:
+    """
+    A sequence of Instructions together with the SymbolTable they refer to.
+
+    Programs derived from one another by optimizer passes share the same
+    SymbolTable, so operand IDs stay comparable across passes.
+
+    ``functions`` lists the (name, start, end) instruction range of each
+    function, as recorded by the TAC generator. derive() carries the ranges
+    over when the instruction count is unchanged (passes that rewrite
+    instructions one for one); passes that add or remove instructions pass
+    remapped ranges explicitly.
+
+    ``shared`` holds variables that code outside this program also uses,
+    e.g. the globals of a function optimized apart from the rest of its
+    file (see tac_utils.module). Passes treat them like globals shared
+    within the program. derive() always carries it over.
+
+    ``types`` maps variables to the arithmetic type they were declared
+    with ('int', 'unsigned long', 'double', ... see tac_utils.c_types), or
+    to None when one name was declared with different types. derive()
+    always carries it over; the dict form of TAC does not keep it.
+
+    ``globals`` holds the variables declared by top-level code. A function
+    that uses one shares it with the rest of the file even when no
+    top-level instruction mentions it (``int g;``). derive() always carries
+    it over.
+    """
+
+    def __init__(self, instructions: Optional[List[Instruction]] = None,
+                 symbols: Optional[SymbolTable] = None, style: str = TYPED):
+        self.instructions: List[Instruction] = instructions if instructions is not None else []
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.style = style
+        self.functions: List[Tuple[str, int, int]] = []
+        self.shared: Set[int] = set()
+        self.types: Dict[int, Optional[str]] = {}
+        self.globals: Set[int] = set()
+
+    def derive(self, instructions: List[Instruction],
+               functions: Optional[List[Tuple[str, int, int]]] = None) -> 'TACProgram':
+        """Return a new program over the same symbols with different instructions."""
+        program = TACProgram(instructions, self.symbols, self.style)
+        program.shared = self.shared
+        program.types = self.types
+        program.globals = self.globals
+        if functions is not None:
+            program.functions = functions
+        elif len(instructions) == len(self.instructions):
+            program.functions = self.functions
+        return program
+
+    def append(self, instruction: Instruction) -> None:
+        self.instructions.append(instruction)
+
+    def declare(self, variable: int, c_type: Optional[str]) -> None:
+        """Record the declared type of a variable; a name declared with two different types gets None."""
+        if self.types.setdefault(variable, c_type) != c_type:
+            self.types[variable] = None
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def __iter__(self) -> Iterator[Instruction]:
+        return iter(self.instructions)
+
+    def __getitem__(self, index):
+        return self.instructions[index]
+
+    # Conversion to and from the dict form
+
+    @classmethod
+    def from_dicts(cls, dicts: Iterable[Dict[str, str]],
+                   symbols: Optional[SymbolTable] = None) -> 'TACProgram':
+        """
+        Build a program from TAC dicts in either the typed or legacy style.
+
+        Args:
+            dicts: TAC instructions as produced by the parser or loaded from JSON
+            symbols: Optional SymbolTable to intern into
+
+        Returns:
+            TACProgram: The interned program, remembering the input style
+        """
+        program = cls(symbols=symbols)
+        style = None
+        for d in dicts:
+            if style is None:
+                style = TYPED if 'type' in d else LEGACY
+            program.instructions.append(program.instruction_from_dict(d))
+        program.style = style or TYPED
+        return program
+
+    def instruction_from_dict(self, d: Dict[str, str]) -> Instruction:
+        """Convert a single TAC dict into an Instruction."""
+        intern = self.symbols.intern
+        kind = d.get('type')
+
+        if kind is None:
+            # Legacy optimizer style: {'lhs', 'op', 'arg1'[, 'arg2']}
+            if 'arg2' in d:
+                return Instruction(BINOP, intern(d['lhs']), d['op'], intern(d['arg1']), intern(d['arg2']))
+            if d.get('op') == '=':
+                return Instruction(ASSIGN, intern(d['lhs']), None, intern(d['arg1']))
+            if 'op' in d and 'arg1' in d:
+                return Instruction(UNARYOP, intern(d['lhs']), d['op'], intern(d['arg1']))
+            raise ValueError(f'Unsupported TAC instruction: {d!r}')
+
+        opcode = OPCODES_BY_NAME.get(kind)
+        if opcode is ASSIGN:
+            return Instruction(opcode, intern(d['lhs']), None, intern(d['rhs']))
+        if opcode is BINOP:
+            return Instruction(opcode, intern(d['lhs']), d['op'], intern(d['arg1']), intern(d['arg2']))
+        if opcode is UNARYOP:
+            return Instruction(opcode, intern(d['lhs']), d['op'], intern(d['arg']))
+        if opcode is LABEL:
+            return Instruction(opcode, label=d['label'])
+        if opcode is JUMP:
+            return Instruction(opcode, label=d['target'])
+        if opcode is COND_JUMP:
+            return Instruction(opcode, arg1=intern(d['condition']), label=d['target'])
+        if opcode is RETURN:
+            value = d.get('value')
+            return Instruction(opcode, arg1=None if value is None else intern(value))
+        raise ValueError(f'Unsupported TAC instruction: {d!r}')
+
+    def to_dicts(self, style: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Convert the program back into TAC dicts.
+
+        Args:
+            style: 'typed' or 'legacy'; defaults to the style the program was built from
+
+        Returns:
+            list: TAC instructions as dicts
+        """
+        return list(self.iter_dicts(style))
+
+    def iter_dicts(self, style: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        """Lazily convert the program into TAC dicts, one instruction at a time."""
+        style = style or self.style
+        to_dict = self.instruction_to_dict
+        for instr in self.instructions:
+            yield to_dict(instr, style)
+
+    def instruction_to_dict(self, instr: Instruction, style: str = TYPED) -> Dict[str, str]:
+        """Convert a single Instruction into its dict form."""
+        text = self.symbols.text
+        opcode = instr.opcode
+
+        if style == LEGACY:
+            if opcode is ASSIGN:
+                return {'lhs': text(instr.dest), 'op': '=', 'arg1': text(instr.arg1)}
+            if opcode is BINOP:
+                return {'lhs': text(instr.dest), 'op': instr.op, 'arg1': text(instr.arg1), 'arg2': text(instr.arg2)}
+            if opcode is UNARYOP:
+                return {'lhs': text(instr.dest), 'op': instr.op, 'arg1': text(instr.arg1)}
+
+        # Key order mirrors what TACGenerator emits so JSON output is unchanged
+        if opcode is ASSIGN:
+            return {'type': 'assign', 'lhs': text(instr.dest), 'rhs': text(instr.arg1)}
+        if opcode is BINOP:
+            return {'type': 'binop', 'lhs': text(instr.dest), 'op': instr.op,
+                    'arg1': text(instr.arg1), 'arg2': text(instr.arg2)}
+        if opcode is UNARYOP:
+            return {'type': 'unaryop', 'lhs': text(instr.dest), 'op': instr.op, 'arg': text(instr.arg1)}
+        if opcode is LABEL:
+            return {'type': 'label', 'label': instr.label}
+        if opcode is JUMP:
+            return {'type': 'jump', 'target': instr.label}
+        if opcode is COND_JUMP:
+            return {'type': 'cond_jump', 'condition': text(instr.arg1), 'target': instr.label}
+        if opcode is RETURN:
+            if instr.arg1 is None:
+                return {'type': 'return'}
+            return {'type': 'return', 'value': text(instr.arg1)}
+        raise ValueError(f'Unsupported opcode: {opcode!r}')
+
+
+TAC = Union[TACProgram, List[Dict[str, str]]]
+
+# When set, called as observer(optimize, opt_pass, program, args, kwargs) in
+# place of every optimize() call on a TACProgram (see optimizer.metrics)
+_pass_observer: Optional[Callable] = None
+
+
+def set_pass_observer(observer: Optional[Callable]) -> None:
+    """Install (or, with None, remove) the function wrapped around every pass."""
+    global _pass_observer
+    _pass_observer = observer
+
+
+def ir_pass(optimize):
+    """
+    Decorator for optimizer ``optimize`` methods that work on TACProgram.
+
+    The wrapped method may also be called with a list of TAC dicts, in which
+    case the dicts are interned, optimized and converted back to the style
+    they came in.
+    """
+    @functools.wraps(optimize)
+    def wrapper(self, tac_instructions: TAC, *args, **kwargs):
+        if isinstance(tac_instructions, TACProgram):
+            observer = _pass_observer
+            if observer is None:
+                return optimize(self, tac_instructions, *args, **kwargs)
+            return observer(optimize, self, tac_instructions, args, kwargs)
+        program = TACProgram.from_dicts(tac_instructions)
+        return wrapper(self, program, *args, **kwargs).to_dicts()
+    return wrapper
+
+
+if __name__ == "__main__":
+    # Round-trip the example used by the other tac_utils modules
+    example_tac = [
+        {'type': 'assign', 'lhs': 'a', 'rhs': '5'},
+        {'type': 'assign', 'lhs': 'b', 'rhs': '7'},
+        {'type': 'binop', 'lhs': 't0', 'op': '+', 'arg1': 'a', 'arg2': 'b'},
+        {'type': 'assign', 'lhs': 'c', 'rhs': 't0'},
+    ]
+
+    program = TACProgram.from_dicts(example_tac)
+    for instr in program:
+        print(instr)
+    print(program.to_dicts() == example_tac)
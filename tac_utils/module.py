@@ -0,0 +1,289 @@
+# module.py - Per-function TAC units, stitching them into one program and a compact wire format
+
+import pickle
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from tac_utils.ir import TEMP_PATTERN, Instruction, Opcode, SymbolTable, TACProgram
+
+_OPCODES = list(Opcode)
+
+class TACUnit:
+    """
+    The TAC of one function, or of a run of top-level code between functions.
+
+    Every unit has its own SymbolTable, and its temporaries and labels are
+    numbered from 0 (``t0``, ``L0``, ...), so a unit can be optimized,
+    shipped to another process and cached without reference to the rest of
+    its file. ``temp_count`` and ``label_count`` are the numbers the
+    generator handed out; stitching reserves at least that many of each.
+    """
+    __slots__ = ('name', 'program', 'temp_count', 'label_count')
+
+    def __init__(self, name: Optional[str], program: TACProgram, temp_count: int = 0, label_count: int = 0):
+        self.name = name  # Function name, None for top-level code
+        self.program = program
+        self.temp_count = temp_count
+        self.label_count = label_count
+
+    @property
+    def is_function(self) -> bool:
+        return self.name is not None
+
+    def derive(self, program: TACProgram) -> 'TACUnit':
+        """Return the same unit with an optimized program."""
+        return TACUnit(self.name, program, self.temp_count, self.label_count)
+
+    def __len__(self) -> int:
+        return len(self.program)
+
+    def __repr__(self) -> str:
+        return f'TACUnit({self.name!r}, {len(self.program)} instructions)'
+
+class TACModule:
+    """
+    The units of one source file, in source order.
+
+    to_program() stitches the units back into the flat program the rest of
+    the tool works with, renumbering temporaries and labels so they stay
+    unique across units.
+    """
+
+    def __init__(self, units: Optional[List[TACUnit]] = None):
+        self.units: List[TACUnit] = units if units is not None else []
+
+    def append(self, unit: TACUnit) -> None:
+        self.units.append(unit)
+
+    def derive(self, units: List[TACUnit]) -> 'TACModule':
+        return TACModule(units)
+
+    def __len__(self) -> int:
+        return len(self.units)
+
+    def __iter__(self) -> Iterator[TACUnit]:
+        return iter(self.units)
+
+    def instruction_count(self) -> int:
+        return sum(len(unit) for unit in self.units)
+
+    def share_globals(self) -> None:
+        """
+        Record in each unit's ``program.shared`` the variables it shares with
+        other units, so optimizing a unit on its own keeps their stores.
+
+        Mirrors ControlFlowGraph.shared_names() on the stitched program: a
+        variable is shared if it is used by two units and by top-level code,
+        where declaring it counts as a use. Temporaries are private to their
+        unit.
+        """
+        used: List[Set[str]] = []
+        first_user: Dict[str, int] = {}
+        several: Set[str] = set()
+        top_level: Set[str] = set()
+        for index, unit in enumerate(self.units):
+            symbols = unit.program.symbols
+            temps = symbols.temps
+            names = {
+                symbols.names[operand]
+                for instr in unit.program.instructions
+                for operand in (instr.dest, instr.arg1, instr.arg2)
+                if operand is not None and operand >= 0 and operand not in temps
+            }
+            if not unit.is_function:
+                # A declaration is top-level code using the name, even without an initializer (int g;)
+                names |= {symbols.names[operand] for operand in unit.program.types}
+            used.append(names)
+            for name in names:
+                if first_user.setdefault(name, index) != index:
+                    several.add(name)
+            if not unit.is_function:
+                top_level |= names
+
+        shared = several & top_level
+        for unit, names in zip(self.units, used):
+            variable = unit.program.symbols.variable
+            unit.program.shared = {variable(name) for name in names & shared}
+
+    def share_types(self) -> None:
+        """
+        Give each function the declared types of the globals it uses.
+
+        A function's own declarations (locals and parameters) win over
+        globals of the same name.
+        """
+        global_program = TACProgram()
+        for unit in self.units:
+            if not unit.is_function:
+                text = unit.program.symbols.text
+                for operand, c_type in unit.program.types.items():
+                    global_program.declare(global_program.symbols.variable(text(operand)), c_type)
+        global_names = global_program.symbols.names
+        global_types = {global_names[operand]: c_type for operand, c_type in global_program.types.items()}
+        if not global_types:
+            return
+
+        for unit in self.units:
+            if not unit.is_function:
+                continue
+            program = unit.program
+            names = program.symbols.names
+            for operand, name in enumerate(names):
+                if name in global_types and operand not in program.types and operand not in program.symbols.temps:
+                    program.types[operand] = global_types[name]
+
+    def to_program(self) -> TACProgram:
+        """Stitch the units into one program over a single SymbolTable."""
+        program = TACProgram()
+        symbols = program.symbols
+        temp_base = 0
+        label_base = 0
+        for unit in self.units:
+            source = unit.program.symbols
+            temp_count = unit.temp_count
+            # Old operand ID -> ID in the stitched table (None stays None)
+            remap: Dict[Optional[int], Optional[int]] = {None: None}
+            for operand, name in enumerate(source.names):
+                if operand in source.temps and TEMP_PATTERN.match(name):
+                    number = int(name[1:])
+                    temp_count = max(temp_count, number + 1)
+                    remap[operand] = symbols.temp(f't{number + temp_base}')
+                elif operand in source.temps:
+                    remap[operand] = symbols.temp(name)
+                else:
+                    remap[operand] = symbols.variable(name)
+            for index, (text, value) in enumerate(zip(source.constants, source.values)):
+                remap[~index] = symbols.constant(text, value)
+
+            label_count = unit.label_count
+            labels: Dict[Optional[str], Optional[str]] = {None: None}
+            for instr in unit.program.instructions:
+                name = instr.label
+                if name not in labels:
+                    if name.isdigit():
+                        label_count = max(label_count, int(name) + 1)
+                        labels[name] = str(int(name) + label_base)
+                    else:
+                        labels[name] = name
+
+            offset = len(program.instructions)
+            program.instructions.extend(
+                Instruction(instr.opcode, remap[instr.dest], instr.op, remap[instr.arg1],
+                            remap[instr.arg2], labels[instr.label])
+                for instr in unit.program.instructions
+            )
+            program.functions.extend(
+                (name, start + offset, end + offset) for name, start, end in unit.program.functions)
+            program.style = unit.program.style
+            for operand, c_type in unit.program.types.items():
+                program.declare(remap[operand], c_type)
+            if not unit.is_function:
+                program.globals.update(remap[operand] for operand in unit.program.types)
+            temp_base += temp_count
+            label_base += label_count
+        return program
+
+def unit_state(unit: TACUnit) -> Dict[str, Any]:
+    """
+    Describe a unit in plain lists, numbers and strings (JSON-serializable).
+
+    Instructions become six integers each in ``records``: opcode, dest,
+    arg1, arg2 and indices into ``strings`` for the operator and label,
+    much like the records of the .tacb format. Operands keep their IDs in
+    the unit's own symbol table, which is included; a missing operand is
+    ``~len(constants)``, one below the lowest constant ID. ``types`` holds
+    [operand, type] pairs of the declared variables.
+    """
+    program = unit.program
+    symbols = program.symbols
+    missing = ~len(symbols.constants)
+    strings: Dict[Optional[str], int] = {}
+    records: List[int] = []
+    extend = records.extend
+    for instr in program.instructions:
+        op = strings.setdefault(instr.op, len(strings))
+        label = strings.setdefault(instr.label, len(strings))
+        extend((
+            instr.opcode,
+            missing if instr.dest is None else instr.dest,
+            missing if instr.arg1 is None else instr.arg1,
+            missing if instr.arg2 is None else instr.arg2,
+            op,
+            label,
+        ))
+    return {
+        'name': unit.name,
+        'temp_count': unit.temp_count,
+        'label_count': unit.label_count,
+        'style': program.style,
+        'names': symbols.names,
+        'temps': sorted(symbols.temps),
+        'constants': symbols.constants,
+        'values': symbols.values,
+        'strings': list(strings),
+        'records': records,
+        'functions': program.functions,
+        'shared': sorted(program.shared),
+        'types': sorted(program.types.items()),
+    }
+
+def unit_from_state(state: Dict[str, Any]) -> TACUnit:
+    """Rebuild a unit described by unit_state()."""
+    symbols = SymbolTable()
+    for text in state['names']:
+        symbols.variable(text)
+    symbols.temps = set(state['temps'])
+    for text, value in zip(state['constants'], state['values']):
+        symbols.constant(text, value)
+
+    strings = state['strings']
+    operand: Dict[int, Optional[int]] = {~len(symbols.constants): None}
+    operand.update((i, i) for i in range(len(symbols.names)))
+    operand.update((~i, ~i) for i in range(len(symbols.constants)))
+    fields = iter(state['records'])
+    instructions = [
+        Instruction(_OPCODES[opcode], operand[dest], strings[op], operand[arg1], operand[arg2], strings[label])
+        for opcode, dest, arg1, arg2, op, label in zip(fields, fields, fields, fields, fields, fields)
+    ]
+
+    program = TACProgram(instructions, symbols, state['style'])
+    program.functions = [tuple(function) for function in state['functions']]
+    program.shared = set(state['shared'])
+    program.types = {operand: c_type for operand, c_type in state['types']}
+    return TACUnit(state['name'], program, state['temp_count'], state['label_count'])
+
+def pack_unit(unit: TACUnit) -> bytes:
+    """
+    Serialize a unit for sending to another process.
+
+    The records of unit_state() are stored as an array of 16-bit integers
+    when the unit's tables are small enough, as they are for all but huge
+    functions, so a unit costs well under half of pickling its dicts.
+    """
+    state = unit_state(unit)
+    bound = max(len(state['names']), len(state['constants']) + 1, len(state['strings']))
+    typecode = 'h' if bound < 2 ** 15 else 'i'
+    state['records'] = (typecode, array(typecode, state['records']).tobytes())
+    return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+def unpack_unit(data: bytes) -> TACUnit:
+    """Rebuild a unit serialized by pack_unit()."""
+    state = pickle.loads(data)
+    typecode, packed = state['records']
+    records = array(typecode)
+    records.frombytes(packed)
+    state['records'] = records
+    return unit_from_state(state)
+
+if __name__ == "__main__":
+    # Run as: python -m tac_utils.module [file.c]
+    import sys
+
+    from parser.parser import generate_module, parse_c_file
+
+    module = generate_module(parse_c_file(sys.argv[1] if len(sys.argv) > 1 else 'input/sample.c'))
+    for unit in module:
+        data = pack_unit(unit)
+        print(f"{unit.name or '<top level>'}: {len(unit)} instructions, {len(data)} bytes packed")
+        assert [i.key() for i in unpack_unit(data).program] == [i.key() for i in unit.program]
+    print(f"{len(module.to_program())} instructions stitched")
@@ -0,0 +1,727 @@
+# ssa.py - Static single assignment form over TAC: construction and destruction
+
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from tac_utils.c_types import LP64_BITS, operand_types
+from tac_utils.cfg import ControlFlowGraph
+from tac_utils.ir import (
+    ASSIGN, COND_JUMP, JUMP, LABEL, OPCODE_NAMES, RETURN, Instruction, TACProgram, assign, jump, label,
+)
+
+# A stretch of a live range within one block: [start, end, value held]
+Span = List[int]
+INFINITY = float('inf')
+
+# Out of SSA, a name stops being checked against a group once its live range
+# covers this many blocks more than twice the group's: a long-lived temporary
+# rarely fits, and walking every one of them would make coalescing quadratic
+WALK_SLACK = 64
+
+def _interferes(spans: Optional[List[Span]], first: int, last: int, held: int) -> bool:
+    """
+    Return True if a span [first, last] holding one value overlaps one of
+    a group's spans in the same block that holds another.
+    """
+    if not spans:
+        return False
+    # A group's spans in a block are disjoint and sorted, so the ones
+    # overlapping [first, last] end the prefix that starts by last
+    i = bisect_right(spans, [last, INFINITY])
+    while i > 0 and spans[i - 1][1] >= first:
+        i -= 1
+        if spans[i][2] != held:
+            return True
+    return False
+
+def _join(spans: Dict[int, List[Span]], into: Dict[int, List[Span]]) -> None:
+    """Add a live range to a group's that it does not interfere with."""
+    for b, runs in spans.items():
+        others = into.setdefault(b, [])
+        for first, last, held in runs:
+            hi = bisect_right(others, [last, INFINITY])
+            lo = hi
+            while lo > 0 and others[lo - 1][1] >= first:
+                lo -= 1
+            # Overlapping spans hold the same value here: join them
+            if lo < hi:
+                first = min(first, others[lo][0])
+                last = max(last, others[hi - 1][1])
+            others[lo:hi] = [[first, last, held]]
+
+class Phi:
+    """
+    A phi function at the top of a block: ``dest`` takes the value of
+    ``args[i]`` when control arrives from the block's i-th predecessor.
+    Phis in an entry block have one more argument, last, for control
+    entering the region (the variable's value on entry). Arguments for
+    unreachable predecessors stay None.
+    """
+    __slots__ = ('dest', 'base', 'args')
+
+    def __init__(self, base: int, arity: int):
+        self.dest = base
+        self.base = base
+        self.args: List[Optional[int]] = [None] * arity
+
+    def __repr__(self) -> str:
+        return f'Phi(dest={self.dest}, args={self.args})'
+
+class SSAForm:
+    """
+    Pruned SSA form of a TACProgram.
+
+    Phi functions are placed at the iterated dominance frontier of each
+    variable's definitions, only where the variable is live, and every
+    definition is renamed to a fresh version while walking the dominator
+    tree. Versions get IDs past the end of the symbol table, so nothing is
+    interned until translation out of SSA picks the final names; the value
+    a variable has on entry to a function keeps the variable's own ID.
+    Variables shared between a function and top-level code (or between
+    entry regions of a program without recorded functions) stay out of SSA
+    and are treated as memory.
+
+    ``blocks[b]`` holds the renamed instructions of block b, or None for
+    blocks that cannot be reached. Optimizations may replace instructions,
+    set them to None to delete them, edit ``phis`` and remove edges and
+    blocks that are never taken; to_program() then translates back to
+    ordinary TAC.
+    """
+
+    def __init__(self, program: TACProgram):
+        self.program = program
+        self.symbols = program.symbols
+        self.cfg = ControlFlowGraph(program)
+        self.order = self.cfg.dominator_tree_preorder()
+        self.first_version = len(self.symbols)
+        self.bases: List[int] = []
+        self.region = self.cfg.entry_of()
+        self.memory = self.cfg.shared_names()
+        self.blocks: List[Optional[List[Optional[Instruction]]]] = [None] * len(self.cfg)
+        self.origins: List[Optional[List[Instruction]]] = [None] * len(self.cfg)
+        self.phis: List[List[Phi]] = [[] for _ in range(len(self.cfg))]
+        self.touched: List[int] = []
+        self._claimed: Set[int] = set()
+        self._def_block: Dict[int, int] = {}
+        self._reachable: Set[int] = set()
+        self._scratch_temp: Optional[int] = None
+        self._place_phis()
+        self._rename()
+
+    # Names
+
+    def is_name(self, operand: Optional[int]) -> bool:
+        """Return True for operands in SSA form (versions and entry values)."""
+        return operand is not None and operand >= 0 and operand not in self.memory
+
+    def base_of(self, operand: int) -> int:
+        """Return the original variable of a version."""
+        if operand >= self.first_version:
+            return self.bases[operand - self.first_version]
+        return operand
+
+    def name(self, operand: int) -> str:
+        """Return a readable name for an operand, e.g. x.2 for a version of x."""
+        index = operand - self.first_version
+        if index >= 0:
+            return f"{self.symbols.text(self.bases[index])}.{index + 1}"
+        return self.symbols.text(operand)
+
+    def _new_version(self, base: int) -> int:
+        self.bases.append(base)
+        return self.first_version + len(self.bases) - 1
+
+    def instructions(self) -> Iterator[Tuple[int, int, Instruction]]:
+        """Yield (block, position, instruction) in dominator-tree order."""
+        for b in self.order:
+            for pos, instr in enumerate(self.blocks[b]):
+                if instr is not None:
+                    yield b, pos, instr
+
+    # Construction
+
+    def _place_phis(self) -> None:
+        cfg = self.cfg
+        instructions = self.program.instructions
+        def_blocks: Dict[int, List[int]] = {}
+        live_in, _ = cfg.liveness()
+        name_bits = cfg.name_bits
+        for b in self.order:
+            block = cfg.blocks[b]
+            for instr in instructions[block.start:block.end]:
+                dest = instr.dest
+                # Names never live across a block boundary need no phis
+                if dest is not None and dest in name_bits and dest not in self.memory:
+                    sites = def_blocks.setdefault(dest, [])
+                    if not sites or sites[-1] != b:
+                        sites.append(b)
+
+        frontiers = cfg.dominance_frontiers
+        entries = set(cfg.entries)
+        for name, sites in def_blocks.items():
+            bit = name_bits[name]
+            placed: Set[int] = set()
+            work = list(sites)
+            while work:
+                for d in frontiers[work.pop()]:
+                    if d not in placed and (live_in[d] >> bit) & 1:
+                        placed.add(d)
+                        self.phis[d].append(Phi(name, len(cfg.blocks[d].preds) + (d in entries)))
+                        work.append(d)
+
+    def _rename(self) -> None:
+        cfg = self.cfg
+        instructions = self.program.instructions
+        memory = self.memory
+        stacks: Dict[int, List[int]] = {}
+
+        def current(operand: Optional[int]) -> Optional[int]:
+            if operand is None or operand < 0:
+                return operand
+            versions = stacks.get(operand)
+            return versions[-1] if versions else operand
+
+        work: List[Tuple[int, Optional[List[int]]]] = [(entry, None) for entry in reversed(cfg.entries)]
+        while work:
+            b, pushed = work.pop()
+            if pushed is not None:
+                # Leaving b's dominator subtree: its definitions go out of scope
+                for base in pushed:
+                    stacks[base].pop()
+                continue
+
+            pushed = []
+            for phi in self.phis[b]:
+                if len(phi.args) > len(cfg.blocks[b].preds):
+                    # Entering the region: nothing is renamed yet
+                    phi.args[-1] = phi.base
+                phi.dest = self._new_version(phi.base)
+                stacks.setdefault(phi.base, []).append(phi.dest)
+                pushed.append(phi.base)
+
+            block = cfg.blocks[b]
+            origins = instructions[block.start:block.end]
+            renamed: List[Optional[Instruction]] = []
+            for instr in origins:
+                arg1 = current(instr.arg1)
+                arg2 = current(instr.arg2)
+                dest = instr.dest
+                if dest is not None and dest not in memory:
+                    dest = self._new_version(instr.dest)
+                    stacks.setdefault(instr.dest, []).append(dest)
+                    pushed.append(instr.dest)
+                if dest != instr.dest or arg1 != instr.arg1 or arg2 != instr.arg2:
+                    instr = Instruction(instr.opcode, dest, instr.op, arg1, arg2, instr.label)
+                renamed.append(instr)
+            self.blocks[b] = renamed
+            self.origins[b] = origins
+
+            for s in block.succs:
+                pos = cfg.blocks[s].preds.index(b)
+                for phi in self.phis[s]:
+                    phi.args[pos] = current(phi.base)
+
+            work.append((b, pushed))
+            work.extend((child, None) for child in reversed(cfg.dom_children[b]))
+
+    def format(self) -> str:
+        """Return the SSA form as text, block by block, with phis first."""
+        from tac_utils.formatter import format_instruction
+
+        def operand(x: Optional[int]) -> Optional[str]:
+            return None if x is None else self.name(x)
+
+        lines = []
+        for b in sorted(self.order):
+            block = self.cfg.blocks[b]
+            lines.append(f"B{b}:" + (f" (L{block.label})" if block.label is not None else ""))
+            for phi in self.phis[b]:
+                args = ', '.join('-' if arg is None else self.name(arg) for arg in phi.args)
+                lines.append(f"  {self.name(phi.dest)} = phi({args})")
+            for instr in self.blocks[b]:
+                if instr is None:
+                    continue
+                d = {
+                    'type': OPCODE_NAMES[instr.opcode], 'lhs': operand(instr.dest), 'op': instr.op,
+                    'rhs': operand(instr.arg1), 'arg': operand(instr.arg1), 'arg1': operand(instr.arg1),
+                    'arg2': operand(instr.arg2), 'condition': operand(instr.arg1),
+                    'value': operand(instr.arg1), 'label': instr.label, 'target': instr.label,
+                }
+                lines.append(f"  {format_instruction(d)}")
+        return "\n".join(lines)
+
+    # Editing
+
+    def remove_edge(self, pred: int, succ: int) -> None:
+        """
+        Delete the CFG edge pred -> succ (e.g. a branch that is never taken)
+        with the phi operands that came along it. The caller rewrites the
+        jump at the end of pred.
+        """
+        cfg = self.cfg
+        preds = cfg.blocks[succ].preds
+        pos = preds.index(pred)
+        del preds[pos]
+        cfg.blocks[pred].succs.remove(succ)
+        for phi in self.phis[succ]:
+            del phi.args[pos]
+
+    def remove_blocks(self, dead: Set[int]) -> None:
+        """Delete blocks that can never run, with their edges."""
+        if not dead:
+            return
+        for b in dead:
+            for s in list(self.cfg.blocks[b].succs):
+                self.remove_edge(b, s)
+            for p in list(self.cfg.blocks[b].preds):
+                self.remove_edge(p, b)
+            self.blocks[b] = None
+            self.phis[b] = []
+        self.order = [b for b in self.order if b not in dead]
+
+    # Destruction
+
+    def _reads(self) -> Tuple[Dict[int, int], Dict[int, Dict[int, int]]]:
+        """
+        Find where every SSA name is written and read.
+
+        Points within a block are counted so an instruction at position i
+        reads its operands at 2i and writes its result at 2i + 1; phi results
+        are written at -1 and phi operands read at the end of the predecessor
+        they come from. Fills in the block defining each name and returns
+        (point written, {block: last point read}) for every name.
+        """
+        is_name = self.is_name
+        def_block = self._def_block
+        written: Dict[int, int] = {}
+        reads: Dict[int, Dict[int, int]] = {}
+        for b in self.order:
+            for phi in self.phis[b]:
+                def_block[phi.dest] = b
+                written[phi.dest] = -1
+            for pos, instr in enumerate(self.blocks[b]):
+                if instr is None:
+                    continue
+                for arg in (instr.arg1, instr.arg2):
+                    if is_name(arg):
+                        reads.setdefault(arg, {})[b] = 2 * pos
+                if is_name(instr.dest):
+                    def_block[instr.dest] = b
+                    written[instr.dest] = 2 * pos + 1
+        for b in self.order:
+            preds = self.cfg.blocks[b].preds
+            for phi in self.phis[b]:
+                for p, arg in zip(preds, phi.args):
+                    if is_name(arg) and self.blocks[p] is not None:
+                        reads.setdefault(arg, {})[p] = 2 * len(self.blocks[p])
+        return written, reads
+
+    def _live_range(self, name: int, held: int, written: Dict[int, int], reads: Dict[int, Dict[int, int]],
+                    other: Optional[Dict[int, List[Span]]] = None) -> Optional[Dict[int, List[Span]]]:
+        """
+        Return the live range of a name as one span per block, walking up from its reads.
+
+        With ``other``, the live range of a group of names, the walk stops and
+        returns None at the first span that interferes with it, so a failed
+        merge costs only the part of the range walked so far, or once the
+        range has grown past WALK_SLACK blocks more than twice the group's.
+        """
+        home = self._def_block.get(name)
+        born = written.get(name)
+        spans: Dict[int, List[Span]] = {}
+        limit = 2 * len(other) + WALK_SLACK if other is not None else 0
+
+        def reach(b: int, first: int, last: int) -> bool:
+            # The spans found for a block share their start and only grow
+            spans[b] = [[first, last, held]]
+            return other is not None and _interferes(other.get(b), first, last, held)
+
+        # A result that is never read still overwrites its variable
+        if home is not None and reach(home, born, born):
+            return None
+        stack = []
+        for b, point in reads.get(name, {}).items():
+            if b == home:
+                if reach(b, born, point):
+                    return None
+            else:
+                if reach(b, -2, point):
+                    return None
+                stack.append(b)
+        reachable = self._reachable
+        live_in: Set[int] = set()
+        live_out: Set[int] = set()
+        while stack:
+            b = stack.pop()
+            if b in live_in:
+                continue
+            live_in.add(b)
+            for p in self.cfg.blocks[b].preds:
+                if p in live_out or p not in reachable:
+                    continue
+                live_out.add(p)
+                if reach(p, born if p == home else -2, 2 * len(self.blocks[p])):
+                    return None
+                if other is not None and len(spans) > limit:
+                    return None
+                if p != home:
+                    stack.append(p)
+        return spans
+
+    def _coalesce(self) -> Dict[int, int]:
+        """
+        Map every SSA name to its final variable.
+
+        Names connected by a phi, a copy or a common original variable are
+        merged into one variable unless their live ranges interfere, so most
+        versions get their original name back and most copies disappear.
+        Names of different C types are never merged: a copy between them
+        converts the value.
+
+        Merged names form a union-find forest. A group keeps its live range
+        block by block; a name is checked against a group by walking its own
+        live range, stopping at the first interference, and two groups by
+        checking the smaller range against the larger one, which it then
+        joins. Ranges that overlap only where they hold the same value (a
+        copy and its source) do not interfere.
+        """
+        is_name = self.is_name
+        base_of = self.base_of
+        is_temp = self.symbols.is_temp
+
+        # Affinities in priority order: phi operands, copies, then versions
+        # of the same variable
+        affinities: List[Tuple[int, int]] = []
+        names: List[int] = []
+        seen: Set[int] = set()
+
+        def note(name: Optional[int]) -> None:
+            if is_name(name) and name not in seen:
+                seen.add(name)
+                names.append(name)
+
+        types = operand_types(self.program, LP64_BITS)
+        value: Dict[int, int] = {}
+        copies: List[Tuple[int, int]] = []
+        for b in self.order:
+            for phi in self.phis[b]:
+                note(phi.dest)
+                for arg in phi.args:
+                    note(arg)
+                    if is_name(arg):
+                        affinities.append((phi.dest, arg))
+            for instr in self.blocks[b]:
+                if instr is None:
+                    continue
+                note(instr.arg1)
+                note(instr.arg2)
+                note(instr.dest)
+                if instr.opcode is ASSIGN and is_name(instr.dest) and is_name(instr.arg1):
+                    copies.append((instr.dest, instr.arg1))
+                    if types.get(base_of(instr.dest)) == types.get(base_of(instr.arg1)):
+                        # Blocks are in dominator order, so the source is seen first
+                        value[instr.dest] = value.get(instr.arg1, instr.arg1)
+        affinities.extend(copies)
+        versions = [name for name in names if name >= self.first_version]
+        affinities.extend((name, base_of(name)) for name in versions)
+        # The entry value may never be read, so versions also join the one before them
+        previous: Dict[int, int] = {}
+        for name in versions:
+            base = base_of(name)
+            if base in previous:
+                affinities.append((name, previous[base]))
+            previous[base] = name
+
+        self._reachable = set(self.order)
+        written, reads = self._reads()
+        group: Dict[int, int] = {}
+        variable: Dict[int, Optional[int]] = {}
+        entry: Dict[int, Optional[int]] = {}
+        for name in names:
+            group[name] = name
+            base = base_of(name)
+            variable[name] = None if is_temp(base) else base
+            entry[name] = name if name < self.first_version else None
+
+        def leader(x: int) -> int:
+            while group[x] != x:
+                group[x] = group[group[x]]
+                x = group[x]
+            return x
+
+        # Live ranges of the groups merged so far (and of names they were
+        # checked against); any other group is a single name
+        ranges: Dict[int, Dict[int, List[Span]]] = {}
+
+        # Greedily merge along affinities. A group may hold at most one
+        # user variable and at most one value live on entry.
+        for a, b in affinities:
+            if b not in group:
+                continue
+            ga, gb = leader(a), leader(b)
+            if ga == gb:
+                continue
+            if variable[ga] is not None and variable[gb] is not None and variable[ga] != variable[gb]:
+                continue
+            if entry[ga] is not None and entry[gb] is not None:
+                continue
+            if types.get(base_of(ga)) != types.get(base_of(gb)):
+                continue
+            if gb not in ranges:
+                ga, gb = gb, ga
+            if gb not in ranges:
+                ranges[gb] = self._live_range(gb, value.get(gb, gb), written, reads)
+            if ga not in ranges:
+                walked = self._live_range(ga, value.get(ga, ga), written, reads, ranges[gb])
+                if walked is None:
+                    continue
+                ranges[ga] = walked
+            else:
+                if len(ranges[ga]) > len(ranges[gb]):
+                    ga, gb = gb, ga
+                if any(_interferes(ranges[gb].get(block), first, last, held)
+                       for block, spans in ranges[ga].items() for first, last, held in spans):
+                    continue
+            if len(ranges[ga]) > len(ranges[gb]):
+                ga, gb = gb, ga
+            _join(ranges.pop(ga), ranges[gb])
+            group[ga] = gb
+            if variable[gb] is None:
+                variable[gb] = variable[ga]
+            if entry[gb] is None:
+                entry[gb] = entry[ga]
+
+        # Name the groups: a group holding a value live on entry must use that
+        # variable; other groups take their variable's name while it is free
+        # in their function (the same local name may be reused by each function)
+        final: Dict[int, int] = {}
+        entry_names: Set[int] = set()
+        for name in names:
+            g = leader(name)
+            if entry[g] is not None and g not in final:
+                final[g] = entry[g]
+                entry_names.add(entry[g])
+        claimed: Dict[Optional[int], Set[int]] = {}
+        suffixes: Dict[Optional[int], Dict[int, int]] = {}
+        in_use: Optional[Set[int]] = None
+        for name in names:
+            g = leader(name)
+            if g in final:
+                continue
+            region = self.region[self._def_block[name]]
+            taken = claimed.setdefault(region, set())
+            wanted = variable[g] if variable[g] is not None else base_of(name)
+            if wanted in taken or wanted in entry_names:
+                if variable[g] is None:
+                    wanted = self.symbols.new_temp()
+                else:
+                    if in_use is None:
+                        in_use = {op for instr in self.program.instructions
+                                  for op in (instr.dest, instr.arg1, instr.arg2) if op is not None}
+                    wanted = self._fresh_variable(wanted, (taken, entry_names, in_use),
+                                                  suffixes.setdefault(region, {}))
+            final[g] = wanted
+            taken.add(wanted)
+        self._claimed = entry_names.union(*claimed.values())
+        return {name: final[leader(name)] for name in names}
+
+    def _fresh_variable(self, base: int, taken: Sequence[Set[int]], suffixes: Dict[int, int]) -> int:
+        """
+        Return a new variable x.k for the variable x that is in none of the taken sets.
+
+        ``suffixes`` holds the next k to try for each variable; the taken sets
+        only grow, so names found taken are not tried again.
+        """
+        text = self.symbols.text(base)
+        k = suffixes.get(base, 1)
+        while True:
+            candidate = f"{text}.{k}"
+            k += 1
+            existing = self.symbols._name_ids.get(candidate)
+            if existing is None or not any(existing in names for names in taken):
+                suffixes[base] = k
+                variable = self.symbols.variable(candidate)
+                if base in self.program.types:
+                    # The new name holds values of the variable, converted to its type
+                    self.program.declare(variable, self.program.types[base])
+                return variable
+
+    def _scratch(self) -> int:
+        """
+        Return the temporary used to break copy cycles.
+
+        A cycle is finished before the next one is broken, so one temporary
+        serves every edge. Reusing a temporary of the input that the output
+        no longer needs keeps repeated runs from inventing new names.
+        """
+        if self._scratch_temp is None:
+            temps = self.symbols.temps
+            free = sorted(
+                instr.dest for instr in self.program.instructions
+                if instr.dest in temps and instr.dest not in self._claimed and instr.dest not in self.memory
+            )
+            self._scratch_temp = free[0] if free else self.symbols.new_temp()
+        return self._scratch_temp
+
+    def _sequentialize(self, copies: List[Tuple[int, int]]) -> List[Instruction]:
+        """Order parallel copies so no source is overwritten before it is read."""
+        pending = {dest: src for dest, src in copies if dest != src}
+        ordered: List[Instruction] = []
+        while pending:
+            sources: Dict[int, int] = {}
+            for src in pending.values():
+                sources[src] = sources.get(src, 0) + 1
+            ready = [dest for dest in pending if not sources.get(dest)]
+            if ready:
+                for dest in ready:
+                    ordered.append(assign(dest, pending.pop(dest)))
+                continue
+            # Only cycles are left: save one value in a temporary to break one
+            dest = next(iter(pending))
+            saved = self._scratch()
+            ordered.append(assign(saved, dest))
+            for d, src in pending.items():
+                if src == dest:
+                    pending[d] = saved
+        return ordered
+
+    def to_program(self) -> TACProgram:
+        """
+        Translate out of SSA form.
+
+        Phi functions become copies at the end of their predecessors; copies
+        on an edge from a conditional jump to a block with several
+        predecessors go in a new block placed just before the target, and
+        copies on entry to a region go ahead of its entry block.
+        Unreachable blocks are dropped, and instructions that come out the
+        same as in the original program are the original objects. Sets
+        ``touched`` like an optimizer pass; returns the original program if
+        nothing changed.
+        """
+        cfg = self.cfg
+        names = self._coalesce()
+
+        def rename(operand: Optional[int]) -> Optional[int]:
+            return names.get(operand, operand) if operand is not None else None
+
+        labels = [instr.label for instr in self.program.instructions if instr.opcode is LABEL]
+        next_label = 1 + max((int(l) for l in labels if l.isdigit()), default=-1)
+
+        # Copies for each edge with phi operands, and the split blocks they need
+        before: Dict[int, List[Instruction]] = {}  # ... end of a block, ahead of its jump
+        after: Dict[int, List[Instruction]] = {}   # ... after a conditional jump (fall-through)
+        splits: Dict[int, List[Tuple[str, List[Instruction]]]] = {}
+        retarget: Dict[int, str] = {}
+        entering: Dict[int, List[Instruction]] = {}  # ... ahead of an entry block, on entering its region
+        for s in sorted(self.order):
+            if not self.phis[s]:
+                continue
+            preds = cfg.blocks[s].preds
+            if len(self.phis[s][0].args) > len(preds):
+                entering[s] = self._sequentialize([
+                    (rename(phi.dest), rename(phi.args[-1])) for phi in self.phis[s]
+                ])
+            for pos, p in enumerate(preds):
+                if self.blocks[p] is None:
+                    continue
+                copies = self._sequentialize([
+                    (rename(phi.dest), rename(phi.args[pos])) for phi in self.phis[s]
+                ])
+                if not copies:
+                    continue
+                succs = cfg.blocks[p].succs
+                if len(succs) == 1:
+                    before[p] = copies
+                elif s == succs[0]:
+                    after[p] = copies
+                else:
+                    name = str(next_label)
+                    next_label += 1
+                    splits.setdefault(s, []).append((name, copies))
+                    retarget[p] = name
+
+        out: List[Instruction] = []
+        touched: List[int] = []
+        new_start: Dict[int, int] = {}
+        entries = set(cfg.entries)
+        gap = False  # Set when an instruction was deleted, so its new neighbour is touched
+
+        def emit(instr: Instruction, original: bool = False) -> None:
+            nonlocal gap
+            if gap or not original:
+                touched.append(len(out))
+                gap = False
+            out.append(instr)
+
+        for block in cfg.blocks:
+            b = block.index
+            new_start[b] = len(out)
+            renamed = self.blocks[b]
+            if renamed is None:
+                gap = True
+                continue
+            for copy in entering.get(b, ()):
+                emit(copy)
+            if b in splits:
+                # Control must not enter the split blocks by falling into them,
+                # nor by entering the region when b starts it
+                if b in entries or (out and out[-1].opcode is not JUMP and out[-1].opcode is not RETURN):
+                    emit(jump(block.label))
+                for name, copies in splits[b]:
+                    emit(label(name))
+                    for copy in copies:
+                        emit(copy)
+                    emit(jump(block.label))
+
+            copies = before.get(b)
+            last = max((i for i, instr in enumerate(renamed) if instr is not None), default=-1)
+            for i, (instr, origin) in enumerate(zip(renamed, self.origins[b])):
+                if instr is None:
+                    gap = True
+                    continue
+                if copies and i == last and (instr.opcode is JUMP or instr.opcode is COND_JUMP):
+                    for copy in copies:
+                        emit(copy)
+                    copies = None
+                dest, arg1, arg2 = rename(instr.dest), rename(instr.arg1), rename(instr.arg2)
+                target = retarget.get(b, instr.label) if instr.opcode is COND_JUMP else instr.label
+                if instr.opcode is ASSIGN and dest == arg1:
+                    gap = True
+                elif (dest, arg1, arg2, target) == (origin.dest, origin.arg1, origin.arg2, origin.label):
+                    emit(origin, original=True)
+                else:
+                    emit(Instruction(instr.opcode, dest, instr.op, arg1, arg2, target))
+            for copy in copies or ():
+                emit(copy)
+            for copy in after.get(b, ()):
+                emit(copy)
+
+        new_start[len(cfg.blocks)] = len(out)
+        block_at = {block.start: block.index for block in cfg.blocks}
+        block_at[len(self.program.instructions)] = len(cfg.blocks)
+        functions = [
+            (name, new_start[block_at[start]], new_start[block_at[end]])
+            for name, start, end in self.program.functions
+        ]
+
+        keys = [instr.key() for instr in out]
+        if keys == [instr.key() for instr in self.program.instructions]:
+            self.touched = []
+            return self.program
+        self.touched = sorted(set(t for t in touched if t < len(out)))
+        return self.program.derive(out, functions)
+
+if __name__ == "__main__":
+    # Run as: python -m tac_utils.ssa [file.c]
+    import sys
+
+    from parser.parser import generate_ir, parse_c_file
+    from tac_utils.formatter import format_instruction
+
+    program = generate_ir(parse_c_file(sys.argv[1] if len(sys.argv) > 1 else 'input/sample.c'))
+    ssa = SSAForm(program)
+    print(ssa.format())
+    print()
+    print("Out of SSA:")
+    for d in ssa.to_program().to_dicts():
+        print(f"  {format_instruction(d)}")
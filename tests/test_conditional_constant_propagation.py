@@ -0,0 +1,62 @@
+import unittest
+
+from optimizer.conditional_constant_propagation import ConditionalConstantPropagator
+from optimizer.pass_manager import PassManager
+from parser.parser import generate_ir, parse_c_text
+from tac_utils.ir import RETURN, TACProgram
+
+SOURCE = '''
+double f() { double x = 3; double y = x / 2; return y; }
+unsigned g() { unsigned a = 0; a = a - 1; return a / 2; }
+'''
+
+def returned_constants(program):
+    """The constant each function returns, by function name."""
+    symbols = program.symbols
+    found = {}
+    for name, start, end in program.functions:
+        returns = [instr for instr in program.instructions[start:end] if instr.opcode is RETURN]
+        if len(returns) == 1 and returns[0].arg1 is not None and returns[0].arg1 < 0:
+            found[name] = symbols.value(returns[0].arg1)
+    return found
+
+class TypedFoldingTest(unittest.TestCase):
+    def setUp(self):
+        self.program = generate_ir(parse_c_text(SOURCE))
+
+    def check(self, program):
+        constants = returned_constants(program)
+        # x / 2 divides a double, and a - 1 wraps around in unsigned int
+        self.assertEqual(constants['f'], 1.5)
+        self.assertIs(type(constants['f']), float)
+        self.assertEqual(constants['g'], 2147483647)
+
+    def test_sccp(self):
+        self.check(ConditionalConstantPropagator().optimize(self.program))
+
+    def test_default_pipeline(self):
+        self.check(PassManager().run(self.program))
+
+    def test_constants_are_spelled_in_their_type(self):
+        optimized = ConditionalConstantPropagator().optimize(self.program)
+        returned = [optimized.symbols.text(instr.arg1) for instr in optimized.instructions if instr.opcode is RETURN]
+        self.assertEqual(returned, ['1.5', '2147483647u'])
+
+class DeadBlockTest(unittest.TestCase):
+    """TAC without function ranges, with a block nothing jumps to after break."""
+
+    def setUp(self):
+        source = 'int f(int n) { int s = 0; while (n > 0) { n = n - 1; break; s = s + 1; } return s; }'
+        self.tac = generate_ir(parse_c_text(source)).to_dicts()
+
+    def test_sccp_on_dicts(self):
+        optimized = ConditionalConstantPropagator().optimize(self.tac)
+        self.assertEqual([d['value'] for d in optimized if d['type'] == 'return'], ['0'])
+
+    def test_pipeline(self):
+        optimized = PassManager(['sccp']).run(TACProgram.from_dicts(self.tac))
+        returns = [instr for instr in optimized.instructions if instr.opcode is RETURN]
+        self.assertEqual([optimized.symbols.value(instr.arg1) for instr in returns], [0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+from optimizer.pass_manager import PassManager
+from parser.parser import generate_ir, parse_c_text
+from tac_utils.ir import RETURN
+
+SOURCE = '''
+int h(double d) { int y = d; int z = y; return z; }
+'''
+
+class ConversionCopyTest(unittest.TestCase):
+    """y = d truncates, so nothing may read d in place of y."""
+
+    def setUp(self):
+        self.program = generate_ir(parse_c_text(SOURCE))
+        self.d = self.program.symbols.variable('d')
+
+    def check(self, pipeline):
+        optimized = PassManager(pipeline).run(self.program)
+        returns = [instr for instr in optimized.instructions if instr.opcode is RETURN]
+        self.assertEqual(len(returns), 1)
+        self.assertNotEqual(returns[0].arg1, self.d)
+
+    def test_copy_propagation(self):
+        self.check(['copy-propagation'])
+
+    def test_ssa(self):
+        self.check(['ssa'])
+
+    def test_default_pipeline(self):
+        self.check(None)
+
+    def test_same_type_copies_are_propagated(self):
+        optimized = PassManager(['copy-propagation']).run(self.program)
+        y = self.program.symbols.variable('y')
+        self.assertEqual([instr.arg1 for instr in optimized.instructions if instr.opcode is RETURN], [y])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from optimizer.pass_manager import PassManager
+from parser.parser import generate_ir, generate_module, parse_c_text
+from tac_utils.cfg import ControlFlowGraph
+
+SOURCE = '''
+int g;
+int f(int a) { g = a * 2; return 0; }
+'''
+
+def stores(program, name):
+    """Instructions of program that write the variable called name."""
+    variable = program.symbols.variable(name)
+    return [instr for instr in program.instructions if instr.dest == variable]
+
+class DeclaredGlobalTest(unittest.TestCase):
+    """g is only declared at top level, but a function writing it still writes a global."""
+
+    def setUp(self):
+        self.program = generate_ir(parse_c_text(SOURCE))
+
+    def test_declared_global_is_shared(self):
+        self.assertIn(self.program.symbols.variable('g'), ControlFlowGraph(self.program).shared_names())
+
+    def test_store_is_kept(self):
+        for pipeline in (['dce'], ['ssa'], ['gvn', 'copy-propagation', 'dce'], None):
+            with self.subTest(pipeline=pipeline):
+                self.assertEqual(len(stores(PassManager(pipeline).run(self.program), 'g')), 1)
+
+class ModuleGlobalTest(unittest.TestCase):
+    """Optimizing f as a unit of its own must keep the store to g, under its own name."""
+
+    def setUp(self):
+        self.module = generate_module(parse_c_text(SOURCE))
+
+    def test_unit_shares_declared_global(self):
+        unit = next(unit for unit in self.module if unit.is_function)
+        self.assertEqual(unit.program.shared, {unit.program.symbols.variable('g')})
+
+    def test_store_is_kept(self):
+        for pipeline in (['dce'], ['gvn', 'copy-propagation', 'dce'], None):
+            with self.subTest(pipeline=pipeline):
+                optimized = PassManager(pipeline).run_module(self.module).to_program()
+                self.assertEqual(len(stores(optimized, 'g')), 1)
+
+if __name__ == '__main__':
+    unittest.main()
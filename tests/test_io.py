@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from parser.parser import generate_ir, parse_c_text
+from tac_utils.binary import BinaryTAC
+from tac_utils.io import iter_tac_from_file, raw_tac_path, save_tac_to_file
+
+SOURCE = '''
+int f(int a) { int b = a + 1; return b; }
+int main() { int x = 3; return x; }
+'''
+
+class SaveTACToFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, 'out.txt')
+        self.program = generate_ir(parse_c_text(SOURCE))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_binary_keeps_function_table(self):
+        tac = self.program.to_dicts()
+        self.assertTrue(save_tac_to_file(tac, self.output, raw_format='tacb', functions=self.program.functions))
+        with BinaryTAC(str(raw_tac_path(self.output, 'tacb'))) as binary:
+            self.assertEqual(list(binary), tac)
+            self.assertEqual(binary.functions, {'f': (0, 3), 'main': (3, 5)})
+            self.assertEqual(list(binary.function('main')), tac[3:5])
+
+    def test_binary_from_program(self):
+        self.assertTrue(save_tac_to_file(self.program, self.output, raw_format='tacb'))
+        with BinaryTAC(str(raw_tac_path(self.output, 'tacb'))) as binary:
+            self.assertEqual(list(binary.function('f')), self.program.to_dicts()[0:3])
+
+    def test_binary_keeps_temporaries(self):
+        self.assertTrue(save_tac_to_file(self.program, self.output, raw_format='tacb'))
+        with BinaryTAC(str(raw_tac_path(self.output, 'tacb'))) as binary:
+            loaded = binary.to_program()
+        self.assertEqual(loaded.to_dicts(), self.program.to_dicts())
+        self.assertEqual({loaded.symbols.text(t) for t in loaded.symbols.temps},
+                         {self.program.symbols.text(t) for t in self.program.symbols.temps})
+
+    def test_jsonl_round_trip(self):
+        tac = self.program.to_dicts()
+        self.assertTrue(save_tac_to_file(tac, self.output, raw_format='jsonl'))
+        self.assertEqual(list(iter_tac_from_file(raw_tac_path(self.output, 'jsonl'))), tac)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from optimizer.pass_manager import PassManager
+from parser.parser import generate_ir, parse_c_text
+from tac_utils.interpreter import run
+from tac_utils.ir import BINOP
+
+SOURCE = '''
+int f(int a, int b) {
+    int i = 0;
+    int s = 0;
+    while (i < 3) {
+        if (a) return 9;
+        s = 12 << b;
+        i = i + 1;
+    }
+    return s;
+}
+'''
+
+class TrappingShiftTest(unittest.TestCase):
+    """12 << b is only evaluated when a is 0, so it must not move to where a negative b would trap."""
+
+    def setUp(self):
+        self.program = generate_ir(parse_c_text(SOURCE))
+
+    def test_shift_by_variable_stays_in_loop(self):
+        optimized = PassManager(['licm']).run(self.program)
+        self.assertEqual(run(optimized, arguments={'a': 1, 'b': -15}).value, 9)
+        self.assertEqual(run(optimized, arguments={'a': 0, 'b': 2}).value, 48)
+
+    def test_shift_by_small_constant_is_hoisted(self):
+        program = generate_ir(parse_c_text(SOURCE.replace('12 << b', 'b << 3')))
+        optimized = PassManager(['licm']).run(program)
+        header = next(pos for pos, instr in enumerate(optimized.instructions) if instr.opcode is BINOP
+                      and instr.op == '<')
+        shifts = [pos for pos, instr in enumerate(optimized.instructions) if instr.opcode is BINOP
+                  and instr.op == '<<']
+        self.assertEqual(len(shifts), 1)
+        self.assertLess(shifts[0], header)
+
+if __name__ == '__main__':
+    unittest.main()
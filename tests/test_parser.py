@@ -0,0 +1,29 @@
+import unittest
+
+from optimizer.pass_manager import PassManager
+from parser.parser import generate_ir, parse_c_text
+from tac_utils.interpreter import run
+
+SOURCE = '''
+int f(int a, int b) { int x = b && a / b; int y = b == 0 || a % b; return x * 10 + y; }
+'''
+
+class ShortCircuitTest(unittest.TestCase):
+    """The right operand of && and || is only evaluated when the left one does not decide the result."""
+
+    def setUp(self):
+        self.program = generate_ir(parse_c_text(SOURCE))
+
+    def check(self, program):
+        self.assertEqual(run(program, arguments={'a': 5, 'b': 0}).value, 1)
+        self.assertEqual(run(program, arguments={'a': 5, 'b': 2}).value, 11)
+        self.assertEqual(run(program, arguments={'a': 4, 'b': 2}).value, 10)
+
+    def test_unoptimized(self):
+        self.check(self.program)
+
+    def test_default_pipeline(self):
+        self.check(PassManager().run(self.program))
+
+if __name__ == '__main__':
+    unittest.main()
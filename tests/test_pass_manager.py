@@ -0,0 +1,28 @@
+import unittest
+
+from optimizer.pass_manager import PassManager
+from parser.parser import generate_ir, parse_c_text
+from tac_utils.interpreter import run
+
+SOURCE = '''
+int f(int a) { return a / 8; }
+int g(int n) { int s = 0; while (n > 0) { n = n - 1; break; s = s + 1; } return s + n * 7; }
+'''
+
+class RunBlocksTest(unittest.TestCase):
+    """Strength reduction grows f, so the function ranges must move with the blocks."""
+
+    def setUp(self):
+        self.program = generate_ir(parse_c_text(SOURCE))
+
+    def test_function_ranges_move(self):
+        optimized = PassManager(['strength-reduction', 'sccp']).run_blocks(self.program)
+        self.assertEqual([name for name, _, _ in optimized.functions], ['f', 'g'])
+        _, start, end = optimized.functions[1]
+        self.assertEqual(end, len(optimized))
+        self.assertGreater(start, self.program.functions[1][1])
+        self.assertEqual(run(optimized, 'f', {'a': -17}).value, -2)
+        self.assertEqual(run(optimized, 'g', {'n': 4}).value, 21)
+
+if __name__ == '__main__':
+    unittest.main()
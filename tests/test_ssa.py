@@ -0,0 +1,45 @@
+import unittest
+
+from optimizer.pass_manager import PassManager
+from parser.parser import generate_ir, parse_c_text
+from tac_utils.interpreter import run
+from tac_utils.ir import TACProgram
+
+BREAK_SOURCE = '''
+int f(int n) { int s = 0; while (n > 0) { n = n - 1; break; s = s + 1; } return s; }
+'''
+
+class UnrangedEntryTest(unittest.TestCase):
+    """
+    Without function ranges every block nothing jumps to may start a
+    function, but the dead block after break leads back into the loop, so
+    it must not be taken for one.
+    """
+
+    def setUp(self):
+        # The dict form does not keep function ranges
+        self.program = TACProgram.from_dicts(generate_ir(parse_c_text(BREAK_SOURCE)).to_dicts())
+
+    def test_round_trip(self):
+        for pipeline in (['ssa'], ['gvn'], ['sccp'], ['ssa', 'gvn', 'ssa']):
+            with self.subTest(pipeline=pipeline):
+                optimized = PassManager(pipeline).run(self.program)
+                # Optimizing again must find every jump target
+                optimized = PassManager(pipeline).run(optimized)
+                for n in (0, 1, 5):
+                    self.assertEqual(run(optimized, arguments={'n': n}).value, 0)
+
+class CoalescingTest(unittest.TestCase):
+    """Versions of x that do not interfere get the name x back, even though x's entry value is never read."""
+
+    def test_straight_line_keeps_names(self):
+        program = generate_ir(parse_c_text('int f(int a) { int x = a + 1; int y = x << 1; x = y + 3; return x; }'))
+        for pipeline in (['ssa'], None):
+            with self.subTest(pipeline=pipeline):
+                optimized = PassManager(pipeline).run(program)
+                names = {optimized.symbols.text(operand) for instr in optimized.instructions
+                         for operand in (instr.dest, instr.arg1, instr.arg2) if operand is not None and operand >= 0}
+                self.assertFalse([name for name in names if '.' in name], names)
+
+if __name__ == '__main__':
+    unittest.main()